@@ -0,0 +1,132 @@
+"""异步 AI 任务（/api/ai/jobs）的吞吐与排队延迟。
+
+并发提交 --jobs 个健康建议任务（各自带不同的 Idempotency-Key），随后轮询直到全部完成，统计：
+- submit：提交请求本身的延迟（应与大模型耗时无关）；
+- queue / run：服务端记录的排队时长（created_at -> started_at）与执行时长（started_at -> finished_at）；
+- completion：客户端视角从提交到观察到完成的时长（包含轮询间隔带来的误差）；
+- throughput_jobs_per_s：全部任务完成的吞吐；
+- replay：用相同的 Idempotency-Key 重新提交全部任务，检查返回的是同一任务且没有新增大模型调用。
+
+默认在进程内启动桩服务与应用；排队行为取决于 AI_JOB_WORKERS 与桩服务的生成速度。
+请求体默认相同，大模型结果会被缓存复用；--distinct 为每个任务附加不同的 additional_info，使每个任务都实际调用大模型。
+
+用法（在 backend 目录下）：
+    python -m benchmarks.ai_jobs --jobs 64 --concurrency 16 --distinct --out ai_jobs.json
+    AI_JOB_WORKERS=8 python -m benchmarks.ai_jobs --token-rate 100
+"""
+import argparse
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from benchmarks.common import environment, summarize, write_results
+from benchmarks.load import start_local_app
+
+BODY = {'symptoms': ['发热', '咳嗽'], 'severity': '中等', 'duration': '1-2天'}
+
+
+def submit_all(base_url, keys, concurrency, distinct=False):
+    """返回 {key: (响应状态码, 任务 id, 提交时刻)} 与提交延迟样本"""
+    submitted = {}
+    latencies = []
+    lock = threading.Lock()
+    local = threading.local()
+
+    def one(key):
+        session = getattr(local, 'session', None)
+        if session is None:
+            session = local.session = requests.Session()
+        body = dict(BODY, additional_info=f'编号 {key}') if distinct else BODY
+        start = time.perf_counter()
+        response = session.post(f'{base_url}/api/ai/jobs', json=body, headers={'Idempotency-Key': key}, timeout=30)
+        elapsed = time.perf_counter() - start
+        job_id = response.json().get('data', {}).get('id') if response.ok else None
+        with lock:
+            latencies.append(elapsed)
+            submitted[key] = (response.status_code, job_id, start)
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(one, keys))
+    return submitted, latencies
+
+
+def wait_all(base_url, submitted, poll_interval, timeout):
+    """轮询直到全部任务完成，返回 {任务 id: (任务 dict, 客户端观察到完成的时刻)}"""
+    pending = {job_id for _, job_id, _ in submitted.values() if job_id}
+    finished = {}
+    deadline = time.perf_counter() + timeout
+    session = requests.Session()
+    while pending and time.perf_counter() < deadline:
+        for job_id in list(pending):
+            job = session.get(f'{base_url}/api/ai/jobs/{job_id}', timeout=30).json()['data']
+            if job['status'] in ('done', 'failed'):
+                finished[job_id] = (job, time.perf_counter())
+                pending.discard(job_id)
+        if pending:
+            time.sleep(poll_interval)
+    return finished
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--base-url', help='压测已运行的服务；不指定则在进程内启动应用与桩服务')
+    parser.add_argument('--jobs', type=int, default=32, help='提交的任务数')
+    parser.add_argument('--concurrency', type=int, default=8, help='并发提交的客户端数')
+    parser.add_argument('--distinct', action='store_true', help='每个任务使用不同的请求体，不复用大模型缓存')
+    parser.add_argument('--poll-interval', type=float, default=0.05, help='客户端轮询间隔（秒）')
+    parser.add_argument('--timeout', type=float, default=300.0, help='等待全部任务完成的上限（秒）')
+    parser.add_argument('--token-rate', type=float, default=200.0, help='桩服务每秒输出的 token 数')
+    parser.add_argument('--first-token-latency', type=float, default=0.2, help='桩服务首包延迟（秒）')
+    parser.add_argument('--out', help='结果 JSON 输出路径')
+    args = parser.parse_args(argv)
+
+    stub_config = {'token_rate': args.token_rate, 'first_token_latency': args.first_token_latency}
+    base_url, stub = args.base_url, None
+    if not base_url:
+        base_url, stub = start_local_app(stub_config)
+
+    keys = [f'bench-{uuid.uuid4().hex}' for _ in range(args.jobs)]
+    started = time.perf_counter()
+    submitted, submit_latencies = submit_all(base_url, keys, args.concurrency, args.distinct)
+    finished = wait_all(base_url, submitted, args.poll_interval, args.timeout)
+    wall = time.perf_counter() - started
+
+    submit_times = {job_id: at for _, job_id, at in submitted.values() if job_id}
+    jobs = [job for job, _ in finished.values()]
+    llm_calls = stub.stub_config.requests if stub else None
+
+    # 幂等重放：同一键应返回同一任务（200 + Idempotent-Replayed），且不再调用大模型
+    replayed, _ = submit_all(base_url, keys, args.concurrency, args.distinct)
+    replay_ok = sum(1 for key, (status, job_id, _) in replayed.items()
+                    if status == 200 and job_id == submitted[key][1])
+
+    write_results({
+        'suite': 'ai_jobs',
+        'environment': environment(),
+        'config': {'jobs': args.jobs, 'concurrency': args.concurrency, 'distinct': args.distinct,
+                   'poll_interval': args.poll_interval,
+                   'workers': int(os.environ.get('AI_JOB_WORKERS', '4')),
+                   'base_url': args.base_url or 'in-process', 'stub': stub_config},
+        'results': {
+            'accepted': sum(1 for status, _, _ in submitted.values() if status == 202),
+            'done': sum(1 for job in jobs if job['status'] == 'done'),
+            'failed': sum(1 for job in jobs if job['status'] == 'failed'),
+            'unfinished': len(submit_times) - len(finished),
+            'wall_seconds': round(wall, 3),
+            'throughput_jobs_per_s': round(len(finished) / wall, 2) if wall else None,
+            'submit': summarize(submit_latencies),
+            'queue': summarize([job['queue_seconds'] for job in jobs if job['queue_seconds'] is not None]),
+            'run': summarize([job['run_seconds'] for job in jobs if job['run_seconds'] is not None]),
+            'completion': summarize([at - submit_times[job_id] for job_id, (_, at) in finished.items()]),
+            'replay': {'matched': replay_ok, 'total': len(keys),
+                       'extra_llm_calls': (stub.stub_config.requests - llm_calls) if stub else None},
+        },
+    }, args.out)
+
+
+if __name__ == '__main__':
+    main()
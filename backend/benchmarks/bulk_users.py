@@ -0,0 +1,93 @@
+"""用户写入吞吐：逐行 POST /api/users 与批量 POST /api/users/bulk 的对比（行/秒）。
+
+每种路径在独立的临时 SQLite 数据库上运行，通过 Flask 测试客户端直接调用应用（不经过网络）：
+- single：每行一次 POST /api/users（每行一个事务）；
+- bulk_json：JSON 数组一次提交，按 --batch-size 分批写入；
+- bulk_ndjson：NDJSON 请求体，结果逐行流式返回；
+- bulk_upsert：对已存在的同一批用户做 upsert（全部走 ON CONFLICT DO UPDATE）。
+
+用法（在 backend 目录下）：
+    python -m benchmarks.bulk_users --rows 2000 --batch-size 500 --out bulk_users.json
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+
+from benchmarks.common import environment, write_results
+
+
+def _rows(count, prefix):
+    return [{'username': f'{prefix}_{i}', 'email': f'{prefix}_{i}@example.org'} for i in range(count)]
+
+
+def _fresh_app():
+    os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(tempfile.mkdtemp(prefix='medical_ai_bulk_'), 'app.db')}"
+    from src.main import create_app
+    return create_app()
+
+
+def _timed(name, rows, fn):
+    start = time.perf_counter()
+    fn()
+    elapsed = time.perf_counter() - start
+    return {'path': name, 'rows': rows, 'seconds': round(elapsed, 4), 'rows_per_sec': round(rows / elapsed, 1)}
+
+
+def bench_single(rows):
+    client = _fresh_app().test_client()
+    data = _rows(rows, 'single')
+
+    def run():
+        for row in data:
+            assert client.post('/api/users', json=row).status_code == 201
+
+    return _timed('single', rows, run)
+
+
+def bench_bulk(rows, ndjson=False):
+    client = _fresh_app().test_client()
+    data = _rows(rows, 'bulk')
+
+    def run():
+        if ndjson:
+            body = '\n'.join(json.dumps(row) for row in data)
+            response = client.post('/api/users/bulk', data=body, content_type='application/x-ndjson')
+            summary = json.loads(response.data.splitlines()[-1])['summary']
+        else:
+            summary = client.post('/api/users/bulk', json=data).get_json()['summary']
+        assert summary.get('created') == rows, summary
+
+    result = _timed('bulk_ndjson' if ndjson else 'bulk_json', rows, run)
+
+    def upsert():
+        summary = client.post('/api/users/bulk?op=upsert', json=data).get_json()['summary']
+        assert summary.get('updated') == rows, summary
+
+    return [result, _timed('bulk_upsert', rows, upsert)] if not ndjson else [result]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=2000)
+    parser.add_argument('--batch-size', type=int, default=None, help='覆盖 USER_BULK_BATCH_SIZE')
+    parser.add_argument('--out', help='结果 JSON 输出路径')
+    args = parser.parse_args(argv)
+    os.environ.setdefault('LOG_LEVEL', 'WARNING')
+
+    if args.batch_size:
+        # 须在导入应用之前设置
+        os.environ['USER_BULK_BATCH_SIZE'] = str(args.batch_size)
+
+    results = [bench_single(args.rows)]
+    results.extend(bench_bulk(args.rows))
+    results.extend(bench_bulk(args.rows, ndjson=True))
+    single = results[0]['rows_per_sec']
+    for result in results:
+        result['speedup'] = round(result['rows_per_sec'] / single, 1)
+    write_results({'environment': environment(), 'rows': args.rows, 'results': results}, args.out)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,137 @@
+"""基准测试公用工具：计时、统计、合成数据与 JSON 结果输出。
+
+所有基准脚本都在 backend 目录下以模块方式运行，例如：
+    python -m benchmarks.micro --out micro.json
+输出的 JSON 带有提交号与运行环境信息，便于在不同提交之间比较回归。
+"""
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+# 合成数据使用的常用汉字，保证生成的症状/科室名与真实数据同为中文字符
+CJK_CHARS = '痛热咳嗽头腹胸恶心呕吐泻乏力失眠晕肿痒酸胀麻闷喘咽喉鼻塞流涕背腰颈关节皮疹眼耳牙出血尿频便秘'
+LEVELS = ('三甲', '三乙', '二甲', '二乙', '一甲', None)
+DEPARTMENTS = ('内科', '外科', '呼吸内科', '心血管内科', '消化内科', '神经内科', '急诊科', '儿科',
+               '妇产科', '皮肤科', '感染科', '肿瘤科', '泌尿外科', '肾内科', '内分泌科', '精神科')
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=BACKEND_DIR,
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def environment():
+    return {
+        'commit': git_commit(),
+        'python': sys.version.split()[0],
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+    }
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(pct / 100.0 * (len(sorted_values) - 1)))))
+    return sorted_values[index]
+
+
+def summarize(samples):
+    """对耗时样本（秒）求统计量，结果以毫秒表示"""
+    ordered = sorted(samples)
+    return {
+        'count': len(ordered),
+        'mean_ms': round(statistics.fmean(ordered) * 1000, 4) if ordered else 0.0,
+        'p50_ms': round(percentile(ordered, 50) * 1000, 4),
+        'p90_ms': round(percentile(ordered, 90) * 1000, 4),
+        'p99_ms': round(percentile(ordered, 99) * 1000, 4),
+        'max_ms': round(ordered[-1] * 1000, 4) if ordered else 0.0,
+    }
+
+
+def measure(fn, repeat=5, min_time=0.2):
+    """多轮计时：每轮循环调用 fn 直到超过 min_time 秒，返回每次调用的平均耗时（秒）列表"""
+    per_call = []
+    for _ in range(repeat):
+        calls = 0
+        start = time.perf_counter()
+        while True:
+            fn()
+            calls += 1
+            elapsed = time.perf_counter() - start
+            if elapsed >= min_time:
+                break
+        per_call.append(elapsed / calls)
+    best = min(per_call)
+    return {
+        'best_us': round(best * 1e6, 3),
+        'median_us': round(statistics.median(per_call) * 1e6, 3),
+        'ops_per_sec': round(1.0 / best, 1) if best else None,
+        'repeat': repeat,
+    }
+
+
+def synthetic_symptom_kb(size, seed=0):
+    """生成 size 条症状知识库，结构与 SYMPTOM_DISEASE_MAP 相同"""
+    rng = random.Random(seed)
+    kb = {}
+    while len(kb) < size:
+        name = ''.join(rng.choice(CJK_CHARS) for _ in range(rng.randint(2, 4)))
+        kb[name] = {
+            'diseases': [f'疾病{rng.randint(0, size)}' for _ in range(4)],
+            'departments': rng.sample(DEPARTMENTS, 3),
+            'severity_weight': round(rng.uniform(0.3, 0.95), 2),
+        }
+    return kb
+
+
+class SyntheticHospital:
+    """只带评分所需字段的轻量医院对象，避免基准测试依赖数据库"""
+
+    __slots__ = ('id', 'name', 'level', 'latitude', 'longitude', 'rating', 'specialties')
+
+    def __init__(self, **fields):
+        for key, value in fields.items():
+            setattr(self, key, value)
+
+
+def synthetic_hospitals(size, seed=0, center=(39.9, 116.4), spread_deg=2.0):
+    """在 center 附近随机生成 size 家医院"""
+    rng = random.Random(seed)
+    return [
+        SyntheticHospital(
+            id=i + 1,
+            name=f'合成医院{i + 1}',
+            level=rng.choice(LEVELS),
+            latitude=center[0] + rng.uniform(-spread_deg, spread_deg),
+            longitude=center[1] + rng.uniform(-spread_deg, spread_deg),
+            rating=round(rng.uniform(3.0, 5.0), 1),
+            specialties=json.dumps(rng.sample(DEPARTMENTS, 4), ensure_ascii=False),
+        )
+        for i in range(size)
+    ]
+
+
+def parse_sizes(text):
+    return [int(float(s)) for s in text.split(',') if s.strip()]
+
+
+def write_results(results, out_path=None):
+    payload = json.dumps(results, ensure_ascii=False, indent=2)
+    if out_path:
+        with open(out_path, 'w', encoding='utf-8') as f:
+            f.write(payload + '\n')
+    print(payload)
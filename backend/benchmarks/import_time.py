@@ -0,0 +1,104 @@
+"""启动耗时预算检查。
+
+在干净的子进程中以 python -X importtime 分别测量：
+- import：仅 import src.main（应用工厂模块本身不应触发任何初始化）；
+- create_app：创建应用（注册蓝图、建表），不应导入 LAZY_MODULES 中的重依赖；
+- warm_up：preload 模式下主进程的预热（导入重依赖并构建只读索引），仅报告不设预算。
+每个阶段输出累计导入耗时最高的模块。任一阶段超出预算或提前导入了重依赖时以状态码 1 退出，可直接用于 CI。
+
+用法（在 backend 目录下）：
+    python -m benchmarks.import_time --import-budget-ms 150 --app-budget-ms 1500 --out import_time.json
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+
+from benchmarks.common import BACKEND_DIR, environment, write_results
+
+# 只应在首次使用或 warm_up 时导入的模块
+LAZY_MODULES = ('pandas', 'dashscope', 'numpy', 'aiohttp', 'geopy', 'requests')
+
+STAGES = {
+    'import': 'import src.main',
+    'create_app': 'import src.main; src.main.create_app()',
+    'warm_up': 'import src.main; src.main.warm_up(src.main.create_app())',
+}
+
+_REPORT = 'import sys; print(",".join(m for m in {lazy!r} if m in sys.modules))'
+
+
+def _parse_importtime(stderr):
+    """解析 -X importtime 输出，返回 [(模块, 自身微秒, 累计微秒)]"""
+    modules = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        try:
+            self_us, cumulative_us, name = line[len('import time:'):].split('|')
+            # '|' 后固定一个空格，其后的缩进表示嵌套层级
+            modules.append((name[1:].rstrip(), int(self_us), int(cumulative_us)))
+        except ValueError:
+            continue
+    return modules
+
+
+def run_stage(code, top):
+    env = dict(os.environ)
+    env.setdefault('LOG_LEVEL', 'WARNING')
+    # 使用临时数据库，避免 create_all 修改仓库中的数据
+    env.setdefault('DATABASE_URL', f"sqlite:///{os.path.join(tempfile.mkdtemp(prefix='medical_ai_import_'), 'app.db')}")
+    # 不访问网络下载城市编码表
+    env.setdefault('AMAP_ADCODE_URL', os.path.join(tempfile.gettempdir(), 'medical_ai_missing_adcode.csv'))
+    script = f'{code}; {_REPORT.format(lazy=LAZY_MODULES)}'
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', script], cwd=BACKEND_DIR, env=env,
+                            capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f'stage failed: {code}\n{result.stderr[-2000:]}')
+    modules = _parse_importtime(result.stderr)
+    # 顶层导入（缩进最浅）的累计耗时之和即总导入耗时
+    total_us = sum(cumulative for name, _, cumulative in modules if not name.startswith(' '))
+    slowest = sorted(modules, key=lambda m: m[2], reverse=True)[:top]
+    loaded = [m for m in result.stdout.strip().splitlines()[-1].split(',') if m] if result.stdout.strip() else []
+    return {
+        'total_ms': round(total_us / 1000, 1),
+        'modules': len(modules),
+        'lazy_modules_loaded': loaded,
+        'slowest': [{'module': name.strip(), 'self_ms': round(s / 1000, 1), 'cumulative_ms': round(c / 1000, 1)}
+                    for name, s, c in slowest],
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--import-budget-ms', type=float, default=150.0, help='import src.main 的导入耗时上限')
+    parser.add_argument('--app-budget-ms', type=float, default=1500.0, help='create_app 阶段的导入耗时上限')
+    parser.add_argument('--top', type=int, default=10, help='每个阶段列出的最慢模块数')
+    parser.add_argument('--skip-warm-up', action='store_true', help='不测量 warm_up 阶段')
+    parser.add_argument('--out', help='结果 JSON 输出路径')
+    args = parser.parse_args(argv)
+
+    budgets = {'import': args.import_budget_ms, 'create_app': args.app_budget_ms}
+    results = {'environment': environment(), 'budgets_ms': budgets, 'lazy_modules': list(LAZY_MODULES), 'stages': {}}
+    failures = []
+    for stage, code in STAGES.items():
+        if stage == 'warm_up' and args.skip_warm_up:
+            continue
+        report = run_stage(code, args.top)
+        results['stages'][stage] = report
+        if stage in budgets:
+            if report['total_ms'] > budgets[stage]:
+                failures.append(f"{stage}: {report['total_ms']} ms > budget {budgets[stage]} ms")
+            if report['lazy_modules_loaded']:
+                failures.append(f"{stage}: eagerly imported {', '.join(report['lazy_modules_loaded'])}")
+    results['failures'] = failures
+    write_results(results, args.out)
+    if failures:
+        print('\n'.join(failures), file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
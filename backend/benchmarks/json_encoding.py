@@ -0,0 +1,69 @@
+"""医院列表响应的 JSON 编码吞吐对比。
+
+比较三条路径对同一份 {"success": true, "data": [hospital...]} 响应的编码速度：
+- stdlib：Flask 默认 provider 的行为（标准库 json，ensure_ascii + sort_keys，逐行 to_dict）；
+- orjson_dict：FastJSONProvider，逐行 to_dict 后用 orjson 编码；
+- fragments：使用按数据版本缓存的医院片段，仅做字节拼接。
+
+用法（在 backend 目录下）：
+    python -m benchmarks.json_encoding --sizes 10,100,1000,10000 --out json.json
+"""
+import argparse
+import datetime
+import json
+
+from benchmarks.common import environment, measure, parse_sizes, synthetic_hospitals, write_results
+from src.models.hospital import Hospital
+from src.utils.json_provider import RawJSON, dumps_bytes
+
+
+def _hospital_models(size):
+    created_at = datetime.datetime(2025, 6, 24, 2, 31, 32)
+    return [
+        Hospital(id=h.id, name=h.name, level=h.level, address=f'北京市东城区示例路{h.id}号',
+                 latitude=h.latitude, longitude=h.longitude, phone='010-69156114',
+                 website='https://www.example.org', specialties=h.specialties, rating=h.rating,
+                 created_at=created_at)
+        for h in synthetic_hospitals(size)
+    ]
+
+
+def bench_size(size):
+    hospitals = _hospital_models(size)
+    fragments = [dumps_bytes(h.to_dict()) for h in hospitals]
+
+    def stdlib():
+        return json.dumps({'success': True, 'data': [h.to_dict() for h in hospitals]},
+                          ensure_ascii=True, sort_keys=True).encode('utf-8')
+
+    def orjson_dict():
+        return dumps_bytes({'success': True, 'data': [h.to_dict() for h in hospitals]})
+
+    def cached_fragments():
+        return dumps_bytes({'success': True, 'data': [RawJSON(f) for f in fragments]})
+
+    results = {}
+    for name, fn in (('stdlib', stdlib), ('orjson_dict', orjson_dict), ('fragments', cached_fragments)):
+        body_size = len(fn())
+        stats = measure(fn, repeat=5, min_time=0.1)
+        stats['body_bytes'] = body_size
+        stats['mb_per_sec'] = round(body_size * stats['ops_per_sec'] / 1e6, 2)
+        results[name] = stats
+    baseline = results['stdlib']['ops_per_sec']
+    for stats in results.values():
+        stats['speedup_vs_stdlib'] = round(stats['ops_per_sec'] / baseline, 2)
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', default='10,100,1000,10000')
+    parser.add_argument('--out', help='结果 JSON 输出路径')
+    args = parser.parse_args(argv)
+    results = {'suite': 'json_encoding', 'environment': environment(),
+               'results': {str(size): bench_size(size) for size in parse_sizes(args.sizes)}}
+    write_results(results, args.out)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,179 @@
+"""端到端压测：对每个蓝图路由发起并发请求，统计吞吐与延迟分位数。
+
+默认在进程内启动 DashScope/高德桩服务和应用本身（使用临时 SQLite 数据库，不会写入
+src/database/app.db）；也可以用 --base-url 指向已运行的服务。
+
+用法（在 backend 目录下）：
+    python -m benchmarks.load --requests 200 --concurrency 8 --out load.json
+    python -m benchmarks.load --routes symptoms_analyze,hospitals_nearby --token-rate 100
+"""
+import argparse
+import itertools
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from benchmarks.common import environment, summarize, write_results
+from benchmarks.stub_server import start_stub_server, stub_environment
+
+BEIJING = {'latitude': 39.9139, 'longitude': 116.4074}
+_counter = itertools.count()
+
+
+class Scenario:
+    """一个被压测的路由。prepare 在计时之外执行，用于准备依赖数据（如待删除的用户）"""
+
+    def __init__(self, name, method, path, body=None, prepare=None, expect=(200,)):
+        self.name = name
+        self.method = method
+        self.path = path
+        self.body = body
+        self.prepare = prepare
+        self.expect = expect
+
+    def build(self, session, base_url):
+        context = self.prepare(session, base_url) if self.prepare else {}
+        path = self.path.format(**context) if context else self.path
+        body = self.body(context) if callable(self.body) else self.body
+        return path, body
+
+
+def _create_user(session, base_url):
+    n = next(_counter)
+    response = session.post(f'{base_url}/api/users', json={'username': f'load_{os.getpid()}_{n}',
+                                                           'email': f'load_{os.getpid()}_{n}@example.com'})
+    return {'user_id': response.json()['id']}
+
+
+def _new_user_body(context):
+    n = next(_counter)
+    return {'username': f'bench_{os.getpid()}_{n}', 'email': f'bench_{os.getpid()}_{n}@example.com'}
+
+
+SCENARIOS = [
+    Scenario('health', 'GET', '/health'),
+    Scenario('users_list', 'GET', '/api/users'),
+    Scenario('users_create', 'POST', '/api/users', body=_new_user_body, expect=(201,)),
+    Scenario('users_get', 'GET', '/api/users/{user_id}', prepare=_create_user),
+    Scenario('users_update', 'PUT', '/api/users/{user_id}', prepare=_create_user,
+             body=lambda ctx: {'email': f'updated_{ctx["user_id"]}@example.com'}),
+    Scenario('users_delete', 'DELETE', '/api/users/{user_id}', prepare=_create_user, expect=(204,)),
+    Scenario('symptoms_analyze', 'POST', '/api/symptoms/analyze',
+             body={'symptoms': ['发热', '咳嗽'], 'severity': '中等', 'duration': '1-2天'}),
+    Scenario('symptoms_suggestions', 'GET', '/api/symptoms/suggestions?q=痛'),
+    Scenario('hospitals_recommend', 'POST', '/api/hospitals/recommend',
+             body={'analysis_result': {'recommended_departments': ['呼吸内科', '内科']}, 'location': BEIJING}),
+    Scenario('hospitals_details', 'GET', '/api/hospitals/1'),
+    Scenario('hospitals_search', 'GET', '/api/hospitals/search?q=医院'),
+    Scenario('hospitals_nearby', 'POST', '/api/hospitals/nearby', body=dict(BEIJING, radius=20000)),
+    Scenario('ai_chat', 'POST', '/api/ai/chat', body={'message': '我有点咳嗽，需要注意什么？'}),
+    Scenario('ai_chat_weather_tool', 'POST', '/api/ai/chat', body={'message': '海淀区今天天气怎么样？'}),
+    Scenario('ai_health_advice', 'POST', '/api/ai/health-advice',
+             body={'symptoms': ['发热', '咳嗽'], 'severity': '中等', 'duration': '1-2天'}),
+    Scenario('ai_health_advice_stream', 'POST', '/api/ai/health-advice/stream',
+             body={'symptoms': ['发热', '咳嗽'], 'severity': '中等', 'duration': '1-2天'}),
+    Scenario('ai_emergency_check', 'POST', '/api/ai/emergency-check', body={'symptoms': ['胸痛'], 'severity': '严重'}),
+    Scenario('triage', 'POST', '/api/triage',
+             body={'symptoms': ['发热', '咳嗽'], 'severity': '中等', 'duration': '1-2天', 'location': BEIJING}),
+    Scenario('metrics', 'GET', '/metrics'),
+]
+
+
+def start_local_app(stub_config):
+    """启动桩服务与应用，返回 (base_url, stub_server)"""
+    import logging
+    from werkzeug.serving import make_server
+
+    # 关闭开发服务器的逐请求访问日志，避免其 I/O 干扰测量
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)
+
+    stub, stub_url = start_stub_server(**stub_config)
+    os.environ.update(stub_environment(stub_url))
+    db_path = os.path.join(tempfile.mkdtemp(prefix='medical_ai_load_'), 'app.db')
+    os.environ.setdefault('DATABASE_URL', f'sqlite:///{db_path}')
+    os.environ.setdefault('LOG_LEVEL', 'WARNING')
+
+    import dashscope
+    dashscope.base_http_api_url = os.environ['DASHSCOPE_HTTP_BASE_URL']
+    from src.main import app
+    from src.routes.hospitals import init_sample_data
+    with app.app_context():
+        init_sample_data()
+
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, name='app-server', daemon=True).start()
+    return f'http://127.0.0.1:{server.server_port}', stub
+
+
+def run_scenario(scenario, base_url, total_requests, concurrency):
+    latencies = []
+    errors = 0
+    lock = threading.Lock()
+    local = threading.local()
+
+    def one(_):
+        nonlocal errors
+        session = getattr(local, 'session', None)
+        if session is None:
+            session = local.session = requests.Session()
+        path, body = scenario.build(session, base_url)
+        start = time.perf_counter()
+        try:
+            response = session.request(scenario.method, base_url + path, json=body, timeout=120)
+            ok = response.status_code in scenario.expect
+            _ = response.content
+        except requests.RequestException:
+            ok = False
+        elapsed = time.perf_counter() - start
+        with lock:
+            latencies.append(elapsed)
+            if not ok:
+                errors += 1
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(one, range(total_requests)))
+    wall = time.perf_counter() - started
+    result = summarize(latencies)
+    result.update({'errors': errors, 'wall_seconds': round(wall, 3),
+                   'throughput_rps': round(len(latencies) / wall, 2) if wall else None})
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--base-url', help='压测已运行的服务；不指定则在进程内启动应用与桩服务')
+    parser.add_argument('--requests', type=int, default=100, help='每个路由的请求数')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--routes', help='逗号分隔的场景名，默认全部')
+    parser.add_argument('--token-rate', type=float, default=200.0, help='桩服务每秒输出的 token 数')
+    parser.add_argument('--first-token-latency', type=float, default=0.05, help='桩服务首包延迟（秒）')
+    parser.add_argument('--out', help='结果 JSON 输出路径')
+    args = parser.parse_args(argv)
+
+    stub_config = {'token_rate': args.token_rate, 'first_token_latency': args.first_token_latency}
+    base_url = args.base_url
+    if not base_url:
+        base_url, _ = start_local_app(stub_config)
+
+    selected = set(args.routes.split(',')) if args.routes else None
+    results = {
+        'suite': 'load',
+        'environment': environment(),
+        'config': {'requests': args.requests, 'concurrency': args.concurrency, 'base_url': args.base_url or 'in-process',
+                   'stub': stub_config},
+        'results': {},
+    }
+    for scenario in SCENARIOS:
+        if selected and scenario.name not in selected:
+            continue
+        results['results'][scenario.name] = run_scenario(scenario, base_url, args.requests, args.concurrency)
+    write_results(results, args.out)
+
+
+if __name__ == '__main__':
+    main()
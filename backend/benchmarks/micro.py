@@ -0,0 +1,105 @@
+"""规则引擎与医院评分的微基准。
+
+在不同规模的合成症状知识库和医院目录（默认 1e2~1e6）上测量：
+- normalize_symptoms / analyze_symptoms_logic：知识库规模对单次分析的影响（含容错索引的构建耗时与整段容错查询）；
+- calculate_distance / calculate_hospital_score：对整个医院目录做一次扫描的耗时。
+
+用法（在 backend 目录下）：
+    python -m benchmarks.micro --sizes 100,1000,10000 --out micro.json
+"""
+import argparse
+import math
+import time
+
+from benchmarks.common import (environment, measure, parse_sizes, synthetic_hospitals,
+                               synthetic_symptom_kb, write_results)
+from src.routes import hospitals, symptoms
+from src.services.symptom_index import SymptomIndex
+
+DEFAULT_SIZES = '100,1000,10000,100000,1000000'
+
+
+def _repeat_for(size):
+    # 大规模下单次扫描已足够稳定，减少轮数以控制总耗时
+    return 5 if size <= 10_000 else 1
+
+
+# 容错索引的删除字典随知识库线性增长，超过此规模时不再构建（只测原有知识库上的匹配）
+FUZZY_INDEX_MAX_SIZE = 100_000
+
+
+def bench_symptoms(size):
+    kb = synthetic_symptom_kb(size)
+    keys = list(kb)
+    text = '我最近' + '，'.join(keys[:3]) + '，还有点' + keys[-1]
+    # 把最长的一个症状名改错一个字，测整段容错查询
+    typo = max(keys[:100], key=len)
+    typo = typo[:-1] + ('错' if typo[-1] != '错' else '对')
+    original = symptoms.SYMPTOM_DISEASE_MAP, symptoms.SYMPTOM_INDEX
+    symptoms.SYMPTOM_DISEASE_MAP = kb
+    results = {}
+    try:
+        if size <= FUZZY_INDEX_MAX_SIZE:
+            started = time.perf_counter()
+            symptoms.SYMPTOM_INDEX = SymptomIndex(kb)
+            results['symptom_index_build_ms'] = round((time.perf_counter() - started) * 1000, 1)
+        min_time = 0.2 if size <= 10_000 else 0.0
+        results.update({
+            'normalize_symptoms': measure(lambda: symptoms.normalize_symptoms(text),
+                                          repeat=_repeat_for(size), min_time=min_time),
+            'analyze_symptoms_logic': measure(lambda: symptoms.analyze_symptoms_logic([text], '严重', '3-7天'),
+                                              repeat=_repeat_for(size), min_time=min_time),
+        })
+        if size <= FUZZY_INDEX_MAX_SIZE:
+            results['fuzzy_lookup'] = measure(lambda: symptoms.SYMPTOM_INDEX.lookup(typo),
+                                              repeat=_repeat_for(size), min_time=min_time)
+        return results
+    finally:
+        symptoms.SYMPTOM_DISEASE_MAP, symptoms.SYMPTOM_INDEX = original
+
+
+def bench_hospitals(size):
+    directory = synthetic_hospitals(size)
+    user_lat, user_lng = 39.9, 116.4
+    # 评分基准只需要距离数值，用等距柱状投影近似，避免在大规模下重复付出测地线计算的代价
+    distances = [111.0 * math.hypot(h.latitude - user_lat, (h.longitude - user_lng) * math.cos(math.radians(user_lat)))
+                 for h in directory]
+
+    def scan_distance():
+        for h in directory:
+            hospitals.calculate_distance(user_lat, user_lng, h.latitude, h.longitude)
+
+    def scan_score():
+        for h, distance in zip(directory, distances):
+            hospitals.calculate_hospital_score(h, 2, distance, {})
+
+    results = {}
+    for name, fn in (('calculate_distance', scan_distance), ('calculate_hospital_score', scan_score)):
+        stats = measure(fn, repeat=_repeat_for(size), min_time=0.0)
+        stats['per_item_ns'] = round(stats['best_us'] * 1000 / size, 1)
+        results[name] = stats
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', default=DEFAULT_SIZES, help='逗号分隔的数据规模，支持 1e5 写法')
+    parser.add_argument('--only', choices=('symptoms', 'hospitals'), help='只运行其中一组')
+    parser.add_argument('--out', help='结果 JSON 输出路径')
+    args = parser.parse_args(argv)
+
+    results = {'suite': 'micro', 'environment': environment(), 'results': {}}
+    for size in parse_sizes(args.sizes):
+        started = time.perf_counter()
+        entry = {}
+        if args.only in (None, 'symptoms'):
+            entry.update(bench_symptoms(size))
+        if args.only in (None, 'hospitals'):
+            entry.update(bench_hospitals(size))
+        entry['wall_seconds'] = round(time.perf_counter() - started, 2)
+        results['results'][str(size)] = entry
+    write_results(results, args.out)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,236 @@
+"""症状 -> 科室检索的召回率与延迟：关键词匹配、本地语义检索与两者组合的对比。
+
+查询集为人工标注的口语化描述及其可接受的科室，每条查询在三条路径上各自给出按相关度排序的科室列表：
+- keyword：SYMPTOM_INDEX 容错匹配出的症状，按出现顺序展开为知识库中的科室；
+- semantic：本地语义索引的 top-k 命中，科室文档直接取科室名，症状文档展开为知识库中的科室；
+- combined：analyze_symptoms_logic 的实际行为，关键词有命中时用关键词结果，否则回退到语义检索
+  （得分阈值 SEMANTIC_MIN_SCORE、领先差距 SEMANTIC_MIN_MARGIN）。
+recall@k 为前 k 个科室中包含任一标注科室的查询比例；延迟为单条查询的耗时。
+另有一组与医疗无关的查询，false_positive_rate 为其中仍给出科室的比例（combined 路径应为 0）。
+
+标注查询与非医疗查询各分为调优集与留出集：--calibrate 只在调优集上网格搜索得分阈值与领先差距
+（调优集零误报的前提下召回率最高，同等召回取这一片参数的中位点），再在留出集上报告所选参数的召回率与误报率；
+留出集不参与参数选择，也不用于补充科室主诉文本。
+
+用法（在 backend 目录下）：
+    python -m benchmarks.semantic_symptoms --k 3 --out semantic.json
+    python -m benchmarks.semantic_symptoms --calibrate
+"""
+import argparse
+
+from benchmarks.common import environment, measure, write_results
+
+# (描述, 可接受的科室)；调优集
+LABELLED_QUERIES = [
+    ("发烧三天了", {"内科", "感染科", "呼吸内科"}),
+    ("咳嗽有痰", {"呼吸内科"}),
+    ("头疼得厉害", {"神经内科"}),
+    ("肚子疼", {"消化内科", "普外科"}),
+    ("拉肚子一天好几次", {"消化内科", "感染科"}),
+    ("晚上睡不着觉", {"精神科", "神经内科"}),
+    ("浑身没劲", {"内科"}),
+    ("想吐", {"消化内科"}),
+    ("心慌", {"心血管内科"}),
+    ("心跳特别快还不齐", {"心血管内科"}),
+    ("喘不上气", {"呼吸内科", "急诊科"}),
+    ("嗓子疼", {"呼吸内科"}),
+    ("皮肤痒起红疹子", {"皮肤科"}),
+    ("身上起风团", {"皮肤科"}),
+    ("胃胀反酸烧心", {"消化内科"}),
+    ("大便发黑", {"消化内科"}),
+    ("天旋地转站不稳", {"神经内科"}),
+    ("手脚发麻", {"神经内科"}),
+    ("尿频尿急", {"泌尿外科"}),
+    ("小便的时候疼", {"泌尿外科"}),
+    ("月经推迟了两个月", {"妇产科"}),
+    ("口渴喝水多体重下降", {"内分泌科"}),
+    ("最近情绪低落什么都不想做", {"精神科"}),
+    ("总是焦虑紧张", {"精神科"}),
+    ("眼皮和脚都肿了", {"肾内科", "心血管内科"}),
+    ("摔了一跤手腕肿了", {"外科"}),
+    ("宝宝不吃奶一直哭闹", {"儿科"}),
+    ("牙龈出血身上有瘀斑", {"血液科"}),
+    ("血压高头晕", {"心血管内科", "神经内科"}),
+    ("高烧不退", {"感染科", "内科"}),
+    ("嗓子冒烟浑身滚烫", {"呼吸内科", "内科", "感染科"}),
+]
+
+# 留出集：只用于报告，不参与阈值选择
+HELD_OUT_QUERIES = [
+    ("烧到三十九度", {"内科", "感染科", "呼吸内科"}),
+    ("发烧咳嗽", {"内科", "呼吸内科", "感染科"}),
+    ("一直干咳没有痰", {"呼吸内科"}),
+    ("太阳穴一跳一跳地疼", {"神经内科"}),
+    ("胃里难受想吐", {"消化内科"}),
+    ("一吃东西就拉", {"消化内科", "感染科"}),
+    ("半夜总是醒", {"精神科", "神经内科"}),
+    ("走几步路就喘", {"呼吸内科", "心血管内科"}),
+    ("心口发紧", {"心血管内科"}),
+    ("喉咙又干又痛", {"呼吸内科"}),
+    ("身上长了好多红点很痒", {"皮肤科"}),
+    ("便秘好几天了", {"消化内科"}),
+    ("起床的时候眼前发黑", {"神经内科", "心血管内科", "内科", "血液科"}),
+    ("腿脚发麻没知觉", {"神经内科"}),
+    ("尿里有血", {"泌尿外科", "肾内科"}),
+    ("例假不规律", {"妇产科"}),
+    ("老是口干想喝水", {"内分泌科"}),
+    ("心情烦躁压力很大", {"精神科"}),
+    ("早上起来眼睛肿", {"肾内科"}),
+    ("脚踝扭了肿起来", {"外科"}),
+    ("孩子发烧咳嗽", {"儿科", "呼吸内科", "内科"}),
+    ("脸色发白没精神", {"血液科", "内科"}),
+]
+
+# 与医疗无关的输入，不应得到任何科室；调优集
+NEGATIVE_QUERIES = [
+    "我想买一台电脑", "fail test", "test", "hello world", "我很好没有不舒服", "我很开心", "我身体很好",
+    "今天天气不错", "帮我订一张去上海的机票", "推荐一部好看的电影", "我想学习编程", "这个手机多少钱",
+    "明天开会吗", "你好", "谢谢你", "我要退款", "股票怎么买", "写一首诗", "周末去哪里玩", "请问几点了",
+    "我家的猫不吃饭", "汽车发动机异响", "电脑开不了机", "老板让我加班", "怎么做红烧肉", "最近工作很忙",
+    "今天吃了火锅", "我想减肥", "帮我查一下快递",
+    # 含人称、身体部位或情绪词但与就医无关，最容易被误判
+    "孩子不爱写作业", "宝宝的玩具坏了", "小孩喜欢画画", "老人想去旅游", "心里很高兴", "我的手机屏幕碎了",
+    "眼镜找不到了", "头发该剪了", "胃口很好吃了三碗饭", "嗓门太大被邻居投诉", "手机信号不好", "这家店服务不好",
+]
+
+# 留出的非医疗查询
+HELD_OUT_NEGATIVE_QUERIES = [
+    "帮我写个周报", "这道数学题怎么做", "附近有什么好吃的", "我的电脑很卡", "孩子考试考得不好", "我想换工作",
+    "这件衣服多少钱", "怎么去火车站", "给我讲个笑话", "我的花叶子黄了", "房租该交了", "我心情很好",
+]
+
+# 网格搜索的得分阈值与领先差距
+CALIBRATION_SCORES = [round(0.05 + 0.01 * i, 2) for i in range(26)]
+CALIBRATION_MARGINS = [round(0.01 * i, 2) for i in range(16)]
+
+
+def _expand(symptoms, departments_of):
+    ranked = []
+    for symptom in symptoms:
+        for department in departments_of(symptom):
+            if department not in ranked:
+                ranked.append(department)
+    return ranked
+
+
+def keyword_departments(query):
+    from src.routes.symptoms import SYMPTOM_DISEASE_MAP, match_symptoms
+    return _expand((match.symptom for match in match_symptoms(query)),
+                   lambda symptom: SYMPTOM_DISEASE_MAP[symptom]["departments"])
+
+
+def semantic_departments(query, k, min_score=0.0, min_margin=0.0):
+    from src.routes.symptoms import SYMPTOM_DISEASE_MAP, semantic_search
+    ranked = []
+    for hit in semantic_search(query, k=k, min_score=min_score, min_margin=min_margin):
+        names = [hit.key] if hit.kind == "department" else SYMPTOM_DISEASE_MAP[hit.key]["departments"]
+        ranked.extend(name for name in names if name not in ranked)
+    return ranked
+
+
+def combined_departments(query, k, min_score=None, min_margin=None):
+    from src.routes.symptoms import SEMANTIC_MIN_MARGIN, SEMANTIC_MIN_SCORE
+    return keyword_departments(query) or semantic_departments(
+        query, k, SEMANTIC_MIN_SCORE if min_score is None else min_score,
+        SEMANTIC_MIN_MARGIN if min_margin is None else min_margin)
+
+
+def _score(rank, k, labelled, negatives):
+    found = covered = 0
+    misses = []
+    for query, expected in labelled:
+        ranked = rank(query)[:k]
+        covered += bool(ranked)
+        if expected & set(ranked):
+            found += 1
+        else:
+            misses.append({"query": query, "departments": ranked})
+    false_positives = [query for query in negatives if rank(query)]
+    return found, covered, misses, false_positives
+
+
+def _report(k, labelled, negatives, found, covered, misses, false_positives):
+    return {
+        f"recall@{k}": round(found / len(labelled), 3),
+        "coverage": round(covered / len(labelled), 3),
+        "misses": misses,
+        "false_positive_rate": round(len(false_positives) / len(negatives), 3),
+        "false_positives": false_positives,
+    }
+
+
+def evaluate(name, rank, k, query_fn):
+    timing = measure(lambda: [query_fn(query) for query, _ in LABELLED_QUERIES])
+    return {
+        "path": name,
+        "per_query_us": round(timing["best_us"] / len(LABELLED_QUERIES), 3),
+        "tuning": _report(k, LABELLED_QUERIES, NEGATIVE_QUERIES,
+                          *_score(rank, k, LABELLED_QUERIES, NEGATIVE_QUERIES)),
+        "held_out": _report(k, HELD_OUT_QUERIES, HELD_OUT_NEGATIVE_QUERIES,
+                            *_score(rank, k, HELD_OUT_QUERIES, HELD_OUT_NEGATIVE_QUERIES)),
+    }
+
+
+def calibrate(k):
+    """在调优集上选取 (得分阈值, 领先差距)，返回所选参数及其在调优集与留出集上的表现"""
+    from src.routes.symptoms import SEMANTIC_TOP_K
+    feasible = {}
+    for min_score in CALIBRATION_SCORES:
+        for min_margin in CALIBRATION_MARGINS:
+            rank = lambda q: combined_departments(q, SEMANTIC_TOP_K, min_score, min_margin)
+            found, _, _, false_positives = _score(rank, k, LABELLED_QUERIES, NEGATIVE_QUERIES)
+            if not false_positives:
+                feasible[(min_score, min_margin)] = found
+    if not feasible:
+        return None
+    # 召回率最高的参数往往连成一片，取其中位点而不是边缘，离误报与漏报两侧的边界都留出余量
+    found = max(feasible.values())
+    best = sorted(params for params, count in feasible.items() if count == found)
+    scores = sorted({score for score, _ in best})
+    min_score = scores[(len(scores) - 1) // 2]
+    margins = [margin for score, margin in best if score == min_score]
+    min_margin = margins[(len(margins) - 1) // 2]
+    rank = lambda q: combined_departments(q, SEMANTIC_TOP_K, min_score, min_margin)
+    return {
+        "min_score": min_score,
+        "min_margin": min_margin,
+        "tuning": _report(k, LABELLED_QUERIES, NEGATIVE_QUERIES,
+                          *_score(rank, k, LABELLED_QUERIES, NEGATIVE_QUERIES)),
+        "held_out": _report(k, HELD_OUT_QUERIES, HELD_OUT_NEGATIVE_QUERIES,
+                            *_score(rank, k, HELD_OUT_QUERIES, HELD_OUT_NEGATIVE_QUERIES)),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--k", type=int, default=3, help="评估的科室条数")
+    parser.add_argument("--out", help="结果 JSON 输出路径")
+    parser.add_argument("--calibrate", action="store_true", help="在调优集上选取得分阈值与领先差距，并在留出集上评估")
+    args = parser.parse_args(argv)
+
+    from src.routes.symptoms import SEMANTIC_TOP_K, analyze_symptoms_logic, match_symptoms, semantic_index
+
+    if args.calibrate:
+        write_results({"environment": environment(), "calibration": calibrate(args.k)}, args.out)
+        return
+
+    index = semantic_index()
+    results = [
+        evaluate("keyword", keyword_departments, args.k, match_symptoms),
+        evaluate("semantic", lambda q: semantic_departments(q, SEMANTIC_TOP_K), args.k,
+                 lambda q: index.search(q, k=SEMANTIC_TOP_K)),
+        evaluate("combined", lambda q: combined_departments(q, SEMANTIC_TOP_K), args.k,
+                 lambda q: analyze_symptoms_logic([q])),
+    ]
+    write_results({
+        "environment": environment(),
+        "queries": {"tuning": len(LABELLED_QUERIES), "held_out": len(HELD_OUT_QUERIES)},
+        "negative_queries": {"tuning": len(NEGATIVE_QUERIES), "held_out": len(HELD_OUT_NEGATIVE_QUERIES)},
+        "index": {"documents": len(index), "components": index.components,
+                  "explained_variance": round(index.explained_variance, 4)},
+        "results": results,
+    }, args.out)
+
+
+if __name__ == "__main__":
+    main()
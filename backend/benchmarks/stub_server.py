@@ -0,0 +1,241 @@
+"""DashScope 与高德天气 API 的本地桩服务，用于可重复的端到端压测。
+
+- POST /api/v1/services/aigc/text-generation/generation
+  模拟 Generation.call：支持 SSE 流式（按 --token-rate 逐 token 输出，首包前等待 --first-token-latency）、
+  incremental_output、天气类问题按提到的每个区县各返回一个 amap_weather 工具调用、诊断类请求返回诊断 JSON，并附带 usage。
+- GET /v3/weather/weatherInfo：模拟高德实时天气（--weather-latency 模拟工具耗时）。
+- GET /adcode.csv：行政区划编码表（AmapWeather 可通过 AMAP_ADCODE_URL 指向此处）。
+
+应用侧只需设置环境变量即可切换到桩服务：
+    DASHSCOPE_HTTP_BASE_URL=http://127.0.0.1:8765/api/v1
+    AMAP_WEATHER_URL=http://127.0.0.1:8765/v3/weather/weatherInfo
+    AMAP_ADCODE_URL=http://127.0.0.1:8765/adcode.csv
+
+独立运行：python -m benchmarks.stub_server --port 8765 --token-rate 50
+"""
+import argparse
+import json
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+GENERATION_PATH = '/api/v1/services/aigc/text-generation/generation'
+
+ADCODE_ROWS = [
+    ('中文名', 'adcode', 'citycode'),
+    ('北京市', '110000', '010'),
+    ('东城区', '110101', '010'),
+    ('西城区', '110102', '010'),
+    ('海淀区', '110108', '010'),
+    ('丰台区', '110106', '010'),
+    ('上海市', '310000', '021'),
+    ('静安区', '310106', '021'),
+    ('广东省', '440000', ''),
+    ('广州市', '440100', '020'),
+    ('越秀区', '440104', '020'),
+    ('成都市', '510100', '028'),
+    ('锦江区', '510104', '028'),
+]
+
+CHAT_REPLY = ('根据您的描述，建议注意休息、多饮水，并密切观察体温变化。如果症状持续超过三天或出现呼吸困难、'
+              '胸痛等情况，请及时前往医院呼吸内科或急诊科就诊。')
+
+DIAGNOSIS_REPLY = json.dumps({
+    'urgency_level': '中',
+    'possible_diseases': [{'name': '上呼吸道感染', 'confidence': 0.6}, {'name': '流感', 'confidence': 0.3}],
+    'recommended_departments': ['呼吸内科', '内科'],
+    'analysis': '症状符合上呼吸道感染的常见表现，需结合体温与病程进一步判断。',
+    'recommendations': {
+        'immediate_actions': ['多饮水', '监测体温'],
+        'lifestyle_advice': ['保证睡眠', '清淡饮食'],
+        'when_to_see_doctor': ['高热不退超过三天', '出现呼吸困难'],
+        'prevention_tips': ['勤洗手', '佩戴口罩'],
+    },
+}, ensure_ascii=False)
+
+
+class StubConfig:
+    def __init__(self, token_rate=50.0, first_token_latency=0.3, chars_per_token=2, model_latency=None,
+                 weather_latency=0.0):
+        self.token_rate = token_rate
+        self.first_token_latency = first_token_latency
+        self.chars_per_token = chars_per_token
+        # 按模型名覆盖首包延迟，用于模拟不同档位（如 qwen-turbo 快、qwen-max 慢）
+        self.model_latency = model_latency or {}
+        self.weather_latency = weather_latency
+        self.requests = 0
+        self.lock = threading.Lock()
+
+
+def _estimate_tokens(messages):
+    return sum(len(str(m.get('content') or '')) for m in messages) // 2 + 1
+
+
+def _parse_model_latency(text):
+    result = {}
+    for item in (text or '').split(','):
+        if '=' in item:
+            model, seconds = item.split('=', 1)
+            result[model.strip()] = float(seconds)
+    return result
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    server_version = 'MedicalAIStub/1.0'
+
+    def log_message(self, format, *args):
+        pass
+
+    @property
+    def config(self):
+        return self.server.stub_config
+
+    def _send_json(self, payload, status=200):
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path == '/v3/weather/weatherInfo':
+            city = parse_qs(url.query).get('city', [''])[0]
+            if not city:
+                return self._send_json({'status': '0', 'info': 'INVALID_PARAMS'})
+            if self.config.weather_latency:
+                time.sleep(self.config.weather_latency)
+            return self._send_json({'status': '1', 'info': 'OK', 'lives': [
+                {'adcode': city, 'weather': '晴', 'temperature': '24', 'humidity': '40'}]})
+        if url.path == '/adcode.csv':
+            body = '\n'.join(','.join(row) for row in ADCODE_ROWS).encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/csv; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+        self._send_json({'code': 'NotFound', 'message': self.path}, status=404)
+
+    def do_POST(self):
+        if urlparse(self.path).path != GENERATION_PATH:
+            return self._send_json({'code': 'NotFound', 'message': self.path}, status=404)
+        length = int(self.headers.get('Content-Length') or 0)
+        request = json.loads(self.rfile.read(length) or b'{}')
+        with self.config.lock:
+            self.config.requests += 1
+
+        model = request.get('model', '')
+        messages = request.get('input', {}).get('messages', [])
+        parameters = request.get('parameters', {})
+        stream = self.headers.get('X-DashScope-SSE') == 'enable' or 'text/event-stream' in self.headers.get('Accept', '')
+        incremental = bool(parameters.get('incremental_output'))
+        first_token_latency = self.config.model_latency.get(model, self.config.first_token_latency)
+
+        system_prompt = messages[0].get('content', '') if messages else ''
+        last_user = next((m.get('content', '') for m in reversed(messages) if m.get('role') == 'user'), '')
+        has_tool_result = any(m.get('role') == 'tool' for m in messages)
+        tool_calls = None
+        if parameters.get('tools') and '天气' in last_user and not has_tool_result:
+            locations = [row[0] for row in ADCODE_ROWS[1:] if row[0] in last_user] or ['海淀区']
+            tool_calls = [{'type': 'function', 'id': f'call_{uuid.uuid4().hex[:8]}',
+                           'function': {'name': 'amap_weather',
+                                        'arguments': json.dumps({'location': location}, ensure_ascii=False)}}
+                          for location in locations]
+            text = ''
+        elif '诊断' in system_prompt:
+            text = DIAGNOSIS_REPLY
+        else:
+            text = CHAT_REPLY
+
+        input_tokens = _estimate_tokens(messages)
+        time.sleep(first_token_latency)
+        if not stream:
+            time.sleep(len(text) / self.config.chars_per_token / self.config.token_rate)
+            return self._send_json(self._payload(text, tool_calls, 'stop', input_tokens, len(text)))
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream;charset=UTF-8')
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        step = self.config.chars_per_token
+        delay = 1.0 / self.config.token_rate if self.config.token_rate > 0 else 0
+        if tool_calls:
+            self._send_event(1, self._payload('', tool_calls, 'tool_calls', input_tokens, 10))
+        else:
+            event_id = 0
+            for end in range(step, len(text) + step, step):
+                event_id += 1
+                chunk = text[end - step:end] if incremental else text[:end]
+                finish = 'stop' if end >= len(text) else 'null'
+                self._send_event(event_id, self._payload(chunk, None, finish, input_tokens, min(end, len(text)) // step))
+                if delay:
+                    time.sleep(delay)
+        self.close_connection = True
+
+    def _payload(self, content, tool_calls, finish_reason, input_tokens, output_tokens):
+        message = {'role': 'assistant', 'content': content}
+        if tool_calls:
+            message['tool_calls'] = tool_calls
+        return {
+            'output': {'choices': [{'finish_reason': finish_reason, 'message': message}]},
+            'usage': {'input_tokens': input_tokens, 'output_tokens': output_tokens,
+                      'total_tokens': input_tokens + output_tokens},
+            'request_id': uuid.uuid4().hex,
+        }
+
+    def _send_event(self, event_id, payload):
+        data = json.dumps(payload, ensure_ascii=False)
+        self.wfile.write(f'id:{event_id}\nevent:result\n:HTTP_STATUS/200\ndata:{data}\n\n'.encode('utf-8'))
+        self.wfile.flush()
+
+
+def start_stub_server(host='127.0.0.1', port=0, **config):
+    """在后台线程启动桩服务，返回 (server, base_url)"""
+    server = ThreadingHTTPServer((host, port), StubHandler)
+    server.daemon_threads = True
+    server.stub_config = StubConfig(**config)
+    thread = threading.Thread(target=server.serve_forever, name='stub-server', daemon=True)
+    thread.start()
+    return server, f'http://{host}:{server.server_address[1]}'
+
+
+def stub_environment(base_url):
+    """让应用指向桩服务所需的环境变量"""
+    return {
+        'DASHSCOPE_HTTP_BASE_URL': f'{base_url}/api/v1',
+        'DASHSCOPE_API_KEY': 'sk-stub',
+        'AMAP_WEATHER_URL': f'{base_url}/v3/weather/weatherInfo',
+        'AMAP_ADCODE_URL': f'{base_url}/adcode.csv',
+        'WEATHER_API': 'stub-key',
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--token-rate', type=float, default=50.0, help='每秒输出的 token 数')
+    parser.add_argument('--first-token-latency', type=float, default=0.3, help='首包延迟（秒）')
+    parser.add_argument('--model-latency', default='', help='按模型覆盖首包延迟，如 qwen-turbo=0.1,qwen-max=1.2')
+    parser.add_argument('--weather-latency', type=float, default=0.0, help='天气接口响应延迟（秒）')
+    args = parser.parse_args(argv)
+    server, base_url = start_stub_server(args.host, args.port, token_rate=args.token_rate,
+                                         first_token_latency=args.first_token_latency,
+                                         model_latency=_parse_model_latency(args.model_latency),
+                                         weather_latency=args.weather_latency)
+    print(f'stub server listening on {base_url}')
+    for key, value in stub_environment(base_url).items():
+        print(f'export {key}={value}')
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
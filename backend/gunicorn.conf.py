@@ -0,0 +1,26 @@
+"""gunicorn 配置（在 backend 目录下运行）：
+
+    gunicorn -c gunicorn.conf.py 'src.main:create_app()'
+
+默认开启 preload：应用在主进程中创建一次，warm_up 构建的只读索引（急诊医院列表、医院专科集合、
+天气工具城市编码表）与已导入的模块由 fork 出的 worker 写时复制共享，worker 启动无需重复导入与加载。
+GUNICORN_PRELOAD=0 时每个 worker 各自创建应用，索引在首次请求时按需构建。
+"""
+import multiprocessing
+import os
+
+bind = os.environ.get('GUNICORN_BIND', f"0.0.0.0:{os.environ.get('PORT', '5000')}")
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1))
+# 大模型与天气调用以等待 I/O 为主，每个 worker 用多线程处理并发请求
+worker_class = 'gthread'
+threads = int(os.environ.get('GUNICORN_THREADS', '4'))
+# 大模型流式响应可能持续较长时间
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', '120'))
+preload_app = os.environ.get('GUNICORN_PRELOAD', '1') != '0'
+
+
+def when_ready(server):
+    # 主进程已加载应用、尚未 fork worker
+    if preload_app:
+        from src.main import warm_up
+        warm_up(server.app.wsgi())
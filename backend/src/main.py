@@ -1,68 +1,210 @@
+import gc
 import os
 import sys
+import time
 # DON'T CHANGE THIS !!!
 sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
 
-from flask import Flask, send_from_directory
-from flask_cors import CORS
-from src.models.user import db
-from src.routes.user import user_bp
-from src.routes.symptoms import symptoms_bp
-from src.routes.hospitals import hospitals_bp
-from src.routes.ai_assistant import ai_bp
-
-app = Flask(__name__, static_folder=os.path.join(os.path.dirname(__file__), 'static'))
-app.config['SECRET_KEY'] = 'medical_ai_app_secret_key_2024'
-
-# Enable CORS for all routes
-CORS(app, origins="*")
-
-# Database configuration
-app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{os.path.join(os.path.dirname(__file__), 'database', 'app.db')}"
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-db.init_app(app)
-
-# Import all models to ensure they are registered
-from src.models.user import User
-from src.models.hospital import Hospital, Department, SearchHistory
-
-with app.app_context():
-    db.create_all()
-
-# Register blueprints
-app.register_blueprint(user_bp, url_prefix='/api')
-app.register_blueprint(symptoms_bp, url_prefix='/api')
-app.register_blueprint(hospitals_bp, url_prefix='/api')
-app.register_blueprint(ai_bp, url_prefix='/api')
-
-@app.route('/', defaults={'path': ''})
-@app.route('/<path:path>')
-def serve(path):
-    static_folder_path = app.static_folder
-    if static_folder_path is None:
-        return "Static folder not configured", 404
-
-    if path != "" and os.path.exists(os.path.join(static_folder_path, path)):
-        return send_from_directory(static_folder_path, path)
-    else:
-        index_path = os.path.join(static_folder_path, 'index.html')
-        if os.path.exists(index_path):
-            return send_from_directory(static_folder_path, 'index.html')
-        else:
-            return "index.html not found", 404
-
-@app.route('/health')
-def health_check():
-    return {"status": "healthy", "service": "medical_ai_backend"}
-
-@app.route('/test')
-def test_route():
-    print("DEBUG: Test route accessed.")
-    return {"status": "test_successful", "message": "This is a test route."}
+from src.utils.log import configure_logging, get_logger
+
+logger = get_logger('main')
+
+
+def create_app(config=None):
+    """应用工厂：导入本模块不做任何初始化，gunicorn worker 与测试各自按需创建应用。
+
+    重依赖（dashscope、pandas、geopy）与天气工具的城市编码表都在首次使用时才加载，
+    preload 模式下由 warm_up 在主进程提前构建。
+    """
+    # 日志需在导入各路由模块之前初始化，以便捕获模块加载阶段的告警
+    configure_logging()
+
+    import click
+    from flask import Flask
+    from flask_cors import CORS
+    from src.models.user import db
+    from src.routes.user import user_bp
+    from src.routes.symptoms import symptoms_bp
+    from src.routes.hospitals import hospitals_bp
+    from src.routes.ai_assistant import ai_bp
+    from src.routes.admin import admin_bp
+    from src.routes.triage import triage_bp
+    from src.services import usage
+    from src.utils import compression, metrics, profiling
+    from src.utils.json_provider import FastJSONProvider
+    from src.utils.schema import add_missing_columns, rebuild_changed_unique_constraints
+    from src.utils.static_assets import StaticManifest, serve_asset
+
+    app = Flask(__name__, static_folder=os.path.join(os.path.dirname(__file__), 'static'))
+    app.config['SECRET_KEY'] = 'medical_ai_app_secret_key_2024'
+    # 使用 orjson 加速所有 jsonify / request.get_json
+    app.json = FastJSONProvider(app)
+    # 管理接口（剖析结果下载等）令牌，未设置时管理接口全部拒绝访问
+    app.config['ADMIN_TOKEN'] = os.environ.get('ADMIN_TOKEN', '')
+
+    # Enable CORS for all routes
+    CORS(app, origins="*")
+
+    # Database configuration
+    app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get(
+        'DATABASE_URL', f"sqlite:///{os.path.join(os.path.dirname(__file__), 'database', 'app.db')}")
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    if config:
+        app.config.update(config)
+    db.init_app(app)
+
+    # Import all models to ensure they are registered
+    from src.models.user import User
+    from src.models.hospital import Hospital, Department, SearchHistory
+    from src.models.conversation import Conversation, ConversationTurn
+    from src.models.usage import LLMClientUsage, LLMUsageRollup
+    from src.models.job import AIJob
+
+    with app.app_context():
+        db.create_all()
+        # create_all 不修改已有表：补齐后来新增的列（如医院的行政区划编码）
+        added = add_missing_columns(db.engine, Hospital)
+        # 旧库刚补上行政区划编码列时立即按地址回填，城市/区县筛选不必等人工执行 backfill-hospital-regions
+        if any(column.endswith('_adcode') for column in added):
+            matched, total = backfill_hospital_regions()
+            logger.info("Backfilled hospital regions: %d of %d hospitals matched", matched, total)
+        # 幂等键改为按客户端区分：旧库 ai_jobs 上的全局唯一约束需要重建
+        rebuild_changed_unique_constraints(db.engine, AIJob)
+
+    # 请求与数据库指标中间件
+    metrics.init_app(app, db)
+    # 大模型 token 用量按请求路由与客户端归属，并定期写入汇总表
+    usage.init_app(app)
+    # 按需请求剖析（X-Profile 请求头或抽样率触发）
+    profiling.init_app(app)
+    # 按 Accept-Encoding 协商压缩响应（小响应跳过，流式响应逐块压缩）
+    compression.init_app(app)
+
+    # Register blueprints
+    app.register_blueprint(user_bp, url_prefix='/api')
+    app.register_blueprint(symptoms_bp, url_prefix='/api')
+    app.register_blueprint(hospitals_bp, url_prefix='/api')
+    app.register_blueprint(ai_bp, url_prefix='/api')
+    app.register_blueprint(admin_bp, url_prefix='/api')
+    app.register_blueprint(triage_bp, url_prefix='/api')
+
+    # 启动时扫描一次静态目录，之后的 SPA 路由只查内存清单
+    static_manifest = StaticManifest(app.static_folder)
+
+    @app.route('/', defaults={'path': ''})
+    @app.route('/<path:path>')
+    def serve(path):
+        if app.static_folder is None:
+            return "Static folder not configured", 404
+
+        asset = static_manifest.get(path) if path != "" else None
+        if asset is not None:
+            return serve_asset(asset)
+        if static_manifest.index is not None:
+            return serve_asset(static_manifest.index)
+        return "index.html not found", 404
+
+    @app.route('/health')
+    def health_check():
+        return {"status": "healthy", "service": "medical_ai_backend"}
+
+    @app.route('/metrics')
+    def metrics_endpoint():
+        return metrics.metrics_response()
+
+    @app.route('/test')
+    def test_route():
+        logger.debug("Test route accessed.")
+        return {"status": "test_successful", "message": "This is a test route."}
+
+    @app.cli.command('export-hospital-directory')
+    def export_hospital_directory_command():
+        """导出内存映射的医院目录文件（HOSPITAL_DIRECTORY_PATH），原子替换旧版本"""
+        from src.services.hospital_directory import HOSPITAL_DIRECTORY_PATH, export_directory
+        version, count = export_directory()
+        print(f"hospital directory v{version}: {count} hospitals -> {HOSPITAL_DIRECTORY_PATH}")
+
+    @app.cli.command('export-hospital-shards')
+    def export_hospital_shards_command():
+        """按省导出医院分片（HOSPITAL_SHARD_DIR），最后原子替换分片清单"""
+        from src.services.hospital_shards import HOSPITAL_SHARD_DIR, export_shards
+        version, counts = export_shards()
+        print(f"hospital shards v{version}: {len(counts)} shards, {sum(counts.values())} hospitals -> {HOSPITAL_SHARD_DIR}")
+
+    @app.cli.command('backfill-hospital-regions')
+    @click.option('--all', 'overwrite', is_flag=True, help='重新匹配所有医院（默认只处理尚未匹配的）')
+    def backfill_hospital_regions_command(overwrite):
+        """按地址为医院匹配省/市/区县编码"""
+        matched, total = backfill_hospital_regions(overwrite)
+        print(f"hospital regions: {matched} of {total} hospitals matched")
+
+    return app
+
+
+def backfill_hospital_regions(overwrite=False):
+    """按地址为医院匹配省/市/区县编码并提交（默认只处理尚未匹配的医院），返回 (匹配数, 处理的医院数)；
+    需在应用上下文中调用"""
+    from src.models.hospital import Hospital
+    from src.models.user import db
+    from src.services.regions import assign_regions
+    query = Hospital.query if overwrite else Hospital.query.filter(Hospital.province_adcode.is_(None))
+    hospitals = query.order_by(Hospital.id).all()
+    matched = assign_regions(hospitals, overwrite=overwrite)
+    db.session.commit()
+    return matched, len(hospitals)
+
+
+def warm_up(app, freeze=True):
+    """构建只读的索引与知识库，并导入首次请求才会用到的重依赖。
+
+    gunicorn preload 模式下在主进程 fork 之前调用（见 gunicorn.conf.py）：构建好的对象由各 worker
+    写时复制共享。随后关闭主进程持有的数据库连接（SQLite 连接不能跨进程使用），
+    并以 gc.freeze() 把现有对象移出 GC 追踪，避免 worker 中的垃圾回收改写引用计数所在页面、破坏共享。
+    """
+    start = time.perf_counter()
+    import dashscope
+    import geopy.distance
+    from src.models.hospital import Hospital, get_data_version
+    from src.models.user import db
+    from src.routes.ai_assistant import amap_weather_tool
+    from src.routes.hospitals import hospital_specialties
+    from src.routes.symptoms import semantic_index
+    from src.services.emergency import nearest_emergency_rooms
+    from src.services.hospital_directory import hospital_directory
+    from src.services.hospital_shards import hospital_shards
+    from src.services.regions import region_matcher
+
+    amap_weather_tool.load_city_data()
+    region_matcher()
+    semantic_index()
+    with app.app_context():
+        # 急诊医院列表与各医院的专科集合均按数据版本缓存，数据变更后 worker 会自行重建
+        nearest_emergency_rooms()
+        version = get_data_version()
+        for hospital in Hospital.query.all():
+            hospital_specialties(hospital, version)
+        # 映射医院目录文件：worker 继承映射，所有进程共享同一份页缓存
+        hospital_directory.current(version)
+        hospital_shards.current(version)
+        db.session.remove()
+        db.engine.dispose()
+    if freeze:
+        gc.collect()
+        gc.freeze()
+    logger.info("Warm-up finished in %.0f ms (gc frozen objects: %d)",
+                (time.perf_counter() - start) * 1000, gc.get_freeze_count())
+
+
+def __getattr__(name):
+    # 兼容 `src.main:app` 与 `from src.main import app`：首次访问时才创建应用
+    if name == 'app':
+        global app
+        app = create_app()
+        return app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 
 if __name__ == '__main__':
-    import os
     port = int(os.environ.get('PORT', 5000))
     debug = os.environ.get('FLASK_ENV') == 'development'
-    app.run(host='0.0.0.0', port=port, debug=debug)
-
+    create_app().run(host='0.0.0.0', port=port, debug=debug)
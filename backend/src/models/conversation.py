@@ -0,0 +1,344 @@
+"""AI 对话会话的服务端存储。
+
+客户端只需携带 conversation_id，历史对话保存在 SQLite（conversations / conversation_turns），
+热会话同时缓存在进程内 LRU 中。多个 worker 进程可能交替处理同一会话：使用缓存前先按主键读取数据库中的
+turn_count / summary_upto，与缓存不一致（其他进程追加了轮次或更新了摘要）时重新加载。每次调用模型时按 CHAT_HISTORY_TOKEN_BUDGET 组装历史：
+从最近一轮往前尽量保留原文（尾部截断），放不下的较早轮次并入滚动摘要。摘要是抽取式的
+（取每轮问答的首句），随会话增长增量更新并持久化，因此每轮请求的 prompt 大小保持稳定。
+会话只在客户端请求时创建；最后一次活动超过 CONVERSATION_TTL 秒的会话在定期清理时连同轮次一起删除。
+"""
+import datetime
+import os
+import re
+import threading
+import time
+import uuid
+from collections import OrderedDict, namedtuple
+
+from sqlalchemy.exc import IntegrityError
+
+from src.models.user import db
+from src.utils.log import get_logger
+from src.utils.metrics import REGISTRY, record_cache
+
+logger = get_logger('conversation')
+
+# 历史对话（摘要 + 原文轮次）的 token 预算
+CHAT_HISTORY_TOKEN_BUDGET = int(os.environ.get('CHAT_HISTORY_TOKEN_BUDGET', '1500'))
+# 滚动摘要本身的 token 上限，超出时丢弃最早的摘要行
+CHAT_SUMMARY_TOKEN_BUDGET = int(os.environ.get('CHAT_SUMMARY_TOKEN_BUDGET', '300'))
+# 进程内缓存的会话数
+CONVERSATION_CACHE_SIZE = int(os.environ.get('CONVERSATION_CACHE_SIZE', '256'))
+# 会话在最后一次活动后保留的时长（秒），以及两次清理的最小间隔（秒）
+CONVERSATION_TTL = float(os.environ.get('CONVERSATION_TTL', str(7 * 24 * 3600)))
+CONVERSATION_SWEEP_INTERVAL = float(os.environ.get('CONVERSATION_SWEEP_INTERVAL', '300'))
+# 摘要中每条问/答保留的最大字符数
+SUMMARY_LINE_CHARS = 60
+
+CONVERSATION_CACHE_STALE = REGISTRY.counter(
+    'conversation_cache_stale_total', 'Cached conversations reloaded because another process changed them')
+CHAT_HISTORY_TOKENS = REGISTRY.histogram(
+    'chat_history_tokens', 'Estimated prompt tokens spent on conversation history', ('part',),
+    buckets=(50, 100, 250, 500, 1000, 2000, 4000, 8000))
+
+_CJK = re.compile(r'[\u3000-\u303f\u3400-\u4dbf\u4e00-\u9fff\uff00-\uffef]')
+_SENTENCE_END = re.compile(r'[。！？!?\n]')
+
+# 组装好的历史：summary 为摘要文本（可能为空），messages 为按时间顺序的 user/assistant 消息
+HistoryWindow = namedtuple('HistoryWindow', ['summary', 'messages', 'tokens'])
+
+
+def estimate_tokens(text):
+    """粗略估算 token 数：中文约每字 1 个 token，其余字符约每 4 个 1 个 token"""
+    if not text:
+        return 0
+    cjk = len(_CJK.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+class Conversation(db.Model):
+    __tablename__ = 'conversations'
+
+    id = db.Column(db.String(32), primary_key=True)
+    summary = db.Column(db.Text, default='')
+    # 已并入摘要的最后一轮序号，0 表示尚无摘要
+    summary_upto = db.Column(db.Integer, default=0, nullable=False)
+    turn_count = db.Column(db.Integer, default=0, nullable=False)
+    created_at = db.Column(db.DateTime, default=db.func.current_timestamp())
+    updated_at = db.Column(db.DateTime, default=db.func.current_timestamp())
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'summary': self.summary or '',
+            'turn_count': self.turn_count,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None
+        }
+
+
+class ConversationTurn(db.Model):
+    __tablename__ = 'conversation_turns'
+    __table_args__ = (db.UniqueConstraint('conversation_id', 'seq'),)
+
+    id = db.Column(db.Integer, primary_key=True)
+    conversation_id = db.Column(db.String(32), db.ForeignKey('conversations.id'), nullable=False, index=True)
+    seq = db.Column(db.Integer, nullable=False)
+    user_message = db.Column(db.Text, nullable=False)
+    ai_message = db.Column(db.Text, nullable=False)
+    tokens = db.Column(db.Integer, nullable=False)
+    created_at = db.Column(db.DateTime, default=db.func.current_timestamp())
+
+    def to_dict(self):
+        return {
+            'seq': self.seq,
+            'user': self.user_message,
+            'ai': self.ai_message,
+            'created_at': self.created_at.isoformat() if self.created_at else None
+        }
+
+
+def _first_sentence(text, limit=SUMMARY_LINE_CHARS):
+    text = ' '.join((text or '').split())
+    match = _SENTENCE_END.search(text)
+    if match:
+        text = text[:match.end()]
+    return text if len(text) <= limit else text[:limit] + '…'
+
+
+def summarize_turn(user_message, ai_message):
+    """单轮问答的抽取式摘要行"""
+    return f'用户：{_first_sentence(user_message)} 医生：{_first_sentence(ai_message)}'
+
+
+def _trim_summary(lines, budget=CHAT_SUMMARY_TOKEN_BUDGET):
+    """从最早的摘要行开始丢弃，直到不超过 budget"""
+    total = sum(estimate_tokens(line) for line in lines)
+    start = 0
+    while start < len(lines) and total > budget:
+        total -= estimate_tokens(lines[start])
+        start += 1
+    return lines[start:]
+
+
+def _split_window(turns, budget):
+    """turns 为 (user, ai, tokens) 列表；返回能放入预算的尾部起始下标"""
+    used = 0
+    start = len(turns)
+    while start > 0 and used + turns[start - 1][2] <= budget:
+        used += turns[start - 1][2]
+        start -= 1
+    return start
+
+
+def _window_messages(turns):
+    messages = []
+    for user_message, ai_message, _ in turns:
+        messages.append({'role': 'user', 'content': user_message})
+        messages.append({'role': 'assistant', 'content': ai_message})
+    return messages
+
+
+def history_from_context(history, budget=None):
+    """兼容旧客户端：对请求体中的 context['history'] 同样应用 token 预算（摘要不缓存）"""
+    budget = CHAT_HISTORY_TOKEN_BUDGET if budget is None else budget
+    turns = []
+    for item in history or []:
+        user_message, ai_message = item.get('user', ''), item.get('ai', '')
+        turns.append((user_message, ai_message, estimate_tokens(user_message) + estimate_tokens(ai_message)))
+    start = _split_window(turns, budget)
+    summary = '\n'.join(_trim_summary([summarize_turn(u, a) for u, a, _ in turns[:start]]))
+    window = turns[start:]
+    while window and estimate_tokens(summary) + sum(t[2] for t in window) > budget:
+        window = window[1:]
+    return _record_window(summary, window)
+
+
+def _record_window(summary, window):
+    summary_tokens = estimate_tokens(summary)
+    turn_tokens = sum(t[2] for t in window)
+    CHAT_HISTORY_TOKENS.observe(summary_tokens, part='summary')
+    CHAT_HISTORY_TOKENS.observe(turn_tokens, part='turns')
+    return HistoryWindow(summary, _window_messages(window), summary_tokens + turn_tokens)
+
+
+class _CachedConversation:
+    """缓存中的会话状态：摘要 + 尚未并入摘要的轮次"""
+
+    __slots__ = ('summary_lines', 'summary_upto', 'turn_count', 'turns', 'lock')
+
+    def __init__(self, summary, summary_upto, turn_count, turns):
+        self.summary_lines = summary.split('\n') if summary else []
+        self.summary_upto = summary_upto
+        self.turn_count = turn_count
+        # (seq, user, ai, tokens)
+        self.turns = turns
+        self.lock = threading.Lock()
+
+
+class ConversationStore:
+    """SQLite 持久化 + 进程内 LRU 的会话存储，需在应用上下文中使用"""
+
+    def __init__(self, capacity=CONVERSATION_CACHE_SIZE, budget=CHAT_HISTORY_TOKEN_BUDGET, ttl=CONVERSATION_TTL):
+        self.capacity = capacity
+        self.budget = budget
+        self.ttl = ttl
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self._swept_at = float('-inf')
+
+    def _cache_get(self, conversation_id):
+        with self._lock:
+            state = self._cache.get(conversation_id)
+            if state is not None:
+                self._cache.move_to_end(conversation_id)
+        record_cache('conversation', state is not None)
+        return state
+
+    def _cache_put(self, conversation_id, state):
+        with self._lock:
+            self._cache[conversation_id] = state
+            self._cache.move_to_end(conversation_id)
+            while len(self._cache) > self.capacity:
+                self._cache.popitem(last=False)
+
+    def _load(self, conversation_id):
+        state = self._cache_get(conversation_id)
+        if state is not None:
+            # 只读两个计数列，与缓存一致时不必重新读取轮次
+            current = (db.session.query(Conversation.turn_count, Conversation.summary_upto)
+                       .filter(Conversation.id == conversation_id).first())
+            if current is None:
+                self._evict(conversation_id)
+                return None
+            if tuple(current) == (state.turn_count, state.summary_upto):
+                return state
+            CONVERSATION_CACHE_STALE.inc()
+        conversation = db.session.get(Conversation, conversation_id, populate_existing=True)
+        if conversation is None:
+            return None
+        rows = (ConversationTurn.query
+                .filter(ConversationTurn.conversation_id == conversation_id,
+                        ConversationTurn.seq > conversation.summary_upto)
+                .order_by(ConversationTurn.seq).all())
+        state = _CachedConversation(conversation.summary or '', conversation.summary_upto, conversation.turn_count,
+                                    [(r.seq, r.user_message, r.ai_message, r.tokens) for r in rows])
+        self._cache_put(conversation_id, state)
+        return state
+
+    def create(self):
+        self.maybe_sweep()
+        conversation_id = uuid.uuid4().hex
+        now = datetime.datetime.utcnow()
+        db.session.add(Conversation(id=conversation_id, summary='', summary_upto=0, turn_count=0,
+                                    created_at=now, updated_at=now))
+        db.session.commit()
+        self._cache_put(conversation_id, _CachedConversation('', 0, 0, []))
+        return conversation_id
+
+    def exists(self, conversation_id):
+        return self._load(conversation_id) is not None
+
+    def history(self, conversation_id):
+        """按 token 预算组装历史；较早轮次滚入摘要并持久化，会话不存在时返回 None"""
+        state = self._load(conversation_id)
+        if state is None:
+            return None
+        with state.lock:
+            summary_budget = min(CHAT_SUMMARY_TOKEN_BUDGET, self.budget // 2)
+            turns = [(u, a, t) for _, u, a, t in state.turns]
+            start = _split_window(turns, self.budget - summary_budget)
+            if start:
+                self._roll_summary(conversation_id, state, start, summary_budget)
+            summary = '\n'.join(state.summary_lines)
+            window = [(u, a, t) for _, u, a, t in state.turns]
+        return _record_window(summary, window)
+
+    def _roll_summary(self, conversation_id, state, count, summary_budget):
+        rolled = state.turns[:count]
+        lines = _trim_summary(state.summary_lines + [summarize_turn(u, a) for _, u, a, _ in rolled], summary_budget)
+        # 仅当数据库中的摘要仍是本进程读到的版本时才写入，避免覆盖其他进程更新过的摘要
+        updated = Conversation.query.filter_by(id=conversation_id, summary_upto=state.summary_upto).update(
+            {'summary': '\n'.join(lines), 'summary_upto': rolled[-1][0]})
+        db.session.commit()
+        if not updated:
+            # 摘要已被其他进程滚动：本次仍用内存中的结果组装历史，缓存丢弃，下次请求重新加载
+            self._evict(conversation_id)
+        state.summary_lines = lines
+        state.summary_upto = rolled[-1][0]
+        state.turns = state.turns[count:]
+
+    def append_turn(self, conversation_id, user_message, ai_message):
+        state = self._load(conversation_id)
+        if state is None:
+            raise KeyError(conversation_id)
+        tokens = estimate_tokens(user_message) + estimate_tokens(ai_message)
+        with state.lock:
+            seq = state.turn_count + 1
+            try:
+                self._insert_turn(conversation_id, seq, user_message, ai_message, tokens)
+            except IntegrityError:
+                # 其他进程已写入同一序号：本进程缓存已过期，丢弃后按数据库状态重试一次
+                db.session.rollback()
+                self._evict(conversation_id)
+                return self.append_turn(conversation_id, user_message, ai_message)
+            state.turn_count = seq
+            state.turns.append((seq, user_message, ai_message, tokens))
+        return seq
+
+    @staticmethod
+    def _insert_turn(conversation_id, seq, user_message, ai_message, tokens):
+        db.session.add(ConversationTurn(conversation_id=conversation_id, seq=seq, user_message=user_message,
+                                        ai_message=ai_message, tokens=tokens))
+        Conversation.query.filter_by(id=conversation_id).update(
+            {'turn_count': seq, 'updated_at': datetime.datetime.utcnow()})
+        db.session.commit()
+
+    def _evict(self, conversation_id):
+        with self._lock:
+            self._cache.pop(conversation_id, None)
+
+    def turns(self, conversation_id):
+        return (ConversationTurn.query.filter_by(conversation_id=conversation_id)
+                .order_by(ConversationTurn.seq).all())
+
+    def delete(self, conversation_id):
+        self._evict(conversation_id)
+        ConversationTurn.query.filter_by(conversation_id=conversation_id).delete()
+        deleted = Conversation.query.filter_by(id=conversation_id).delete()
+        db.session.commit()
+        return bool(deleted)
+
+    # --- 清理 ---
+    def maybe_sweep(self):
+        now = time.monotonic()
+        if now - self._swept_at < CONVERSATION_SWEEP_INTERVAL:
+            return
+        with self._lock:
+            if now - self._swept_at < CONVERSATION_SWEEP_INTERVAL:
+                return
+            self._swept_at = now
+        try:
+            self.sweep()
+        except Exception:
+            db.session.rollback()
+            logger.exception("Conversation sweep failed")
+
+    def sweep(self):
+        """删除最后一次活动早于 ttl 的会话及其轮次，返回删除的会话数"""
+        cutoff = datetime.datetime.utcnow() - datetime.timedelta(seconds=self.ttl)
+        expired = [conversation_id for (conversation_id,) in
+                   db.session.query(Conversation.id).filter(Conversation.updated_at < cutoff)]
+        if not expired:
+            return 0
+        ConversationTurn.query.filter(ConversationTurn.conversation_id.in_(expired)).delete(synchronize_session=False)
+        Conversation.query.filter(Conversation.id.in_(expired)).delete(synchronize_session=False)
+        db.session.commit()
+        with self._lock:
+            for conversation_id in expired:
+                self._cache.pop(conversation_id, None)
+        logger.info("Conversation sweep: %d expired", len(expired))
+        return len(expired)
+
+
+conversation_store = ConversationStore()
@@ -1,5 +1,19 @@
+import datetime
+import itertools
+import os
+import time
+
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event
+from sqlalchemy.orm import Session
 from src.models.user import db
+from src.utils.json_provider import dumps_bytes
+from src.utils.metrics import record_cache
+
+# 医院/科室数据的版本名，任何增删改都会使其版本号加一
+HOSPITAL_DATA = 'hospitals'
+# 各进程缓存版本号的时长（秒），在此时间窗内其他进程的写入可能尚不可见
+DATA_VERSION_TTL = float(os.environ.get('DATA_VERSION_TTL', '1.0'))
 
 class Hospital(db.Model):
     __tablename__ = 'hospitals'
@@ -15,6 +29,10 @@ class Hospital(db.Model):
     specialties = db.Column(db.Text)  # JSON string of specialties
     rating = db.Column(db.Float, default=0.0)
     created_at = db.Column(db.DateTime, default=db.func.current_timestamp())
+    # 按地址匹配的高德行政区划编码（省/市/区县），导入时填写，城市筛选走索引等值查询
+    province_adcode = db.Column(db.Integer, index=True)
+    city_adcode = db.Column(db.Integer, index=True)
+    district_adcode = db.Column(db.Integer, index=True)
     
     def to_dict(self):
         return {
@@ -28,7 +46,10 @@ class Hospital(db.Model):
             'website': self.website,
             'specialties': self.specialties,
             'rating': self.rating,
-            'created_at': self.created_at.isoformat() if self.created_at else None
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'province_adcode': self.province_adcode,
+            'city_adcode': self.city_adcode,
+            'district_adcode': self.district_adcode
         }
 
 class Department(db.Model):
@@ -71,3 +92,71 @@ class SearchHistory(db.Model):
             'search_time': self.search_time.isoformat() if self.search_time else None
         }
 
+class DataVersion(db.Model):
+    __tablename__ = 'data_versions'
+
+    name = db.Column(db.String(50), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime)
+
+_version_cache = {}
+
+def get_data_version_info(name=HOSPITAL_DATA):
+    """读取 (版本号, 最后修改时间)，进程内缓存 DATA_VERSION_TTL 秒"""
+    now = time.monotonic()
+    cached = _version_cache.get(name)
+    if cached and cached[0] > now:
+        return cached[1]
+    row = db.session.get(DataVersion, name)
+    info = (row.version, row.updated_at) if row else (0, None)
+    _version_cache[name] = (now + DATA_VERSION_TTL, info)
+    return info
+
+def get_data_version(name=HOSPITAL_DATA):
+    """读取数据版本号"""
+    return get_data_version_info(name)[0]
+
+@event.listens_for(Session, 'before_flush')
+def _mark_hospital_changes(session, flush_context, instances):
+    for obj in itertools.chain(session.new, session.dirty, session.deleted):
+        if isinstance(obj, (Hospital, Department)):
+            session.info['hospital_data_changed'] = True
+            return
+
+@event.listens_for(Session, 'after_flush')
+def _bump_hospital_version(session, flush_context):
+    """与数据修改处于同一事务内递增版本号，回滚时版本号一起回滚"""
+    if not session.info.pop('hospital_data_changed', False):
+        return
+    table = DataVersion.__table__
+    connection = session.connection()
+    now = datetime.datetime.utcnow().replace(microsecond=0)
+    result = connection.execute(
+        table.update().where(table.c.name == HOSPITAL_DATA).values(version=table.c.version + 1, updated_at=now))
+    if result.rowcount == 0:
+        connection.execute(table.insert().values(name=HOSPITAL_DATA, version=1, updated_at=now))
+    _version_cache.pop(HOSPITAL_DATA, None)
+
+# --- 预序列化片段缓存 ---
+# 医院与科室的 to_dict() 结果按数据版本缓存为 JSON 字节串，
+# 大列表响应直接拼接这些片段，不必逐行重新构造 dict 并编码。
+_fragment_cache = {}
+
+def _cached_fragment(kind, obj, version):
+    key = (kind, obj.id)
+    cached = _fragment_cache.get(key)
+    if cached is not None and cached[0] == version:
+        record_cache('json_fragment', True)
+        return cached[1]
+    record_cache('json_fragment', False)
+    fragment = dumps_bytes(obj.to_dict())
+    _fragment_cache[key] = (version, fragment)
+    return fragment
+
+def hospital_json(hospital, version=None):
+    """医院 to_dict() 的 JSON 字节串片段"""
+    return _cached_fragment('hospital', hospital, get_data_version() if version is None else version)
+
+def department_json(department, version=None):
+    """科室 to_dict() 的 JSON 字节串片段"""
+    return _cached_fragment('department', department, get_data_version() if version is None else version)
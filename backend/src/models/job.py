@@ -0,0 +1,65 @@
+"""异步 AI 任务。
+
+长耗时的 AI 分析（健康建议、紧急情况的大模型补充说明）以任务形式提交，客户端凭任务 id 轮询或订阅完成通知。
+任务行持久化在 SQLite 中，任一 worker 进程都能查询任务状态；执行由提交任务的进程内线程池完成，
+见 src/services/ai_jobs.py。
+"""
+import json
+
+from src.models.user import db
+
+JOB_QUEUED = 'queued'
+JOB_RUNNING = 'running'
+JOB_DONE = 'done'
+JOB_FAILED = 'failed'
+JOB_FINISHED = (JOB_DONE, JOB_FAILED)
+
+
+class AIJob(db.Model):
+    __tablename__ = 'ai_jobs'
+    __table_args__ = (db.UniqueConstraint('client', 'idempotency_key', name='uq_ai_jobs_client_key'),)
+
+    id = db.Column(db.String(32), primary_key=True)
+    kind = db.Column(db.String(32), nullable=False)
+    status = db.Column(db.String(16), nullable=False, default=JOB_QUEUED, index=True)
+    # 客户端提供的幂等键，按 (client, idempotency_key) 唯一：同一客户端以同一键重复提交返回已有任务，
+    # 不同客户端碰巧使用相同的键互不影响。request_hash 用于发现同一键对应了不同的请求
+    idempotency_key = db.Column(db.String(128))
+    request_hash = db.Column(db.String(64), nullable=False)
+    client = db.Column(db.String(128))
+    payload = db.Column(db.Text, nullable=False)  # JSON
+    result = db.Column(db.Text)  # JSON
+    error = db.Column(db.Text)
+    webhook_url = db.Column(db.String(500))
+    # 每次被领取执行时加一；完成时按领取时的值条件更新，超时后被重新领取的旧执行不会覆盖结果
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    created_at = db.Column(db.DateTime, nullable=False)
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+    # 结果的过期时间，过期后查询返回 404 并被清理
+    expires_at = db.Column(db.DateTime, index=True)
+
+    @property
+    def finished(self):
+        return self.status in JOB_FINISHED
+
+    def to_dict(self):
+        queue_seconds = run_seconds = None
+        if self.started_at:
+            queue_seconds = round((self.started_at - self.created_at).total_seconds(), 3)
+            if self.finished_at:
+                run_seconds = round((self.finished_at - self.started_at).total_seconds(), 3)
+        return {
+            'id': self.id,
+            'kind': self.kind,
+            'status': self.status,
+            'result': json.loads(self.result) if self.result else None,
+            'error': self.error,
+            'attempts': self.attempts,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None,
+            'expires_at': self.expires_at.isoformat() if self.expires_at else None,
+            'queue_seconds': queue_seconds,
+            'run_seconds': run_seconds
+        }
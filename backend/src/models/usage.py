@@ -0,0 +1,47 @@
+"""大模型 token 用量的小时级汇总。
+
+每行对应一个 (小时, 路由, 模型, 调用阶段) 组合，累计调用次数、输入/输出 token 与估算费用。
+写入由 src/services/usage.py 在内存中聚合后批量 upsert，多个进程写同一行时各自累加。
+按客户端配额的计数单独存放在 llm_client_usage，所有 worker 共用同一份计数。
+"""
+from src.models.user import db
+
+
+class LLMUsageRollup(db.Model):
+    __tablename__ = 'llm_usage_rollup'
+    __table_args__ = (db.UniqueConstraint('bucket', 'route', 'model', 'call'),)
+
+    id = db.Column(db.Integer, primary_key=True)
+    # 小时起点（UTC）
+    bucket = db.Column(db.DateTime, nullable=False, index=True)
+    route = db.Column(db.String(128), nullable=False)
+    model = db.Column(db.String(64), nullable=False)
+    call = db.Column(db.String(64), nullable=False)
+    calls = db.Column(db.Integer, default=0, nullable=False)
+    input_tokens = db.Column(db.Integer, default=0, nullable=False)
+    output_tokens = db.Column(db.Integer, default=0, nullable=False)
+    cost = db.Column(db.Float, default=0.0, nullable=False)
+
+    def to_dict(self):
+        return {
+            'bucket': self.bucket.isoformat() if self.bucket else None,
+            'route': self.route,
+            'model': self.model,
+            'call': self.call,
+            'calls': self.calls,
+            'input_tokens': self.input_tokens,
+            'output_tokens': self.output_tokens,
+            'cost': round(self.cost, 6)
+        }
+
+
+class LLMClientUsage(db.Model):
+    """按客户端、配额窗口累计的 token 数；窗口按墙钟对齐，各 worker 对同一窗口累加到同一行"""
+    __tablename__ = 'llm_client_usage'
+    __table_args__ = (db.UniqueConstraint('client', 'window_start'),)
+
+    id = db.Column(db.Integer, primary_key=True)
+    client = db.Column(db.String(128), nullable=False)
+    # 窗口起点（UTC）
+    window_start = db.Column(db.DateTime, nullable=False, index=True)
+    tokens = db.Column(db.Integer, default=0, nullable=False)
@@ -0,0 +1,101 @@
+import datetime
+
+from flask import Blueprint, current_app, jsonify, request, send_file
+from src.services.hospital_directory import export_directory, hospital_directory
+from src.services.hospital_shards import export_shards, hospital_shards
+from src.services.model_router import model_router
+from src.services.usage import USAGE_GROUP_COLUMNS, query_usage, token_quota
+from src.utils.profiling import pstats_summary, take_memory_snapshot
+
+admin_bp = Blueprint('admin', __name__)
+
+def _authorized():
+    """管理接口需携带与 ADMIN_TOKEN 一致的 X-Admin-Token 请求头"""
+    token = current_app.config.get('ADMIN_TOKEN')
+    return bool(token) and request.headers.get('X-Admin-Token') == token
+
+@admin_bp.before_request
+def require_admin_token():
+    if not _authorized():
+        return jsonify({"error": "无权访问管理接口"}), 403
+
+@admin_bp.route('/admin/profiles', methods=['GET'])
+def list_profiles():
+    """列出已保存的剖析结果"""
+    store = current_app.extensions['profile_store']
+    return jsonify({
+        "success": True,
+        "data": store.list()
+    })
+
+@admin_bp.route('/admin/profiles/<name>', methods=['GET'])
+def download_profile(name):
+    """下载剖析结果；对 .pstats 文件传 ?format=text 可直接查看按累计耗时排序的摘要"""
+    store = current_app.extensions['profile_store']
+    path = store.resolve(name)
+    if path is None:
+        return jsonify({"error": "剖析结果不存在"}), 404
+    if name.endswith('.pstats') and request.args.get('format') == 'text':
+        return current_app.response_class(pstats_summary(path), mimetype='text/plain')
+    return send_file(path, as_attachment=True, download_name=name)
+
+@admin_bp.route('/admin/profiles/memory', methods=['POST'])
+def snapshot_memory():
+    """对整个进程做 tracemalloc 快照；首次调用仅开启追踪"""
+    store = current_app.extensions['profile_store']
+    name = take_memory_snapshot(store)
+    if name is None:
+        return jsonify({"success": True, "data": {"tracing_started": True}}), 202
+    return jsonify({"success": True, "data": {"name": name}})
+
+@admin_bp.route('/admin/models', methods=['GET'])
+def model_status():
+    """各模型档位的滚动延迟、错误率与 SLO 状态"""
+    return jsonify({
+        "success": True,
+        "data": {"routing_enabled": model_router.enabled, "tiers": model_router.status()}
+    })
+
+
+@admin_bp.route('/admin/usage', methods=['GET'])
+def usage_report():
+    """大模型 token 用量与费用汇总；?hours=24&group_by=route,model,call（可选 bucket 按小时展开），?client=xxx 查看该客户端配额"""
+    try:
+        hours = float(request.args.get('hours', 24))
+        group_by = tuple(c for c in request.args.get('group_by', ','.join(USAGE_GROUP_COLUMNS)).split(',') if c)
+        if not group_by or any(c not in USAGE_GROUP_COLUMNS + ('bucket',) for c in group_by):
+            return jsonify({"error": "group_by 仅支持 route、model、call、bucket"}), 400
+        since = datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None) - datetime.timedelta(hours=hours)
+        # 汇总表按小时起点存储，包含 since 所在的整个小时
+        since = since.replace(minute=0, second=0, microsecond=0)
+        data = {"since": since.isoformat(), "group_by": list(group_by), "rows": query_usage(since, group_by=group_by)}
+        client = request.args.get('client')
+        if client:
+            data["quota"] = token_quota.status(client) if token_quota.enabled else None
+        return jsonify({"success": True, "data": data})
+    except ValueError as e:
+        return jsonify({"error": f"参数错误: {str(e)}"}), 400
+    except Exception as e:
+        return jsonify({"error": f"查询用量失败: {str(e)}"}), 500
+
+
+@admin_bp.route('/admin/hospital-directory', methods=['POST'])
+def export_hospital_directory():
+    """重新导出内存映射的医院目录文件，各 worker 在下次检查时映射新版本"""
+    try:
+        version, count = export_directory()
+        hospital_directory.reset()
+        return jsonify({"success": True, "data": {"version": version, "hospitals": count}})
+    except Exception as e:
+        return jsonify({"error": f"导出医院目录失败: {str(e)}"}), 500
+
+
+@admin_bp.route('/admin/hospital-shards', methods=['POST'])
+def export_hospital_shards():
+    """按省重新导出医院分片并替换清单，各 worker 在下次检查时加载新版本"""
+    try:
+        version, counts = export_shards()
+        hospital_shards.reset()
+        return jsonify({"success": True, "data": {"version": version, "shards": counts}})
+    except Exception as e:
+        return jsonify({"error": f"导出医院分片失败: {str(e)}"}), 500
@@ -1,11 +1,23 @@
-print("DEBUG: ai_assistant.py loaded successfully.")
-
+import logging
 import os
-from flask import Blueprint, request, jsonify
+import time
+from flask import Blueprint, Response, request, jsonify, stream_with_context
 import json
-import requests
-from dashscope import Generation
-import codecs # 临时导入，用于处理BOM
+import threading
+from src.models.conversation import Conversation, HistoryWindow, conversation_store, history_from_context
+from src.models.user import db
+from src.services.emergency import (EMERGENCY_CHECK_SECONDS, EMERGENCY_CONTACTS, EMERGENCY_RECOMMENDATION,
+                                    detect_emergency, elaboration_prompt, emergency_prestage, nearest_emergency_rooms,
+                                    reported_emergency)
+from src.services.ai_jobs import AI_JOB_SSE_TIMEOUT, JobConflict, job_queue, validate_webhook_url
+from src.services.hedged_diagnosis import HedgedDiagnosis, local_diagnosis
+from src.services.model_router import model_router
+from src.services.regions import load_adcode_rows
+from src.services.tool_engine import TOOL_MAX_ROUNDS, ToolError, ToolRegistry
+from src.services.usage import client_id, quota_exceeded_response, quota_retry_after, record_usage, usage_of
+from src.utils.incremental_json import IncrementalObjectParser, extract_json_object
+from src.utils.log import get_logger, sampled
+from src.utils.metrics import LLM_CALL_SECONDS, LLM_FIRST_TOKEN_SECONDS, REGISTRY
 
 # 以下导入是 Qwen-Agent 工具体系的基础概念，尽管为了解决Flask热重载问题，
 # 我们不再直接依赖其注册机制，而是手动处理工具实例化和调用。
@@ -15,6 +27,15 @@ ai_bp = Blueprint('ai_assistant', __name__)
 
 DASHSCOPE_API_KEY = os.environ.get("DASHSCOPE_API_KEY")
 
+logger = get_logger('ai_assistant')
+
+# 流式诊断中各顶层字段从发起请求到解析完成的耗时
+DIAGNOSIS_FIELD_SECONDS = REGISTRY.histogram(
+    'diagnosis_stream_field_seconds', 'Time from request to each diagnosis field closing in the stream', ('field',))
+
+# 流式分片日志的采样间隔：DEBUG 级别下每 N 个分片记录一次，避免逐分片刷屏
+STREAM_CHUNK_LOG_EVERY = int(os.environ.get('LOG_CHUNK_SAMPLE', '50'))
+
 # --- AmapWeather 工具类定义 ---
 # 这个类定义了一个可被AI助手调用的高德天气查询工具。
 # 它的设计目标是封装对高德天气API的调用逻辑。
@@ -41,36 +62,41 @@ class AmapWeather:
     def __init__(self, cfg=None):
         self.cfg = cfg if cfg is not None else {}
         # 高德天气API的基础URL，其中包含占位符 {city} 和 {key}。
-        self.url = 'https://restapi.amap.com/v3/weather/weatherInfo?city={city}&key={key}'
-        # 导入 pandas：用于读取和处理城市编码数据。
-        # 这里确保 pandas 在运行时可用。
-        import pandas as pd
-        try:
-            # 尝试从阿里云OSS下载高德行政区划编码表。
-            # 这个Excel文件包含了城市名称和对应的adcode，用于精确查询。
-            self.city_df = pd.read_excel('https://modelscope.oss-cn-beijing.aliyuncs.com/resource/agent/AMap_adcode_citycode.xlsx')
-        except Exception as e:
-            # 如果下载或加载失败，打印错误信息，并回退到一个空的DataFrame，以防止程序崩溃。
-            print(f"Error loading city data: {e}. Please ensure you have internet access and pandas is installed correctly.")
-            self.city_df = pd.DataFrame(columns=['中文名', 'adcode']) # Fallback to empty DataFrame
+        # 可通过环境变量 AMAP_WEATHER_URL 指向本地桩服务（见 benchmarks/stub_server.py）。
+        self.url = os.environ.get('AMAP_WEATHER_URL', 'https://restapi.amap.com/v3/weather/weatherInfo') + '?city={city}&key={key}'
+        # 城市编码表在首次查询（或 warm_up）时才加载：pandas 导入与 xlsx 下载都很慢，
+        # 不应由每个进程的启动和不涉及天气的请求承担。
+        self.city_adcodes = None
+        self._load_lock = threading.Lock()
 
         # 获取高德API Key：优先从cfg中获取，其次从环境变量WEATHER_API中获取。
         # 这是一个关键的安全措施，避免将API Key硬编码。
         self.token = self.cfg.get('token', os.environ.get('WEATHER_API', ''))
         if not self.token:
-            print("Warning: WEATHER_API environment variable not set. AmapWeather tool may not function.")
+            logger.warning("WEATHER_API environment variable not set. AmapWeather tool may not function.")
+
+    # 加载城市编码表，转换为 {中文名: adcode} 字典（同名取第一条）；可重复调用，只加载一次。
+    # 编码表由 src.services.regions 统一读取，医院的行政区划匹配使用同一份数据。
+    def load_city_data(self):
+        if self.city_adcodes is not None:
+            return self.city_adcodes
+        with self._load_lock:
+            if self.city_adcodes is None:
+                adcodes = {}
+                for name, adcode in load_adcode_rows():
+                    adcodes.setdefault(name, adcode)
+                self.city_adcodes = adcodes
+        return self.city_adcodes
 
     # 辅助方法：根据城市名称获取其高德行政区划代码 (adcode)。
     # adcode对于精确天气查询至关重要。
     def get_city_adcode(self, city_name):
-        # 在城市DataFrame中过滤，查找匹配中文名的行。
-        filtered_df = self.city_df[self.city_df['中文名'] == city_name]
-        if filtered_df.empty:
+        city_adcodes = self.load_city_data()
+        adcode = city_adcodes.get(city_name)
+        if adcode is None:
             # 如果找不到对应的城市名称，抛出ValueError。
-            raise ValueError(f'location {city_name} not found, availables are {self.city_df["中文名"].tolist()}')
-        else:
-            # 返回找到的第一个adcode。
-            return filtered_df['adcode'].values[0]
+            raise ValueError(f'location {city_name} not found, availables are {list(city_adcodes)}')
+        return adcode
 
     # call 方法：这是工具的实际执行逻辑。当AI模型决定调用此工具时，会执行此方法。
     # params: 包含工具调用所需的参数，通常是一个字典，键为参数名（如'location'）。
@@ -85,66 +111,132 @@ class AmapWeather:
             # 如果缺少必需的location参数，抛出ValueError。
             raise ValueError("Location parameter is missing for AmapWeather tool.")
         
-        try:
-            # 根据提供的地理位置名称获取其adcode。
-            city_adcode = self.get_city_adcode(location)
-            # 调试信息：打印即将发起的高德API请求URL。
-            request_url = self.url.format(city=city_adcode, key=self.token)
-            print(f"DEBUG: AmapWeather Request URL: {request_url}")
-            
-            # 发送GET请求到高德天气API。
-            response = requests.get(request_url)
-            # 检查HTTP响应状态码，如果不是2xx，则抛出HTTPError。
-            response.raise_for_status()
-            # 解析API返回的JSON数据。
-            data = response.json()
-            # 调试信息：打印高德API返回的原始响应数据。
-            print(f"DEBUG: AmapWeather Raw Response Data: {data}")
-            # 检查高德API的业务状态码（'status'字段）。'0'通常表示请求失败。
-            if data['status'] == '0':
-                # 如果API返回失败，统一处理错误信息。
-                return json.dumps({"error": f"Amap API Error: {data.get('info', 'Unknown error')}"})
-            else:
-                # 成功时，从响应中提取天气和温度信息。
-                weather = data['lives'][0]['weather']
-                temperature = data['lives'][0]['temperature']
-                # 返回JSON格式的天气信息，包括天气、温度和查询的地点。
-                return json.dumps({"weather": weather, "temperature": temperature, "location": location})
-        except Exception as e:
-            # 捕获并处理调用高德API过程中可能发生的任何异常。
-            return json.dumps({"error": f"Error calling AmapWeather tool: {str(e)}"})
+        # 失败时抛出异常，由工具引擎转成 {"error": ...} 交给模型并按 status=error 计入指标
+        # 根据提供的地理位置名称获取其adcode。
+        city_adcode = self.get_city_adcode(location)
+        # 调试信息：记录即将发起的高德API请求URL（key 会被日志层脱敏）。
+        request_url = self.url.format(city=city_adcode, key=self.token)
+        logger.debug("AmapWeather request url=%s", request_url)
+
+        # 发送GET请求到高德天气API（requests 在首次调用时才导入）。
+        import requests
+        response = requests.get(request_url)
+        # 检查HTTP响应状态码，如果不是2xx，则抛出HTTPError。
+        response.raise_for_status()
+        # 解析API返回的JSON数据。
+        data = response.json()
+        logger.debug("AmapWeather raw response: %s", data)
+        # 检查高德API的业务状态码（'status'字段）。'0'通常表示请求失败。
+        if data['status'] == '0':
+            raise ToolError(f"Amap API Error: {data.get('info', 'Unknown error')}")
+        # 成功时，从响应中提取天气和温度信息。
+        weather = data['lives'][0]['weather']
+        temperature = data['lives'][0]['temperature']
+        # 返回JSON格式的天气信息，包括天气、温度和查询的地点。
+        return json.dumps({"weather": weather, "temperature": temperature, "location": location})
 
 # 实例化 AmapWeather 工具。
 # 在这里传入 WEATHER_API 环境变量作为token，确保API Key被正确配置。
 amap_weather_tool = AmapWeather(cfg={'token': os.environ.get('WEATHER_API', '')})
 
-# --- 为通义千问模型定义工具列表 ---
-# 这个列表以 DashScope 模型所需的格式定义了所有可用的工具。
-# 模型会根据其内部逻辑和用户输入，选择并调用这些工具。
-TOOLS = [{
-    "type": "function", # 工具类型，这里是函数工具
-    "function": {
-        "name": amap_weather_tool.name,         # 工具的名称
-        "description": amap_weather_tool.description, # 工具的描述
-        "parameters": { # 工具的参数定义，遵循JSON Schema规范
-            "type": "object",
-            "properties": {
-                # 动态生成参数属性，根据 AmapWeather 类的 parameters 列表
-                param['name']: {"type": param['type'], "description": param['description']}
-                for param in amap_weather_tool.parameters
-            },
-            # 动态生成必需参数列表
-            "required": [param['name'] for param in amap_weather_tool.parameters if param.get('required')]
-        }
-    }
-}]
+# --- 工具注册表 ---
+# 所有可供模型调用的工具都在这里注册（名称、参数 Schema、超时），新增工具只需再注册一个。
+# TOOLS 是以 DashScope 模型所需格式生成的工具列表，模型会根据用户输入选择并调用这些工具。
+tool_registry = ToolRegistry()
+tool_registry.register_tool(amap_weather_tool, timeout=float(os.environ.get('AMAP_WEATHER_TIMEOUT', '5')))
+TOOLS = tool_registry.schemas()
+
+# --- 大模型调用的计时封装 ---
+# 所有对 Generation.call 的调用都经过这里，以便统一记录总耗时；
+# 流式调用还会记录从发起请求到首个分片到达的时间（首 token 延迟）。
+# 每次调用的延迟与成败同时上报给模型路由器：流式调用记为首包延迟（first_token），非流式记为总耗时（total），
+# 两类分开统计、各有 SLO。
+# 响应中的 token 用量（流式取最后一个分片的 usage）记入用量统计，见 src/services/usage.py。
+def call_generation(call_name, **kwargs):
+    """调用 Generation.call 并记录耗时指标"""
+    # dashscope（连带 aiohttp）导入较慢，首次调用时才导入；preload 模式下由 warm_up 提前导入
+    from dashscope import Generation
+    model = kwargs.get('model', '')
+    start = time.perf_counter()
+    try:
+        response = Generation.call(**kwargs)
+    except Exception:
+        LLM_CALL_SECONDS.observe(time.perf_counter() - start, model=model, call=call_name, status='error')
+        model_router.record(model, time.perf_counter() - start, ok=False,
+                            kind='first_token' if kwargs.get('stream') else 'total')
+        raise
+    if not kwargs.get('stream'):
+        status = 'ok' if getattr(response, 'status_code', None) == 200 else 'error'
+        elapsed = time.perf_counter() - start
+        LLM_CALL_SECONDS.observe(elapsed, model=model, call=call_name, status=status)
+        model_router.record(model, elapsed, ok=status == 'ok', kind='total')
+        record_usage(model, call_name, *usage_of(response))
+        return response
+    return _timed_stream(response, start, model, call_name)
+
+def _timed_stream(stream, start, model, call_name):
+    first_chunk = True
+    first_token_latency = None
+    status = 'ok'
+    usage = (0, 0)
+    try:
+        for chunk in stream:
+            if first_chunk:
+                first_token_latency = time.perf_counter() - start
+                LLM_FIRST_TOKEN_SECONDS.observe(first_token_latency, model=model, call=call_name)
+                first_chunk = False
+            if getattr(chunk, 'status_code', 200) != 200:
+                status = 'error'
+            # 各分片的 usage 是截至当前的累计值
+            chunk_usage = usage_of(chunk)
+            if any(chunk_usage):
+                usage = chunk_usage
+            yield chunk
+    except Exception:
+        status = 'error'
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        LLM_CALL_SECONDS.observe(elapsed, model=model, call=call_name, status=status)
+        model_router.record(model, elapsed if first_token_latency is None else first_token_latency,
+                            ok=status == 'ok', kind='first_token')
+        record_usage(model, call_name, *usage)
+
+# --- 流式响应的消费 ---
+# 遍历 Generation.call 的流式分片，返回 (最终文本, 最后一组完整的工具调用)。
+# result_format='message' 且未开启 incremental_output 时，每个分片都携带截至当前的完整内容。
+def consume_stream(response_generator, call_name):
+    full_content = "" # 累积的文本内容
+    last_complete_tool_calls = [] # 模型返回的完整工具调用列表
+    for resp in response_generator:
+        if logger.isEnabledFor(logging.DEBUG) and sampled(call_name, STREAM_CHUNK_LOG_EVERY):
+            logger.debug("DashScope stream chunk, %s (sampled 1/%d): %s", call_name, STREAM_CHUNK_LOG_EVERY, resp)
+        if resp.status_code != 200: # 检查HTTP状态码是否成功
+            logger.warning("DashScope stream chunk not OK (%s): status=%s code=%s message=%s", call_name,
+                           resp.status_code, getattr(resp, 'code', None), getattr(resp, 'message', None))
+            continue
+        if not resp.output or getattr(resp.output, 'choices', None) is None:
+            continue
+        for choice in resp.output.choices:
+            try:
+                if not choice.message: # 检查消息体是否存在
+                    continue
+                # 安全地获取文本内容，处理可能为None的情况。
+                current_content = getattr(choice.message, 'content', None)
+                if current_content is not None:
+                    full_content = current_content
+                # 只有当 tool_calls 非空时才更新，确保我们拿到的是完整的工具调用指令。
+                # message 是 dict 子类，缺少字段时 getattr 会抛 KeyError，因此用 get。
+                current_tool_calls = choice.message.get('tool_calls')
+                if current_tool_calls:
+                    last_complete_tool_calls = current_tool_calls
+            except Exception as e: # 捕获处理 choice.message 时的异常
+                logger.warning("Error processing choice.message (%s): %s: %s", call_name, type(e).__name__, e)
+    return full_content, last_complete_tool_calls
 
 # --- call_qwen_for_diagnosis 函数：调用大模型进行病情诊断 ---
-def call_qwen_for_diagnosis(symptoms, severity, duration, additional_info):
-    api_key = os.getenv("DASHSCOPE_API_KEY")
-    if not api_key:
-        return {"error": "DASHSCOPE_API_KEY is not set in environment variables."}
-
+def diagnosis_messages(symptoms, severity, duration, additional_info):
+    """构建诊断请求的消息列表（非流式与流式诊断共用）"""
     # 构建系统消息，指导大模型扮演专业医生并输出特定JSON格式的诊断结果。
     system_prompt = f"""
 你是一位专业的医疗诊断助手。根据用户提供的症状、严重程度、持续时间和任何附加信息，请你进行详细的病情分析，并以严格的JSON格式输出结果。请确保JSON结构和内容严格符合以下定义，不要有任何额外文本、解释或格式错误。所有建议应专业、具体且实用。
@@ -178,20 +270,29 @@ JSON输出格式（所有字段必须包含）：
 请根据以上信息，输出详细的病情诊断，严格按照您被指示的JSON格式。
 """
 
-    messages = [
+    return [
         {'role': 'system', 'content': system_prompt},
         {'role': 'user', 'content': user_message}
     ]
 
+def call_qwen_for_diagnosis(symptoms, severity, duration, additional_info):
+    api_key = os.getenv("DASHSCOPE_API_KEY")
+    if not api_key:
+        return {"error": "DASHSCOPE_API_KEY is not set in environment variables."}
+
+    messages = diagnosis_messages(symptoms, severity, duration, additional_info)
+
     try:
-        response = Generation.call(
-            model='qwen-max', # 或 qwen-plus，根据需要选择
+        response = call_generation(
+            'diagnosis',
+            # 按症状数量、严重程度等选择模型档位，选中档位超出延迟 SLO 时自动降级
+            model=model_router.choose('diagnosis', symptoms=symptoms, severity=severity,
+                                      additional_info=additional_info),
             api_key=api_key,
             messages=messages,
             result_format='message',
         )
-        print(f"DEBUG: Type of response object from Generation.call: {type(response)}") # NEW: Check type immediately
-        print(f"DEBUG: Raw DashScope Diagnosis Response (non-stream): {response}") # 打印原始响应
+        logger.debug("Raw DashScope diagnosis response: %s", response)
 
         # Safely get status_code, output, and choices
         status_code = getattr(response, 'status_code', None)
@@ -202,65 +303,88 @@ JSON输出格式（所有字段必须包含）：
         
         # 严格检查响应结构
         if status_code == 200 and isinstance(output, object) and isinstance(choices, list) and len(choices) > 0:
-            print(f"DEBUG: Diagnosis Response Output: {output}") # 打印 output
-            print(f"DEBUG: Diagnosis Response Choices: {choices}") # 打印 choices
-            
             first_choice = choices[0]
             message = getattr(first_choice, 'message', None)
             content = getattr(message, 'content', None) if message else None
 
             if content is not None and isinstance(content, str):
-                print(f"DEBUG: Type of content before assignment: {type(content)}")
-                print(f"DEBUG: Content before assignment: '''{content}'''")
                 full_content = content # 直接赋值，因为它已经是字符串
             else:
-                print("DEBUG: No valid content found in diagnosis response choice.")
+                logger.warning("No valid content found in diagnosis response choice.")
                 return {"error": "大模型诊断返回内容为空或格式不正确"}
         else:
             # 更具体的错误消息
             error_message = f"DashScope Resp for diagnosis not OK. Status: {status_code}, Output valid: {output is not None}, Choices valid: {choices is not None and len(choices) > 0}"
-            print(f"DEBUG: {error_message}")
+            logger.warning("%s", error_message)
             return {"error": f"大模型诊断失败: {error_message}"}
 
         # 尝试解析大模型返回的JSON字符串
         try:
-            # 显式去除潜在的BOM和所有空白字符
-            cleaned_full_content = full_content.strip()
-            if cleaned_full_content.startswith(codecs.BOM_UTF8.decode('utf-8')):
-                cleaned_full_content = cleaned_full_content[len(codecs.BOM_UTF8.decode('utf-8')):]
-            cleaned_full_content = cleaned_full_content.strip() # 移除BOM后再次strip，以防有新的空白
-            
-            # NEW: Precisely extract JSON content by finding first '{' and last '}'
-            start_index = cleaned_full_content.find('{')
-            end_index = cleaned_full_content.rfind('}')
-
-            if start_index == -1 or end_index == -1 or end_index < start_index:
-                raise ValueError("无法在内容中找到有效的JSON对象边界")
-
-            final_json_string = cleaned_full_content[start_index : end_index + 1]
-
-            print(f"DEBUG: Final JSON string for parsing (type: {type(final_json_string)}): '''{final_json_string}'''")
-            diagnosis_data = json.loads(final_json_string)
+            # 去除BOM与前后说明文字，取第一个 '{' 到最后一个 '}' 之间的内容解析
+            diagnosis_data = extract_json_object(full_content)
             return {"success": True, "data": diagnosis_data}
         except json.JSONDecodeError as e:
-            print(f"DEBUG: JSON decoding error from LLM: {e}")
-            print(f"DEBUG: LLM raw response (during error): '''{full_content}'''") # Keep original full_content for debugging
+            logger.warning("JSON decoding error from LLM: %s", e)
+            logger.debug("LLM raw response (during error): %s", full_content)
             return {"error": f"大模型返回的诊断数据格式错误: {str(e)}. 原始回复: {full_content[:200]}..."}
         except ValueError as e:
-            print(f"DEBUG: Value error during JSON extraction: {e}")
-            print(f"DEBUG: LLM raw response (during error - extraction): '''{full_content}'''")
+            logger.warning("Value error during JSON extraction: %s", e)
+            logger.debug("LLM raw response (during extraction error): %s", full_content)
             return {"error": f"大模型返回内容无法提取JSON: {str(e)}. 原始回复: {full_content[:200]}..."}
 
     except Exception as e:
-        print(f"DEBUG: Outer exception caught in call_qwen_for_diagnosis: {type(e).__name__}: {e}")
+        logger.exception("call_qwen_for_diagnosis failed: %s", type(e).__name__)
         return {"error": f"调用大模型进行诊断失败: {type(e).__name__}: {str(e)}"}
 
+# --- 流式诊断 ---
+# 以 incremental_output 流式调用模型，输出增量交给 IncrementalObjectParser，
+# 顶层字段（urgency_level、possible_diseases 等）一闭合就产出，无需等待 recommendations 生成完毕。
+# 依次产出 ('field', 字段名, 值)，最后产出 ('result', 完整诊断) 或 ('error', 错误信息)。
+def stream_qwen_diagnosis(symptoms, severity, duration, additional_info):
+    api_key = os.getenv("DASHSCOPE_API_KEY")
+    if not api_key:
+        yield 'error', "DASHSCOPE_API_KEY is not set in environment variables."
+        return
+
+    parser = IncrementalObjectParser()
+    start = time.perf_counter()
+    try:
+        response_generator = call_generation(
+            'diagnosis_stream',
+            model=model_router.choose('diagnosis', symptoms=symptoms, severity=severity,
+                                      additional_info=additional_info),
+            api_key=api_key,
+            messages=diagnosis_messages(symptoms, severity, duration, additional_info),
+            result_format='message',
+            stream=True,
+            incremental_output=True # 每个分片只包含新增内容
+        )
+        for resp in response_generator:
+            if resp.status_code != 200:
+                logger.warning("DashScope diagnosis stream not OK: status=%s code=%s message=%s",
+                               resp.status_code, getattr(resp, 'code', None), getattr(resp, 'message', None))
+                yield 'error', f"大模型诊断失败: {getattr(resp, 'code', None)} {getattr(resp, 'message', None)}"
+                return
+            choices = getattr(resp.output, 'choices', None) if resp.output else None
+            if not choices:
+                continue
+            delta = choices[0].message.get('content') if choices[0].message else None
+            for key, value in parser.feed(delta or ''):
+                DIAGNOSIS_FIELD_SECONDS.observe(time.perf_counter() - start, field=key)
+                yield 'field', key, value
+        yield 'result', parser.result()
+    except (ValueError, json.JSONDecodeError) as e:
+        logger.warning("Streaming diagnosis JSON error: %s", e)
+        yield 'error', f"大模型返回内容无法提取JSON: {str(e)}"
+    except Exception as e:
+        logger.exception("stream_qwen_diagnosis failed: %s", type(e).__name__)
+        yield 'error', f"调用大模型进行诊断失败: {type(e).__name__}: {str(e)}"
+
 # --- call_qwen_api 函数（核心AI交互逻辑）---
 # 该函数负责与通义千问大模型进行交互，处理用户消息、工具调用和模型响应。
-def call_qwen_api(message, context=None):
+def call_qwen_api(message, context=None, history=None):
     # 从环境变量中获取 DashScope API Key。这是访问大模型服务的凭证。
     api_key = os.getenv("DASHSCOPE_API_KEY")
-    print(f"DEBUG: DASHSCOPE_API_KEY value: {api_key}") # 临时调试信息，检查API Key是否加载
     """调用通义千问大模型API"""
     if not api_key:
         # 如果API Key未设置，返回错误信息。
@@ -271,188 +395,71 @@ def call_qwen_api(message, context=None):
     messages = [
         {'role': 'system', 'content': '你是一位专业的医疗医生，知道一切的医学知识，同时你也可以获取实时天气信息。请以专业、简洁的口吻回答用户的问题，提供医学建议和指导。请直接开始回答，避免任何形式的寒暄或重复的问候。切记要专业，不要出现任何重复语言，只输出最后的答案。当用户问到天气相关问题时，你应该调用 `amap_weather` 工具来获取天气数据。在调用 `amap_weather` 工具时，`location` 参数请务必提供详细的区或县名称，例如"海淀区"、"锦江区"，而不是笼统的城市名如"北京"或"成都"。'}
     ]
-    # 如果有历史对话上下文，将其添加到消息列表中。
-    if context and 'history' in context:
-        for item in context['history']:
-            if 'user' in item:
-                messages.append({'role': 'user', 'content': item['user']})
-            if 'ai' in item:
-                messages.append({'role': 'assistant', 'content': item['ai']})
+    # 历史对话：服务端会话传入已按 token 预算组装好的 history；
+    # 旧客户端仍可在 context['history'] 中携带全部历史，同样按预算截断。
+    if history is None and context and 'history' in context:
+        history = history_from_context(context['history'])
+    if history is not None:
+        if history.summary:
+            # 较早轮次的摘要并入系统消息，保持 system 消息唯一
+            messages[0]['content'] += f'\n\n以下是此前对话的摘要，供参考：\n{history.summary}'
+        messages.extend(history.messages)
     
     # 将当前用户消息添加到消息列表的末尾。
     messages.append({'role': 'user', 'content': message})
 
     try:
-        # --- 第一次调用大模型：让模型决定是否需要调用工具 ---
+        # --- 工具循环：模型决定是否调用工具，执行后把结果传回模型，直到给出最终回复 ---
         # `Generation.call` 是 DashScope SDK 调用大模型的核心方法。
-        # model: 使用的模型名称，例如 'qwen-max'。
+        # model: 由模型路由器按消息复杂度选择（turbo/plus/max），同一轮对话的各次调用使用同一模型。
         # api_key: 访问模型的API Key。
         # messages: 当前对话的消息历史。
         # seed: 随机种子，用于控制模型生成结果的确定性（方便调试和复现）。
         # stream: True 表示以流式方式获取模型响应。
         # result_format: 'message' 表示返回结构化的消息对象。
-        # tools: 传入我们定义的工具列表，模型会根据此列表决定是否进行工具调用。
-        response_generator = Generation.call(
-            model='qwen-max',
-            api_key=api_key,
-            messages=messages,
-            seed=1234,
-            stream=True,
-            result_format='message',
-            tools=TOOLS # 传入工具列表，让模型知道有哪些工具可用
-        )
-        
-        full_content = "" # 用于累积模型返回的文本内容
-        last_complete_tool_calls = [] # 用于存储模型返回的完整工具调用列表
-
-        # 遍历流式响应，处理模型的输出。
-        for resp in response_generator:
-            print(f"DEBUG: Raw DashScope Resp: {resp}") # 调试信息：打印原始响应
-            if resp.status_code == 200: # 检查HTTP状态码是否成功
-                if resp.output: # 检查响应输出是否存在
-                    print(f"DEBUG: DashScope Resp Output: {resp.output}") # 调试信息
-                    if hasattr(resp.output, 'choices') and resp.output.choices is not None:
-                        print(f"DEBUG: DashScope Resp Choices: {resp.output.choices}") # 调试信息
-                        for choice in resp.output.choices:
-                            try:
-                                if choice.message: # 检查消息体是否存在
-                                    # 安全地获取文本内容，处理可能为None的情况。
-                                    current_content = getattr(choice.message, 'content', None)
-                                    if current_content is not None:
-                                        full_content = current_content # 累积文本内容
-                                    else:
-                                        print("DEBUG: choice.message has no content or it's None.")
-
-                                    # 安全地获取工具调用列表。
-                                    current_tool_calls = getattr(choice.message, 'tool_calls', None)
-                                    if current_tool_calls is not None:
-                                        # 只有当 tool_calls 非空时才更新，确保我们拿到的是完整的工具调用指令。
-                                        if current_tool_calls:
-                                            last_complete_tool_calls = current_tool_calls
-                                    else:
-                                        print("DEBUG: choice.message has no tool_calls attribute or it's None.")
-                                else:
-                                    print("DEBUG: choice.message is None.")
-                            except Exception as e: # 捕获处理 choice.message 时的异常
-                                print(f"DEBUG: Exception caught during choice.message processing: {e}, type: {type(e)}")
-                                continue # 继续处理下一个 choice
-                    else:
-                        print("DEBUG: resp.output.choices is None or missing.")
-                else:
-                    print("DEBUG: resp.output is None.")
-            else:
-                print(f"DEBUG: DashScope Resp not OK or missing output/choices: {resp}")
-
-        # --- 处理工具调用：在模型第一次生成响应后执行 ---
-        valid_tool_calls_to_execute = [] # 存储有效的、可执行的工具调用
-        if last_complete_tool_calls: # 如果模型返回了工具调用
-            for tool_call in last_complete_tool_calls:
-                # 验证工具调用结构是否正确。
-                if isinstance(tool_call, dict) and 'function' in tool_call and isinstance(tool_call['function'], dict) and 'name' in tool_call['function']:
-                    function_name = tool_call['function']['name'] # 获取函数名称
-                    # 获取参数字符串，如果不存在则默认为空JSON对象。
-                    function_args_str = tool_call['function'].get('arguments', '{}')
-                    
-                    try:
-                        # 尝试解析工具参数为JSON对象。
-                        function_args = json.loads(function_args_str)
-                        # 如果解析成功，将工具调用信息添加到待执行列表。
-                        valid_tool_calls_to_execute.append({
-                            "name": function_name,
-                            "args": function_args,
-                            "id": tool_call.get('id', 'unknown_id') # 确保工具调用ID被传递
-                        })
-                    except json.JSONDecodeError:
-                        print(f"DEBUG: Skipping malformed tool_call arguments: {function_args_str}")
-                        # 如果参数解析失败，跳过此工具调用。
-                else:
-                    print(f"DEBUG: Skipping malformed tool_call format: {tool_call}")
-
-        print(f"DEBUG: Processed Tool Calls for execution: {valid_tool_calls_to_execute}") # 打印最终处理的工具调用列表
-
-        # --- 如果模型决定调用工具，则执行工具并进行第二次模型调用 ---
-        if valid_tool_calls_to_execute:
-            # Step 1: 将AI助手的响应（包含工具调用）添加到消息历史。
-            # 这是为了让模型知道它之前发出了哪些工具调用指令。
-            assistant_tool_call_message = {
-                "role": "assistant",
-                "content": full_content, # 第一次调用中模型可能生成的文本内容
-                "tool_calls": last_complete_tool_calls # 第一次调用中模型生成的工具调用列表
-            }
-            messages.append(assistant_tool_call_message)
-
-            # Step 2: 遍历所有有效的工具调用，执行它们并将结果添加到消息历史。
-            for tool_call_info in valid_tool_calls_to_execute:
-                function_name = tool_call_info['name']
-                function_args = tool_call_info['args']
-                tool_call_id = tool_call_info['id']
-
-                if function_name == "amap_weather":
-                    # 如果是天气工具，则调用 AmapWeather 实例的 call 方法。
-                    tool_response_data = amap_weather_tool.call(function_args)
-                    print(f"DEBUG: AmapWeather Tool Response: {tool_response_data}") # 调试信息
-                    # 将工具执行结果以 'tool' 角色添加到消息历史。
-                    messages.append({
-                        "role": "tool",
-                        "tool_call_id": tool_call_id, # 对应模型的工具调用ID
-                        "content": tool_response_data
-                    })
-                else:
-                    # 如果是未知工具，返回错误信息。
-                    messages.append({
-                        "role": "tool",
-                        "tool_call_id": tool_call_id,
-                        "content": json.dumps({"error": f"Unknown tool: {function_name}"})
-                    })
-            
-            # --- 第二次调用大模型：将工具执行结果传回模型，获取最终回复 ---
-            # 模型在接收到工具结果后，可以基于这些信息生成更准确的回复。
-            print(f"DEBUG: Messages before second pass: {messages}") # 调试信息
-            second_response_generator = Generation.call(
-                model='qwen-max',
+        # tools: 传入已注册的工具列表；达到 TOOL_MAX_ROUNDS 轮后不再传入，让模型直接作答。
+        model = model_router.choose('chat', message=message, history_tokens=history.tokens if history else 0)
+        full_content = ""
+        for round_index in range(TOOL_MAX_ROUNDS + 1):
+            call_kwargs = {}
+            if round_index < TOOL_MAX_ROUNDS:
+                call_kwargs['tools'] = TOOLS
+            call_name = 'chat_first_pass' if round_index == 0 else 'chat_second_pass'
+            response_generator = call_generation(
+                call_name,
+                model=model,
                 api_key=api_key,
-                messages=messages, # 包含工具调用和工具结果的完整消息历史
+                messages=messages,
                 seed=1234,
                 stream=True,
-                result_format='message'
-                # 在第二轮中通常不再需要传入 tools=TOOLS，因为模型已经知道如何根据结果回复。
+                result_format='message',
+                **call_kwargs
             )
-            
-            full_content = "" # 重置 full_content 以捕获第二次调用的回复
-
-            # 遍历第二次流式响应，获取最终的文本回复。
-            for resp in second_response_generator:
-                print(f"DEBUG: Raw DashScope Resp (second pass): {resp}") # 调试信息
-                if resp.status_code == 200:
-                    if resp.output:
-                        print(f"DEBUG: DashScope Resp Output (second pass): {resp.output}") # 调试信息
-                        if hasattr(resp.output, 'choices') and resp.output.choices is not None:
-                            print(f"DEBUG: DashScope Resp Choices (second pass): {resp.output.choices}") # 调试信息
-                            for choice in resp.output.choices:
-                                try:
-                                    if choice.message:
-                                        current_content = getattr(choice.message, 'content', None)
-                                        if current_content is not None:
-                                            full_content = current_content
-                                        else:
-                                            print("DEBUG: choice.message (second pass) has no content or it's None.")
-                                    else:
-                                        print("DEBUG: choice.message (second pass) is None.")
-                                except Exception as e:
-                                    print(f"DEBUG: Unexpected error during choice.message (second pass) processing: {e}, type: {type(e)}")
-                                    continue
-                        else:
-                            print("DEBUG: resp.output.choices is None or missing.")
-                    else:
-                        print("DEBUG: resp.output is None.")
-                else:
-                    print(f"DEBUG: DashScope Resp (second pass) not OK or missing output/choices: {resp}")
+            full_content, tool_calls = consume_stream(response_generator, call_name)
+            # 最后一轮没有传入工具，模型仍返回 tool_calls 时不再执行，直接使用本轮的文本内容
+            if not tool_calls or round_index == TOOL_MAX_ROUNDS:
+                break
+
+            # 将AI助手的响应（包含工具调用）添加到消息历史，让模型知道它之前发出了哪些工具调用指令。
+            messages.append({
+                "role": "assistant",
+                "content": full_content, # 模型在本轮可能生成的文本内容
+                "tool_calls": tool_calls # 模型在本轮生成的工具调用列表
+            })
+            # 同一轮的工具调用并发执行，结果按 tool_call_id 顺序以 'tool' 角色追加到消息历史。
+            messages.extend(tool_registry.execute(tool_calls))
+            logger.debug("Messages after tool round %d: %s", round_index + 1, messages)
+            full_content = ""
         
-        # 返回最终的AI回复。如果第二次调用没有生成内容（例如模型只返回工具调用），则返回空字符串。
+        if tool_calls and not full_content:
+            # 工具调用轮数已用尽且模型只返回了工具调用，没有可用的回复
+            logger.warning("Chat tool rounds exhausted without a final answer (%d rounds)", TOOL_MAX_ROUNDS)
+            return {"error": "大模型未能给出最终回复（工具调用轮数已用尽）"}
+        # 返回最终的AI回复。
         return {"success": True, "response": full_content if full_content else ""}
     except Exception as e:
         # 捕获并处理调用大模型API过程中可能发生的任何错误。
-        print(f"DEBUG: Exception caught in call_qwen_api: {e}, type: {type(e)}") # 调试信息
+        logger.exception("call_qwen_api failed: %s", type(e).__name__)
         return {"error": f"调用通义千问API失败: {str(e)}"}
 
 # --- 辅助函数：格式化AI回复 ---
@@ -468,7 +475,6 @@ def format_ai_response(response_data):
 # 处理来自前端的AI聊天请求。
 @ai_bp.route('/ai/chat', methods=['POST'])
 def chat_with_ai():
-    print("DEBUG: chat_with_ai route accessed.") # 临时调试信息
     """AI助手对话API"""
     try:
         data = request.get_json() # 获取JSON格式的请求体
@@ -477,30 +483,75 @@ def chat_with_ai():
             return jsonify({"error": "请提供对话内容"}), 400
         
         message = data.get('message', '') # 获取用户消息内容
-        context = data.get('context', {}) # 获取历史对话上下文（可选）
+        context = data.get('context', {}) # 获取历史对话上下文（可选，旧客户端）
+        conversation_id = data.get('conversation_id') # 服务端会话ID（可选）
         
         if not message:
             return jsonify({"error": "请提供有效的消息内容"}), 400
+
+        # 携带 conversation_id 时从服务端会话组装历史；请求 "conversation": true 且没有旧式 history 时新建会话，
+        # 其余一次性请求不落库（不返回 conversation_id）。
+        history = None
+        if conversation_id:
+            history = conversation_store.history(conversation_id)
+            if history is None:
+                return jsonify({"error": "会话不存在"}), 404
+        elif data.get('conversation') is True and not (context and context.get('history')):
+            conversation_id = conversation_store.create()
+            history = HistoryWindow('', [], 0)
+
+        # 紧急症状短路：描述正在发生的紧急症状时直接返回急救指引，不等待大模型；
+        # 只是询问相关医学知识（如“心悸是什么原因”）时照常由大模型回答，急救提示附在回答中
+        emergency = emergency_prestage('chat', (message,), data.get('latitude'), data.get('longitude'))
+        if reported_emergency(emergency):
+            reply = format_emergency_reply(emergency)
+            if data.get('elaborate'):
+                emergency['elaboration_id'] = submit_elaboration(
+                    elaboration_prompt(emergency['detected_symptoms'], message))
+            if conversation_id:
+                conversation_store.append_turn(conversation_id, message, reply)
+            return jsonify({
+                "success": True,
+                "conversation_id": conversation_id,
+                "data": {
+                    "response": reply,
+                    "raw_data": reply,
+                    "emergency": emergency,
+                    "timestamp": "2024-01-01T00:00:00Z"
+                }
+            })
         
+        # 客户端 token 配额用尽时不再调用大模型（紧急症状短路不受配额限制）
+        retry_after = quota_retry_after()
+        if retry_after is not None:
+            return quota_exceeded_response(retry_after)
+
         # 调用核心函数与通义千问API交互。
-        qwen_response = call_qwen_api(message, context)
+        qwen_response = call_qwen_api(message, context, history)
         # 格式化模型返回的响应。
         formatted_response = format_ai_response(qwen_response)
         
         if qwen_response.get("success"):
+            if conversation_id:
+                conversation_store.append_turn(conversation_id, message, qwen_response.get("response", ""))
             # 如果成功，返回成功状态和格式化后的数据。
+            response_data = {
+                "response": formatted_response,
+                "raw_data": qwen_response.get("response"), # 存储原始模型回复以供调试/分析
+                "timestamp": "2024-01-01T00:00:00Z"  # 实际应用中应使用真实时间戳
+            }
+            if emergency:
+                response_data["emergency"] = emergency
             return jsonify({
                 "success": True,
-                "data": {
-                    "response": formatted_response,
-                    "raw_data": qwen_response.get("response"), # 存储原始模型回复以供调试/分析
-                    "timestamp": "2024-01-01T00:00:00Z"  # 实际应用中应使用真实时间戳
-                }
+                "conversation_id": conversation_id,
+                "data": response_data
             })
         else:
             # 如果失败，返回失败状态和错误信息。
             return jsonify({
                 "success": False,
+                "conversation_id": conversation_id,
                 "error": formatted_response # 错误信息
             }), 500
         
@@ -508,11 +559,157 @@ def chat_with_ai():
         # 捕获并处理整个API请求处理过程中的异常。
         return jsonify({"error": f"AI对话过程中出现错误: {str(e)}"}), 500
 
+# --- Flask 路由：/ai/conversations/<id> （服务端会话查询与删除）---
+@ai_bp.route('/ai/conversations/<conversation_id>', methods=['GET'])
+def get_conversation(conversation_id):
+    """获取会话历史"""
+    try:
+        conversation = db.session.get(Conversation, conversation_id)
+        if conversation is None:
+            return jsonify({"error": "会话不存在"}), 404
+        data = conversation.to_dict()
+        data['turns'] = [turn.to_dict() for turn in conversation_store.turns(conversation_id)]
+        return jsonify({"success": True, "data": data})
+    except Exception as e:
+        return jsonify({"error": f"获取会话失败: {str(e)}"}), 500
+
+@ai_bp.route('/ai/conversations/<conversation_id>', methods=['DELETE'])
+def delete_conversation(conversation_id):
+    """删除会话"""
+    try:
+        if not conversation_store.delete(conversation_id):
+            return jsonify({"error": "会话不存在"}), 404
+        return jsonify({"success": True, "message": "会话已删除"})
+    except Exception as e:
+        return jsonify({"error": f"删除会话失败: {str(e)}"}), 500
+
+# --- 紧急症状短路的响应格式 ---
+# 见 src/services/emergency.py；health-advice 的短路结果保持与诊断结果相同的结构，前端无需区分。
+def emergency_advice(emergency):
+    return {
+        "analysis": {
+            "urgency_level": "高",
+            "possible_diseases": [],
+            "recommended_departments": ["急诊科"],
+            "advice": [emergency["recommendation"]],
+        },
+        "recommendations": {
+            "immediate_actions": emergency["immediate_actions"],
+            "lifestyle_advice": [],
+            "when_to_see_doctor": ["立即就医"],
+            "prevention_tips": [],
+        },
+        "urgency_level": "高",
+        "source": "emergency",
+        "fallback_reason": None,
+        "emergency": emergency,
+        "disclaimer": "检测到紧急症状，以上为标准急救指引，请立即就医，不要等待线上咨询结果。"
+    }
+
+def format_emergency_reply(emergency):
+    lines = [f"您描述的症状（{'、'.join(emergency['detected_symptoms'])}）可能属于紧急情况。",
+             emergency["recommendation"]]
+    lines.extend(f"{i}. {action}" for i, action in enumerate(emergency["immediate_actions"], 1))
+    if emergency["nearest_emergency_rooms"]:
+        names = '、'.join(h['name'] for h in emergency["nearest_emergency_rooms"])
+        lines.append(f"附近可就诊的急诊医院：{names}")
+    return "\n".join(lines)
+
+# --- 紧急情况的大模型补充说明 ---
+# 以异步任务（kind=emergency_elaboration）执行，任务持久化在数据库中，轮询请求落到任一 worker 进程都能查到。
+def run_elaboration_job(payload):
+    response = call_qwen_api(payload['prompt'])
+    if not response.get('success'):
+        raise RuntimeError(response.get('error', '大模型服务异常'))
+    return {"response": response.get('response')}
+
+def submit_elaboration(prompt):
+    job, _ = job_queue.submit('emergency_elaboration', {"prompt": prompt}, client=client_id())
+    return job.id
+
+# --- Flask 路由：/ai/emergency/elaborations/<id> （紧急情况的大模型补充说明）---
+@ai_bp.route('/ai/emergency/elaborations/<elaboration_id>', methods=['GET'])
+def get_emergency_elaboration(elaboration_id):
+    """获取紧急情况补充说明"""
+    try:
+        job = job_queue.get(elaboration_id)
+        if job is None or job.kind != 'emergency_elaboration':
+            return jsonify({"error": "补充说明不存在或已过期"}), 404
+        # 保持原有的响应结构：status 为 pending / done / failed
+        result = json.loads(job.result) if job.result else {}
+        return jsonify({"success": True, "data": {
+            "id": job.id,
+            "status": job.status if job.finished else 'pending',
+            "result": result.get('response'),
+            "error": job.error
+        }})
+    except Exception as e:
+        return jsonify({"error": f"获取补充说明失败: {str(e)}"}), 500
+
+# --- 对冲诊断 ---
+# 本地规则引擎与大模型诊断赛跑，见 src/services/hedged_diagnosis.py
+hedged_diagnosis = HedgedDiagnosis(call_qwen_for_diagnosis)
+
+DIAGNOSIS_DISCLAIMERS = {
+    'llm': "以上建议由AI大模型生成，仅供参考，不能替代专业医疗诊断。请根据实际情况咨询医生。",
+    'llm_cache': "以上建议由AI大模型生成，仅供参考，不能替代专业医疗诊断。请根据实际情况咨询医生。",
+    'local': "AI大模型暂时未能及时响应，以上建议由症状规则库生成，仅供参考，不能替代专业医疗诊断。请根据实际情况咨询医生。",
+}
+
+# --- 健康建议的响应格式 ---
+# 映射诊断结果（大模型或本地规则引擎，两者结构相同）到现有前端所需的格式。
+def health_advice_data(llm_analysis_data, source, reason=None):
+    # 提取紧急程度
+    urgency_level = llm_analysis_data.get('urgency_level', '低')
+    
+    # 直接使用提供的分类建议
+    recommendations_from_llm = llm_analysis_data.get('recommendations', {})
+    
+    return {
+        "analysis": { # 这里的analysis是旧的generate_ai_response的analysis_result结构
+            "urgency_level": urgency_level,
+            "possible_diseases": llm_analysis_data.get('possible_diseases', []),
+            "recommended_departments": llm_analysis_data.get('recommended_departments', []),
+            "advice": [llm_analysis_data.get('analysis', '')], # 详细分析作为advice，封装为数组以匹配前端期望
+        },
+        "recommendations": { # 直接使用分类建议
+            "immediate_actions": recommendations_from_llm.get('immediate_actions', []),
+            "lifestyle_advice": recommendations_from_llm.get('lifestyle_advice', []),
+            "when_to_see_doctor": recommendations_from_llm.get('when_to_see_doctor', []),
+            "prevention_tips": recommendations_from_llm.get('prevention_tips', []),
+        },
+        "urgency_level": urgency_level, # 保持与旧接口兼容
+        "source": source, # llm / llm_cache / local
+        "fallback_reason": reason, # 本地结果的原因：deadline（大模型超时）、llm_error 或 quota（配额用尽）
+        "disclaimer": DIAGNOSIS_DISCLAIMERS[source]
+    }
+
+class DiagnosisUnavailable(RuntimeError):
+    """本地引擎无法识别症状且大模型调用失败"""
+
+def diagnose_health_advice(symptoms, severity, duration, additional_info, wait_for_llm=False):
+    """配额检查与对冲诊断，返回 (health-advice 的 data, None)；配额用尽且本地无法识别症状时返回 (None, 重置前的秒数)。
+    wait_for_llm 为 True 时（异步任务）不设截止时间，等待大模型的完整结果"""
+    # 客户端 token 配额用尽时只使用本地规则引擎
+    retry_after = quota_retry_after()
+    if retry_after is not None:
+        local = local_diagnosis(symptoms, severity, duration, additional_info)
+        if local is None:
+            return None, retry_after
+        return health_advice_data(local, 'local', 'quota'), None
+
+    # 对冲诊断：本地规则引擎立即给出结果，大模型在截止时间内返回时优先使用大模型结果
+    source, llm_analysis_data, reason = hedged_diagnosis.diagnose(symptoms, severity, duration, additional_info,
+                                                                  wait_for_llm=wait_for_llm)
+    logger.debug("Diagnosis source=%s reason=%s data=%s", source, reason, llm_analysis_data)
+    if llm_analysis_data is None:
+        raise DiagnosisUnavailable(reason)
+    return health_advice_data(llm_analysis_data, source, reason), None
+
 # --- Flask 路由：/ai/health-advice （获取健康建议API）---
 # 这是一个独立的API，用于基于症状获取健康建议。
 @ai_bp.route('/ai/health-advice', methods=['POST'])
 def get_health_advice():
-    print("DEBUG: /ai/health-advice route accessed.") # 临时调试信息
     """获取健康建议API"""
     try:
         data = request.get_json()
@@ -528,46 +725,100 @@ def get_health_advice():
         
         if not symptoms:
             return jsonify({"error": "请提供症状信息"}), 400
+
+        # 紧急症状短路：描述正在发生的紧急症状时直接返回急救指引与最近急诊，大模型补充说明可选地在后台生成；
+        # 知识性提问照常诊断，急救提示附在结果中
+        emergency = emergency_prestage('health_advice', (symptoms, additional_info),
+                                       data.get('latitude'), data.get('longitude'))
+        if reported_emergency(emergency):
+            if data.get('elaborate'):
+                emergency['elaboration_id'] = submit_elaboration(
+                    elaboration_prompt(emergency['detected_symptoms'], additional_info))
+            return jsonify({"success": True, "data": emergency_advice(emergency)})
         
-        # 调用大模型进行诊断
-        diagnosis_response = call_qwen_for_diagnosis(symptoms, severity, duration, additional_info)
-        print(f"DEBUG: Diagnosis Response from call_qwen_for_diagnosis: {diagnosis_response}")
-
-        if diagnosis_response.get("success"):
-            llm_analysis_data = diagnosis_response.get("data")
-            
-            # 映射大模型的输出到现有前端所需的格式
-            # 这里假设大模型的输出与前端期望的analysisResult结构非常接近
-            # 否则需要进行更复杂的映射或调整前端期望的结构
-            
-            # 提取大模型提供的紧急程度
-            urgency_level = llm_analysis_data.get('urgency_level', '低')
-            
-            # 直接使用大模型提供的推荐建议
-            recommendations_from_llm = llm_analysis_data.get('recommendations', {})
-            
-            return jsonify({
-                "success": True,
-                "data": {
-                    "analysis": { # 这里的analysis是旧的generate_ai_response的analysis_result结构
-                        "urgency_level": urgency_level,
-                        "possible_diseases": llm_analysis_data.get('possible_diseases', []),
-                        "recommended_departments": llm_analysis_data.get('recommended_departments', []),
-                        "advice": [llm_analysis_data.get('analysis', '')], # 大模型的详细分析作为advice，封装为数组以匹配前端期望
-                    },
-                    "recommendations": { # 直接使用大模型提供的分类建议
-                        "immediate_actions": recommendations_from_llm.get('immediate_actions', []),
-                        "lifestyle_advice": recommendations_from_llm.get('lifestyle_advice', []),
-                        "when_to_see_doctor": recommendations_from_llm.get('when_to_see_doctor', []),
-                        "prevention_tips": recommendations_from_llm.get('prevention_tips', []),
-                    },
-                    "urgency_level": urgency_level, # 保持与旧接口兼容
-                    "disclaimer": "以上建议由AI大模型生成，仅供参考，不能替代专业医疗诊断。请根据实际情况咨询医生。"
-                }
-            })
-        else:
-            # 如果大模型调用失败，返回错误信息
-            return jsonify({"error": diagnosis_response.get("error", "大模型诊断服务异常")}), 500
+        try:
+            advice, retry_after = diagnose_health_advice(symptoms, severity, duration, additional_info)
+        except DiagnosisUnavailable as e:
+            # 本地引擎无法识别症状且大模型调用失败，返回错误信息
+            return jsonify({"error": str(e)}), 500
+        if advice is None:
+            return quota_exceeded_response(retry_after)
+        if emergency:
+            advice["emergency"] = emergency
+        return jsonify({
+            "success": True,
+            "data": advice
+        })
+        
+    except Exception as e:
+        return jsonify({"error": f"获取健康建议时出现错误: {str(e)}"}), 500
+
+# --- Flask 路由：/ai/health-advice/stream （流式健康建议，SSE）---
+# 事件顺序：field（每个顶层字段闭合时推送一次）→ result（与 /ai/health-advice 的 data 相同）→ done。
+# 命中紧急症状时直接推送 emergency 与 result（知识性提问先推送 emergency，其余照常）；
+# 大模型失败时推送 error 后以本地规则引擎的结果兜底。
+def _sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+@ai_bp.route('/ai/health-advice/stream', methods=['POST'])
+def stream_health_advice():
+    """流式获取健康建议API"""
+    try:
+        data = request.get_json()
+        
+        if not data:
+            return jsonify({"error": "请提供症状信息"}), 400
+        
+        symptoms = data.get('symptoms', [])
+        severity = data.get('severity', '中等')
+        duration = data.get('duration', '1-2天')
+        additional_info = data.get('additional_info', '')
+        
+        if not symptoms:
+            return jsonify({"error": "请提供症状信息"}), 400
+
+        emergency = emergency_prestage('health_advice_stream', (symptoms, additional_info),
+                                       data.get('latitude'), data.get('longitude'))
+        reported = reported_emergency(emergency)
+        retry_after = None if reported else quota_retry_after()
+        quota_local = None
+        if retry_after is not None:
+            quota_local = local_diagnosis(symptoms, severity, duration, additional_info)
+            if quota_local is None:
+                return quota_exceeded_response(retry_after)
+
+        def result(advice):
+            # 与 /ai/health-advice 相同：知识性提问的结果附带急救提示
+            if emergency:
+                advice["emergency"] = emergency
+            return _sse('result', advice)
+
+        def generate():
+            if emergency:
+                yield _sse('emergency', emergency)
+            if reported:
+                yield _sse('result', emergency_advice(emergency))
+                yield _sse('done', {})
+                return
+            if quota_local is not None:
+                # 配额用尽，直接返回本地规则引擎的结果
+                yield result(health_advice_data(quota_local, 'local', 'quota'))
+                yield _sse('done', {})
+                return
+            for event in stream_qwen_diagnosis(symptoms, severity, duration, additional_info):
+                if event[0] == 'field':
+                    yield _sse('field', {"field": event[1], "value": event[2]})
+                elif event[0] == 'result':
+                    yield result(health_advice_data(event[1], 'llm'))
+                else:
+                    yield _sse('error', {"error": event[1]})
+                    local = local_diagnosis(symptoms, severity, duration, additional_info)
+                    if local is not None:
+                        yield result(health_advice_data(local, 'local', 'llm_error'))
+            yield _sse('done', {})
+
+        return Response(stream_with_context(generate()), mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
         
     except Exception as e:
         return jsonify({"error": f"获取健康建议时出现错误: {str(e)}"}), 500
@@ -586,21 +837,11 @@ def emergency_check():
         symptoms = data.get('symptoms', []) # 获取症状列表
         severity = data.get('severity', '中等') # 获取症状严重程度
         
-        # 预定义的紧急症状关键词列表。
-        emergency_keywords = [
-            "胸痛", "呼吸困难", "意识模糊", "剧烈头痛", "大量出血",
-            "严重腹痛", "高热不退", "抽搐", "昏迷", "心悸"
-        ]
-        
-        # 检查用户提供的症状中是否包含紧急关键词。
-        emergency_detected = False
-        detected_emergency_symptoms = []
-        
-        for symptom in symptoms:
-            for emergency_keyword in emergency_keywords:
-                if emergency_keyword in symptom:
-                    emergency_detected = True
-                    detected_emergency_symptoms.append(emergency_keyword)
+        # 使用预编译的紧急症状检测（与其他入口的短路检测相同）。
+        start = time.perf_counter()
+        result = detect_emergency(symptoms)
+        emergency_detected = result.is_emergency
+        detected_emergency_symptoms = result.detected_symptoms
         
         # 如果严重程度被标记为"严重"，也视为紧急情况。
         if severity == "严重":
@@ -611,18 +852,17 @@ def emergency_check():
             "is_emergency": emergency_detected,         # 是否检测到紧急情况
             "detected_symptoms": detected_emergency_symptoms, # 检测到的紧急症状
             "recommendation": "",                       # 推荐建议
-            "emergency_contacts": {                     # 紧急联系电话
-                "emergency_number": "120",
-                "poison_control": "400-161-9595",
-                "mental_health_hotline": "400-161-9995",
-            }
+            "emergency_contacts": EMERGENCY_CONTACTS    # 紧急联系电话
         }
         
         # 根据是否检测到紧急情况，提供不同的推荐建议。
         if emergency_detected:
-            response["recommendation"] = "检测到可能的紧急情况，建议立即拨打120急救电话或前往最近的急诊科！"
+            response["recommendation"] = EMERGENCY_RECOMMENDATION
+            response["nearest_emergency_rooms"] = nearest_emergency_rooms(data.get('latitude'), data.get('longitude'))
         else:
             response["recommendation"] = "暂未检测到紧急情况，但请继续关注症状变化。如有担心，建议咨询医生。"
+        EMERGENCY_CHECK_SECONDS.observe(time.perf_counter() - start, entry='emergency_check',
+                                        result='hit' if emergency_detected else 'miss')
         
         return jsonify({
             "success": True,
@@ -632,3 +872,125 @@ def emergency_check():
     except Exception as e:
         return jsonify({"error": f"紧急情况检查时出现错误: {str(e)}"}), 500
 
+# --- 异步任务：/ai/jobs ---
+# 提交后立即返回 202 与任务 id，客户端轮询 GET /ai/jobs/<id>、订阅 /ai/jobs/<id>/events（SSE）或等待 webhook。
+# 请求头 Idempotency-Key 用于去重：网络不稳定时客户端可以放心重试提交，不会重复调用大模型。
+def run_health_advice_job(payload):
+    """任务版的 /ai/health-advice：不受同步接口的截止时间限制，等待大模型的完整诊断"""
+    symptoms = payload['symptoms']
+    additional_info = payload.get('additional_info', '')
+    emergency = emergency_prestage('ai_job', (symptoms, additional_info),
+                                   payload.get('latitude'), payload.get('longitude'))
+    if reported_emergency(emergency):
+        return emergency_advice(emergency)
+    advice, retry_after = diagnose_health_advice(symptoms, payload.get('severity', '中等'),
+                                                 payload.get('duration', '1-2天'), additional_info, wait_for_llm=True)
+    if advice is None:
+        raise RuntimeError(f"AI服务使用额度已用完，请在 {int(retry_after) + 1} 秒后重试")
+    if emergency:
+        advice["emergency"] = emergency
+    return advice
+
+job_queue.register('health_advice', run_health_advice_job)
+job_queue.register('emergency_elaboration', run_elaboration_job)
+
+# 可由客户端直接提交的任务类型
+PUBLIC_JOB_KINDS = ('health_advice',)
+# 建议客户端轮询的间隔（秒）
+JOB_POLL_AFTER = 1
+
+def _job_response(job, status=200, **headers):
+    response = jsonify({"success": True, "data": job.to_dict()})
+    response.status_code = status
+    if not job.finished:
+        response.headers['Retry-After'] = str(JOB_POLL_AFTER)
+    response.headers.update(headers)
+    return response
+
+@ai_bp.route('/ai/jobs', methods=['POST'])
+def submit_ai_job():
+    """提交异步 AI 任务（请求体与 /ai/health-advice 相同，可选 kind、webhook_url；请求头 Idempotency-Key 用于去重）"""
+    try:
+        data = request.get_json()
+        
+        if not data:
+            return jsonify({"error": "请提供症状信息"}), 400
+        
+        payload = dict(data)
+        kind = payload.pop('kind', 'health_advice')
+        webhook_url = payload.pop('webhook_url', None)
+        if kind not in PUBLIC_JOB_KINDS:
+            return jsonify({"error": f"不支持的任务类型: {kind}"}), 400
+        if not payload.get('symptoms'):
+            return jsonify({"error": "请提供症状信息"}), 400
+        idempotency_key = request.headers.get('Idempotency-Key', '').strip() or None
+        if idempotency_key and len(idempotency_key) > 128:
+            return jsonify({"error": "Idempotency-Key 过长"}), 400
+        try:
+            if webhook_url:
+                validate_webhook_url(webhook_url)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
+        # 配额已用尽且本地规则引擎也无法识别症状时直接返回 429，不占用任务队列
+        retry_after = quota_retry_after()
+        if retry_after is not None and local_diagnosis(payload['symptoms'], payload.get('severity', '中等'),
+                                                      payload.get('duration', '1-2天'),
+                                                      payload.get('additional_info', '')) is None:
+            return quota_exceeded_response(retry_after)
+
+        try:
+            job, created = job_queue.submit(kind, payload, client=client_id(), idempotency_key=idempotency_key,
+                                            webhook_url=webhook_url)
+        except JobConflict as e:
+            return jsonify({"error": str(e)}), 422
+        if created:
+            return _job_response(job, 202, Location=f"/api/ai/jobs/{job.id}")
+        return _job_response(job, 200, **{'Idempotent-Replayed': 'true'})
+        
+    except Exception as e:
+        return jsonify({"error": f"提交任务时出现错误: {str(e)}"}), 500
+
+@ai_bp.route('/ai/jobs/<job_id>', methods=['GET'])
+def get_ai_job(job_id):
+    """查询异步任务状态与结果（未完成时响应头 Retry-After 为建议的轮询间隔）"""
+    try:
+        job = job_queue.get(job_id)
+        if job is None or job.kind not in PUBLIC_JOB_KINDS:
+            return jsonify({"error": "任务不存在或结果已过期"}), 404
+        return _job_response(job)
+    except Exception as e:
+        return jsonify({"error": f"查询任务时出现错误: {str(e)}"}), 500
+
+@ai_bp.route('/ai/jobs/<job_id>/events', methods=['GET'])
+def stream_ai_job(job_id):
+    """订阅异步任务的完成通知（SSE）：先推送 status，完成时推送 result 后以 done 结束"""
+    try:
+        job = job_queue.get(job_id)
+        if job is None or job.kind not in PUBLIC_JOB_KINDS:
+            return jsonify({"error": "任务不存在或结果已过期"}), 404
+
+        def generate():
+            yield _sse('status', job.to_dict())
+            deadline = time.monotonic() + AI_JOB_SSE_TIMEOUT
+            current = job
+            while not current.finished:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    # 订阅超时，客户端可重新订阅或改为轮询
+                    yield _sse('timeout', current.to_dict())
+                    return
+                # 每 15 秒至少输出一次，避免代理因空闲断开连接
+                current = job_queue.wait(job_id, min(15.0, remaining))
+                if current is None:
+                    yield _sse('error', {"error": "任务不存在或结果已过期"})
+                    return
+                if not current.finished:
+                    yield ": keep-alive\n\n"
+            yield _sse('result', current.to_dict())
+            yield _sse('done', {})
+
+        return Response(stream_with_context(generate()), mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+    except Exception as e:
+        return jsonify({"error": f"订阅任务时出现错误: {str(e)}"}), 500
@@ -1,6 +1,14 @@
 from flask import Blueprint, request, jsonify
-from src.models.hospital import Hospital, Department, db
-from geopy.distance import geodesic
+from src.models.hospital import (Hospital, Department, db, department_json, get_data_version,
+                                 get_data_version_info, hospital_json)
+from src.services.hospital_directory import hospital_directory
+from src.services.hospital_shards import HOSPITAL_SHARD_TOKEN, hospital_shards
+from src.services.regions import assign_regions, region_condition, region_filter
+from src.utils.http_cache import conditional_response, make_etag
+from src.utils.json_provider import RawJSON, extend_raw, json_response
+from src.utils.pagination import (STREAM_BATCH_SIZE, after_cursor, decode_cursor, encode_cursor, ndjson_response,
+                                  page_limit, paginate, wants_ndjson)
+import heapq
 import json
 import math
 
@@ -8,6 +16,8 @@ hospitals_bp = Blueprint('hospitals', __name__)
 
 def calculate_distance(lat1, lon1, lat2, lon2):
     """计算两点间距离（公里）"""
+    # geopy 导入较慢，首次调用时才导入（之后只是一次模块缓存查找）
+    from geopy.distance import geodesic
     try:
         return geodesic((lat1, lon1), (lat2, lon2)).kilometers
     except:
@@ -49,6 +59,140 @@ def calculate_hospital_score(hospital, departments_match, distance, user_prefere
     
     return round(final_score, 2)
 
+# 推荐接口返回的医院数
+RECOMMEND_LIMIT = 10
+
+# 各医院 specialties 解析后的集合，按数据版本缓存，避免每次推荐都 json.loads
+_specialty_cache = {'version': None, 'sets': {}}
+
+def hospital_specialties(hospital, version):
+    if _specialty_cache['version'] != version:
+        _specialty_cache['sets'] = {}
+        _specialty_cache['version'] = version
+    specialties = _specialty_cache['sets'].get(hospital.id)
+    if specialties is None:
+        specialties = frozenset(json.loads(hospital.specialties) if hospital.specialties else [])
+        _specialty_cache['sets'][hospital.id] = specialties
+    return specialties
+
+def recommend_for(recommended_departments, user_lat, user_lng, radius=50000, preferences=None, region=None):
+    """按科室匹配、距离、等级与评分给医院打分排序，返回全部候选（调用方自行截取前 RECOMMEND_LIMIT 个）；
+    region 为 region_filter 返回的 RegionFilter 时只推荐该城市/区县内的医院"""
+    preferences = preferences or {}
+    recommended = set(recommended_departments)
+    version = get_data_version()
+    codes = region.region if region is not None else None
+    
+    # 数据源依次为：按省分片（已导出时）、内存映射的医院目录、数据库；
+    # 城市/区县无法解析为编码时只能按地址文本匹配，直接查询数据库
+    by_address = region is not None and codes is None
+    shard_hospitals = None if by_address else hospital_shards.query_box(
+        version, _bounding_box(float(user_lat), float(user_lng), radius / 1000), codes)
+    directory = hospital_directory.current(version) if shard_hospitals is None and not by_address else None
+    if shard_hospitals is not None:
+        recommendations = _recommend_from_shards(shard_hospitals, recommended, user_lat, user_lng, radius,
+                                                 preferences)
+    elif directory is not None:
+        recommendations = _recommend_from_directory(directory, recommended, user_lat, user_lng, radius, preferences,
+                                                    codes)
+    else:
+        recommendations = _recommend_from_db(recommended, user_lat, user_lng, radius, preferences, version, region)
+    
+    # 按评分排序
+    sort_by = preferences.get('sort_by', 'score')
+    if sort_by == 'distance':
+        recommendations.sort(key=lambda x: x['distance'])
+    elif sort_by == 'rating':
+        recommendations.sort(key=lambda x: x['_rating'], reverse=True)
+    else:
+        recommendations.sort(key=lambda x: x['score'], reverse=True)
+    for item in recommendations:
+        del item['_rating']
+    return recommendations
+
+def _recommend_from_shards(hospitals, recommended, user_lat, user_lng, radius, preferences):
+    """从分片查询合并后的候选计算推荐（分片已按外接矩形与行政区划筛选）"""
+    user_lat, user_lng, radius_km = float(user_lat), float(user_lng), radius / 1000
+    recommendations = []
+    for hospital in hospitals:
+        distance = calculate_distance(user_lat, user_lng, hospital.latitude, hospital.longitude)
+        if distance > radius_km:
+            continue
+        matched_departments = list(recommended & hospital.specialties)
+        score = calculate_hospital_score(hospital, len(matched_departments), distance, preferences)
+        recommendations.append({
+            "hospital": RawJSON(hospital.fragment),
+            "distance": round(distance, 2),
+            "score": score,
+            "matched_departments": matched_departments,
+            "departments_match_count": len(matched_departments),
+            "_rating": hospital.rating or 0
+        })
+    return recommendations
+
+def _recommend_from_directory(directory, recommended, user_lat, user_lng, radius, preferences, region):
+    """从内存映射的医院目录计算候选：外接矩形与科室位图都在映射的数组上完成，不查询数据库"""
+    user_lat, user_lng, radius_km = float(user_lat), float(user_lng), radius / 1000
+    mask = directory.mask(recommended)
+    recommendations = []
+    for row in directory.in_box(*_bounding_box(user_lat, user_lng, radius_km), region=region):
+        lat, lng = float(directory.latitude[row]), float(directory.longitude[row])
+        # 与数据库路径一致：坐标为 0 视为缺失
+        if not lat or not lng:
+            continue
+        distance = calculate_distance(user_lat, user_lng, lat, lng)
+        if distance > radius_km:
+            continue
+        matched_departments = directory.matched(row, mask)
+        entry = directory.entry(row)
+        score = calculate_hospital_score(entry, len(matched_departments), distance, preferences)
+        recommendations.append({
+            "hospital": RawJSON(directory.fragment(row)),
+            "distance": round(distance, 2),
+            "score": score,
+            "matched_departments": matched_departments,
+            "departments_match_count": len(matched_departments),
+            "_rating": entry.rating or 0
+        })
+    return recommendations
+
+def _recommend_from_db(recommended, user_lat, user_lng, radius, preferences, version, region):
+    # 查询所有医院（指定行政区划时走编码列索引，无法解析时按地址文本匹配）
+    query = Hospital.query
+    if region is not None:
+        query = query.filter(region_condition(Hospital, region))
+    hospitals = query.all()
+    
+    recommendations = []
+    
+    for hospital in hospitals:
+        if not hospital.latitude or not hospital.longitude:
+            continue
+        
+        # 计算距离
+        distance = calculate_distance(user_lat, user_lng, hospital.latitude, hospital.longitude)
+        
+        # 距离过滤
+        if distance > radius / 1000:  # 转换为公里
+            continue
+        
+        # 匹配的科室与匹配度
+        matched_departments = list(recommended & hospital_specialties(hospital, version))
+        departments_match = len(matched_departments)
+        
+        # 计算综合评分
+        score = calculate_hospital_score(hospital, departments_match, distance, preferences)
+        
+        recommendations.append({
+            "hospital": RawJSON(hospital_json(hospital, version)),
+            "distance": round(distance, 2),
+            "score": score,
+            "matched_departments": matched_departments,
+            "departments_match_count": departments_match,
+            "_rating": hospital.rating or 0
+        })
+    return recommendations
+
 def init_sample_data():
     """初始化示例数据"""
     # 检查是否已有数据
@@ -114,9 +258,10 @@ def init_sample_data():
         }
     ]
     
-    for hospital_data in sample_hospitals:
-        hospital = Hospital(**hospital_data)
-        db.session.add(hospital)
+    hospitals = [Hospital(**hospital_data) for hospital_data in sample_hospitals]
+    # 导入时按地址匹配行政区划编码
+    assign_regions(hospitals)
+    db.session.add_all(hospitals)
     
     db.session.commit()
     
@@ -170,56 +315,18 @@ def recommend_hospitals():
         if not user_lat or not user_lng:
             return jsonify({"error": "请提供用户位置信息"}), 400
         
+        # 可选：只推荐指定城市/区县内的医院
+        region = region_filter(data.get('city'), data.get('district'))
+        
         # 获取推荐科室
         recommended_departments = analysis_result.get('recommended_departments', [])
         
-        # 查询所有医院
-        hospitals = Hospital.query.all()
-        
-        recommendations = []
-        
-        for hospital in hospitals:
-            if not hospital.latitude or not hospital.longitude:
-                continue
-            
-            # 计算距离
-            distance = calculate_distance(user_lat, user_lng, hospital.latitude, hospital.longitude)
-            
-            # 距离过滤
-            if distance > radius / 1000:  # 转换为公里
-                continue
-            
-            # 计算科室匹配度
-            hospital_specialties = json.loads(hospital.specialties) if hospital.specialties else []
-            departments_match = len(set(recommended_departments) & set(hospital_specialties))
-            
-            # 计算综合评分
-            score = calculate_hospital_score(hospital, departments_match, distance, preferences)
-            
-            # 获取匹配的科室
-            matched_departments = list(set(recommended_departments) & set(hospital_specialties))
-            
-            recommendations.append({
-                "hospital": hospital.to_dict(),
-                "distance": round(distance, 2),
-                "score": score,
-                "matched_departments": matched_departments,
-                "departments_match_count": departments_match
-            })
+        recommendations = recommend_for(recommended_departments, user_lat, user_lng, radius, preferences, region)
         
-        # 按评分排序
-        sort_by = preferences.get('sort_by', 'score')
-        if sort_by == 'distance':
-            recommendations.sort(key=lambda x: x['distance'])
-        elif sort_by == 'rating':
-            recommendations.sort(key=lambda x: x['hospital']['rating'], reverse=True)
-        else:
-            recommendations.sort(key=lambda x: x['score'], reverse=True)
-        
-        return jsonify({
+        return json_response({
             "success": True,
             "data": {
-                "recommendations": recommendations[:10],  # 返回前10个推荐
+                "recommendations": recommendations[:RECOMMEND_LIMIT],  # 返回前10个推荐
                 "total_count": len(recommendations),
                 "search_params": {
                     "location": location,
@@ -236,57 +343,96 @@ def recommend_hospitals():
 def get_hospital_details(hospital_id):
     """获取医院详情"""
     try:
-        hospital = Hospital.query.get(hospital_id)
-        
-        if not hospital:
-            return jsonify({"error": "医院不存在"}), 404
+        version, updated_at = get_data_version_info()
         
-        # 获取科室信息
-        departments = Department.query.filter_by(hospital_id=hospital_id).all()
+        def build():
+            hospital = Hospital.query.get(hospital_id)
+            
+            if not hospital:
+                return jsonify({"error": "医院不存在"}), 404
+            
+            # 获取科室信息
+            departments = Department.query.filter_by(hospital_id=hospital_id).all()
+            
+            return json_response({
+                "success": True,
+                "data": {
+                    "hospital": RawJSON(hospital_json(hospital, version)),
+                    "departments": [RawJSON(department_json(dept, version)) for dept in departments]
+                }
+            })
         
-        return jsonify({
-            "success": True,
-            "data": {
-                "hospital": hospital.to_dict(),
-                "departments": [dept.to_dict() for dept in departments]
-            }
-        })
+        # ETag 只依赖数据版本与医院ID，客户端缓存有效时无需查询数据库
+        etag = make_etag('hospital', hospital_id, version)
+        return conditional_response('hospital_details', etag, build, 'hospital_details', updated_at)
         
     except Exception as e:
         return jsonify({"error": f"获取医院详情时出现错误: {str(e)}"}), 500
 
+# 搜索与附近医院的每页条数
+SEARCH_PAGE_SIZE = 20
+SEARCH_PAGE_MAX = 100
+NEARBY_PAGE_SIZE = 50
+NEARBY_PAGE_MAX = 200
+
 @hospitals_bp.route('/hospitals/search', methods=['GET'])
 def search_hospitals():
-    """搜索医院"""
+    """搜索医院（按 id 键集分页：?limit=&cursor=，响应中的 next_cursor 为空表示没有下一页；?format=ndjson 流式导出全部结果）"""
     try:
         query = request.args.get('q', '')
         city = request.args.get('city', '')
+        district = request.args.get('district', '')
         level = request.args.get('level', '')
+        cursor = request.args.get('cursor', '')
+        limit = page_limit(request.args.get('limit'), SEARCH_PAGE_SIZE, SEARCH_PAGE_MAX)
+        version, updated_at = get_data_version_info()
         
         hospitals_query = Hospital.query
         
         if query:
             hospitals_query = hospitals_query.filter(Hospital.name.contains(query))
         
-        if city:
-            hospitals_query = hospitals_query.filter(Hospital.address.contains(city))
+        region = region_filter(city, district)
+        if region is not None:
+            # 城市/区县解析为行政区划编码时走索引等值查询；编码表不可用或名称无法唯一确定时退回地址文本匹配
+            hospitals_query = hospitals_query.filter(region_condition(Hospital, region))
         
         if level:
             hospitals_query = hospitals_query.filter(Hospital.level == level)
+
+        if wants_ndjson():
+            return ndjson_response(after_cursor(hospitals_query, Hospital.id, cursor),
+                                   lambda hospital: hospital_json(hospital, version))
+        # 提前校验游标，非法游标返回 400 而不是进入缓存逻辑
+        decode_cursor(cursor, 1)
         
-        hospitals = hospitals_query.limit(20).all()
+        def build():
+            hospitals, next_cursor = paginate(hospitals_query, Hospital.id, cursor, limit)
+            
+            return json_response({
+                "success": True,
+                "data": [RawJSON(hospital_json(hospital, version)) for hospital in hospitals],
+                "next_cursor": next_cursor
+            })
         
-        return jsonify({
-            "success": True,
-            "data": [hospital.to_dict() for hospital in hospitals]
-        })
+        etag = make_etag('hospital_search', query, city, district, level, cursor, limit, version)
+        return conditional_response('hospital_search', etag, build, 'hospital_search', updated_at)
         
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         return jsonify({"error": f"搜索医院时出现错误: {str(e)}"}), 500
 
+def _bounding_box(lat, lng, radius_km):
+    """半径外接的经纬度矩形（略放大），用于在数据库中预筛选候选医院"""
+    lat_delta = radius_km / 110.574 * 1.01
+    cos_lat = math.cos(math.radians(lat))
+    lng_delta = 180.0 if cos_lat < 1e-6 else min(180.0, radius_km / (111.320 * cos_lat) * 1.01)
+    return lat - lat_delta, lat + lat_delta, lng - lng_delta, lng + lng_delta
+
 @hospitals_bp.route('/hospitals/nearby', methods=['POST'])
 def get_nearby_hospitals():
-    """获取附近医院"""
+    """获取附近医院（按 (距离, id) 键集分页：请求体中的 limit、cursor，响应中的 next_cursor 为空表示没有下一页）"""
     try:
         data = request.get_json()
         
@@ -299,29 +445,102 @@ def get_nearby_hospitals():
         
         if not user_lat or not user_lng:
             return jsonify({"error": "请提供有效的位置坐标"}), 400
+
+        try:
+            limit = page_limit(data.get('limit'), NEARBY_PAGE_SIZE, NEARBY_PAGE_MAX)
+            after = decode_cursor(data.get('cursor'), 2)
+            after = (float(after[0]), int(after[1])) if after is not None else None
+            user_lat, user_lng, radius_km = float(user_lat), float(user_lng), float(radius) / 1000  # 转换为公里
+        except (TypeError, ValueError) as e:
+            return jsonify({"error": str(e)}), 400
         
-        hospitals = Hospital.query.all()
-        nearby_hospitals = []
-        
-        for hospital in hospitals:
-            if not hospital.latitude or not hospital.longitude:
-                continue
-            
-            distance = calculate_distance(user_lat, user_lng, hospital.latitude, hospital.longitude)
-            
-            if distance <= radius / 1000:  # 转换为公里
-                hospital_data = hospital.to_dict()
-                hospital_data['distance'] = round(distance, 2)
-                nearby_hospitals.append(hospital_data)
+        # 可选：只返回指定城市/区县内的医院
+        region = region_filter(data.get('city'), data.get('district'))
+        codes = region.region if region is not None else None
+        # 城市/区县无法解析为编码时只能按地址文本匹配，直接查询数据库
+        by_address = region is not None and codes is None
         
-        # 按距离排序
-        nearby_hospitals.sort(key=lambda x: x['distance'])
+        # 先用外接矩形筛掉半径外的医院，只对候选计算测地线距离
+        min_lat, max_lat, min_lng, max_lng = _bounding_box(user_lat, user_lng, radius_km)
+        version = get_data_version()
+        box = (min_lat, max_lat, min_lng, max_lng)
+        shard_hospitals = None if by_address else hospital_shards.query_box(version, box, codes)
+        directory = hospital_directory.current(version) if shard_hospitals is None and not by_address else None
+        if shard_hospitals is not None:
+            # 按省分片：只查询与矩形相交的分片（R*Tree 索引），并行查询后合并
+            candidates = ((hospital.latitude, hospital.longitude, hospital.id, hospital)
+                          for hospital in shard_hospitals)
+            fragment = lambda hospital: hospital.fragment
+        elif directory is not None:
+            # 内存映射的医院目录：矩形筛选在映射的坐标数组上完成，响应直接使用目录中的 JSON 片段
+            candidates = ((float(directory.latitude[row]), float(directory.longitude[row]),
+                           int(directory.ids[row]), row)
+                          for row in directory.in_box(min_lat, max_lat, min_lng, max_lng, region=codes))
+            fragment = directory.fragment
+        else:
+            query = (Hospital.query
+                     .filter(Hospital.latitude.between(min_lat, max_lat))
+                     .filter(Hospital.longitude.between(min_lng, max_lng)))
+            if region is not None:
+                query = query.filter(region_condition(Hospital, region))
+            candidates = ((hospital.latitude, hospital.longitude, hospital.id, hospital)
+                          for hospital in query.yield_per(STREAM_BATCH_SIZE))
+            fragment = lambda hospital: hospital_json(hospital, version)
+
+        def in_radius():
+            for lat, lng, hospital_id, hospital in candidates:
+                distance = round(calculate_distance(user_lat, user_lng, lat, lng), 2)
+                # 排序键 (距离, id) 全序且确定，翻页时不会重复或遗漏
+                if distance <= radius_km and (after is None or (distance, hospital_id) > after):
+                    yield distance, hospital_id, hospital
+
+        # 只保留本页所需的最近 limit + 1 家，多出的一家用于判断是否还有下一页
+        nearby_hospitals = heapq.nsmallest(limit + 1, in_radius(), key=lambda item: (item[0], item[1]))
+        next_cursor = None
+        if len(nearby_hospitals) > limit:
+            nearby_hospitals = nearby_hospitals[:limit]
+            next_cursor = encode_cursor(nearby_hospitals[-1][0], nearby_hospitals[-1][1])
         
-        return jsonify({
+        return json_response({
             "success": True,
-            "data": nearby_hospitals
+            "data": [extend_raw(fragment(hospital), {'distance': distance})
+                     for distance, _, hospital in nearby_hospitals],
+            "next_cursor": next_cursor
         })
         
     except Exception as e:
         return jsonify({"error": f"获取附近医院时出现错误: {str(e)}"}), 500
 
+@hospitals_bp.route('/hospitals/shards/<int:province>/box', methods=['POST'])
+def query_hospital_shard(province):
+    """节点间接口：在本机的省级分片上做矩形查询（需携带与 HOSPITAL_SHARD_TOKEN 一致的 X-Shard-Token 请求头）"""
+    if not HOSPITAL_SHARD_TOKEN or request.headers.get('X-Shard-Token') != HOSPITAL_SHARD_TOKEN:
+        return jsonify({"error": "无权访问分片接口"}), 403
+    try:
+        data = request.get_json() or {}
+        shards = hospital_shards.snapshot()
+        if shards is None or province not in shards.shards:
+            return jsonify({"error": "本节点没有该分片"}), 404
+        # 调用方与本节点的分片必须是同一数据版本，否则由调用方回退
+        if data.get('version') != shards.version:
+            return jsonify({"error": "分片数据版本不一致", "version": shards.version}), 409
+        try:
+            box = tuple(float(value) for value in data['box'])
+            region = data.get('region')
+            region = (str(region[0]), int(region[1])) if region else None
+            if len(box) != 4:
+                raise ValueError('box 需要 4 个坐标')
+        except (KeyError, TypeError, ValueError, IndexError) as e:
+            return jsonify({"error": f"参数错误: {str(e)}"}), 400
+        hospitals = shards.query_local(province, box, region)
+        return json_response({
+            "success": True,
+            "data": {
+                "version": shards.version,
+                "hospitals": [{"id": h.id, "latitude": h.latitude, "longitude": h.longitude, "level": h.level,
+                               "rating": h.rating, "specialties": sorted(h.specialties),
+                               "hospital": RawJSON(h.fragment)} for h in hospitals]
+            }
+        })
+    except Exception as e:
+        return jsonify({"error": f"查询医院分片时出现错误: {str(e)}"}), 500
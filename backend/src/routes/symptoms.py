@@ -1,6 +1,10 @@
 from flask import Blueprint, request, jsonify
 import json
-import re
+import os
+import threading
+from src.services.emergency import emergency_prestage, reported_emergency
+from src.services.semantic_index import SemanticIndex
+from src.services.symptom_index import MAX_EDIT_DISTANCE, SymptomIndex, normalize_text
 
 symptoms_bp = Blueprint('symptoms', __name__)
 
@@ -58,17 +62,118 @@ SYMPTOM_DISEASE_MAP = {
     }
 }
 
+# 症状的常见说法与拼音，与症状名一起进入容错匹配索引
+SYMPTOM_SYNONYMS = {
+    "发热": ["发烧", "高烧", "低烧", "高热", "体温升高", "fare", "fashao"],
+    "咳嗽": ["干咳", "咳痰", "kesou"],
+    "头痛": ["头疼", "头好痛", "脑袋疼", "偏头疼", "toutong"],
+    "腹痛": ["肚子疼", "肚子痛", "肚疼", "胃疼", "胃痛", "futong", "duzitong"],
+    "胸痛": ["胸口疼", "胸口痛", "胸闷痛", "xiongtong"],
+    "恶心": ["想吐", "反胃", "exin"],
+    "呕吐": ["outu"],
+    "腹泻": ["拉肚子", "拉稀", "闹肚子", "fuxie", "laduzi"],
+    "乏力": ["没力气", "浑身无力", "疲劳", "疲倦", "fali"],
+    "失眠": ["睡不着", "睡不好", "入睡困难", "shimian"]
+}
+
+# 启动时构建一次：症状名与同义词的删除字典，支持错别字、繁体字与拼音
+SYMPTOM_INDEX = SymptomIndex(SYMPTOM_DISEASE_MAP, SYMPTOM_SYNONYMS)
+
+# 各科室的典型主诉，与症状条目一起构成语义检索的文档
+DEPARTMENT_PROFILES = {
+    "内科": "发热 浑身发烫 乏力 全身不舒服 全身酸痛 头晕 感冒 体检指标异常 慢性病复诊",
+    "呼吸内科": "咳嗽 咳痰 痰多 黄痰 咯血 痰中带血 气短 气喘 喘不上气 呼吸困难 胸闷憋气 嗓子疼 嗓子干 嗓子哑 喉咙痛 咽喉肿痛 鼻塞 流鼻涕 打喷嚏 支气管炎 肺炎 哮喘",
+    "心血管内科": "心慌 心里发慌 心慌气短 心悸 心跳快 心跳不齐 胸闷 胸口压榨感 胸口发紧 血压高 高血压 头晕 下肢水肿 脚肿 活动后气短 心绞痛 冠心病",
+    "消化内科": "胃胀 反酸 烧心 打嗝 嗳气 消化不良 食欲不振 吃不下饭 肚子胀 腹胀 便秘 大便带血 黑便 大便发黑 拉肚子 恶心 呕吐 胃炎 肠胃炎",
+    "神经内科": "头晕 眩晕 天旋地转 头痛 偏头痛 手脚麻木 手脚发麻 肢体无力 抽搐 记忆力下降 说话不清 口角歪斜 手抖 睡眠不好",
+    "普外科": "右下腹痛 阑尾炎 疝气 腹部包块 胆结石 胆囊炎 急腹症 乳腺肿块 甲状腺结节",
+    "外科": "外伤 伤口 流血 骨折 扭伤 摔伤 摔了一跤 摔倒后肿痛 手腕扭伤 肿块 烧伤 烫伤 需要手术",
+    "感染科": "发烧 身上滚烫 高烧不退 反复发热 传染病 肝炎 黄疸 发热伴皮疹 流感 痢疾 结核 被动物咬伤",
+    "急诊科": "突然发作 剧烈疼痛 昏迷 意识不清 晕倒 呼吸困难 大出血 中毒 车祸 高烧抽搐 急救",
+    "妇产科": "月经不调 痛经 月经量多 停经 怀孕 孕吐 阴道出血 白带异常 下腹坠痛 妊娠 产检",
+    "内分泌科": "口渴 多饮 多尿 体重下降 消瘦 血糖高 糖尿病 甲状腺 脖子粗 怕热 多汗 怕冷 甲亢 甲减",
+    "血液科": "贫血 脸色苍白 头晕乏力 牙龈出血 皮下瘀斑 鼻出血 淋巴结肿大 白细胞异常",
+    "精神科": "焦虑 紧张 心烦 情绪低落 抑郁 闷闷不乐 兴趣减退 失眠 多梦 早醒 幻听 压力大 惊恐发作",
+    "儿科": "婴儿 新生儿 哭闹 拒绝吃奶 不肯吃奶 吐奶 夜里哭 长牙 囟门",
+    "泌尿外科": "尿频 尿急 尿痛 小便疼 排尿困难 血尿 腰痛 肾结石 前列腺 尿不出来",
+    "肾内科": "水肿 眼睑浮肿 眼皮肿 泡沫尿 蛋白尿 肾炎 肾功能不全 夜尿多 腰酸",
+    "神经外科": "头部外伤 脑出血 颅内肿瘤 剧烈头痛伴喷射性呕吐 脑积水 脊髓损伤",
+    "皮肤科": "皮疹 起疹子 红疹 瘙痒 皮肤痒 湿疹 荨麻疹 起风团 身上起疙瘩 脱皮 长痘 痤疮 脱发 皮肤过敏 风团",
+    "肿瘤科": "肿瘤 癌症 肿块 包块 不明原因消瘦 化疗 放疗 淋巴结肿大"
+}
+
+# 关键词未命中时的语义检索：相似度阈值、最佳命中须领先第二名的差距与检索条数
+# 取值为 python -m benchmarks.semantic_symptoms --calibrate 在调优集上的选择（调优集召回 31/31、误报 0/41）；
+# 留出集不参与选择，其上召回 7/22、误报 0/12，召回低主要是科室主诉覆盖不足，而非阈值过严
+SEMANTIC_MIN_SCORE = float(os.environ.get('SEMANTIC_MIN_SCORE', '0.15'))
+SEMANTIC_MIN_MARGIN = float(os.environ.get('SEMANTIC_MIN_MARGIN', '0.03'))
+SEMANTIC_TOP_K = int(os.environ.get('SEMANTIC_TOP_K', '5'))
+
+_semantic_index = None
+_semantic_lock = threading.Lock()
+
+def semantic_documents():
+    """语义检索的文档：每个症状条目（症状名、同义词与相关疾病）与每个科室的典型主诉"""
+    documents = []
+    for symptom, symptom_data in SYMPTOM_DISEASE_MAP.items():
+        text = " ".join([symptom] + SYMPTOM_SYNONYMS.get(symptom, []) + symptom_data["diseases"])
+        documents.append(("symptom", symptom, text))
+    for department, profile in DEPARTMENT_PROFILES.items():
+        documents.append(("department", department, department + " " + profile))
+    return documents
+
+def semantic_index():
+    """语义索引首次使用时构建（需要 numpy），preload 模式下由 warm_up 提前构建"""
+    global _semantic_index
+    if _semantic_index is None:
+        with _semantic_lock:
+            if _semantic_index is None:
+                _semantic_index = SemanticIndex(semantic_documents())
+    return _semantic_index
+
+def hit_departments(hit):
+    """语义命中指向的科室：科室文档为科室本身，症状文档为知识库中该症状的科室"""
+    if hit.kind == "department":
+        return {hit.key}
+    return set(SYMPTOM_DISEASE_MAP[hit.key]["departments"])
+
+def same_department(first, second):
+    """两个语义命中是否指向同一科室（此时得分接近不算歧义）"""
+    return bool(hit_departments(first) & hit_departments(second))
+
+def semantic_search(text, k=SEMANTIC_TOP_K, min_score=None, min_margin=None):
+    """按 SEMANTIC_MIN_SCORE / SEMANTIC_MIN_MARGIN 检索；前两名指向同一科室时不要求领先差距"""
+    return semantic_index().search(text, k=k,
+                                   min_score=SEMANTIC_MIN_SCORE if min_score is None else min_score,
+                                   min_margin=SEMANTIC_MIN_MARGIN if min_margin is None else min_margin,
+                                   related=same_department)
+
+def symptom_list(symptoms):
+    """请求中的症状统一为字符串列表：接口同时接受列表与整段描述字符串"""
+    if symptoms is None:
+        return []
+    if isinstance(symptoms, str):
+        symptoms = [symptoms]
+    elif not isinstance(symptoms, (list, tuple)):
+        symptoms = [symptoms]
+    return [str(s).strip() for s in symptoms if s is not None and str(s).strip()]
+
+def join_symptom_text(symptoms, additional_info=""):
+    """把症状列表与补充信息拼成一段待匹配文本"""
+    return " ".join(symptom_list(symptoms)) + " " + str(additional_info or "")
+
+def match_symptoms(symptom_text):
+    """识别文本中的症状，返回带得分的 SymptomMatch 列表（按出现顺序、去重）"""
+    return SYMPTOM_INDEX.match(symptom_text)
+
 def normalize_symptoms(symptom_text):
-    """标准化症状描述"""
-    # 简单的关键词匹配，不使用jieba
-    symptoms = []
-    
-    # 直接在文本中查找症状关键词
-    for symptom in SYMPTOM_DISEASE_MAP.keys():
-        if symptom in symptom_text:
-            symptoms.append(symptom)
-    
-    return list(set(symptoms))  # 去重
+    """标准化症状描述：容错匹配后返回知识库中的症状名"""
+    return [match.symptom for match in match_symptoms(symptom_text)]
+
+def symptom_corrections(matches):
+    """非原文命中的匹配（同义词、错别字、繁体、拼音），用于提示用户系统把哪段描述理解成了哪个症状"""
+    return [{"input": match.text, "symptom": match.symptom, "score": match.score}
+            for match in matches if match.text != match.symptom]
 
 def calculate_severity_score(severity, duration):
     """计算严重程度评分"""
@@ -80,14 +185,29 @@ def calculate_severity_score(severity, duration):
     
     return (severity_score + duration_score) / 2
 
-def analyze_symptoms_logic(symptoms, severity="中等", duration="1-2天", additional_info=""):
-    """症状分析核心逻辑"""
-    normalized_symptoms = normalize_symptoms(" ".join(symptoms) + " " + additional_info)
+def analyze_symptoms_logic(symptoms, severity="中等", duration="1-2天", additional_info="", normalized_symptoms=None,
+                           semantic=True):
+    """症状分析核心逻辑；已标准化过的调用方可直接传入 normalized_symptoms，semantic=False 时不做语义检索"""
+    corrections = []
+    if normalized_symptoms is None:
+        matches = match_symptoms(join_symptom_text(symptoms, additional_info))
+        normalized_symptoms = [match.symptom for match in matches]
+        corrections = symptom_corrections(matches)
     
-    if not normalized_symptoms:
+    # 关键词未命中时先做本地语义检索，仍无结果才报告无法识别（调用方再决定是否交给大模型）
+    semantic_hits = []
+    if not normalized_symptoms and semantic:
+        semantic_hits = semantic_search(join_symptom_text(symptoms, additional_info))
+    
+    if not normalized_symptoms and not semantic_hits:
+        suggestions = ["请使用更具体的症状描述", "如：发热、咳嗽、头痛等"]
+        # 整段描述放宽编辑距离再查一次，给出“您是否想描述”的候选
+        candidates = SYMPTOM_INDEX.lookup(join_symptom_text(symptoms), limit=3, max_distance=MAX_EDIT_DISTANCE)
+        if candidates:
+            suggestions.insert(0, "您是否想描述：" + "、".join(match.symptom for match in candidates))
         return {
             "error": "未能识别有效症状，请重新描述",
-            "suggestions": ["请使用更具体的症状描述", "如：发热、咳嗽、头痛等"]
+            "suggestions": suggestions
         }
     
     # 收集可能的疾病和科室
@@ -96,10 +216,17 @@ def analyze_symptoms_logic(symptoms, severity="中等", duration="1-2天", addit
     
     severity_score = calculate_severity_score(severity, duration)
     
-    for symptom in normalized_symptoms:
+    # 每个症状的置信系数：关键词命中为 1，语义检索命中为相似度
+    symptom_factors = {symptom: 1.0 for symptom in normalized_symptoms}
+    if semantic_hits:
+        symptom_factors = {hit.key: hit.score for hit in semantic_hits if hit.kind == "symptom"}
+        normalized_symptoms = list(symptom_factors)
+        recommended_departments.update(hit.key for hit in semantic_hits if hit.kind == "department")
+    
+    for symptom, factor in symptom_factors.items():
         if symptom in SYMPTOM_DISEASE_MAP:
             symptom_data = SYMPTOM_DISEASE_MAP[symptom]
-            weight = symptom_data["severity_weight"] * severity_score
+            weight = symptom_data["severity_weight"] * severity_score * factor
             
             # 累积疾病评分
             for disease in symptom_data["diseases"]:
@@ -120,7 +247,7 @@ def analyze_symptoms_logic(symptoms, severity="中等", duration="1-2天", addit
     elif severity_score > 0.5:
         urgency_level = "中"
     
-    return {
+    result = {
         "normalized_symptoms": normalized_symptoms,
         "possible_diseases": [{"name": disease, "confidence": round(score, 2)} for disease, score in sorted_diseases[:5]],
         "recommended_departments": list(recommended_departments),
@@ -128,6 +255,27 @@ def analyze_symptoms_logic(symptoms, severity="中等", duration="1-2天", addit
         "severity_score": round(severity_score, 2),
         "advice": generate_advice(normalized_symptoms, urgency_level)
     }
+    if corrections:
+        result["symptom_corrections"] = corrections
+    if semantic_hits:
+        result["semantic_matches"] = [{"type": hit.kind, "name": hit.key, "score": hit.score} for hit in semantic_hits]
+    return result
+
+def emergency_analysis(result, emergency, severity="中等", duration="1-2天"):
+    """紧急情况下的分析结果：结构与正常结果相同，紧急程度为高，急诊科排在推荐科室首位；
+    只命中紧急关键词（如“昏迷”）而未识别出知识库症状时，以命中的紧急症状作为标准化症状"""
+    if 'error' in result:
+        result = {
+            "normalized_symptoms": list(emergency['detected_symptoms']),
+            "possible_diseases": [],
+            "recommended_departments": [],
+            "severity_score": round(calculate_severity_score(severity, duration), 2),
+        }
+    departments = [d for d in result['recommended_departments'] if d != "急诊科"]
+    result['recommended_departments'] = ["急诊科"] + departments
+    result['urgency_level'] = "高"
+    result['advice'] = emergency['immediate_actions'] + generate_advice(result['normalized_symptoms'], "高")
+    return result
 
 def generate_advice(symptoms, urgency_level):
     """生成医疗建议"""
@@ -170,8 +318,18 @@ def analyze_symptoms():
         if not symptoms:
             return jsonify({"error": "请提供至少一个症状"}), 400
         
+        # 紧急症状短路（先于症状分析）：描述正在发生的紧急症状时紧急程度直接置为高，急诊科优先，
+        # 并附带急救指引与最近急诊，此时只做关键词分析，不再触发语义检索；知识性提问照常分析，只附带急救提示
+        emergency = emergency_prestage('symptoms_analyze', (symptoms, additional_info),
+                                       data.get('latitude'), data.get('longitude'))
+        reported = reported_emergency(emergency)
+
         # 执行症状分析
-        result = analyze_symptoms_logic(symptoms, severity, duration, additional_info)
+        result = analyze_symptoms_logic(symptoms, severity, duration, additional_info, semantic=not reported)
+        if reported:
+            result = emergency_analysis(result, emergency, severity, duration)
+        if emergency:
+            result['emergency'] = emergency
         
         return jsonify({
             "success": True,
@@ -185,15 +343,26 @@ def analyze_symptoms():
 def get_symptom_suggestions():
     """获取症状建议列表"""
     try:
-        query = request.args.get('q', '').lower()
+        query = normalize_text(request.args.get('q', '')).strip()
         
         suggestions = []
         for symptom in SYMPTOM_DISEASE_MAP.keys():
             if not query or query in symptom:
                 suggestions.append({
                     "name": symptom,
-                    "category": "常见症状"
+                    "category": "常见症状",
+                    "score": 1.0
                 })
+        # 其余按同义词、错别字、拼音的容错匹配得分排序补充
+        if query:
+            listed = {item["name"] for item in suggestions}
+            for match in SYMPTOM_INDEX.lookup(query):
+                if match.symptom not in listed:
+                    suggestions.append({
+                        "name": match.symptom,
+                        "category": "常见症状",
+                        "score": match.score
+                    })
         
         return jsonify({
             "success": True,
@@ -0,0 +1,132 @@
+import time
+
+from flask import Blueprint, Response, jsonify, request, stream_with_context
+
+from src.routes.hospitals import RECOMMEND_LIMIT, init_sample_data, recommend_for
+from src.routes.symptoms import analyze_symptoms_logic, emergency_analysis, join_symptom_text, normalize_symptoms
+from src.services.emergency import emergency_prestage, reported_emergency
+from src.services.hedged_diagnosis import local_diagnosis
+from src.services.regions import region_filter
+from src.services.usage import quota_retry_after
+from src.utils.json_provider import dumps_bytes
+from src.utils.log import get_logger
+
+triage_bp = Blueprint('triage', __name__)
+
+logger = get_logger('triage')
+
+# --- 一次请求完成分诊 ---
+# 症状文本只解析一次，依次执行紧急检测、症状分析、医院推荐（以及可选的 AI 健康建议），
+# 每个阶段完成后立即以 NDJSON 的一行推送给客户端：{"section": ..., "data": ...} 或 {"section": ..., "error": ...}，
+# 最后一行为 {"section": "done", ...}。移动端一次往返即可拿到全部结果，并能先渲染先到的部分。
+
+def _line(section, data=None, error=None):
+    payload = {"section": section}
+    if error is not None:
+        payload["error"] = error
+    else:
+        payload["data"] = data
+    return dumps_bytes(payload) + b'\n'
+
+def _run_triage(data):
+    """各阶段独立捕获异常：响应头与前面的行已经发出，某一阶段失败时推送该阶段的 error 行，后续阶段照常执行，
+    最后总是以 done 行结束，客户端不会收到被截断的流"""
+    start = time.perf_counter()
+    symptoms = data.get('symptoms', [])
+    severity = data.get('severity', '中等')
+    duration = data.get('duration', '1-2天')
+    additional_info = data.get('additional_info', '')
+    location = data.get('location') or {}
+    user_lat = location.get('latitude')
+    user_lng = location.get('longitude')
+
+    # 1. 紧急检测（最快，最先推送）；症状文本只拼接、扫描一次，各阶段共用
+    # 知识性提问（informational）只推送急救提示，后续阶段照常进行
+    text, normalized_symptoms, emergency, reported = '', None, None, False
+    try:
+        text = join_symptom_text(symptoms, additional_info)
+        normalized_symptoms = normalize_symptoms(text)
+        emergency = emergency_prestage('triage', (text,), user_lat, user_lng)
+        reported = reported_emergency(emergency)
+        yield _line('emergency', emergency or {"is_emergency": False})
+    except Exception as e:
+        logger.exception("triage emergency check failed")
+        yield _line('emergency', error=f"紧急检测出现错误: {str(e)}")
+
+    # 2. 症状分析
+    analysis = {}
+    try:
+        analysis = analyze_symptoms_logic(symptoms, severity, duration, additional_info, normalized_symptoms,
+                                          semantic=not reported)
+        if reported:
+            analysis = emergency_analysis(analysis, emergency, severity, duration)
+        if 'error' in analysis:
+            yield _line('analysis', error=analysis['error'])
+        else:
+            yield _line('analysis', analysis)
+    except Exception as e:
+        logger.exception("triage symptom analysis failed")
+        analysis = {}
+        yield _line('analysis', error=f"症状分析出现错误: {str(e)}")
+
+    # 3. 医院推荐：紧急情况优先匹配急诊科（分析结果已把急诊科排在首位，分析失败时也保证这一点）
+    departments = list(analysis.get('recommended_departments', []))
+    if reported and "急诊科" not in departments:
+        departments.insert(0, "急诊科")
+    if not user_lat or not user_lng:
+        yield _line('hospitals', error="请提供用户位置信息")
+    elif not departments:
+        yield _line('hospitals', error="未能识别有效症状，无法推荐科室")
+    else:
+        try:
+            # 可选：只推荐指定城市/区县内的医院（无法解析为编码时按地址文本匹配）
+            region = region_filter(data.get('city'), data.get('district'))
+            init_sample_data()
+            recommendations = recommend_for(departments, user_lat, user_lng, data.get('radius', 50000),
+                                            data.get('preferences', {}), region)
+            yield _line('hospitals', {
+                "recommendations": recommendations[:RECOMMEND_LIMIT],
+                "total_count": len(recommendations),
+                "recommended_departments": departments
+            })
+        except Exception as e:
+            logger.exception("triage hospital recommendation failed")
+            yield _line('hospitals', error=f"推荐过程中出现错误: {str(e)}")
+
+    # 4. 可选的 AI 健康建议（对冲诊断，最多等待 DIAGNOSIS_DEADLINE_MS）；紧急情况下不再调用大模型
+    # 客户端 token 配额用尽时只使用本地规则引擎
+    if data.get('include_advice') and not reported:
+        try:
+            from src.routes.ai_assistant import hedged_diagnosis
+            if quota_retry_after() is not None:
+                source, advice, reason = 'local', local_diagnosis(symptoms, severity, duration, additional_info), 'quota'
+                if advice is None:
+                    reason = "AI服务使用额度已用完，请稍后再试"
+            else:
+                source, advice, reason = hedged_diagnosis.diagnose(symptoms, severity, duration, additional_info)
+            if advice is None:
+                yield _line('advice', error=reason)
+            else:
+                yield _line('advice', {"source": source, "fallback_reason": reason, "diagnosis": advice})
+        except Exception as e:
+            logger.exception("triage health advice failed")
+            yield _line('advice', error=f"生成健康建议时出现错误: {str(e)}")
+
+    yield _line('done', {"elapsed_ms": round((time.perf_counter() - start) * 1000, 2)})
+
+@triage_bp.route('/triage', methods=['POST'])
+def triage():
+    """一站式分诊API（NDJSON 流式返回）"""
+    try:
+        data = request.get_json(silent=True)
+
+        if not data:
+            return jsonify({"error": "请提供症状信息"}), 400
+        if not data.get('symptoms'):
+            return jsonify({"error": "请提供至少一个症状"}), 400
+
+        return Response(stream_with_context(_run_triage(data)), mimetype='application/x-ndjson',
+                        headers={'Cache-Control': 'no-store', 'X-Accel-Buffering': 'no'})
+
+    except Exception as e:
+        return jsonify({"error": f"分诊过程中出现错误: {str(e)}"}), 500
@@ -1,22 +1,108 @@
-from flask import Blueprint, jsonify, request
+import json
+from collections import Counter
+
+from flask import Blueprint, Response, jsonify, request, stream_with_context
+from sqlalchemy.exc import IntegrityError
 from src.models.user import User, db
+from src.services.bulk_users import BULK_OPS, InvalidRow, bulk_write
+from src.utils.json_provider import dumps_bytes
+from src.utils.pagination import (NDJSON_MIMETYPE, after_cursor, ndjson_response, paginate, page_limit,
+                                  wants_ndjson)
 
 user_bp = Blueprint('user', __name__)
 
+# 用户列表每页条数
+USER_PAGE_SIZE = 50
+USER_PAGE_MAX = 500
+
 @user_bp.route('/users', methods=['GET'])
 def get_users():
-    users = User.query.all()
-    return jsonify([user.to_dict() for user in users])
+    """用户列表：按 id 键集分页（?limit=&cursor=），下一页游标在 X-Next-Cursor 响应头；?format=ndjson 流式导出全部用户"""
+    try:
+        limit = page_limit(request.args.get('limit'), USER_PAGE_SIZE, USER_PAGE_MAX)
+        cursor = request.args.get('cursor')
+        if wants_ndjson():
+            return ndjson_response(after_cursor(User.query, User.id, cursor), User.to_dict)
+        users, next_cursor = paginate(User.query, User.id, cursor, limit)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    response = jsonify([user.to_dict() for user in users])
+    if next_cursor:
+        response.headers['X-Next-Cursor'] = next_cursor
+        response.headers['Link'] = f'<{request.base_url}?limit={limit}&cursor={next_cursor}>; rel="next"'
+    return response
 
 @user_bp.route('/users', methods=['POST'])
 def create_user():
     
-    data = request.json
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict) or not data.get('username') or not data.get('email'):
+        return jsonify({"error": "请提供 username 和 email"}), 400
     user = User(username=data['username'], email=data['email'])
     db.session.add(user)
-    db.session.commit()
+    try:
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        return jsonify({"error": "用户名或邮箱已存在"}), 409
     return jsonify(user.to_dict()), 201
 
+# --- 批量写入 ---
+# 请求体为 JSON 数组（或 {"op": ..., "users": [...]}）时返回 JSON：{"success", "summary", "results"}；
+# Content-Type 为 application/x-ndjson 时逐行读取请求体，结果同样以 NDJSON 逐行返回，最后一行为 {"summary": ...}。
+# 操作由 ?op=create|upsert|delete 指定（默认 create），写入逻辑见 src/services/bulk_users.py。
+def _ndjson_rows(stream):
+    for line in stream:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError as e:
+            yield InvalidRow(f'无法解析的JSON行: {e}')
+
+@user_bp.route('/users/bulk', methods=['POST'])
+def bulk_users():
+    """批量创建、更新或删除用户"""
+    try:
+        op = request.args.get('op')
+        if request.mimetype == NDJSON_MIMETYPE:
+            op = op or 'create'
+            if op not in BULK_OPS:
+                return jsonify({"error": f"op 仅支持 {'、'.join(BULK_OPS)}"}), 400
+
+            def generate():
+                summary = Counter()
+                for result in bulk_write(op, _ndjson_rows(request.stream)):
+                    summary[result['status']] += 1
+                    yield dumps_bytes(result) + b'\n'
+                yield dumps_bytes({"summary": dict(summary, total=sum(summary.values()))}) + b'\n'
+
+            return Response(stream_with_context(generate()), mimetype=NDJSON_MIMETYPE,
+                            headers={'Cache-Control': 'no-store', 'X-Accel-Buffering': 'no'})
+
+        data = request.get_json(silent=True)
+        if isinstance(data, dict):
+            op = op or data.get('op')
+            data = data.get('users')
+        op = op or 'create'
+        if op not in BULK_OPS:
+            return jsonify({"error": f"op 仅支持 {'、'.join(BULK_OPS)}"}), 400
+        if not isinstance(data, list):
+            return jsonify({"error": "请提供用户数组（JSON 数组或 NDJSON）"}), 400
+
+        results = list(bulk_write(op, data))
+        summary = Counter(result['status'] for result in results)
+        return jsonify({
+            "success": True,
+            "summary": dict(summary, total=len(results)),
+            "results": results
+        })
+
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({"error": f"批量处理用户时出现错误: {str(e)}"}), 500
+
 @user_bp.route('/users/<int:user_id>', methods=['GET'])
 def get_user(user_id):
     user = User.query.get_or_404(user_id)
@@ -28,7 +114,11 @@ def update_user(user_id):
     data = request.json
     user.username = data.get('username', user.username)
     user.email = data.get('email', user.email)
-    db.session.commit()
+    try:
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        return jsonify({"error": "用户名或邮箱已存在"}), 409
     return jsonify(user.to_dict())
 
 @user_bp.route('/users/<int:user_id>', methods=['DELETE'])
@@ -0,0 +1,371 @@
+"""异步 AI 任务队列：提交 / 轮询 / 完成通知。
+
+/ai/health-advice 在整个大模型诊断期间占用 HTTP 连接，移动网络下客户端超时重试会让负载翻倍。
+任务 API 把提交与取结果分开：
+- 提交：任务行写入 SQLite（ai_jobs）后立即返回 202，由本进程的线程池执行；
+  客户端携带 Idempotency-Key 时，同一客户端以同一键的重试返回已有任务而不会重复执行（键对应不同请求时报冲突），
+  键按 (client, idempotency_key) 区分，其他客户端无法用猜到的键取得别人的任务；
+- 执行：worker 以条件 UPDATE（status=queued -> running）领取任务，重复派发的任务只会执行一次；
+  完成时按领取时的 attempts 条件写回结果，超时后被重新领取的旧执行不会覆盖新结果；
+- 结果保留 AI_JOB_RESULT_TTL 秒，过期后查询返回 404，并在定期清理时删除；
+- 完成通知：提交时指定 webhook_url 的任务完成后 POST 任务 JSON（设置 AI_JOB_WEBHOOK_SECRET 时附 HMAC 签名），
+  投递与重试在单独的小线程池中进行，不占用执行任务的 worker；webhook 地址只允许 AI_JOB_WEBHOOK_HOSTS 中的主机，
+  未配置时主机解析出的地址必须全部是公网地址（拒绝回环、链路本地、私有等地址），投递前再校验一次；
+  也可以订阅 SSE（本进程执行的任务由完成事件唤醒，其他进程执行的按间隔查询数据库）。
+提交任务的进程退出后，排队或执行中的任务由其他进程在定期清理时重新派发（执行中的按尝试次数重试或标记失败）。
+排队与执行耗时记录在 ai_job_queue_seconds / ai_job_run_seconds，进程内未完成的任务数为 ai_jobs_in_flight。
+"""
+import datetime
+import hashlib
+import hmac
+import json
+import ipaddress
+import os
+import socket
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+from flask import current_app
+from sqlalchemy.exc import IntegrityError
+
+from src.models.job import JOB_DONE, JOB_FAILED, JOB_QUEUED, JOB_RUNNING, AIJob
+from src.models.user import db
+from src.services.usage import submit_in_context
+from src.utils.json_provider import dumps_bytes
+from src.utils.log import get_logger
+from src.utils.metrics import REGISTRY
+
+logger = get_logger('ai_jobs')
+
+# 执行任务的线程数
+AI_JOB_WORKERS = int(os.environ.get('AI_JOB_WORKERS', '4'))
+# 结果保留时长（秒）
+AI_JOB_RESULT_TTL = float(os.environ.get('AI_JOB_RESULT_TTL', '3600'))
+# 任务排队或执行超过该时长（秒）视为所在进程已退出，由清理重新派发
+AI_JOB_TIMEOUT = float(os.environ.get('AI_JOB_TIMEOUT', '300'))
+AI_JOB_MAX_ATTEMPTS = int(os.environ.get('AI_JOB_MAX_ATTEMPTS', '2'))
+# 两次清理（删除过期结果、重新派发遗留任务）的最小间隔（秒）
+AI_JOB_SWEEP_INTERVAL = float(os.environ.get('AI_JOB_SWEEP_INTERVAL', '30'))
+# SSE 订阅查询其他进程所执行任务的间隔与订阅的最长时长（秒）
+AI_JOB_POLL_INTERVAL = float(os.environ.get('AI_JOB_POLL_INTERVAL', '0.5'))
+AI_JOB_SSE_TIMEOUT = float(os.environ.get('AI_JOB_SSE_TIMEOUT', '120'))
+# webhook：签名密钥、允许的主机（逗号分隔，为空时只允许解析到公网地址的主机）、超时、重试次数与投递线程数
+AI_JOB_WEBHOOK_SECRET = os.environ.get('AI_JOB_WEBHOOK_SECRET', '')
+AI_JOB_WEBHOOK_HOSTS = {h.strip().lower() for h in os.environ.get('AI_JOB_WEBHOOK_HOSTS', '').split(',') if h.strip()}
+AI_JOB_WEBHOOK_TIMEOUT = float(os.environ.get('AI_JOB_WEBHOOK_TIMEOUT', '5'))
+AI_JOB_WEBHOOK_RETRIES = 3
+AI_JOB_WEBHOOK_WORKERS = int(os.environ.get('AI_JOB_WEBHOOK_WORKERS', '2'))
+
+AI_JOBS_SUBMITTED = REGISTRY.counter(
+    'ai_jobs_submitted_total', 'AI job submissions (created, or replayed by idempotency key)', ('kind', 'result'))
+AI_JOBS_IN_FLIGHT = REGISTRY.gauge('ai_jobs_in_flight', 'AI jobs dispatched to this process and not yet finished',
+                                   ('kind',))
+AI_JOB_QUEUE_SECONDS = REGISTRY.histogram(
+    'ai_job_queue_seconds', 'Time from AI job submission to a worker claiming it', ('kind',),
+    buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0, 300.0))
+AI_JOB_RUN_SECONDS = REGISTRY.histogram(
+    'ai_job_run_seconds', 'AI job execution time', ('kind', 'status'),
+    buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0))
+AI_JOB_WEBHOOKS = REGISTRY.counter('ai_job_webhooks_total', 'AI job completion webhook deliveries', ('result',))
+
+
+class JobConflict(ValueError):
+    """幂等键已用于内容不同的请求"""
+
+
+def _utcnow():
+    return datetime.datetime.utcnow()
+
+
+def request_hash(kind, payload):
+    return hashlib.sha256(json.dumps([kind, payload], sort_keys=True, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+
+def _public_address(address):
+    ip = ipaddress.ip_address(address.split('%', 1)[0])
+    if isinstance(ip, ipaddress.IPv6Address) and ip.ipv4_mapped:
+        ip = ip.ipv4_mapped
+    return ip.is_global and not ip.is_multicast
+
+
+def validate_webhook_url(url):
+    """只接受 http(s) 地址；配置了 AI_JOB_WEBHOOK_HOSTS 时主机必须在其中，
+    未配置时主机解析出的全部地址都必须是公网地址，防止借 webhook 访问本机或内网服务"""
+    try:
+        parts = urlsplit(url)
+        hostname, port = parts.hostname, parts.port
+    except ValueError:
+        raise ValueError('webhook_url 必须是 http(s) 地址')
+    if parts.scheme not in ('http', 'https') or not hostname:
+        raise ValueError('webhook_url 必须是 http(s) 地址')
+    if AI_JOB_WEBHOOK_HOSTS:
+        if hostname.lower() not in AI_JOB_WEBHOOK_HOSTS:
+            raise ValueError('webhook_url 的主机不在允许列表中')
+        return url
+    try:
+        addresses = {info[4][0] for info in socket.getaddrinfo(hostname, port or 443, proto=socket.IPPROTO_TCP)}
+    except (socket.gaierror, UnicodeError):
+        raise ValueError('webhook_url 的主机无法解析')
+    if not addresses or not all(_public_address(address) for address in addresses):
+        raise ValueError('webhook_url 不能指向本机、内网或保留地址')
+    return url
+
+
+class JobQueue:
+    """任务的提交、执行与查询，需在应用上下文中调用"""
+
+    def __init__(self, workers=AI_JOB_WORKERS, ttl=AI_JOB_RESULT_TTL, timeout=AI_JOB_TIMEOUT,
+                 max_attempts=AI_JOB_MAX_ATTEMPTS):
+        self.workers = workers
+        self.ttl = ttl
+        self.timeout = timeout
+        self.max_attempts = max_attempts
+        self._handlers = {}
+        self._executor = None
+        self._webhook_executor = None
+        self._lock = threading.Lock()
+        # 任务 id -> 等待者的完成事件集合，供本进程的 SSE 订阅等待
+        self._events = {}
+        self._swept_at = 0.0
+
+    def register(self, kind, handler):
+        """handler(payload) 返回可 JSON 序列化的结果，抛出异常时任务失败"""
+        self._handlers[kind] = handler
+
+    def _pool(self):
+        # 线程池在首次派发时创建，preload 的主进程不会持有线程
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='ai-job')
+        return self._executor
+
+    def _webhook_pool(self):
+        # webhook 投递（含重试间的等待）使用单独的线程池，慢的回调地址不会拖住执行任务的 worker
+        if self._webhook_executor is None:
+            with self._lock:
+                if self._webhook_executor is None:
+                    self._webhook_executor = ThreadPoolExecutor(max_workers=AI_JOB_WEBHOOK_WORKERS,
+                                                                thread_name_prefix='ai-job-webhook')
+        return self._webhook_executor
+
+    # --- 提交与查询 ---
+    def submit(self, kind, payload, client=None, idempotency_key=None, webhook_url=None):
+        """返回 (任务, 是否新建)；同一客户端的幂等键已用于不同请求时抛出 JobConflict"""
+        if kind not in self._handlers:
+            raise ValueError(f'未知的任务类型: {kind}')
+        self.maybe_sweep()
+        digest = request_hash(kind, payload)
+        # 唯一约束中 NULL 互不相等，客户端统一存为字符串，幂等键才能生效
+        client = client or ''
+        if idempotency_key:
+            existing = self._by_key(client, idempotency_key)
+            if existing is not None:
+                return self._replay(existing, digest), False
+        job = AIJob(id=uuid.uuid4().hex, kind=kind, status=JOB_QUEUED, idempotency_key=idempotency_key or None,
+                    request_hash=digest, client=client, payload=json.dumps(payload, ensure_ascii=False),
+                    webhook_url=webhook_url, attempts=0, created_at=_utcnow())
+        db.session.add(job)
+        try:
+            db.session.commit()
+        except IntegrityError:
+            # 并发的重试同时插入了同一幂等键
+            db.session.rollback()
+            existing = self._by_key(client, idempotency_key)
+            if existing is None:
+                raise
+            return self._replay(existing, digest), False
+        AI_JOBS_SUBMITTED.inc(kind=kind, result='created')
+        self._dispatch(job.id, kind)
+        return job, True
+
+    def _by_key(self, client, idempotency_key):
+        job = AIJob.query.filter_by(client=client, idempotency_key=idempotency_key).first()
+        if job is not None and self._expired(job):
+            # 结果已过期：释放该键，按新任务处理
+            db.session.delete(job)
+            db.session.commit()
+            return None
+        return job
+
+    @staticmethod
+    def _replay(job, digest):
+        if job.request_hash != digest:
+            raise JobConflict('该 Idempotency-Key 已用于内容不同的请求')
+        AI_JOBS_SUBMITTED.inc(kind=job.kind, result='replayed')
+        return job
+
+    @staticmethod
+    def _expired(job):
+        return job.expires_at is not None and job.expires_at <= _utcnow()
+
+    def get(self, job_id):
+        """任务的最新状态；不存在或结果已过期时返回 None"""
+        self.maybe_sweep()
+        job = db.session.get(AIJob, job_id, populate_existing=True)
+        if job is None or self._expired(job):
+            return None
+        return job
+
+    def wait(self, job_id, timeout):
+        """等待任务结束，返回最新的任务（超时时可能仍未结束）；任务不存在时返回 None"""
+        deadline = time.monotonic() + timeout
+        # 先登记完成事件再查询，查询之后才完成的任务也能唤醒等待
+        event = threading.Event()
+        with self._lock:
+            self._events.setdefault(job_id, set()).add(event)
+        try:
+            while True:
+                # 结束当前读事务，才能看到其他线程/进程提交的结果
+                db.session.rollback()
+                job = self.get(job_id)
+                remaining = deadline - time.monotonic()
+                if job is None or job.finished or remaining <= 0:
+                    return job
+                # 其他进程执行的任务不会触发本进程的事件，按间隔重新查询
+                event.wait(min(AI_JOB_POLL_INTERVAL, remaining))
+        finally:
+            with self._lock:
+                waiters = self._events.get(job_id)
+                if waiters is not None:
+                    waiters.discard(event)
+                    if not waiters:
+                        del self._events[job_id]
+
+    def _notify(self, job_id):
+        with self._lock:
+            waiters = self._events.pop(job_id, ())
+        for event in waiters:
+            event.set()
+
+    # --- 执行 ---
+    def _dispatch(self, job_id, kind):
+        AI_JOBS_IN_FLIGHT.inc(kind=kind)
+        # 携带当前上下文，大模型用量仍记在提交任务的路由与客户端上
+        submit_in_context(self._pool(), self._run, current_app._get_current_object(), job_id, kind)
+
+    def _run(self, app, job_id, kind):
+        try:
+            with app.app_context():
+                self._execute(job_id)
+        except Exception:
+            logger.exception("AI job %s crashed", job_id)
+        finally:
+            AI_JOBS_IN_FLIGHT.dec(kind=kind)
+            self._notify(job_id)
+
+    def _execute(self, job_id):
+        claimed = (AIJob.query.filter_by(id=job_id, status=JOB_QUEUED)
+                   .update({'status': JOB_RUNNING, 'started_at': _utcnow(), 'attempts': AIJob.attempts + 1},
+                           synchronize_session=False))
+        db.session.commit()
+        if not claimed:
+            # 已被其他进程或线程领取，或已被删除
+            return
+        job = db.session.get(AIJob, job_id, populate_existing=True)
+        attempt = job.attempts
+        AI_JOB_QUEUE_SECONDS.observe((job.started_at - job.created_at).total_seconds(), kind=job.kind)
+
+        start = time.perf_counter()
+        try:
+            result = self._handlers[job.kind](json.loads(job.payload))
+            values = {'status': JOB_DONE, 'result': dumps_bytes(result).decode('utf-8'), 'error': None}
+        except Exception as e:
+            logger.warning("AI job %s (%s) failed: %s: %s", job_id, job.kind, type(e).__name__, e)
+            values = {'status': JOB_FAILED, 'result': None, 'error': str(e) or type(e).__name__}
+        AI_JOB_RUN_SECONDS.observe(time.perf_counter() - start, kind=job.kind, status=values['status'])
+
+        finished = _utcnow()
+        values.update(finished_at=finished, expires_at=finished + datetime.timedelta(seconds=self.ttl))
+        updated = (AIJob.query.filter_by(id=job_id, status=JOB_RUNNING, attempts=attempt)
+                   .update(values, synchronize_session=False))
+        db.session.commit()
+        if updated and job.webhook_url:
+            self._webhook_pool().submit(self._deliver_webhook_in_context, current_app._get_current_object(), job_id)
+
+    def _deliver_webhook(self, job):
+        import requests
+
+        try:
+            # 提交后主机的解析结果可能已变化，投递前再校验一次
+            validate_webhook_url(job.webhook_url)
+        except ValueError as e:
+            AI_JOB_WEBHOOKS.inc(result='rejected')
+            logger.warning("Webhook for AI job %s rejected: %s", job.id, e)
+            return False
+        body = dumps_bytes({'event': 'ai_job.finished', 'job': job.to_dict()})
+        headers = {'Content-Type': 'application/json', 'X-Job-Id': job.id}
+        if AI_JOB_WEBHOOK_SECRET:
+            signature = hmac.new(AI_JOB_WEBHOOK_SECRET.encode('utf-8'), body, hashlib.sha256).hexdigest()
+            headers['X-Job-Signature'] = f'sha256={signature}'
+        for attempt in range(AI_JOB_WEBHOOK_RETRIES):
+            if attempt:
+                time.sleep(2 ** (attempt - 1))
+            try:
+                # 不跟随重定向：重定向目标未经校验
+                response = requests.post(job.webhook_url, data=body, headers=headers, timeout=AI_JOB_WEBHOOK_TIMEOUT,
+                                         allow_redirects=False)
+                if response.status_code < 300:
+                    AI_JOB_WEBHOOKS.inc(result='ok')
+                    return True
+                error = f'HTTP {response.status_code}'
+            except requests.RequestException as e:
+                error = f'{type(e).__name__}: {e}'
+        AI_JOB_WEBHOOKS.inc(result='failed')
+        logger.warning("Webhook for AI job %s failed after %d attempts: %s", job.id, AI_JOB_WEBHOOK_RETRIES, error)
+        return False
+
+    # --- 清理 ---
+    def maybe_sweep(self):
+        now = time.monotonic()
+        if now - self._swept_at < AI_JOB_SWEEP_INTERVAL:
+            return
+        with self._lock:
+            if now - self._swept_at < AI_JOB_SWEEP_INTERVAL:
+                return
+            self._swept_at = now
+        try:
+            self.sweep()
+        except Exception:
+            db.session.rollback()
+            logger.exception("AI job sweep failed")
+
+    def sweep(self):
+        """删除过期结果；执行超时的任务按尝试次数重新排队或标记失败，长时间未被领取的任务重新派发到本进程"""
+        now = _utcnow()
+        stale = now - datetime.timedelta(seconds=self.timeout)
+        expired = AIJob.query.filter(AIJob.expires_at <= now).delete(synchronize_session=False)
+        failed = []
+        for job in AIJob.query.filter(AIJob.status == JOB_RUNNING, AIJob.started_at <= stale).all():
+            if job.attempts >= self.max_attempts:
+                job.status, job.error = JOB_FAILED, '任务执行超时'
+                job.finished_at, job.expires_at = now, now + datetime.timedelta(seconds=self.ttl)
+                failed.append(job)
+            else:
+                job.status = JOB_QUEUED
+        db.session.commit()
+        orphaned = (AIJob.query.with_entities(AIJob.id, AIJob.kind)
+                    .filter(AIJob.status == JOB_QUEUED, AIJob.created_at <= stale).all())
+        for job_id, kind in orphaned:
+            if kind in self._handlers:
+                self._dispatch(job_id, kind)
+        for job in failed:
+            if job.webhook_url:
+                self._webhook_pool().submit(self._deliver_webhook_in_context, current_app._get_current_object(), job.id)
+        if expired or orphaned or failed:
+            logger.info("AI job sweep: %d expired, %d re-dispatched, %d timed out", expired, len(orphaned), len(failed))
+
+    def _deliver_webhook_in_context(self, app, job_id):
+        try:
+            with app.app_context():
+                job = db.session.get(AIJob, job_id)
+                if job is not None:
+                    self._deliver_webhook(job)
+        except Exception:
+            logger.exception("Webhook delivery for AI job %s crashed", job_id)
+
+
+job_queue = JobQueue()
@@ -0,0 +1,166 @@
+"""用户批量写入（/api/users/bulk）。
+
+输入行按 USER_BULK_BATCH_SIZE 分批，每批一个事务、一条语句：
+- create：INSERT ... ON CONFLICT DO NOTHING RETURNING，用户名或邮箱已存在的行报告 conflict；
+- upsert：INSERT ... ON CONFLICT(username) DO UPDATE SET email = excluded.email，按用户名新建或更新；
+  新邮箱与其他用户冲突导致整批失败时，回滚后逐行重试，只有冲突的行报告 conflict；
+- delete：DELETE ... WHERE id IN (...) OR username IN (...) RETURNING，行可以是 id、{"id": ...} 或 {"username": ...}。
+每一行都有一条结果 {"index", "status", "id", "error"}；各批独立提交，前面批次的写入不会因后续批次失败而回滚。
+"""
+import os
+
+from sqlalchemy import or_
+from sqlalchemy.exc import IntegrityError
+
+from src.models.user import User, db
+from src.utils.log import get_logger
+
+logger = get_logger('bulk_users')
+
+# 每个事务写入的行数
+USER_BULK_BATCH_SIZE = int(os.environ.get('USER_BULK_BATCH_SIZE', '500'))
+BULK_OPS = ('create', 'upsert', 'delete')
+
+
+class InvalidRow(ValueError):
+    """行格式错误（无法解析的 JSON、缺少字段等），只影响该行"""
+
+
+def _insert():
+    if db.engine.dialect.name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    return insert(User.__table__)
+
+
+def _result(index, status, user_id=None, error=None):
+    result = {'index': index, 'status': status}
+    if user_id is not None:
+        result['id'] = user_id
+    if error is not None:
+        result['error'] = error
+    return result
+
+
+def _user_fields(row):
+    if not isinstance(row, dict):
+        raise InvalidRow('每一行必须是JSON对象')
+    username, email = row.get('username'), row.get('email')
+    if not isinstance(username, str) or not username or not isinstance(email, str) or not email:
+        raise InvalidRow('缺少 username 或 email')
+    return {'username': username, 'email': email}
+
+
+def _delete_key(row):
+    if isinstance(row, dict):
+        if isinstance(row.get('id'), int) and not isinstance(row.get('id'), bool):
+            return 'id', row['id']
+        if isinstance(row.get('username'), str) and row['username']:
+            return 'username', row['username']
+    elif isinstance(row, int) and not isinstance(row, bool):
+        return 'id', row
+    raise InvalidRow('删除行需为用户 id、{"id": ...} 或 {"username": ...}')
+
+
+def _write_users(op, rows):
+    """rows: [(index, fields)]，用户名在批内唯一；返回 {username: (id, status)}"""
+    stmt = _insert().values([fields for _, fields in rows])
+    usernames = [fields['username'] for _, fields in rows]
+    if op == 'create':
+        stmt = stmt.on_conflict_do_nothing()
+        existing = set()
+    else:
+        stmt = stmt.on_conflict_do_update(index_elements=['username'], set_={'email': stmt.excluded.email})
+        existing = {name for (name,) in db.session.query(User.username).filter(User.username.in_(usernames))}
+    written = {}
+    for user_id, username in db.session.execute(stmt.returning(User.id, User.username)):
+        written[username] = (user_id, 'updated' if username in existing else 'created')
+    return written
+
+
+def _process_upsert_rows(op, rows):
+    try:
+        written = _write_users(op, rows)
+        db.session.commit()
+    except IntegrityError:
+        # 只有 upsert 会因更新后的邮箱与其他用户冲突而整批失败：逐行重试定位冲突行
+        db.session.rollback()
+        written = {}
+        for row in rows:
+            try:
+                written.update(_write_users(op, [row]))
+                db.session.commit()
+            except IntegrityError:
+                db.session.rollback()
+    results = []
+    for index, fields in rows:
+        user_id, status = written.get(fields['username'], (None, None))
+        if status is None:
+            results.append(_result(index, 'conflict', error='用户名或邮箱已存在'))
+        else:
+            results.append(_result(index, status, user_id))
+    return results
+
+
+def _process_delete_rows(rows):
+    ids = [value for _, (key, value) in rows if key == 'id']
+    usernames = [value for _, (key, value) in rows if key == 'username']
+    table = User.__table__
+    stmt = (table.delete()
+            .where(or_(table.c.id.in_(ids), table.c.username.in_(usernames)))
+            .returning(table.c.id, table.c.username))
+    deleted_ids, deleted_names = {}, {}
+    for user_id, username in db.session.execute(stmt):
+        deleted_ids[user_id] = user_id
+        deleted_names[username] = user_id
+    db.session.commit()
+    results = []
+    for index, (key, value) in rows:
+        user_id = (deleted_ids if key == 'id' else deleted_names).get(value)
+        results.append(_result(index, 'deleted', user_id) if user_id is not None else _result(index, 'not_found'))
+    return results
+
+
+def _process_batch(op, batch):
+    """batch: [(index, row 或 InvalidRow)]，返回按 index 排序的结果"""
+    results = []
+    valid = []
+    seen = set()
+    for index, row in batch:
+        if isinstance(row, InvalidRow):
+            results.append(_result(index, 'invalid', error=str(row)))
+            continue
+        try:
+            parsed = _delete_key(row) if op == 'delete' else _user_fields(row)
+        except InvalidRow as e:
+            results.append(_result(index, 'invalid', error=str(e)))
+            continue
+        if op != 'delete':
+            # 批内重复的用户名只写入第一次出现的行
+            if parsed['username'] in seen:
+                results.append(_result(index, 'conflict', error='用户名在本次请求中重复'))
+                continue
+            seen.add(parsed['username'])
+        valid.append((index, parsed))
+    if valid:
+        try:
+            results.extend(_process_delete_rows(valid) if op == 'delete' else _process_upsert_rows(op, valid))
+        except Exception as e:
+            db.session.rollback()
+            logger.exception("Bulk %s batch failed", op)
+            results.extend(_result(index, 'error', error=f'{type(e).__name__}: {e}') for index, _ in valid)
+    results.sort(key=lambda result: result['index'])
+    return results
+
+
+def bulk_write(op, rows, batch_size=USER_BULK_BATCH_SIZE):
+    """逐批写入 rows（可迭代，元素为行或 InvalidRow），按输入顺序逐条产出结果"""
+    batch = []
+    for index, row in enumerate(rows):
+        batch.append((index, row))
+        if len(batch) >= batch_size:
+            yield from _process_batch(op, batch)
+            batch = []
+    if batch:
+        yield from _process_batch(op, batch)
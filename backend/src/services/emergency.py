@@ -0,0 +1,187 @@
+"""紧急症状短路。
+
+所有 AI 与症状分析入口在调用大模型之前先做紧急症状检测：关键词预编译为一个正则，单次扫描完成匹配。
+紧跟在否定词之后的关键词（“没有胸痛”“否认心悸”）先去掉再匹配，否定不延伸到同一分句中后面的关键词
+（“没吃东西突然抽搐”仍命中“抽搐”）；只是在问医学知识（“心悸是什么原因”）且没有描述正在发生的情况时，结果标记为 informational，
+各入口都不短路（以 reported_emergency 判断），照常给出结果并把急救提示附在其中。
+命中时立即返回急救指引和最近的急诊医院列表（毫秒级），不再等待大模型；需要时大模型的补充说明作为异步任务在后台生成，
+客户端凭 elaboration_id 轮询获取。检测耗时单独记录在 emergency_check_duration_seconds。
+"""
+import json
+import math
+import os
+import re
+import threading
+import time
+from collections import namedtuple
+
+from src.models.hospital import Department, Hospital, get_data_version
+from src.services.symptom_index import strip_negated
+from src.utils.log import get_logger
+from src.utils.metrics import REGISTRY
+
+logger = get_logger('emergency')
+
+EMERGENCY_KEYWORDS = [
+    "胸痛", "呼吸困难", "意识模糊", "剧烈头痛", "大量出血",
+    "严重腹痛", "高热不退", "抽搐", "昏迷", "心悸", "大出血", "晕倒"
+]
+# 长词优先，避免短词抢先匹配
+EMERGENCY_PATTERN = re.compile('|'.join(re.escape(k) for k in sorted(EMERGENCY_KEYWORDS, key=len, reverse=True)))
+
+EMERGENCY_CONTACTS = {
+    "emergency_number": "120",
+    "poison_control": "400-161-9595",
+    "mental_health_hotline": "400-161-9995",
+}
+EMERGENCY_RECOMMENDATION = "检测到可能的紧急情况，建议立即拨打120急救电话或前往最近的急诊科！"
+EMERGENCY_ACTIONS = [
+    "立即拨打120急救电话，说明症状、所在位置和联系方式",
+    "保持冷静，停止活动，采取舒适体位等待救援",
+    "不要自行驾车前往医院，尽量有人陪同",
+]
+
+# 返回的急诊医院数量
+EMERGENCY_ER_LIMIT = int(os.environ.get('EMERGENCY_ER_LIMIT', '3'))
+# 二级及以上医院均设急诊科
+_ER_LEVEL_PREFIXES = ('三', '二')
+_LEVEL_RANK = {"三甲": 0, "三乙": 1, "二甲": 2, "二乙": 3}
+
+EMERGENCY_CHECK_SECONDS = REGISTRY.histogram(
+    'emergency_check_duration_seconds', 'Emergency pre-stage latency (detection and ER lookup)', ('entry', 'result'),
+    buckets=(0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1))
+
+# 知识性提问的句式，以及说明症状正在发生（本人或身边的人、时间、程度）的词
+KNOWLEDGE_QUESTION = re.compile('是什么|什么是|什么原因|的原因|原因是|为什么会|怎么引起|会引起|由什么|有哪些|的症状|的区别|'
+                                '怎么预防|如何预防|科普')
+EXPERIENCE_MARKERS = re.compile('我|本人|自己|孩子|宝宝|小孩|老人|家人|爸|妈|爷|奶|老公|老婆|丈夫|妻子|他|她|'
+                                '现在|正在|突然|一直|刚才|刚刚|今天|昨天|已经|好几|持续|受不了')
+
+# informational：命中的关键词只出现在知识性提问中
+EmergencyResult = namedtuple('EmergencyResult', ['is_emergency', 'detected_symptoms', 'informational'])
+
+
+def detect_emergency(*texts):
+    """扫描任意数量的文本或文本列表，返回命中的紧急症状（按首次出现顺序去重，忽略被否定的片段）"""
+    detected = []
+    reported = False
+    for text in texts:
+        if not text:
+            continue
+        if isinstance(text, (list, tuple)):
+            text = ' '.join(str(t) for t in text)
+        text = strip_negated(str(text), EMERGENCY_KEYWORDS)
+        keywords = EMERGENCY_PATTERN.findall(text)
+        if keywords and (not KNOWLEDGE_QUESTION.search(text) or EXPERIENCE_MARKERS.search(text)):
+            reported = True
+        for keyword in keywords:
+            if keyword not in detected:
+                detected.append(keyword)
+    return EmergencyResult(bool(detected), detected, bool(detected) and not reported)
+
+
+# --- 急诊医院列表 ---
+# 按数据版本缓存可接诊急诊的医院（预先转换好坐标），请求时只做距离计算与排序。
+_er_cache = {'version': None, 'hospitals': []}
+_er_lock = threading.Lock()
+
+
+def _specialties(hospital):
+    # specialties 为 JSON 字符串（中文被转义），需解析后再匹配
+    try:
+        specialties = json.loads(hospital.specialties or '[]')
+    except ValueError:
+        return [hospital.specialties]
+    return [str(s) for s in specialties] if isinstance(specialties, list) else [str(specialties)]
+
+
+def _er_hospitals():
+    version = get_data_version()
+    if _er_cache['version'] == version:
+        return _er_cache['hospitals']
+    with _er_lock:
+        if _er_cache['version'] != version:
+            er_ids = {hospital_id for (hospital_id,) in
+                      Department.query.with_entities(Department.hospital_id).filter(Department.name.contains('急诊'))}
+            hospitals = []
+            for hospital in Hospital.query.all():
+                explicit = hospital.id in er_ids or any('急诊' in s for s in _specialties(hospital))
+                if not explicit and not (hospital.level or '').startswith(_ER_LEVEL_PREFIXES):
+                    continue
+                hospitals.append({
+                    'explicit': explicit,
+                    'lat': hospital.latitude,
+                    'lng': hospital.longitude,
+                    'info': {'id': hospital.id, 'name': hospital.name, 'level': hospital.level,
+                             'address': hospital.address, 'phone': hospital.phone},
+                })
+            _er_cache['hospitals'] = hospitals
+            _er_cache['version'] = version
+    return _er_cache['hospitals']
+
+
+def _approx_distance_km(lat1, lng1, lat2, lng2):
+    """等距柱状投影近似距离，用于排序；城市范围内误差远小于 1%"""
+    x = math.radians(lng2 - lng1) * math.cos(math.radians((lat1 + lat2) / 2))
+    y = math.radians(lat2 - lat1)
+    return 6371.0 * math.hypot(x, y)
+
+
+def nearest_emergency_rooms(latitude=None, longitude=None, limit=EMERGENCY_ER_LIMIT):
+    """最近的急诊医院；未提供位置时按是否明确设有急诊科、医院等级排序"""
+    hospitals = _er_hospitals()
+    if latitude is not None and longitude is not None:
+        try:
+            latitude, longitude = float(latitude), float(longitude)
+        except (TypeError, ValueError):
+            latitude = longitude = None
+    if latitude is not None and longitude is not None:
+        ranked = []
+        for hospital in hospitals:
+            if hospital['lat'] is None or hospital['lng'] is None:
+                continue
+            distance = _approx_distance_km(latitude, longitude, hospital['lat'], hospital['lng'])
+            ranked.append((distance, hospital))
+        ranked.sort(key=lambda item: item[0])
+        return [dict(hospital['info'], distance=round(distance, 2)) for distance, hospital in ranked[:limit]]
+    ranked = sorted(hospitals, key=lambda h: (not h['explicit'], _LEVEL_RANK.get(h['info']['level'], len(_LEVEL_RANK))))
+    return [dict(hospital['info']) for hospital in ranked[:limit]]
+
+
+def emergency_payload(result, latitude=None, longitude=None):
+    return {
+        "is_emergency": True,
+        "detected_symptoms": result.detected_symptoms,
+        "informational": result.informational,
+        "recommendation": EMERGENCY_RECOMMENDATION,
+        "immediate_actions": EMERGENCY_ACTIONS,
+        "emergency_contacts": EMERGENCY_CONTACTS,
+        "nearest_emergency_rooms": nearest_emergency_rooms(latitude, longitude),
+    }
+
+
+def emergency_prestage(entry, texts, latitude=None, longitude=None):
+    """入口统一调用：未命中返回 None，命中返回急救指引 payload（知识性提问时 informational 为 True）；
+    耗时按入口与结果（hit / question / miss）记录"""
+    start = time.perf_counter()
+    result = detect_emergency(*texts)
+    payload = emergency_payload(result, latitude, longitude) if result.is_emergency else None
+    outcome = 'miss' if payload is None else ('question' if result.informational else 'hit')
+    EMERGENCY_CHECK_SECONDS.observe(time.perf_counter() - start, entry=entry, result=outcome)
+    if payload:
+        logger.info("Emergency %s at %s: %s", outcome, entry, ','.join(result.detected_symptoms))
+    return payload
+
+
+def reported_emergency(payload):
+    """emergency_prestage 的结果是否描述了正在发生的紧急情况；只有此时入口才短路"""
+    return bool(payload) and not payload['informational']
+
+
+# --- 大模型补充说明 ---
+# 以异步任务（kind=emergency_elaboration，见 src/services/ai_jobs.py）在后台生成，elaboration_id 即任务 id。
+def elaboration_prompt(detected_symptoms, description=''):
+    text = f"用户出现紧急症状：{'、'.join(detected_symptoms)}。"
+    if description:
+        text += f"用户描述：{description}。"
+    return text + "已建议其立即拨打120或前往急诊。请简要说明在等待救援期间应注意什么、应避免什么，以及可能的原因。"
@@ -0,0 +1,149 @@
+"""对冲式诊断：本地规则引擎与大模型赛跑。
+
+请求到达时先同步跑 analyze_symptoms_logic（微秒级），同时把大模型诊断提交到线程池：
+- 大模型在 DIAGNOSIS_DEADLINE_MS 内返回成功结果时使用大模型结果（source=llm）；
+- 超过截止时间或大模型出错时立即返回本地结果（source=local，并注明原因）；
+- 超时的大模型调用继续在后台完成，成功结果写入预热缓存，相同症状的后续请求直接命中（source=llm_cache）。
+本地引擎（关键词匹配与本地语义检索）都无法识别症状时没有可用的兜底结果，此时等待大模型完成。
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+
+from src.routes.symptoms import analyze_symptoms_logic, symptom_list
+from src.services.usage import submit_in_context
+from src.utils.log import get_logger
+from src.utils.metrics import REGISTRY, record_cache
+
+logger = get_logger('hedged_diagnosis')
+
+# 等待大模型结果的截止时间（毫秒），超过后返回本地结果
+DIAGNOSIS_DEADLINE_MS = int(os.environ.get('DIAGNOSIS_DEADLINE_MS', '2500'))
+# 同时进行的大模型诊断调用上限
+DIAGNOSIS_MAX_WORKERS = int(os.environ.get('DIAGNOSIS_MAX_WORKERS', '8'))
+# 预热缓存的条目数与有效期（秒）
+DIAGNOSIS_CACHE_SIZE = int(os.environ.get('DIAGNOSIS_CACHE_SIZE', '512'))
+DIAGNOSIS_CACHE_TTL = float(os.environ.get('DIAGNOSIS_CACHE_TTL', '3600'))
+
+DIAGNOSIS_RESULTS = REGISTRY.counter(
+    'diagnosis_results_total', 'Health-advice answers by source (llm, llm_cache, local) and reason', ('source', 'reason'))
+DIAGNOSIS_LATE_LLM = REGISTRY.counter(
+    'diagnosis_late_llm_total', 'LLM diagnoses that finished after the deadline', ('status',))
+
+# 本地结果中没有的分类建议，使用通用内容补齐，保证与大模型输出结构一致
+_LOCAL_LIFESTYLE_ADVICE = ['保证充足睡眠', '清淡饮食，多饮水']
+_LOCAL_PREVENTION_TIPS = ['勤洗手，注意个人卫生', '根据天气及时增减衣物']
+_LOCAL_WHEN_TO_SEE_DOCTOR = {
+    '高': ['立即就医或拨打120'],
+    '中': ['症状持续或加重时尽快就医'],
+    '低': ['症状超过一周未缓解时就医'],
+}
+
+
+def local_diagnosis(symptoms, severity, duration, additional_info):
+    """用规则引擎生成与大模型诊断 JSON 结构相同的结果；无法识别症状时返回 None"""
+    result = analyze_symptoms_logic(symptoms, severity, duration, additional_info)
+    if 'error' in result:
+        return None
+    urgency_level = result['urgency_level']
+    return {
+        'urgency_level': urgency_level,
+        'possible_diseases': result['possible_diseases'],
+        'recommended_departments': result['recommended_departments'],
+        'analysis': f"根据症状（{'、'.join(result['normalized_symptoms'] or symptom_list(symptoms))}）与严重程度初步判断，"
+                    f"紧急程度为{urgency_level}。",
+        'recommendations': {
+            'immediate_actions': result['advice'],
+            'lifestyle_advice': _LOCAL_LIFESTYLE_ADVICE,
+            'when_to_see_doctor': _LOCAL_WHEN_TO_SEE_DOCTOR.get(urgency_level, []),
+            'prevention_tips': _LOCAL_PREVENTION_TIPS,
+        },
+    }
+
+
+def _cache_key(symptoms, severity, duration, additional_info):
+    # 症状先统一为字符串列表（整段字符串不能按字符拆开），其余字段转为字符串，保证键可哈希
+    return (tuple(sorted(symptom_list(symptoms))), str(severity or ''), str(duration or ''),
+            str(additional_info or '').strip())
+
+
+class HedgedDiagnosis:
+    def __init__(self, llm_fn, local_fn=local_diagnosis, deadline_ms=DIAGNOSIS_DEADLINE_MS,
+                 max_workers=DIAGNOSIS_MAX_WORKERS, cache_size=DIAGNOSIS_CACHE_SIZE, cache_ttl=DIAGNOSIS_CACHE_TTL):
+        """llm_fn 与 call_qwen_for_diagnosis 签名相同，返回 {"success": True, "data": ...} 或 {"error": ...}"""
+        self.llm_fn = llm_fn
+        self.local_fn = local_fn
+        self.deadline = deadline_ms / 1000.0
+        self.cache_size = cache_size
+        self.cache_ttl = cache_ttl
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='diagnosis')
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _cache_get(self, key):
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry is not None and time.monotonic() - entry[0] > self.cache_ttl:
+                del self._cache[key]
+                entry = None
+            if entry is not None:
+                self._cache.move_to_end(key)
+        record_cache('diagnosis', entry is not None)
+        return entry[1] if entry is not None else None
+
+    def _cache_put(self, key, data):
+        with self._lock:
+            self._cache[key] = (time.monotonic(), data)
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def _store_late(self, key, future):
+        try:
+            response = future.result()
+        except Exception as e:
+            DIAGNOSIS_LATE_LLM.inc(status='error')
+            logger.warning("Late LLM diagnosis failed: %s: %s", type(e).__name__, e)
+            return
+        if response.get('success'):
+            DIAGNOSIS_LATE_LLM.inc(status='ok')
+            self._cache_put(key, response['data'])
+        else:
+            DIAGNOSIS_LATE_LLM.inc(status='error')
+
+    def diagnose(self, symptoms, severity, duration, additional_info, wait_for_llm=False):
+        """返回 (source, data, reason)；source 为 llm / llm_cache / local，两者都不可用时 data 为 None，reason 为错误信息。
+        wait_for_llm 为 True 时（异步任务，客户端不占用连接等待）不设截止时间，本地结果只在大模型出错时使用"""
+        key = _cache_key(symptoms, severity, duration, additional_info)
+        cached = self._cache_get(key)
+        if cached is not None:
+            DIAGNOSIS_RESULTS.inc(source='llm_cache', reason='hit')
+            return 'llm_cache', cached, None
+
+        start = time.monotonic()
+        # 携带当前上下文，大模型用量记在发起请求的路由与客户端上
+        future = submit_in_context(self._executor, self.llm_fn, symptoms, severity, duration, additional_info)
+        local = self.local_fn(symptoms, severity, duration, additional_info)
+
+        try:
+            # 本地无法给出结果时不设截止时间，等待大模型
+            wait = local is None or wait_for_llm
+            response = future.result(timeout=None if wait else max(0.0, self.deadline - (time.monotonic() - start)))
+        except FutureTimeoutError:
+            future.add_done_callback(lambda f: self._store_late(key, f))
+            DIAGNOSIS_RESULTS.inc(source='local', reason='deadline')
+            return 'local', local, 'deadline'
+        except Exception as e:
+            response = {'error': f'{type(e).__name__}: {e}'}
+
+        if response.get('success'):
+            self._cache_put(key, response['data'])
+            DIAGNOSIS_RESULTS.inc(source='llm', reason='ok')
+            return 'llm', response['data'], None
+        if local is not None:
+            DIAGNOSIS_RESULTS.inc(source='local', reason='llm_error')
+            return 'local', local, 'llm_error'
+        DIAGNOSIS_RESULTS.inc(source='none', reason='llm_error')
+        return None, None, response.get('error', '大模型诊断服务异常')
@@ -0,0 +1,292 @@
+"""只读的医院目录二进制文件，供多个 worker 进程通过内存映射共享。
+
+导出（export_directory）把 Hospital 表写成一个带数据版本号的二进制文件，布局（小端、各段 8 字节对齐）：
+- 头部 HEADER_SIZE 字节：魔数、格式版本、医院数、数据版本号、字符串池长度、科室词表大小、每家医院的位图字数；
+- 定长数组：id（int64）、纬度、经度、评分（float64，缺失为 NaN）、省/市/区县行政区划编码（int32，缺失为 0）；
+- 字符串池：偏移数组（uint64，共 2 * 医院数 + 词表大小 + 1 项）与 UTF-8 字节池，
+  第 i 家医院的 to_dict() JSON 片段为第 2i 项、等级为第 2i+1 项，其后依次为科室词表；
+- 科室位图：每家医院若干个 uint64，第 j 位表示该医院的 specialties 包含词表中第 j 个科室。
+写入临时文件并 fsync 后以 os.replace 原子替换，正在读取旧文件的进程仍持有旧文件的映射，不会读到半个文件。
+
+读取方（附近医院、医院推荐）以 numpy.memmap 只读映射该文件，数组与字符串片段都直接引用映射的页面，
+N 个 worker 共享同一份页缓存；文件的数据版本与数据库不一致（或文件不存在）时调用方回退到数据库查询。
+"""
+import json
+import math
+import os
+import struct
+import tempfile
+import threading
+import time
+from collections import namedtuple
+
+from src.services.regions import REGION_LEVELS
+from src.utils.log import get_logger
+from src.utils.metrics import record_cache
+
+logger = get_logger('hospital_directory')
+
+HOSPITAL_DIRECTORY_PATH = os.environ.get(
+    'HOSPITAL_DIRECTORY_PATH',
+    os.path.join(os.path.dirname(os.path.dirname(__file__)), 'database', 'hospital_directory.bin'))
+# 两次检查目录文件是否被替换的最小间隔（秒）
+HOSPITAL_DIRECTORY_CHECK_INTERVAL = float(os.environ.get('HOSPITAL_DIRECTORY_CHECK_INTERVAL', '1.0'))
+
+MAGIC = b'HOSPDIR\x00'
+FORMAT_VERSION = 2
+# 魔数, 格式版本, 医院数, 数据版本号, 字符串池字节数, 科室词表大小, 每家医院的位图字数
+_HEADER = struct.Struct('<8sIIQQII')
+HEADER_SIZE = 64
+
+# 评分所需的医院字段（calculate_hospital_score 只读取 level 与 rating）
+DirectoryEntry = namedtuple('DirectoryEntry', ['id', 'level', 'rating'])
+
+
+def _align(offset):
+    return (offset + 7) & ~7
+
+
+def _layout(count, strings, pool_size, words):
+    """各段的 (起始偏移, 字节数)，读写两端共用"""
+    sections = {}
+    offset = HEADER_SIZE
+    for name, size in (('ids', 8 * count), ('latitude', 8 * count), ('longitude', 8 * count),
+                       ('rating', 8 * count), ('province_adcode', 4 * count), ('city_adcode', 4 * count),
+                       ('district_adcode', 4 * count), ('offsets', 8 * (strings + 1)), ('pool', pool_size),
+                       ('bitmap', 8 * count * words)):
+        sections[name] = (offset, size)
+        offset = _align(offset + size)
+    return sections, offset
+
+
+def _float(value):
+    return float(value) if value is not None else math.nan
+
+
+def read_snapshot():
+    """读取 (数据版本号, 医院列表)；读取期间数据被修改时重试，保证版本号与数据一致"""
+    from src.models.hospital import HOSPITAL_DATA, DataVersion, Hospital
+    from src.models.user import db
+
+    def version():
+        row = db.session.query(DataVersion.version).filter(DataVersion.name == HOSPITAL_DATA).scalar()
+        return row or 0
+
+    for _ in range(3):
+        before = version()
+        hospitals = Hospital.query.order_by(Hospital.id).all()
+        if version() == before:
+            return before, hospitals
+        db.session.expire_all()
+    raise RuntimeError('医院数据在导出期间持续变化，请稍后重试')
+
+
+def export_directory(path=None):
+    """把当前医院数据导出为目录文件（需在应用上下文中调用），返回 (数据版本号, 医院数)"""
+    import numpy as np
+    from src.models.hospital import hospital_json
+
+    path = path or HOSPITAL_DIRECTORY_PATH
+    version, hospitals = read_snapshot()
+    count = len(hospitals)
+
+    specialties = [json.loads(h.specialties) if h.specialties else [] for h in hospitals]
+    vocabulary = sorted({name for names in specialties for name in names})
+    bits = {name: i for i, name in enumerate(vocabulary)}
+    words = max(1, (len(vocabulary) + 63) // 64)
+
+    strings = []
+    for hospital in hospitals:
+        strings.append(hospital_json(hospital, version))
+        strings.append((hospital.level or '').encode('utf-8'))
+    strings.extend(name.encode('utf-8') for name in vocabulary)
+    offsets = np.zeros(len(strings) + 1, dtype='<u8')
+    np.cumsum([len(s) for s in strings], out=offsets[1:])
+    pool = b''.join(strings)
+
+    bitmap = np.zeros((count, words), dtype='<u8')
+    for row, names in enumerate(specialties):
+        for name in names:
+            bit = bits[name]
+            bitmap[row, bit // 64] |= np.uint64(1) << np.uint64(bit % 64)
+
+    arrays = {
+        'ids': np.array([h.id for h in hospitals], dtype='<i8'),
+        'latitude': np.array([_float(h.latitude) for h in hospitals], dtype='<f8'),
+        'longitude': np.array([_float(h.longitude) for h in hospitals], dtype='<f8'),
+        'rating': np.array([_float(h.rating) for h in hospitals], dtype='<f8'),
+        'province_adcode': np.array([h.province_adcode or 0 for h in hospitals], dtype='<i4'),
+        'city_adcode': np.array([h.city_adcode or 0 for h in hospitals], dtype='<i4'),
+        'district_adcode': np.array([h.district_adcode or 0 for h in hospitals], dtype='<i4'),
+        'offsets': offsets,
+        'pool': pool,
+        'bitmap': bitmap,
+    }
+    sections, total = _layout(count, len(strings), len(pool), words)
+
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.hospital_directory.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(_HEADER.pack(MAGIC, FORMAT_VERSION, count, version, len(pool), len(vocabulary), words)
+                    .ljust(HEADER_SIZE, b'\x00'))
+            for name, (offset, _) in sections.items():
+                f.seek(offset)
+                data = arrays[name]
+                f.write(data if isinstance(data, bytes) else data.tobytes())
+            f.truncate(total)
+            f.flush()
+            os.fsync(f.fileno())
+        os.chmod(tmp_path, 0o644)
+        # 原子替换：读取方要么看到旧文件，要么看到完整的新文件
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+    try:
+        dir_fd = os.open(directory, os.O_RDONLY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+    except OSError:
+        pass
+    logger.info("Exported hospital directory v%d: %d hospitals, %d departments, %d bytes -> %s",
+                version, count, len(vocabulary), total, path)
+    return version, count
+
+
+class HospitalDirectory:
+    """目录文件的只读视图，所有数组都是映射页面上的零拷贝视图"""
+
+    def __init__(self, path):
+        import numpy as np
+
+        self.path = path
+        self._raw = np.memmap(path, dtype=np.uint8, mode='r')
+        magic, format_version, count, version, pool_size, vocabulary_size, words = \
+            _HEADER.unpack_from(self._raw, 0)
+        if magic != MAGIC or format_version != FORMAT_VERSION:
+            raise ValueError(f'不支持的医院目录文件格式: {path}')
+        self.count = count
+        self.version = version
+        self.words = words
+        strings = 2 * count + vocabulary_size
+        sections, total = _layout(count, strings, pool_size, words)
+        if len(self._raw) < total:
+            raise ValueError(f'医院目录文件不完整: {path}')
+
+        def section(name, dtype):
+            offset, size = sections[name]
+            return self._raw[offset:offset + size].view(dtype)
+
+        self.ids = section('ids', '<i8')
+        self.latitude = section('latitude', '<f8')
+        self.longitude = section('longitude', '<f8')
+        self.rating = section('rating', '<f8')
+        self.adcodes = {level: section(f'{level}_adcode', '<i4') for level in REGION_LEVELS}
+        self._offsets = section('offsets', '<u8')
+        self._pool = memoryview(section('pool', np.uint8))
+        self.bitmap = section('bitmap', '<u8').reshape(count, words)
+        # 词表很小，解码后常驻；科室名 -> 位序号
+        self.vocabulary = [str(self._string(2 * count + j), 'utf-8') for j in range(vocabulary_size)]
+        self._bits = {name: j for j, name in enumerate(self.vocabulary)}
+
+    def _string(self, index):
+        return self._pool[int(self._offsets[index]):int(self._offsets[index + 1])]
+
+    def fragment(self, row):
+        """第 row 家医院 to_dict() 的 JSON 字节串片段"""
+        return bytes(self._string(2 * row))
+
+    def entry(self, row):
+        level = str(self._string(2 * row + 1), 'utf-8') or None
+        rating = float(self.rating[row])
+        return DirectoryEntry(int(self.ids[row]), level, None if math.isnan(rating) else rating)
+
+    def in_box(self, min_lat, max_lat, min_lng, max_lng, region=None):
+        """坐标落在矩形内（且属于 region=(级别, 编码) 行政区划）的行号数组；坐标缺失的医院不会命中"""
+        import numpy as np
+        lat, lng = self.latitude, self.longitude
+        selected = (lat >= min_lat) & (lat <= max_lat) & (lng >= min_lng) & (lng <= max_lng)
+        if region is not None:
+            level, code = region
+            selected &= self.adcodes[level] == code
+        return np.flatnonzero(selected)
+
+    def mask(self, names):
+        """科室名集合对应的位图掩码（不在词表中的科室忽略）"""
+        import numpy as np
+        mask = np.zeros(self.words, dtype='<u8')
+        for name in names:
+            bit = self._bits.get(name)
+            if bit is not None:
+                mask[bit // 64] |= np.uint64(1) << np.uint64(bit % 64)
+        return mask
+
+    def matched(self, row, mask):
+        """第 row 家医院与掩码相交的科室名，按词表顺序"""
+        matched = []
+        for word, value in enumerate(self.bitmap[row] & mask):
+            value = int(value)
+            while value:
+                low = value & -value
+                matched.append(self.vocabulary[word * 64 + low.bit_length() - 1])
+                value ^= low
+        return matched
+
+
+class _DirectoryHandle:
+    """进程内持有当前映射；文件被原子替换后（inode 或修改时间变化）重新映射"""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._directory = None
+        self._stat = None
+        self._checked_at = 0.0
+
+    def _refresh(self):
+        now = time.monotonic()
+        if now - self._checked_at < HOSPITAL_DIRECTORY_CHECK_INTERVAL:
+            return
+        with self._lock:
+            if now - self._checked_at < HOSPITAL_DIRECTORY_CHECK_INTERVAL:
+                return
+            self._checked_at = now
+            try:
+                st = os.stat(self.path)
+            except FileNotFoundError:
+                self._directory, self._stat = None, None
+                return
+            stat = (st.st_ino, st.st_mtime_ns, st.st_size)
+            if stat == self._stat:
+                return
+            try:
+                directory = HospitalDirectory(self.path)
+            except (OSError, ValueError, struct.error):
+                logger.exception("Failed to map hospital directory %s", self.path)
+                directory = None
+            # 旧映射由仍在使用它的请求持有引用，引用释放后自动解除映射
+            self._directory, self._stat = directory, stat
+            if directory is not None:
+                logger.info("Mapped hospital directory v%d (%d hospitals)", directory.version, directory.count)
+
+    def current(self, version):
+        """数据版本为 version 的目录；文件不存在或版本不一致时返回 None，调用方应回退到数据库"""
+        self._refresh()
+        directory = self._directory
+        hit = directory is not None and directory.version == version
+        record_cache('hospital_directory', hit)
+        return directory if hit else None
+
+    def reset(self):
+        with self._lock:
+            self._directory, self._stat, self._checked_at = None, None, 0.0
+
+
+hospital_directory = _DirectoryHandle(HOSPITAL_DIRECTORY_PATH)
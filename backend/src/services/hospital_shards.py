@@ -0,0 +1,318 @@
+"""按省分片的医院存储与查询路由（可选）。
+
+导出（export_shards）按医院的省级行政区划编码把 Hospital 表拆成若干个只读 SQLite 文件，
+每个分片包含 hospitals 表（评分所需字段、专科列表与 to_dict() JSON 片段）和一个 R*Tree 空间索引；
+没有匹配到省份的医院放在编码为 0 的分片中。分片目录下的 manifest.json 记录数据版本号与每个分片的
+文件名、医院数和坐标外接矩形。分片文件名带数据版本号，先写分片、最后原子替换清单，
+读取方总是看到同一版本的一组文件。
+
+查询时路由器只选择外接矩形与搜索范围相交（且与筛选的省份一致）的分片，多个分片在线程池中并行查询后合并。
+HOSPITAL_SHARD_NODES 把部分分片指向其他节点（如 "110000=http://10.0.0.2:5000"），
+这些分片通过对方的 /api/hospitals/shards/<省编码>/box 接口查询，可由独立的 worker 池或机器承载。
+清单不存在、版本与数据库不一致或任一分片查询失败时返回 None，调用方回退到医院目录或数据库。
+"""
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+from src.utils.log import get_logger
+from src.utils.metrics import REGISTRY, record_cache
+
+logger = get_logger('hospital_shards')
+
+HOSPITAL_SHARD_DIR = os.environ.get(
+    'HOSPITAL_SHARD_DIR',
+    os.path.join(os.path.dirname(os.path.dirname(__file__)), 'database', 'hospital_shards'))
+# 由其他节点承载的分片：逗号分隔的 "省编码=节点地址"
+HOSPITAL_SHARD_NODES = os.environ.get('HOSPITAL_SHARD_NODES', '')
+# 节点之间调用分片接口的令牌，未设置时分片接口拒绝访问
+HOSPITAL_SHARD_TOKEN = os.environ.get('HOSPITAL_SHARD_TOKEN', '')
+# 并行查询分片的线程数与远程分片的超时（秒）
+HOSPITAL_SHARD_WORKERS = int(os.environ.get('HOSPITAL_SHARD_WORKERS', '8'))
+HOSPITAL_SHARD_TIMEOUT = float(os.environ.get('HOSPITAL_SHARD_TIMEOUT', '2.0'))
+# 两次检查清单是否被替换的最小间隔（秒）
+HOSPITAL_SHARD_CHECK_INTERVAL = float(os.environ.get('HOSPITAL_SHARD_CHECK_INTERVAL', '1.0'))
+
+MANIFEST_NAME = 'manifest.json'
+FORMAT_VERSION = 1
+# 未匹配到省份的医院所在分片
+UNASSIGNED = 0
+
+HOSPITAL_SHARD_SECONDS = REGISTRY.histogram(
+    'hospital_shard_query_seconds', 'Hospital shard box query latency', ('shard', 'location'),
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5))
+
+# 分片中的一家医院；具有 level、rating 属性，可直接传给 calculate_hospital_score
+ShardHospital = namedtuple('ShardHospital',
+                           ['id', 'latitude', 'longitude', 'level', 'rating', 'specialties', 'fragment'])
+
+_SCHEMA = (
+    'CREATE TABLE hospitals (id INTEGER PRIMARY KEY, latitude REAL, longitude REAL, level TEXT, rating REAL, '
+    'city_adcode INTEGER, district_adcode INTEGER, specialties TEXT, fragment BLOB)',
+    'CREATE INDEX ix_hospitals_city_adcode ON hospitals (city_adcode)',
+    'CREATE INDEX ix_hospitals_district_adcode ON hospitals (district_adcode)',
+    'CREATE VIRTUAL TABLE hospital_rtree USING rtree(id, min_lat, max_lat, min_lng, max_lng)',
+)
+_BOX_QUERY = (
+    'SELECT h.id, h.latitude, h.longitude, h.level, h.rating, h.specialties, h.fragment '
+    'FROM hospital_rtree AS r JOIN hospitals AS h ON h.id = r.id '
+    'WHERE r.max_lat >= ? AND r.min_lat <= ? AND r.max_lng >= ? AND r.min_lng <= ?')
+
+
+def _has_coordinates(hospital):
+    # 与数据库路径一致：坐标为空或为 0 视为缺失，不进入空间索引
+    return bool(hospital.latitude) and bool(hospital.longitude)
+
+
+def _write_shard(path, hospitals, version):
+    from src.models.hospital import hospital_json
+
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.shard.', suffix='.tmp')
+    os.close(fd)
+    try:
+        connection = sqlite3.connect(tmp_path)
+        try:
+            for statement in _SCHEMA:
+                connection.execute(statement)
+            connection.executemany(
+                'INSERT INTO hospitals VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                [(h.id, h.latitude, h.longitude, h.level, h.rating, h.city_adcode, h.district_adcode,
+                  h.specialties, hospital_json(h, version)) for h in hospitals])
+            connection.executemany(
+                'INSERT INTO hospital_rtree VALUES (?, ?, ?, ?, ?)',
+                [(h.id, h.latitude, h.latitude, h.longitude, h.longitude)
+                 for h in hospitals if _has_coordinates(h)])
+            connection.commit()
+            connection.execute('VACUUM')
+        finally:
+            connection.close()
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+def _bounds(hospitals):
+    located = [h for h in hospitals if _has_coordinates(h)]
+    if not located:
+        return None
+    lats = [h.latitude for h in located]
+    lngs = [h.longitude for h in located]
+    return [min(lats), max(lats), min(lngs), max(lngs)]
+
+
+def export_shards(directory=None):
+    """把当前医院数据按省导出为分片文件并替换清单（需在应用上下文中调用），返回 (数据版本号, {省编码: 医院数})"""
+    from src.services.hospital_directory import read_snapshot
+
+    directory = directory or HOSPITAL_SHARD_DIR
+    os.makedirs(directory, exist_ok=True)
+    version, hospitals = read_snapshot()
+    groups = {}
+    for hospital in hospitals:
+        groups.setdefault(hospital.province_adcode or UNASSIGNED, []).append(hospital)
+
+    shards = []
+    for province in sorted(groups):
+        members = groups[province]
+        name = f'province_{province}.v{version}.db'
+        _write_shard(os.path.join(directory, name), members, version)
+        shards.append({'province': province, 'file': name, 'count': len(members), 'bounds': _bounds(members)})
+
+    manifest = {'format': FORMAT_VERSION, 'version': version, 'shards': shards}
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.manifest.', suffix='.tmp')
+    with os.fdopen(fd, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    os.chmod(tmp_path, 0o644)
+    os.replace(tmp_path, os.path.join(directory, MANIFEST_NAME))
+
+    # 旧版本的分片已不在清单中；仍在查询旧文件的连接持有打开的文件，删除不影响其读完
+    current = {shard['file'] for shard in shards}
+    for name in os.listdir(directory):
+        if name.startswith('province_') and name.endswith('.db') and name not in current:
+            try:
+                os.unlink(os.path.join(directory, name))
+            except OSError:
+                pass
+    counts = {shard['province']: shard['count'] for shard in shards}
+    logger.info("Exported %d hospital shards v%d (%d hospitals) -> %s", len(shards), version, len(hospitals), directory)
+    return version, counts
+
+
+def parse_nodes(spec):
+    """"110000=http://a:5000,310000=http://b:5000" -> {110000: 'http://a:5000', ...}"""
+    nodes = {}
+    for item in filter(None, (part.strip() for part in spec.split(','))):
+        province, _, url = item.partition('=')
+        if not url:
+            raise ValueError(f'无效的分片节点配置: {item}')
+        nodes[int(province)] = url.rstrip('/')
+    return nodes
+
+
+def _intersects(bounds, box):
+    min_lat, max_lat, min_lng, max_lng = box
+    return bounds[1] >= min_lat and bounds[0] <= max_lat and bounds[3] >= min_lng and bounds[2] <= max_lng
+
+
+Shard = namedtuple('Shard', ['province', 'path', 'count', 'bounds', 'node'])
+
+
+class ShardSet:
+    """一个版本的全部分片"""
+
+    def __init__(self, directory, manifest, nodes):
+        if manifest.get('format') != FORMAT_VERSION:
+            raise ValueError(f'不支持的分片清单格式: {directory}')
+        self.version = manifest['version']
+        self.shards = {
+            item['province']: Shard(item['province'], os.path.join(directory, item['file']), item['count'],
+                                    item['bounds'], nodes.get(item['province']))
+            for item in manifest['shards']
+        }
+
+    def route(self, box, region=None):
+        """与矩形相交（且属于 region 所在省份）的分片"""
+        province = region[1] // 10000 * 10000 if region is not None else None
+        return [shard for shard in self.shards.values()
+                if shard.bounds is not None and _intersects(shard.bounds, box)
+                and (province is None or shard.province == province)]
+
+    def query_local(self, province, box, region=None):
+        """在本机的分片文件上做矩形查询；region 为市/区县级时按编码列过滤"""
+        shard = self.shards.get(province)
+        if shard is None:
+            return []
+        sql, params = _BOX_QUERY, list(box)
+        if region is not None and region[0] in ('city', 'district'):
+            sql += f' AND h.{region[0]}_adcode = ?'
+            params.append(region[1])
+        with HOSPITAL_SHARD_SECONDS.time(shard=str(province), location='local'):
+            # 每次查询单独打开只读连接：开销在百微秒以内，也不会在 fork 或文件被替换后持有失效的连接
+            connection = sqlite3.connect(f'file:{shard.path}?mode=ro', uri=True)
+            try:
+                rows = connection.execute(sql, params).fetchall()
+            finally:
+                connection.close()
+        return [ShardHospital(row[0], row[1], row[2], row[3], row[4],
+                              frozenset(json.loads(row[5]) if row[5] else []), row[6])
+                for row in rows]
+
+    def _query_remote(self, shard, box, region):
+        import requests
+        from src.utils.json_provider import dumps_bytes
+
+        with HOSPITAL_SHARD_SECONDS.time(shard=str(shard.province), location='remote'):
+            response = requests.post(
+                f'{shard.node}/api/hospitals/shards/{shard.province}/box',
+                json={'version': self.version, 'box': list(box), 'region': list(region) if region else None},
+                headers={'X-Shard-Token': HOSPITAL_SHARD_TOKEN}, timeout=HOSPITAL_SHARD_TIMEOUT)
+            response.raise_for_status()
+            items = response.json()['data']['hospitals']
+        return [ShardHospital(item['id'], item['latitude'], item['longitude'], item['level'], item['rating'],
+                              frozenset(item['specialties']), dumps_bytes(item['hospital']))
+                for item in items]
+
+    def query(self, shard, box, region=None):
+        if shard.node:
+            return self._query_remote(shard, box, region)
+        return self.query_local(shard.province, box, region)
+
+
+class _ShardRouter:
+    """进程内持有当前清单；清单被替换后（inode 或修改时间变化）重新加载"""
+
+    def __init__(self, directory, nodes):
+        self.directory = directory
+        self.nodes = nodes
+        self._lock = threading.Lock()
+        self._shards = None
+        self._stat = None
+        self._checked_at = 0.0
+        self._executor = None
+
+    def _refresh(self):
+        now = time.monotonic()
+        if now - self._checked_at < HOSPITAL_SHARD_CHECK_INTERVAL:
+            return
+        with self._lock:
+            if now - self._checked_at < HOSPITAL_SHARD_CHECK_INTERVAL:
+                return
+            self._checked_at = now
+            path = os.path.join(self.directory, MANIFEST_NAME)
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:
+                self._shards, self._stat = None, None
+                return
+            stat = (st.st_ino, st.st_mtime_ns, st.st_size)
+            if stat == self._stat:
+                return
+            try:
+                with open(path, encoding='utf-8') as f:
+                    shards = ShardSet(self.directory, json.load(f), self.nodes)
+            except (OSError, ValueError, KeyError):
+                logger.exception("Failed to load hospital shard manifest %s", path)
+                shards = None
+            self._shards, self._stat = shards, stat
+            if shards is not None:
+                logger.info("Loaded hospital shards v%d (%d shards)", shards.version, len(shards.shards))
+
+    def snapshot(self):
+        """当前清单对应的 ShardSet（不检查数据版本），没有清单时为 None"""
+        self._refresh()
+        return self._shards
+
+    def current(self, version):
+        """数据版本为 version 的分片集合；未启用或版本不一致时返回 None"""
+        shards = self.snapshot()
+        if shards is None:
+            return None
+        hit = shards.version == version
+        record_cache('hospital_shards', hit)
+        return shards if hit else None
+
+    def _pool(self):
+        # 线程池在首次并行查询时创建，preload 的主进程不会持有线程
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=HOSPITAL_SHARD_WORKERS,
+                                                        thread_name_prefix='hospital-shard')
+        return self._executor
+
+    def query_box(self, version, box, region=None):
+        """在与矩形相交的分片上并行查询并合并结果；返回 ShardHospital 列表，
+        未启用、版本不一致或任一分片失败时返回 None（调用方回退到医院目录或数据库）"""
+        shards = self.current(version)
+        if shards is None:
+            return None
+        targets = shards.route(box, region)
+        try:
+            if len(targets) <= 1:
+                return [h for shard in targets for h in shards.query(shard, box, region)]
+            futures = [self._pool().submit(shards.query, shard, box, region) for shard in targets]
+            return [h for future in futures for h in future.result()]
+        except Exception as e:
+            # 远程节点不可用时每个请求都会走到这里，只记一行告警
+            logger.warning("Hospital shard query failed (shards: %s): %s: %s",
+                           ','.join(str(shard.province) for shard in targets), type(e).__name__, e)
+            return None
+
+    def reset(self):
+        with self._lock:
+            self._shards, self._stat, self._checked_at = None, None, 0.0
+
+
+hospital_shards = _ShardRouter(HOSPITAL_SHARD_DIR, parse_nodes(HOSPITAL_SHARD_NODES))
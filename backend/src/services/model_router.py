@@ -0,0 +1,197 @@
+"""通义千问模型分档路由。
+
+按请求复杂度在 QWEN_MODEL_TIERS 配置的档位（由快到强，默认 turbo/plus/max）中选择模型：
+- 对话：简短寒暄走最快档；可能触发工具调用（如天气）至少走中档；长消息或长历史走最强档；
+- 诊断：单一症状走最快档，症状较多、严重程度为"严重"或附加信息较长时走最强档。
+每个模型按延迟类型分别维护滑动时间窗内的延迟与错误统计：流式调用记首包延迟（first_token），
+非流式调用记总耗时（total）。两者量级不同（诊断的总耗时常有数秒），各自使用独立的 SLO，
+长诊断的总耗时不会拉高对话首包延迟的 p90。
+任一类型的 p90 延迟超过其 SLO 或错误率超过阈值时，该模型视为不健康，自动降级到更快的健康档位；
+窗口内样本过期后该模型重新参与路由。
+"""
+import math
+import os
+import re
+import threading
+import time
+from collections import deque
+
+from src.utils.log import get_logger
+from src.utils.metrics import REGISTRY
+
+logger = get_logger('model_router')
+
+
+def _parse_pairs(text):
+    pairs = []
+    for item in (text or '').split(','):
+        if '=' in item:
+            key, value = item.split('=', 1)
+            pairs.append((key.strip(), value.strip()))
+    return pairs
+
+
+# 档位名=模型名，按由快到强的顺序
+QWEN_MODEL_TIERS = _parse_pairs(os.environ.get('QWEN_MODEL_TIERS', 'turbo=qwen-turbo,plus=qwen-plus,max=qwen-max'))
+# 各模型的首包延迟 SLO（毫秒），未列出的模型使用 QWEN_DEFAULT_SLO_MS
+QWEN_MODEL_SLO_MS = {model: float(ms) for model, ms in _parse_pairs(
+    os.environ.get('QWEN_MODEL_SLO_MS', 'qwen-turbo=2000,qwen-plus=4000,qwen-max=8000'))}
+QWEN_DEFAULT_SLO_MS = float(os.environ.get('QWEN_DEFAULT_SLO_MS', '8000'))
+# 各模型非流式调用的总耗时 SLO（毫秒），未列出的模型使用 QWEN_DEFAULT_TOTAL_SLO_MS
+QWEN_MODEL_TOTAL_SLO_MS = {model: float(ms) for model, ms in _parse_pairs(
+    os.environ.get('QWEN_MODEL_TOTAL_SLO_MS', 'qwen-turbo=10000,qwen-plus=20000,qwen-max=40000'))}
+QWEN_DEFAULT_TOTAL_SLO_MS = float(os.environ.get('QWEN_DEFAULT_TOTAL_SLO_MS', '40000'))
+# 延迟类型：流式调用的首包延迟、非流式调用的总耗时
+LATENCY_KINDS = ('first_token', 'total')
+# 关闭后所有请求固定使用最强档（即原先的 qwen-max）
+QWEN_MODEL_ROUTING = os.environ.get('QWEN_MODEL_ROUTING', '1') != '0'
+# 统计窗口（秒）、判定所需的最少样本数与错误率上限
+MODEL_STATS_WINDOW = float(os.environ.get('MODEL_STATS_WINDOW', '300'))
+MODEL_STATS_MIN_SAMPLES = int(os.environ.get('MODEL_STATS_MIN_SAMPLES', '5'))
+MODEL_ERROR_RATE_MAX = float(os.environ.get('MODEL_ERROR_RATE_MAX', '0.5'))
+
+MODEL_ROUTE_DECISIONS = REGISTRY.counter(
+    'llm_route_decisions_total', 'Model router decisions by requested tier and chosen model', ('call', 'tier', 'model', 'reason'))
+MODEL_LATENCY_P90 = REGISTRY.gauge(
+    'llm_model_latency_p90_seconds', 'Rolling p90 latency per model and latency kind as seen by the router',
+    ('model', 'kind'))
+
+_GREETING = re.compile(r'^\s*(你好|您好|嗨|哈喽|hi|hello|谢谢|多谢|感谢|再见|好的|ok)[\s!！,，.。~～?？]*$', re.IGNORECASE)
+_TOOL_HINT = re.compile(r'天气|气温|温度|下雨|下雪|空气质量')
+
+
+class ModelStats:
+    """单个模型的滑动窗口统计：(时间, 延迟秒, 是否成功)"""
+
+    def __init__(self, window=MODEL_STATS_WINDOW, max_samples=500):
+        self.window = window
+        self.samples = deque(maxlen=max_samples)
+
+    def _expire(self, now):
+        while self.samples and now - self.samples[0][0] > self.window:
+            self.samples.popleft()
+
+    def record(self, latency, ok, now=None):
+        now = time.monotonic() if now is None else now
+        self.samples.append((now, latency, ok))
+        self._expire(now)
+
+    def snapshot(self, now=None):
+        self._expire(time.monotonic() if now is None else now)
+        count = len(self.samples)
+        if not count:
+            return {'samples': 0, 'p50': None, 'p90': None, 'error_rate': 0.0}
+        latencies = sorted(latency for _, latency, ok in self.samples if ok)
+        errors = sum(1 for _, _, ok in self.samples if not ok)
+
+        def percentile(q):
+            if not latencies:
+                return None
+            return latencies[min(len(latencies) - 1, max(0, math.ceil(q * len(latencies)) - 1))]
+
+        return {'samples': count, 'p50': percentile(0.5), 'p90': percentile(0.9), 'error_rate': errors / count}
+
+
+class ModelRouter:
+    def __init__(self, tiers=QWEN_MODEL_TIERS, slo_ms=QWEN_MODEL_SLO_MS, enabled=QWEN_MODEL_ROUTING,
+                 total_slo_ms=QWEN_MODEL_TOTAL_SLO_MS, window=MODEL_STATS_WINDOW, clock=time.monotonic):
+        self.tiers = list(tiers)
+        self.slo_ms = {'first_token': dict(slo_ms), 'total': dict(total_slo_ms)}
+        self.enabled = enabled
+        self.window = window
+        self._clock = clock
+        self._stats = {}  # (模型, 延迟类型) -> ModelStats
+        self._lock = threading.Lock()
+
+    @property
+    def tier_names(self):
+        return [name for name, _ in self.tiers]
+
+    def _stats_for(self, model, kind):
+        stats = self._stats.get((model, kind))
+        if stats is None:
+            stats = self._stats[(model, kind)] = ModelStats(self.window)
+        return stats
+
+    def slo(self, model, kind):
+        """model 在该延迟类型下的 SLO（秒）"""
+        default = QWEN_DEFAULT_SLO_MS if kind == 'first_token' else QWEN_DEFAULT_TOTAL_SLO_MS
+        return self.slo_ms[kind].get(model, default) / 1000.0
+
+    def record(self, model, latency, ok=True, kind='total'):
+        """记录一次调用：kind 为 first_token（流式首包延迟）或 total（非流式总耗时）"""
+        with self._lock:
+            stats = self._stats_for(model, kind)
+            stats.record(latency, ok, self._clock())
+            p90 = stats.snapshot(self._clock())['p90']
+        if p90 is not None:
+            MODEL_LATENCY_P90.set(p90, model=model, kind=kind)
+
+    def _snapshot(self, model, kind):
+        with self._lock:
+            return self._stats_for(model, kind).snapshot(self._clock())
+
+    def _kind_breached(self, model, kind, snapshot):
+        if snapshot['samples'] < MODEL_STATS_MIN_SAMPLES:
+            return False
+        if snapshot['error_rate'] > MODEL_ERROR_RATE_MAX:
+            return True
+        return snapshot['p90'] is not None and snapshot['p90'] > self.slo(model, kind)
+
+    def breached(self, model):
+        """任一延迟类型样本足够且 p90 超过该类型的 SLO 或错误率过高时视为不健康"""
+        return any(self._kind_breached(model, kind, self._snapshot(model, kind)) for kind in LATENCY_KINDS)
+
+    def classify(self, call, message='', symptoms=None, severity=None, additional_info='', history_tokens=0):
+        """返回档位下标（0 为最快档）"""
+        strongest = len(self.tiers) - 1
+        middle = min(1, strongest)
+        if call == 'diagnosis':
+            count = len(symptoms) if isinstance(symptoms, (list, tuple)) else 1
+            if count >= 4 or severity == '严重' or len(additional_info or '') > 50:
+                return strongest
+            if count <= 1 and not additional_info:
+                return 0
+            return middle
+        message = message or ''
+        if len(message) > 200 or history_tokens > 800:
+            return strongest
+        if _TOOL_HINT.search(message):
+            return middle
+        if _GREETING.match(message) or (len(message) <= 10 and not history_tokens):
+            return 0
+        return middle
+
+    def choose(self, call, **features):
+        """选择模型名；被选档位不健康时依次降级到更快的健康档位"""
+        if not self.enabled or not self.tiers:
+            model = self.tiers[-1][1] if self.tiers else 'qwen-max'
+            MODEL_ROUTE_DECISIONS.inc(call=call, tier='fixed', model=model, reason='routing_disabled')
+            return model
+        index = self.classify(call, **features)
+        tier, model = self.tiers[index]
+        reason = 'classified'
+        if self.breached(model):
+            for fallback in range(index - 1, -1, -1):
+                if not self.breached(self.tiers[fallback][1]):
+                    logger.info("Model %s breached its SLO, failing over to %s", model, self.tiers[fallback][1])
+                    model = self.tiers[fallback][1]
+                    reason = 'failover'
+                    break
+        MODEL_ROUTE_DECISIONS.inc(call=call, tier=tier, model=model, reason=reason)
+        return model
+
+    def status(self):
+        result = []
+        for tier, model in self.tiers:
+            latency = {}
+            for kind in LATENCY_KINDS:
+                snapshot = self._snapshot(model, kind)
+                latency[kind] = {'slo_ms': self.slo(model, kind) * 1000.0,
+                                 'breached': self._kind_breached(model, kind, snapshot), **snapshot}
+            result.append({'tier': tier, 'model': model,
+                           'breached': any(item['breached'] for item in latency.values()), 'latency': latency})
+        return result
+
+
+model_router = ModelRouter()
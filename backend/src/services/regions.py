@@ -0,0 +1,227 @@
+"""行政区划（高德 adcode）匹配。
+
+高德编码表（与天气工具共用同一份数据源）中的 adcode 为 6 位整数 PPCCDD：
+省级为 PP0000，地级为 PPCC00，其余为区县级。医院导入时按地址文本离线匹配出省、市、区县三级编码，
+存入 Hospital 上带索引的整数列；按城市/区县筛选时把查询文本解析为编码，改为索引上的等值查询，
+不再对地址做 LIKE '%...%' 扫描（后者会把其他城市的“北京路”也匹配进来）。
+编码尚未回填的医院（旧库新增编码列后、回填之前）仍按地址文本匹配；编码表不可用或名称无法唯一确定时，
+所有入口都退回地址文本匹配。
+"""
+import os
+import threading
+from collections import namedtuple
+
+from sqlalchemy import and_, or_
+
+from src.utils.log import get_logger
+
+logger = get_logger('regions')
+
+# 高德行政区划编码表的默认下载地址
+AMAP_ADCODE_URL = 'https://modelscope.oss-cn-beijing.aliyuncs.com/resource/agent/AMap_adcode_citycode.xlsx'
+
+REGION_LEVELS = ('province', 'city', 'district')
+# 全国（100000）不参与匹配
+_COUNTRY = 100000
+# 省级、地级名称去掉这些后缀后作为简称参与匹配（“北京市”->“北京”，“广西壮族自治区”->“广西”）
+_PROVINCE_SUFFIXES = ('特别行政区', '维吾尔自治区', '壮族自治区', '回族自治区', '自治区', '省', '市')
+_CITY_SUFFIXES = ('地区', '市', '盟')
+
+_rows = None
+_rows_lock = threading.Lock()
+
+
+def load_adcode_rows():
+    """读取编码表，返回 [(中文名, adcode 字符串)]；首次调用时下载，之后复用。读取失败时返回空表"""
+    global _rows
+    if _rows is not None:
+        return _rows
+    with _rows_lock:
+        if _rows is None:
+            # 导入 pandas：用于读取和处理城市编码数据。
+            import pandas as pd
+            try:
+                # 可通过环境变量 AMAP_ADCODE_URL 替换数据源，.csv 结尾时按CSV读取。
+                adcode_url = os.environ.get('AMAP_ADCODE_URL', AMAP_ADCODE_URL)
+                if adcode_url.endswith('.csv'):
+                    city_df = pd.read_csv(adcode_url, dtype={'adcode': str})
+                else:
+                    city_df = pd.read_excel(adcode_url, dtype={'adcode': str})
+            except Exception as e:
+                # 下载或加载失败时回退到空表，天气工具与行政区划匹配都会报告“未找到”而不是崩溃。
+                logger.warning("Error loading city data: %s. Please ensure you have internet access and pandas is installed correctly.", e)
+                city_df = pd.DataFrame(columns=['中文名', 'adcode'])
+            _rows = [(str(name).strip(), str(adcode).strip())
+                     for name, adcode in zip(city_df['中文名'], city_df['adcode'])
+                     if isinstance(name, str) and str(adcode).strip().isdigit()]
+    return _rows
+
+
+def region_level(adcode):
+    if adcode % 10000 == 0:
+        return 'province'
+    if adcode % 100 == 0:
+        return 'city'
+    return 'district'
+
+
+def region_chain(adcode):
+    """(省, 市, 区县) 三级编码，比 adcode 更细的级别为 None"""
+    level = region_level(adcode)
+    province = adcode // 10000 * 10000
+    if level == 'province':
+        return province, None, None
+    city = adcode // 100 * 100
+    return province, city, adcode if level == 'district' else None
+
+
+def _short_name(name, suffixes):
+    for suffix in suffixes:
+        if name.endswith(suffix) and len(name) - len(suffix) >= 2:
+            return name[:-len(suffix)]
+    return None
+
+
+class RegionMatcher:
+    """按地址文本匹配行政区划：枚举地址的子串查名称表，再按上下级是否一致挑选最具体的一级"""
+
+    def __init__(self, rows):
+        self._codes = {}
+        for name, adcode in rows:
+            adcode = int(adcode)
+            if adcode == _COUNTRY:
+                continue
+            names = [name]
+            level = region_level(adcode)
+            if level == 'province':
+                names.append(_short_name(name, _PROVINCE_SUFFIXES))
+            elif level == 'city':
+                names.append(_short_name(name, _CITY_SUFFIXES))
+            for alias in filter(None, names):
+                codes = self._codes.setdefault(alias, [])
+                if adcode not in codes:
+                    codes.append(adcode)
+        self._max_length = max(map(len, self._codes), default=0)
+
+    def __len__(self):
+        return len(self._codes)
+
+    def _scan(self, text):
+        """地址中出现的全部 {adcode: (首次出现位置, 名称是否唯一)}；同一位置优先取最长的名称"""
+        found = {}
+        position = 0
+        while position < len(text):
+            for length in range(min(self._max_length, len(text) - position), 1, -1):
+                codes = self._codes.get(text[position:position + length])
+                if codes:
+                    for code in codes:
+                        found.setdefault(code, (position, len(codes) == 1))
+                    position += length - 1
+                    break
+            position += 1
+        return found
+
+    def match(self, address):
+        """返回 (省, 市, 区县) 编码，无法确定的级别为 None"""
+        if not address:
+            return None, None, None
+        found = self._scan(address)
+        if not found:
+            return None, None, None
+        provinces = {code for code in found if region_level(code) == 'province'}
+        cities = {code for code in found if region_level(code) == 'city'}
+        best = None
+        for code, (position, unique) in found.items():
+            level = region_level(code)
+            if level == 'province':
+                continue
+            province_ok = code // 10000 * 10000 in provinces
+            city_ok = level == 'district' and code // 100 * 100 in cities
+            # 重名的区县（如“朝阳区”“鼓楼区”）必须有上级名称佐证
+            if not (unique or province_ok or city_ok):
+                continue
+            # 上级佐证越多越可信；同等可信时取更具体的级别，再取在地址中更靠前的
+            rank = (city_ok + province_ok, level == 'district', -position)
+            if best is None or rank > best[0]:
+                best = (rank, code)
+        if best is not None:
+            return region_chain(best[1])
+        if not provinces:
+            return None, None, None
+        # 只匹配到省级：地址自左向右由大到小，取最靠前的
+        return min(provinces, key=lambda code: found[code][0]), None, None
+
+    def resolve(self, text):
+        """把筛选参数（名称或 6 位 adcode）解析为 (级别, 编码)；无法唯一确定时返回 None"""
+        text = (text or '').strip()
+        if text.isdigit() and len(text) == 6:
+            code = int(text)
+            return region_level(code), code
+        province, city, district = self.match(text)
+        if district is not None:
+            return 'district', district
+        if city is not None:
+            return 'city', city
+        if province is not None:
+            return 'province', province
+        return None
+
+
+_matcher = None
+_matcher_lock = threading.Lock()
+
+
+def region_matcher():
+    global _matcher
+    if _matcher is None:
+        with _matcher_lock:
+            if _matcher is None:
+                _matcher = RegionMatcher(load_adcode_rows())
+    return _matcher
+
+
+def assign_regions(hospitals, overwrite=False):
+    """按地址为医院填写三级编码（不提交事务），返回成功匹配的医院数"""
+    matcher = region_matcher()
+    matched = 0
+    for hospital in hospitals:
+        if not overwrite and hospital.province_adcode is not None:
+            continue
+        province, city, district = matcher.match(hospital.address)
+        hospital.province_adcode, hospital.city_adcode, hospital.district_adcode = province, city, district
+        matched += province is not None
+    return matched
+
+
+def resolve_region(*parts):
+    """把若干筛选参数（如 city、district）拼接后解析为 (级别, 编码)；参数全空或无法解析时返回 None"""
+    text = ''.join(str(part).strip() for part in parts if part not in (None, ''))
+    if not text:
+        return None
+    return region_matcher().resolve(text)
+
+
+# 城市/区县筛选：region 为解析出的 (级别, 编码)，无法解析时为 None；names 为用于地址文本匹配的原始名称
+RegionFilter = namedtuple('RegionFilter', ['region', 'names'])
+
+
+def region_filter(city=None, district=None):
+    """请求中的城市/区县参数；两者都为空时返回 None"""
+    names = tuple(str(part).strip() for part in (city, district) if part not in (None, '') and str(part).strip())
+    if not names:
+        return None
+    return RegionFilter(resolve_region(*names), names)
+
+
+def region_condition(model, region_filter):
+    """筛选条件：能解析为编码时走编码列索引，编码为空（尚未回填）的医院按地址文本匹配；无法解析时只做地址文本匹配"""
+    by_address = and_(*(model.address.contains(name) for name in region_filter.names))
+    if region_filter.region is None:
+        return by_address
+    return or_(region_column(model, region_filter.region), and_(model.province_adcode.is_(None), by_address))
+
+
+def region_column(model, region):
+    """region 对应的带索引编码列的等值条件"""
+    level, code = region
+    return getattr(model, f'{level}_adcode') == code
@@ -0,0 +1,111 @@
+"""本地语义检索：症状描述 -> 症状 / 科室，完全在进程内计算，不访问网络。
+
+关键词规则引擎只能识别字面出现的症状词，其余描述（“嗓子冒烟浑身滚烫”“心里发慌”）以前只能交给大模型。
+这里把知识库中的症状条目与各科室的典型主诉整理成文档，构建一个小型向量索引：
+- 特征：归一化文本（小写、繁体转简体）中汉字片段的字符 n-gram（默认 2~3），次线性 TF 乘平滑 IDF，行做 L2 归一化；
+  单字与字母片段不参与：单字（“我”“好”“不”）在日常用语里无处不在，拼音同义词又会与英文单词（“test”“fail”）
+  共享字母 n-gram，两者都会让与医疗无关的输入得到可观的相似度，拼音输入已由关键词匹配覆盖；
+- 查询先去掉被否定的片段（“没有不舒服”），否认的症状不应成为检索依据；
+- 降维：对文档-特征矩阵做截断 SVD（LSA），文档向量为 U·S，查询向量投影到同一空间；
+  余弦相似度按查询原始 TF-IDF 的范数归一化，只含未知 n-gram 的查询不会因为投影后向量变短而被放大；
+- 检索：文档数很少，直接对 NumPy 矩阵做暴力点积并用 argpartition 取 top-k；
+  最佳命中须同时达到得分阈值并领先第二名一定差距，与多个文档都只沾一点边的输入（“孩子考试考得不好”）不采用；
+  前两名指向同一科室（调用方通过 related 判断，如“发烧咳嗽”命中的“发热”“咳嗽”）时不是歧义，不要求领先差距。
+  阈值与差距在标注查询的调优集上选取，在另一组留出的查询上报告召回率与误报率（见 benchmarks/semantic_symptoms.py）。
+"""
+import math
+import os
+import re
+from collections import Counter, namedtuple
+
+from src.services.symptom_index import normalize_text, strip_negated
+
+# 截断 SVD 保留的维数（不超过矩阵的秩；文档数小于该值时等价于精确的 TF-IDF 余弦）
+SEMANTIC_SVD_COMPONENTS = int(os.environ.get('SEMANTIC_SVD_COMPONENTS', '128'))
+SEMANTIC_NGRAM_RANGE = (2, 3)
+
+SemanticHit = namedtuple('SemanticHit', ['kind', 'key', 'score'])
+
+# 只保留汉字，其余字符作为片段分隔（n-gram 不跨片段）
+_SEGMENT = re.compile('[一-鿿]+')
+
+
+def char_ngrams(text, ngram_range=SEMANTIC_NGRAM_RANGE):
+    low, high = ngram_range
+    grams = []
+    for segment in _SEGMENT.findall(normalize_text(text)):
+        for n in range(low, high + 1):
+            grams.extend(segment[i:i + n] for i in range(len(segment) - n + 1))
+    return grams
+
+
+class SemanticIndex:
+    """文档为 (kind, key, text)，如 ('symptom', '发热', '...')、('department', '呼吸内科', '...')"""
+
+    def __init__(self, documents, components=SEMANTIC_SVD_COMPONENTS, ngram_range=SEMANTIC_NGRAM_RANGE):
+        import numpy as np
+
+        self.ngram_range = ngram_range
+        self.labels = [(kind, key) for kind, key, _ in documents]
+        counts = [Counter(char_ngrams(text, ngram_range)) for _, _, text in documents]
+        vocabulary = sorted({gram for count in counts for gram in count})
+        self._vocabulary = {gram: i for i, gram in enumerate(vocabulary)}
+
+        document_frequency = np.zeros(len(vocabulary))
+        for count in counts:
+            for gram in count:
+                document_frequency[self._vocabulary[gram]] += 1
+        self._idf = np.log((1 + len(documents)) / (1 + document_frequency)) + 1
+
+        matrix = np.zeros((len(documents), len(vocabulary)))
+        for row, count in enumerate(counts):
+            for gram, tf in count.items():
+                column = self._vocabulary[gram]
+                matrix[row, column] = (1 + math.log(tf)) * self._idf[column]
+        matrix /= np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12)
+
+        # 截断 SVD：matrix ≈ U·S·Vt，文档向量 U·S，查询通过 Vt 投影
+        u, s, vt = np.linalg.svd(matrix, full_matrices=False)
+        rank = int((s > 1e-10).sum())
+        k = max(1, min(components, rank))
+        self._projection = np.ascontiguousarray(vt[:k].T)
+        embeddings = u[:, :k] * s[:k]
+        self._embeddings = embeddings / np.maximum(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12)
+        self.components = k
+        # 投影前后 TF-IDF 能量的保留比例，降维过多时可据此调大 SEMANTIC_SVD_COMPONENTS
+        self.explained_variance = float((s[:k] ** 2).sum() / max((s ** 2).sum(), 1e-12))
+
+    def __len__(self):
+        return len(self.labels)
+
+    def embed(self, text):
+        """查询的降维向量（已按原始 TF-IDF 范数归一化）；不含任何已知 n-gram 时返回 None"""
+        import numpy as np
+
+        grams = char_ngrams(strip_negated(normalize_text(text)), self.ngram_range)
+        count = Counter(gram for gram in grams if gram in self._vocabulary)
+        if not count:
+            return None
+        columns = np.fromiter((self._vocabulary[gram] for gram in count), dtype=np.intp, count=len(count))
+        weights = np.fromiter(((1 + math.log(tf)) for tf in count.values()), dtype=float, count=len(count))
+        weights *= self._idf[columns]
+        return weights @ self._projection[columns] / np.linalg.norm(weights)
+
+    def search(self, text, k=5, min_score=0.0, min_margin=0.0, related=None):
+        """余弦相似度最高的 k 个文档，按得分降序；最佳得分领先第二名不足 min_margin 时视为没有可信的命中，
+        除非 related(最佳, 第二名) 为 True（两者指向同一结论）"""
+        import numpy as np
+
+        query = self.embed(text)
+        if query is None:
+            return []
+        scores = self._embeddings @ query
+        # 至少取前两名以计算领先差距
+        n = min(max(k, 2), len(scores))
+        top = np.argpartition(-scores, n - 1)[:n]
+        top = top[np.argsort(-scores[top])]
+        hits = [SemanticHit(*self.labels[i], round(float(scores[i]), 4)) for i in top]
+        if len(hits) > 1 and scores[top[0]] - scores[top[1]] < min_margin:
+            if related is None or not related(hits[0], hits[1]):
+                return []
+        return [hit for hit in hits[:k] if hit.score >= min_score]
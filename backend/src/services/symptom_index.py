@@ -0,0 +1,294 @@
+"""容错的症状匹配索引（SymSpell 式删除字典）。
+
+索引词包括知识库中的症状名及其同义词（含拼音），每个词连同删除若干字符得到的全部变体一起放入删除字典。查询时同样生成查询串的删除变体，查字典得到候选词，再用编辑距离（相邻换位记为一次编辑）校验，
+不需要与全部词逐一比较，单次查询在微秒级完成。
+
+文本先做归一化：小写、繁体字转简体（只覆盖症状词用到的字）、去掉拼音字母间的空格；
+再按文字类型切成汉字段与字母段分别扫描，每段内：
+- 任意长度的词都精确匹配；
+- 较长的词（汉字 >= 4、拼音 >= 5 个字母）允许 1 处编辑，参与模糊匹配的片段至少 3 个汉字或 5 个字母；
+  三字的汉字词（“肚子疼”“胸口痛”）只差部位一个字，放宽后“嗓子疼”会被当成“肚子疼”，因此只精确匹配；
+- 整段很短（如症状列表中单独的一项“咳漱”）且没有任何命中时，把整段当作一个词查询，允许更大的编辑距离，
+  但只有唯一的最佳候选症状时才采用，避免“肚痛”这类同时接近“腹痛”“头痛”的输入被误判；
+  字母段只有能完整切分为拼音音节时才做整段查询，避免“fail”“test”这类英文单词被当作拼音错拼匹配到症状。
+"""
+import functools
+import re
+from collections import namedtuple
+
+# 删除字典收录的最大删除数（整段查询的编辑距离上限）
+MAX_EDIT_DISTANCE = 2
+# 整段查询的最大段长
+MAX_TOKEN_LENGTH = 6
+
+# 症状词中用到的繁体字 -> 简体字
+_TRADITIONAL = str.maketrans({
+    '發': '发', '熱': '热', '燒': '烧', '頭': '头', '瀉': '泻', '嘔': '呕', '噁': '恶', '惡': '恶',
+    '暈': '晕', '難': '难', '嚨': '咙', '氣': '气', '悶': '闷', '體': '体', '溫': '温', '覺': '觉',
+    '腦': '脑', '脹': '胀', '著': '着', '軟': '软', '頸': '颈', '喫': '吃', '睏': '困', '吳': '吴',
+    '嗆': '呛', '癢': '痒', '疊': '叠', '慮': '虑', '鬱': '郁', '無': '无', '眾': '众', '腸': '肠',
+    '瀰': '弥', '陣': '阵', '嚴': '严', '輕': '轻', '續': '续', '過': '过', '淺': '浅', '膽': '胆',
+})
+_CJK = re.compile('[一-鿿]+')
+_ASCII = re.compile('[a-z]+(?: +[a-z]+)*')
+
+# 否定表述：否定词（可带“明显”“任何”等修饰）直接修饰的内容视为被否认，如“没有胸痛”“否认发热、咳嗽”。
+# 否定范围只到紧随其后的词（或用顿号、“和”“或”连接的一组词），不延伸到整个分句：“没吃东西突然抽搐”中的“抽搐”不是被否认的。
+# 给定词表时只去掉词表中紧跟否定词的词；未给定时每个被否认的词最多取 NEGATION_WINDOW 个字，遇到标点、空白、转折或并列连词即止。
+# “有没有”“是不是”是疑问而非否定；“没力气”“没有胃口”“无法呼吸”“四肢无力”本身就是症状描述，不视为否定。
+NEGATION_WINDOW = 4
+_NEGATION = ('(?:(?<!有)没有|(?<!有)没|(?<!是)不是|并无|否认|未见|未出现|无明显|不再|无(?!力|法|助|聊|精打采))'
+             '(?!有?(?:什么|啥)?(?:力气|食欲|胃口|精神|劲))')
+_NEGATION_MODIFIER = '(?:明显的?|任何|出现过?|过)?'
+_LIST_SEPARATOR = '(?:、|以及|或者|和|或|及|与)'
+_WINDOW_ITEM = ('(?:(?!但|可是|不过|却|而是|就是|只是|还是|而且|并且|还有|另外|同时)[^，,。.;；!！?？\\s、和或及与])'
+                f'{{1,{NEGATION_WINDOW}}}')
+_NEGATED = re.compile(f'{_NEGATION}{_NEGATION_MODIFIER}{_WINDOW_ITEM}(?:{_LIST_SEPARATOR}{_WINDOW_ITEM})*')
+
+
+@functools.lru_cache(maxsize=8)
+def _negated_terms(terms):
+    term = '(?:' + '|'.join(re.escape(t) for t in sorted(terms, key=len, reverse=True)) + ')'
+    return re.compile(f'{_NEGATION}{_NEGATION_MODIFIER}{term}'
+                      f'(?:{_LIST_SEPARATOR}(?:{_NEGATION})?{_NEGATION_MODIFIER}{term})*')
+
+
+# 不带声调的全部拼音音节，用于判断字母段是否为拼音
+PINYIN_SYLLABLES = frozenset('''
+a ai an ang ao ba bai ban bang bao bei ben beng bi bian biao bie bin bing bo bu ca cai can cang cao ce cen ceng
+cha chai chan chang chao che chen cheng chi chong chou chu chua chuai chuan chuang chui chun chuo ci cong cou cu
+cuan cui cun cuo da dai dan dang dao de dei den deng di dia dian diao die ding diu dong dou du duan dui dun duo
+e ei en eng er fa fan fang fei fen feng fo fou fu ga gai gan gang gao ge gei gen geng gong gou gu gua guai guan
+guang gui gun guo ha hai han hang hao he hei hen heng hong hou hu hua huai huan huang hui hun huo ji jia jian
+jiang jiao jie jin jing jiong jiu ju juan jue jun ka kai kan kang kao ke kei ken keng kong kou ku kua kuai kuan
+kuang kui kun kuo la lai lan lang lao le lei leng li lia lian liang liao lie lin ling liu lo long lou lu luan
+lue lun luo lv lve ma mai man mang mao me mei men meng mi mian miao mie min ming miu mo mou mu na nai nan nang
+nao ne nei nen neng ni nian niang niao nie nin ning niu nong nou nu nuan nue nuo nv nve o ou pa pai pan pang pao
+pei pen peng pi pian piao pie pin ping po pou pu qi qia qian qiang qiao qie qin qing qiong qiu qu quan que qun
+ran rang rao re ren reng ri rong rou ru rua ruan rui run ruo sa sai san sang sao se sen seng sha shai shan shang
+shao she shei shen sheng shi shou shu shua shuai shuan shuang shui shun shuo si song sou su suan sui sun suo ta
+tai tan tang tao te teng ti tian tiao tie ting tong tou tu tuan tui tun tuo wa wai wan wang wei wen weng wo wu
+xi xia xian xiang xiao xie xin xing xiong xiu xu xuan xue xun ya yan yang yao ye yi yin ying yo yong you yu yuan
+yue yun za zai zan zang zao ze zei zen zeng zha zhai zhan zhang zhao zhe zhei zhen zheng zhi zhong zhou zhu zhua
+zhuai zhuan zhuang zhui zhun zhuo zi zong zou zu zuan zui zun zuo
+'''.split())
+_MAX_SYLLABLE = max(map(len, PINYIN_SYLLABLES))
+
+SymptomMatch = namedtuple('SymptomMatch', ['symptom', 'term', 'text', 'start', 'distance', 'score'])
+
+
+def normalize_text(text):
+    return (text or '').lower().translate(_TRADITIONAL)
+
+
+def strip_negated(text, terms=None):
+    """去掉被否定的片段（替换为空格，保持分句边界），“我很好，没有胸痛”-> “我很好， ”；
+    给定 terms 时只去掉紧跟在否定词之后的这些词"""
+    pattern = _negated_terms(tuple(terms)) if terms else _NEGATED
+    return pattern.sub(' ', text or '')
+
+
+def is_pinyin(text):
+    """text 能否完整切分为若干拼音音节（“kesou”“fali”可以，“fail”“test”不行）"""
+    if not text:
+        return False
+    reachable = [True] + [False] * len(text)
+    for end in range(1, len(text) + 1):
+        reachable[end] = any(reachable[start] and text[start:end] in PINYIN_SYLLABLES
+                             for start in range(max(0, end - _MAX_SYLLABLE), end))
+    return reachable[-1]
+
+
+def edit_distance(a, b, limit):
+    """a、b 的编辑距离（插入、删除、替换、相邻换位各计 1）；超过 limit 时返回 limit + 1"""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous2, previous = None, list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = a[i - 1] != b[j - 1]
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                current[j] = min(current[j], previous2[j - 2] + 1)
+        if min(current) > limit:
+            return limit + 1
+        previous2, previous = previous, current
+    return previous[-1]
+
+
+def _deletes(word, depth):
+    """word 删除至多 depth 个字符得到的全部变体（含 word 本身）"""
+    variants = {word}
+    frontier = {word}
+    for _ in range(depth):
+        frontier = {w[:i] + w[i + 1:] for w in frontier if len(w) > 1 for i in range(len(w))} - variants
+        variants |= frontier
+    return variants
+
+
+def _is_ascii(term):
+    return term.isascii()
+
+
+def scan_distance(term):
+    """扫描文本时该词允许的编辑距离：短词只精确匹配；
+    三字的汉字词多为“部位 + 子/口 + 感觉”（“肚子疼”“胸口痛”），1 处编辑就会换掉部位（“嗓子疼”），同样只精确匹配"""
+    if _is_ascii(term):
+        return 0 if len(term) < 5 else 1
+    return 0 if len(term) < 4 else 1
+
+
+def token_distance(term):
+    """整段查询时该词允许的编辑距离；三字的汉字词与 scan_distance 一样只精确匹配"""
+    if not _is_ascii(term) and len(term) == 3:
+        return 0
+    return 1 if len(term) < 6 else 2
+
+
+class SymptomIndex:
+    """症状名与同义词的删除字典索引"""
+
+    def __init__(self, knowledge_base, synonyms=None):
+        self._terms = {}  # 归一化的词 -> 症状名
+        for symptom in knowledge_base:
+            self._add(symptom, symptom)
+        for symptom, words in (synonyms or {}).items():
+            if symptom in knowledge_base:
+                for word in words:
+                    self._add(word, symptom)
+        # 删除字典 {变体: 词集合}：全部词删除 1 个字符的变体覆盖 1 处编辑；
+        # 允许 2 处编辑的长词另建一份深度 2 的字典，短词不进入，避免短变体（单字）引出大量候选
+        self._deletes = self._build_deletes(self._terms, 1)
+        self._long_deletes = self._build_deletes([t for t in self._terms if token_distance(t) >= 2], 2)
+        self._full_deletes = None
+        # 参与模糊匹配的词用到的字符：片段中不在此集合的字符超过 1 个时不可能在 1 处编辑内匹配
+        self._fuzzy_chars = {ch for term in self._terms if scan_distance(term) for ch in term}
+        # 扫描时各文字类型需要尝试的窗口长度
+        self._windows = {}
+        for ascii_script in (False, True):
+            lengths = set()
+            for term in self._terms:
+                if _is_ascii(term) == ascii_script:
+                    d = scan_distance(term)
+                    lengths.update(range(max(1, len(term) - d), len(term) + d + 1))
+            self._windows[ascii_script] = sorted(lengths, reverse=True)
+
+    def _add(self, word, symptom):
+        term = normalize_text(word).replace(' ', '')
+        if term:
+            self._terms.setdefault(term, symptom)
+
+    def __len__(self):
+        return len(self._terms)
+
+    @staticmethod
+    def _build_deletes(terms, depth):
+        deletes = {}
+        for term in terms:
+            for variant in _deletes(term, min(depth, len(term) - 1)):
+                deletes.setdefault(variant, set()).add(term)
+        return deletes
+
+    @staticmethod
+    def _candidates(query, depth, deletes):
+        terms = set()
+        for variant in _deletes(query, min(depth, len(query) - 1)):
+            terms |= deletes.get(variant, set())
+        return terms
+
+    def lookup(self, query, limit=10, max_distance=None):
+        """把 query 整体当作一个词查询，返回按得分排序的候选 SymptomMatch（同一症状只保留最佳的一个）；
+        max_distance 覆盖按词长决定的编辑距离上限（不超过 MAX_EDIT_DISTANCE）"""
+        query = normalize_text(query).replace(' ', '')
+        if not query:
+            return []
+        if max_distance is None:
+            candidates = self._candidates(query, 1, self._deletes)
+            # 与长词（>= 6）相差 2 处编辑的查询至少有 4 个字符
+            if len(query) >= 4:
+                candidates |= self._candidates(query, 2, self._long_deletes)
+        elif max_distance <= 1:
+            candidates = self._candidates(query, 1, self._deletes)
+        else:
+            if self._full_deletes is None:
+                # 只有识别失败时的放宽查询会用到，首次使用时才构建
+                self._full_deletes = self._build_deletes(self._terms, MAX_EDIT_DISTANCE)
+            candidates = self._candidates(query, MAX_EDIT_DISTANCE, self._full_deletes)
+        best = {}
+        for term in candidates:
+            allowed = token_distance(term) if max_distance is None else min(max_distance, MAX_EDIT_DISTANCE)
+            distance = edit_distance(query, term, allowed)
+            if distance > allowed:
+                continue
+            match = SymptomMatch(self._terms[term], term, query, 0, distance, _score(query, term, distance))
+            current = best.get(match.symptom)
+            if current is None or match.score > current.score:
+                best[match.symptom] = match
+        return sorted(best.values(), key=lambda m: (-m.score, m.symptom))[:limit]
+
+    def _scan_run(self, run, offset, ascii_script):
+        """一段同类文字内的全部命中：精确匹配 + 较长词的 1 处编辑"""
+        matches = []
+        windows = self._windows[ascii_script]
+        covered = [False] * len(run)
+        for start in range(len(run)):
+            for length in windows:
+                window = run[start:start + length]
+                if len(window) == length and window in self._terms:
+                    matches.append(SymptomMatch(self._terms[window], window, window, offset + start, 0, 1.0))
+                    covered[start:start + length] = [True] * length
+        # 精确命中总是优先保留，与之重叠的片段不必再做模糊匹配
+        min_length = 5 if ascii_script else 3
+        for start in range(len(run)):
+            for length in windows:
+                # 过短的片段不做模糊匹配（“肚子”不应匹配到“肚子疼”）
+                if length < min_length or start + length > len(run) or any(covered[start:start + length]):
+                    continue
+                window = run[start:start + length]
+                if sum(ch not in self._fuzzy_chars for ch in window) > 1:
+                    continue
+                for term in self._candidates(window, 1, self._deletes):
+                    allowed = scan_distance(term)
+                    if not allowed:
+                        continue
+                    distance = edit_distance(window, term, allowed)
+                    if distance <= allowed:
+                        matches.append(SymptomMatch(self._terms[term], term, window, offset + start, distance,
+                                                    _score(window, term, distance)))
+        if not matches and len(run) <= MAX_TOKEN_LENGTH and (not ascii_script or is_pinyin(run)):
+            # 整段查询：只有唯一的最佳候选症状时才采用；字母段须是拼音，英文单词不做查询
+            candidates = self.lookup(run, limit=2)
+            if candidates and (len(candidates) == 1 or candidates[1].score < candidates[0].score):
+                matches.append(candidates[0]._replace(text=run, start=offset))
+        return matches
+
+    def match(self, text):
+        """文本中识别出的症状，返回按出现顺序排列、互不重叠的 SymptomMatch 列表（同一症状只保留第一次）"""
+        text = normalize_text(text)
+        matches = []
+        for match in _CJK.finditer(text):
+            matches.extend(self._scan_run(match.group(), match.start(), False))
+        for match in _ASCII.finditer(text):
+            # 拼音允许按音节空格分开书写
+            matches.extend(self._scan_run(match.group().replace(' ', ''), match.start(), True))
+        # 编辑距离小的优先，其次是更长的匹配，再按出现位置；重叠的命中只保留最优的一个
+        matches.sort(key=lambda m: (m.distance, -len(m.text), m.start))
+        taken, chosen = [], []
+        for match in matches:
+            span = (match.start, match.start + len(match.text))
+            if any(span[0] < end and start < span[1] for start, end in taken):
+                continue
+            taken.append(span)
+            chosen.append(match)
+        chosen.sort(key=lambda m: m.start)
+        seen, result = set(), []
+        for match in chosen:
+            if match.symptom not in seen:
+                seen.add(match.symptom)
+                result.append(match)
+        return result
+
+
+def _score(query, term, distance):
+    return round(1.0 - distance / max(len(query), len(term)), 2)
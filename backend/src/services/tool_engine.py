@@ -0,0 +1,163 @@
+"""大模型工具调用执行引擎。
+
+- ToolRegistry：工具按名称注册（附带 JSON Schema 与超时），schemas() 生成传给 Generation.call 的 tools 列表，
+  新增工具只需注册，无需修改分发逻辑；
+- execute()：同一轮的多个 tool_calls 提交到有界线程池并发执行，每个工具有各自的超时，
+  超时或异常都转成 {"error": ...} 结果；返回的 tool 消息与模型给出的 tool_call_id 顺序一致。
+  工具通过抛出异常表示失败（预期内的失败抛 ToolError，消息原样交给模型），返回值一律视为成功结果，
+  不根据内容判断（医院、疾病描述中同样可能出现 "error" 字样）。
+
+多轮工具循环（模型看到工具结果后再次调用工具）由调用方驱动，最大轮数见 TOOL_MAX_ROUNDS。
+"""
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+
+from src.utils.log import get_logger
+from src.utils.metrics import REGISTRY, TOOL_CALL_SECONDS
+
+logger = get_logger('tool_engine')
+
+# 工具线程池大小：限制同时访问外部 API 的并发数
+TOOL_MAX_WORKERS = int(os.environ.get('TOOL_MAX_WORKERS', '8'))
+# 未单独指定时每个工具调用的超时（秒）
+TOOL_DEFAULT_TIMEOUT = float(os.environ.get('TOOL_DEFAULT_TIMEOUT', '8'))
+# 一次对话中模型最多发起几轮工具调用，达到上限后不再提供 tools，强制模型给出回答
+TOOL_MAX_ROUNDS = int(os.environ.get('TOOL_MAX_ROUNDS', '3'))
+
+TOOL_TIMEOUTS = REGISTRY.counter('tool_call_timeouts_total', 'Tool calls abandoned after their timeout', ('tool',))
+
+
+class ToolError(Exception):
+    """工具的预期内失败（如外部 API 返回错误），消息作为 {"error": ...} 交给模型"""
+
+
+class Tool:
+    __slots__ = ('name', 'func', 'description', 'parameters', 'timeout')
+
+    def __init__(self, name, func, description, parameters, timeout):
+        self.name = name
+        self.func = func
+        self.description = description
+        self.parameters = parameters
+        self.timeout = timeout
+
+    def schema(self):
+        return {'type': 'function',
+                'function': {'name': self.name, 'description': self.description, 'parameters': self.parameters}}
+
+
+def _parameters_schema(parameters):
+    """把 Qwen-Agent 风格的参数列表（name/type/description/required）转换为 JSON Schema"""
+    if isinstance(parameters, dict):
+        return parameters
+    return {
+        'type': 'object',
+        'properties': {p['name']: {'type': p['type'], 'description': p['description']} for p in parameters},
+        'required': [p['name'] for p in parameters if p.get('required')],
+    }
+
+
+def _error(message):
+    return json.dumps({'error': message}, ensure_ascii=False)
+
+
+def parse_tool_calls(raw_tool_calls):
+    """规范化模型返回的 tool_calls，返回 [(id, name, args, error)]；参数无法解析时 error 非空"""
+    calls = []
+    for index, tool_call in enumerate(raw_tool_calls or []):
+        function = tool_call.get('function') if isinstance(tool_call, dict) else None
+        if not isinstance(function, dict) or 'name' not in function:
+            logger.warning("Skipping malformed tool_call format: %s", tool_call)
+            continue
+        call_id = tool_call.get('id') or f'call_{index}'
+        arguments = function.get('arguments') or '{}'
+        try:
+            args = json.loads(arguments) if isinstance(arguments, str) else arguments
+            calls.append((call_id, function['name'], args, None))
+        except json.JSONDecodeError:
+            logger.warning("Malformed tool_call arguments: %s", arguments)
+            calls.append((call_id, function['name'], None, f'Malformed arguments for tool {function["name"]}'))
+    return calls
+
+
+class ToolRegistry:
+    def __init__(self, max_workers=TOOL_MAX_WORKERS):
+        self._tools = {}
+        self._max_workers = max_workers
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def register(self, name, func, description, parameters, timeout=None):
+        """注册工具：func(args: dict) -> str（JSON 字符串）或可序列化的对象；失败时抛出异常（ToolError 等）"""
+        self._tools[name] = Tool(name, func, description, _parameters_schema(parameters),
+                                 TOOL_DEFAULT_TIMEOUT if timeout is None else timeout)
+        return self._tools[name]
+
+    def register_tool(self, tool, timeout=None):
+        """注册带 name/description/parameters/call 属性的工具对象（如 AmapWeather）"""
+        return self.register(tool.name, tool.call, tool.description, tool.parameters, timeout)
+
+    def __contains__(self, name):
+        return name in self._tools
+
+    def schemas(self):
+        return [tool.schema() for tool in self._tools.values()]
+
+    @property
+    def executor(self):
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=self._max_workers, thread_name_prefix='tool')
+        return self._executor
+
+    def _run(self, tool, args):
+        start = time.perf_counter()
+        status = 'ok'
+        try:
+            result = tool.func(args)
+            if not isinstance(result, str):
+                result = json.dumps(result, ensure_ascii=False)
+            return result
+        except ToolError as e:
+            status = 'error'
+            logger.warning("Tool %s returned an error: %s", tool.name, e)
+            return _error(str(e))
+        except Exception as e:
+            status = 'error'
+            logger.warning("Tool %s failed: %s: %s", tool.name, type(e).__name__, e)
+            return _error(f'Error calling {tool.name}: {e}')
+        finally:
+            TOOL_CALL_SECONDS.observe(time.perf_counter() - start, tool=tool.name, status=status)
+
+    def execute(self, raw_tool_calls):
+        """并发执行一轮工具调用，返回按 tool_call 顺序排列的 tool 消息列表"""
+        pending = []
+        for call_id, name, args, error in parse_tool_calls(raw_tool_calls):
+            tool = self._tools.get(name)
+            if error is None and tool is None:
+                error = f'Unknown tool: {name}'
+            if error is not None:
+                pending.append((call_id, name, None, None, error))
+                continue
+            future = self.executor.submit(self._run, tool, args)
+            pending.append((call_id, name, future, time.monotonic() + tool.timeout, None))
+
+        messages = []
+        for call_id, name, future, deadline, error in pending:
+            if future is not None:
+                try:
+                    content = future.result(timeout=max(0.0, deadline - time.monotonic()))
+                except FutureTimeoutError:
+                    # 无法中断已在运行的线程；尚未开始的任务直接取消
+                    future.cancel()
+                    TOOL_TIMEOUTS.inc(tool=name)
+                    logger.warning("Tool %s timed out after %.1fs", name, self._tools[name].timeout)
+                    content = _error(f'Tool {name} timed out')
+            else:
+                content = _error(error)
+            messages.append({'role': 'tool', 'tool_call_id': call_id, 'content': content})
+        return messages
@@ -0,0 +1,401 @@
+"""大模型 token 与费用统计。
+
+每次 Generation.call 完成后，从响应的 usage 字段（流式调用取最后一个分片）读取输入/输出 token，
+按 路由 × 模型 × 调用阶段（chat_first_pass / chat_second_pass / diagnosis ...）累加到：
+- 指标：llm_tokens_total、llm_cost_total，以及每个 HTTP 请求消耗的 token 直方图 llm_request_tokens；
+- SQLite 汇总表 llm_usage_rollup（小时粒度），在内存中聚合后每 USAGE_FLUSH_INTERVAL 秒批量写入一次，
+  通过 GET /api/admin/usage 查询。
+用量归属的路由与客户端记录在 contextvar 中；提交到线程池的大模型调用需经 submit_in_context 携带上下文。
+可选的按客户端 token 配额（LLM_CLIENT_TOKEN_QUOTA）按墙钟对齐的固定窗口计数，超出后拒绝新的大模型调用；
+计数存放在 llm_client_usage 表中，gunicorn 的多个 worker 共用同一份额度（LLM_QUOTA_SHARED=0 时退回按 worker 计数）。
+客户端按来源地址区分；只有来自可信代理（TRUSTED_PROXIES）的请求才采用代理转发的标识，
+客户端自带的 X-Client-Id / X-Forwarded-For 不能用来绕过配额。
+"""
+import contextvars
+import datetime
+import ipaddress
+import os
+import threading
+import time
+
+from flask import jsonify, request
+from sqlalchemy import func, select
+
+from src.models.usage import LLMClientUsage, LLMUsageRollup
+from src.models.user import db
+from src.utils.log import get_logger
+from src.utils.metrics import REGISTRY
+
+logger = get_logger('usage')
+
+
+def _parse_prices(text):
+    """model=输入单价:输出单价（元 / 千 token），逗号分隔"""
+    prices = {}
+    for item in (text or '').split(','):
+        if '=' not in item or ':' not in item:
+            continue
+        model, pair = item.split('=', 1)
+        input_price, output_price = pair.split(':', 1)
+        prices[model.strip()] = (float(input_price), float(output_price))
+    return prices
+
+
+# 各模型单价（元 / 千 token），未列出的模型费用记为 0
+QWEN_MODEL_PRICES = _parse_prices(os.environ.get(
+    'QWEN_MODEL_PRICES', 'qwen-turbo=0.002:0.006,qwen-plus=0.004:0.012,qwen-max=0.04:0.12'))
+# 汇总表写入间隔（秒）
+USAGE_FLUSH_INTERVAL = float(os.environ.get('USAGE_FLUSH_INTERVAL', '15'))
+# 每个客户端在一个窗口内可消耗的 token 数，0 表示不限制；窗口长度（秒）
+LLM_CLIENT_TOKEN_QUOTA = int(os.environ.get('LLM_CLIENT_TOKEN_QUOTA', '0'))
+LLM_QUOTA_WINDOW = float(os.environ.get('LLM_QUOTA_WINDOW', '3600'))
+# 配额计数存放在数据库（llm_client_usage）中由所有 worker 共享；设为 0 时每个 worker 各自在进程内计数，
+# 此时 N 个 worker 下单个客户端实际可用的额度最多为 LLM_CLIENT_TOKEN_QUOTA 的 N 倍
+LLM_QUOTA_SHARED = os.environ.get('LLM_QUOTA_SHARED', '1') != '0'
+# 进程内计数表的客户端数上限，超出时清理已过期的窗口
+LLM_QUOTA_MAX_CLIENTS = 10000
+
+LLM_TOKENS = REGISTRY.counter(
+    'llm_tokens_total', 'LLM tokens by route, model, call and kind (input/output)', ('route', 'model', 'call', 'kind'))
+LLM_COST = REGISTRY.counter(
+    'llm_cost_total', 'Estimated LLM cost in CNY by route, model and call', ('route', 'model', 'call'))
+LLM_REQUEST_TOKENS = REGISTRY.histogram(
+    'llm_request_tokens', 'LLM tokens consumed per HTTP request', ('route',),
+    buckets=(100, 250, 500, 1000, 2000, 4000, 8000, 16000, 32000))
+LLM_QUOTA_REJECTIONS = REGISTRY.counter(
+    'llm_quota_rejections_total', 'Requests refused or degraded because the client token quota is used up', ('route',))
+
+def _parse_networks(text):
+    """逗号分隔的 IP 或 CIDR"""
+    networks = []
+    for item in (text or '').split(','):
+        item = item.strip()
+        if item:
+            networks.append(ipaddress.ip_network(item, strict=False))
+    return networks
+
+
+# 可信反向代理的地址（逗号分隔的 IP 或 CIDR），默认不信任任何代理
+TRUSTED_PROXIES = _parse_networks(os.environ.get('TRUSTED_PROXIES', ''))
+
+# 没有请求上下文的调用（如启动任务）归入该路由
+BACKGROUND_ROUTE = '<background>'
+
+
+class UsageScope:
+    """一个 HTTP 请求的用量归属与累计"""
+    __slots__ = ('route', 'client', 'input_tokens', 'output_tokens')
+
+    def __init__(self, route, client=None):
+        self.route = route
+        self.client = client
+        self.input_tokens = 0
+        self.output_tokens = 0
+
+
+_current_scope = contextvars.ContextVar('llm_usage_scope', default=None)
+
+
+def submit_in_context(executor, fn, *args):
+    """向线程池提交任务，并让任务继承当前上下文（用量仍记在发起请求的路由与客户端上）"""
+    return executor.submit(contextvars.copy_context().run, fn, *args)
+
+
+def usage_of(response):
+    """读取 DashScope 响应的 usage，返回 (输入 token, 输出 token)"""
+    try:
+        usage = response.usage
+    except (AttributeError, KeyError):
+        return 0, 0
+    if not usage:
+        return 0, 0
+    # usage 是 dict 子类，缺少字段时 getattr 会抛 KeyError
+    get = usage.get if isinstance(usage, dict) else (lambda key: getattr(usage, key, None))
+    return int(get('input_tokens') or 0), int(get('output_tokens') or 0)
+
+
+def estimate_cost(model, input_tokens, output_tokens):
+    input_price, output_price = QWEN_MODEL_PRICES.get(model, (0.0, 0.0))
+    return (input_tokens * input_price + output_tokens * output_price) / 1000.0
+
+
+# --- 汇总表 ---
+class UsageRollup:
+    """(小时, 路由, 模型, 调用阶段) -> [调用次数, 输入 token, 输出 token, 费用]，定期 upsert 到 llm_usage_rollup"""
+
+    def __init__(self, flush_interval=USAGE_FLUSH_INTERVAL):
+        self.flush_interval = flush_interval
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._last_flush = time.monotonic()
+
+    def add(self, route, model, call, input_tokens, output_tokens, cost):
+        bucket = datetime.datetime.now(datetime.timezone.utc).replace(minute=0, second=0, microsecond=0, tzinfo=None)
+        with self._lock:
+            self._merge((bucket, route, model, call), (1, input_tokens, output_tokens, cost))
+
+    def _merge(self, key, values):
+        entry = self._pending.get(key)
+        if entry is None:
+            self._pending[key] = list(values)
+        else:
+            for i, value in enumerate(values):
+                entry[i] += value
+
+    def due(self):
+        return bool(self._pending) and time.monotonic() - self._last_flush >= self.flush_interval
+
+    def flush(self):
+        """写入内存中的汇总（需在应用上下文中调用）；写入失败时保留待下次重试"""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            self._last_flush = time.monotonic()
+        if not pending:
+            return 0
+        rows = [{'bucket': bucket, 'route': route, 'model': model, 'call': call, 'calls': calls,
+                 'input_tokens': input_tokens, 'output_tokens': output_tokens, 'cost': cost}
+                for (bucket, route, model, call), (calls, input_tokens, output_tokens, cost) in pending.items()]
+        try:
+            _upsert(LLMUsageRollup, ('bucket', 'route', 'model', 'call'),
+                    ('calls', 'input_tokens', 'output_tokens', 'cost'), rows)
+        except Exception as e:
+            logger.warning("Usage rollup flush failed, will retry: %s: %s", type(e).__name__, e)
+            with self._lock:
+                for key, values in pending.items():
+                    self._merge(key, values)
+            return 0
+        return len(rows)
+
+
+def _upsert(model, keys, counters, rows):
+    """按 keys 插入或在已有行上累加 counters 列"""
+    table = model.__table__
+    dialect = db.engine.dialect.name
+    if dialect in ('sqlite', 'postgresql'):
+        if dialect == 'sqlite':
+            from sqlalchemy.dialects.sqlite import insert
+        else:
+            from sqlalchemy.dialects.postgresql import insert
+        stmt = insert(table)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=list(keys),
+            set_={column: table.c[column] + stmt.excluded[column] for column in counters})
+        with db.engine.begin() as conn:
+            conn.execute(stmt, rows)
+        return
+    # 其他数据库逐行读改写（单进程部署下足够）
+    for row in rows:
+        existing = model.query.filter_by(**{key: row[key] for key in keys}).first()
+        if existing is None:
+            db.session.add(model(**row))
+        else:
+            for column in counters:
+                setattr(existing, column, getattr(existing, column) + row[column])
+    db.session.commit()
+
+
+usage_rollup = UsageRollup()
+
+USAGE_GROUP_COLUMNS = ('route', 'model', 'call')
+
+
+def query_usage(since=None, until=None, group_by=USAGE_GROUP_COLUMNS):
+    """按 group_by 中的列（route / model / call / bucket）汇总 [since, until) 内的用量，按总 token 降序"""
+    usage_rollup.flush()
+    columns = [getattr(LLMUsageRollup, name) for name in group_by]
+    total_tokens = func.sum(LLMUsageRollup.input_tokens + LLMUsageRollup.output_tokens)
+    query = db.session.query(
+        *columns,
+        func.sum(LLMUsageRollup.calls),
+        func.sum(LLMUsageRollup.input_tokens),
+        func.sum(LLMUsageRollup.output_tokens),
+        func.sum(LLMUsageRollup.cost),
+    )
+    if since is not None:
+        query = query.filter(LLMUsageRollup.bucket >= since)
+    if until is not None:
+        query = query.filter(LLMUsageRollup.bucket < until)
+    rows = []
+    for row in query.group_by(*columns).order_by(total_tokens.desc()):
+        item = {name: row[i].isoformat() if name == 'bucket' else row[i] for i, name in enumerate(group_by)}
+        calls, input_tokens, output_tokens, cost = row[len(group_by):]
+        item.update(calls=calls, input_tokens=input_tokens, output_tokens=output_tokens,
+                    total_tokens=input_tokens + output_tokens, cost=round(cost or 0.0, 6))
+        rows.append(item)
+    return rows
+
+
+# --- 按客户端的 token 配额 ---
+class TokenQuota:
+    """固定窗口计数，窗口按墙钟对齐（起点为 window 的整数倍），所有 worker 对同一客户端落在同一窗口。
+
+    shared 时计数累加到 llm_client_usage（每次大模型调用一次 upsert，每个请求读一次），多 worker 共用同一份额度；
+    数据库不可用（或不在应用上下文中）时退回进程内计数，此时额度按 worker 计算。
+    """
+
+    def __init__(self, limit=LLM_CLIENT_TOKEN_QUOTA, window=LLM_QUOTA_WINDOW, max_clients=LLM_QUOTA_MAX_CLIENTS,
+                 shared=LLM_QUOTA_SHARED, clock=time.time):
+        self.limit = limit
+        self.window = window
+        self.max_clients = max_clients
+        self.shared = shared
+        self._clock = clock
+        # 进程内计数：client -> [窗口起点, 已用 token]
+        self._usage = {}
+        self._lock = threading.Lock()
+        # 已清理过旧行的窗口起点
+        self._purged = None
+
+    @property
+    def enabled(self):
+        return self.limit > 0
+
+    def _window_start(self, now):
+        return now - now % self.window
+
+    def _entry(self, client, start):
+        entry = self._usage.get(client)
+        if entry is None or entry[0] != start:
+            if entry is None and len(self._usage) >= self.max_clients:
+                self._usage = {k: v for k, v in self._usage.items() if v[0] == start}
+            entry = self._usage[client] = [start, 0]
+        return entry
+
+    @staticmethod
+    def _bucket(start):
+        return datetime.datetime.fromtimestamp(start, datetime.timezone.utc).replace(tzinfo=None)
+
+    def _charge_shared(self, client, start, tokens):
+        try:
+            bucket = self._bucket(start)
+            _upsert(LLMClientUsage, ('client', 'window_start'), ('tokens',),
+                    [{'client': client, 'window_start': bucket, 'tokens': tokens}])
+            if self._purged != start:
+                # 每个窗口开始后由首次写入的 worker 清理过期窗口的行（重复清理无害）
+                self._purged = start
+                with db.engine.begin() as conn:
+                    conn.execute(LLMClientUsage.__table__.delete().where(LLMClientUsage.window_start < bucket))
+        except Exception as e:
+            logger.warning("Shared quota charge failed, counting in process: %s: %s", type(e).__name__, e)
+            return False
+        return True
+
+    def _used_shared(self, client, start):
+        try:
+            with db.engine.connect() as conn:
+                used = conn.execute(
+                    select(LLMClientUsage.tokens).where(LLMClientUsage.client == client,
+                                                        LLMClientUsage.window_start == self._bucket(start))
+                ).scalar()
+        except Exception as e:
+            logger.warning("Shared quota lookup failed, using in-process count: %s: %s", type(e).__name__, e)
+            return None
+        return used or 0
+
+    def charge(self, client, tokens):
+        if not self.enabled or not client:
+            return
+        start = self._window_start(self._clock())
+        if self.shared and self._charge_shared(client, start, tokens):
+            return
+        with self._lock:
+            self._entry(client, start)[1] += tokens
+
+    def status(self, client):
+        now = self._clock()
+        start = self._window_start(now)
+        used = self._used_shared(client, start) if self.shared else None
+        with self._lock:
+            local = self._entry(client, start)[1]
+        # 退回进程内计数的部分（数据库暂时不可用期间）同样计入
+        used = local + (used or 0)
+        return {'limit': self.limit, 'used': used, 'remaining': max(0, self.limit - used),
+                'reset_in': round(max(0.0, start + self.window - now), 1), 'shared': self.shared}
+
+    def exceeded(self, client):
+        """配额已用尽时返回距离窗口重置的秒数，否则返回 None"""
+        if not self.enabled or not client:
+            return None
+        status = self.status(client)
+        return status['reset_in'] if status['remaining'] <= 0 else None
+
+
+token_quota = TokenQuota()
+
+
+def record_usage(model, call, input_tokens, output_tokens):
+    """记录一次大模型调用的 token 用量"""
+    if not input_tokens and not output_tokens:
+        return
+    scope = _current_scope.get()
+    route = scope.route if scope is not None else BACKGROUND_ROUTE
+    cost = estimate_cost(model, input_tokens, output_tokens)
+    LLM_TOKENS.inc(input_tokens, route=route, model=model, call=call, kind='input')
+    LLM_TOKENS.inc(output_tokens, route=route, model=model, call=call, kind='output')
+    if cost:
+        LLM_COST.inc(cost, route=route, model=model, call=call)
+    usage_rollup.add(route, model, call, input_tokens, output_tokens, cost)
+    if scope is not None:
+        scope.input_tokens += input_tokens
+        scope.output_tokens += output_tokens
+        token_quota.charge(scope.client, input_tokens + output_tokens)
+
+
+def quota_retry_after():
+    """当前请求的客户端配额已用尽时返回重置前的秒数并计数，否则返回 None"""
+    scope = _current_scope.get()
+    retry_after = token_quota.exceeded(scope.client) if scope is not None else None
+    if retry_after is not None:
+        LLM_QUOTA_REJECTIONS.inc(route=scope.route)
+    return retry_after
+
+
+def quota_exceeded_response(retry_after):
+    response = jsonify({"error": "AI服务使用额度已用完，请稍后再试", "retry_after": retry_after})
+    response.status_code = 429
+    response.headers['Retry-After'] = str(int(retry_after) + 1)
+    return response
+
+
+def _trusted_proxy(address):
+    try:
+        ip = ipaddress.ip_address(address)
+    except ValueError:
+        return False
+    return any(ip in network for network in TRUSTED_PROXIES)
+
+
+def client_id():
+    """配额与用量归属的请求方标识：直连时为来源地址；请求来自可信代理时，采用代理设置的 X-Client-Id
+    （如认证后的用户标识），否则取 X-Forwarded-For 中最右侧的非可信地址"""
+    remote = request.remote_addr or ''
+    if not _trusted_proxy(remote):
+        return remote
+    forwarded_id = request.headers.get('X-Client-Id', '').strip()
+    if forwarded_id:
+        return forwarded_id
+    hops = [hop.strip() for hop in request.headers.get('X-Forwarded-For', '').split(',') if hop.strip()]
+    for hop in reversed(hops):
+        if not _trusted_proxy(hop):
+            return hop
+    return remote
+
+
+def _before_request():
+    rule = request.url_rule
+    _current_scope.set(UsageScope(rule.rule if rule is not None else '<unmatched>', client_id()))
+
+
+def _teardown_request(exc):
+    scope = _current_scope.get()
+    _current_scope.set(None)
+    if scope is not None and (scope.input_tokens or scope.output_tokens):
+        LLM_REQUEST_TOKENS.observe(scope.input_tokens + scope.output_tokens, route=scope.route)
+    if usage_rollup.due():
+        usage_rollup.flush()
+
+
+def init_app(app):
+    """注册用量归属的请求钩子；请求结束时按间隔把汇总写入数据库"""
+    app.before_request(_before_request)
+    app.teardown_request(_teardown_request)
@@ -0,0 +1,157 @@
+"""响应压缩中间件。
+
+根据 Accept-Encoding 协商 br / zstd / gzip（brotli、zstandard 为可选依赖，未安装时只用 gzip）：
+- 普通响应：小于 COMPRESS_MIN_SIZE 字节的直接跳过，避免为小包浪费 CPU；
+- 流式响应（SSE、NDJSON）：逐块压缩并在每块后 flush，不缓冲整个响应，客户端仍能实时收到事件；
+- 已带 Content-Encoding 的响应（如预压缩静态文件）与文件直传响应不再处理。
+压缩后的响应与原始字节不同，强 ETag 降级为弱 ETag；304 响应沿用客户端所缓存表示的强弱，两者保持一致。
+"""
+import os
+import zlib
+
+from flask import request
+
+from src.utils.metrics import REGISTRY
+
+try:
+    import brotli
+except ImportError:  # brotli 为可选依赖
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:  # zstandard 为可选依赖
+    zstandard = None
+
+COMPRESSIBLE_MIMETYPES = {
+    'application/json', 'application/javascript', 'application/x-ndjson', 'application/xml',
+    'image/svg+xml', 'text/event-stream',
+}
+
+COMPRESSION_BYTES = REGISTRY.counter(
+    'http_compression_bytes_total', 'Response bytes before/after compression', ('encoding', 'stage'))
+COMPRESSION_SKIPPED = REGISTRY.counter(
+    'http_compression_skipped_total', 'Responses left uncompressed', ('reason',))
+
+
+def _available_encodings():
+    encodings = []
+    if brotli is not None:
+        encodings.append('br')
+    if zstandard is not None:
+        encodings.append('zstd')
+    encodings.append('gzip')
+    return encodings
+
+
+class _StreamCompressor:
+    """增量压缩器：compress() 返回已可发送的字节（已 flush），finish() 返回结尾字节"""
+
+    def __init__(self, encoding, config):
+        self.encoding = encoding
+        if encoding == 'br':
+            self._obj = brotli.Compressor(quality=config['COMPRESS_BROTLI_QUALITY'])
+        elif encoding == 'zstd':
+            self._obj = zstandard.ZstdCompressor(level=config['COMPRESS_ZSTD_LEVEL']).compressobj()
+        else:
+            self._obj = zlib.compressobj(config['COMPRESS_LEVEL'], zlib.DEFLATED, 31)
+
+    def compress(self, data):
+        if self.encoding == 'br':
+            return self._obj.process(data) + self._obj.flush()
+        if self.encoding == 'zstd':
+            return self._obj.compress(data) + self._obj.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+        return self._obj.compress(data) + self._obj.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        if self.encoding == 'br':
+            return self._obj.finish()
+        return self._obj.flush()
+
+
+def compress_bytes(data, encoding, config):
+    if encoding == 'br':
+        return brotli.compress(data, quality=config['COMPRESS_BROTLI_QUALITY'])
+    if encoding == 'zstd':
+        return zstandard.ZstdCompressor(level=config['COMPRESS_ZSTD_LEVEL']).compress(data)
+    compressor = zlib.compressobj(config['COMPRESS_LEVEL'], zlib.DEFLATED, 31)
+    return compressor.compress(data) + compressor.flush()
+
+
+def _compress_stream(chunks, compressor):
+    raw_size = compressed_size = 0
+    try:
+        for chunk in chunks:
+            if isinstance(chunk, str):
+                chunk = chunk.encode('utf-8')
+            if not chunk:
+                continue
+            out = compressor.compress(chunk)
+            raw_size += len(chunk)
+            compressed_size += len(out)
+            yield out
+        tail = compressor.finish()
+        compressed_size += len(tail)
+        yield tail
+    finally:
+        if hasattr(chunks, 'close'):
+            chunks.close()
+        COMPRESSION_BYTES.inc(raw_size, encoding=compressor.encoding, stage='raw')
+        COMPRESSION_BYTES.inc(compressed_size, encoding=compressor.encoding, stage='compressed')
+
+
+def _match_cached_validator(response):
+    """客户端以 W/"..." 重新验证（缓存的是压缩后的表示）时，304 同样返回弱 ETag"""
+    etag, weak = response.get_etag()
+    if etag and not weak and request.if_none_match.is_weak(etag) and not request.if_none_match.contains(etag):
+        response.set_etag(etag, weak=True)
+
+
+def _compress_response(app, response):
+    config = app.config
+    if response.status_code == 304:
+        _match_cached_validator(response)
+        return response
+    if not config['COMPRESS_ENABLED']:
+        return response
+    if (response.status_code < 200 or response.status_code in (204, 304)
+            or 'Content-Encoding' in response.headers or response.direct_passthrough):
+        return response
+    mimetype = response.mimetype or ''
+    if not (mimetype.startswith('text/') or mimetype in COMPRESSIBLE_MIMETYPES):
+        return response
+
+    response.vary.add('Accept-Encoding')
+    encoding = request.accept_encodings.best_match(_available_encodings())
+    if encoding is None:
+        COMPRESSION_SKIPPED.inc(reason='not_accepted')
+        return response
+
+    if response.is_streamed:
+        response.response = _compress_stream(response.response, _StreamCompressor(encoding, config))
+        response.headers.pop('Content-Length', None)
+    else:
+        data = response.get_data()
+        if len(data) < config['COMPRESS_MIN_SIZE']:
+            COMPRESSION_SKIPPED.inc(reason='below_threshold')
+            return response
+        compressed = compress_bytes(data, encoding, config)
+        COMPRESSION_BYTES.inc(len(data), encoding=encoding, stage='raw')
+        COMPRESSION_BYTES.inc(len(compressed), encoding=encoding, stage='compressed')
+        response.set_data(compressed)
+
+    response.headers['Content-Encoding'] = encoding
+    # 压缩后的表示与原始字节不同，强 ETag 降级为弱 ETag
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+    return response
+
+
+def init_app(app):
+    app.config.setdefault('COMPRESS_ENABLED', os.environ.get('COMPRESS_ENABLED', '1') != '0')
+    app.config.setdefault('COMPRESS_MIN_SIZE', int(os.environ.get('COMPRESS_MIN_SIZE', '1024')))
+    app.config.setdefault('COMPRESS_LEVEL', int(os.environ.get('COMPRESS_LEVEL', '6')))
+    app.config.setdefault('COMPRESS_BROTLI_QUALITY', int(os.environ.get('COMPRESS_BROTLI_QUALITY', '4')))
+    app.config.setdefault('COMPRESS_ZSTD_LEVEL', int(os.environ.get('COMPRESS_ZSTD_LEVEL', '3')))
+    app.after_request(lambda response: _compress_response(app, response))
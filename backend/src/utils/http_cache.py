@@ -0,0 +1,59 @@
+"""HTTP 条件缓存（ETag / Last-Modified）。
+
+ETag 由数据版本号与请求参数计算得出，无需查询或序列化数据即可判断客户端缓存是否仍然有效：
+命中 If-None-Match（或 If-Modified-Since）时直接返回 304。各路由的 Cache-Control 策略集中
+定义在 CACHE_POLICIES，CDN 与移动端据此决定缓存时长与重新验证方式。
+"""
+import hashlib
+
+from flask import current_app, request
+
+from src.utils.metrics import REGISTRY
+
+CACHE_POLICIES = {
+    # 医院详情变化很少：允许共享缓存 5 分钟，过期后 1 分钟内可先用旧数据再后台验证
+    'hospital_details': 'public, max-age=300, stale-while-revalidate=60',
+    # 搜索结果随参数变化，缓存时间更短
+    'hospital_search': 'public, max-age=60, stale-while-revalidate=30',
+}
+
+HTTP_CACHE_REVALIDATIONS = REGISTRY.counter(
+    'http_cache_revalidations_total',
+    'Cacheable GETs: 304 (hit), stale validator (miss) or no validator sent (none)',
+    ('route', 'result'))
+
+
+def make_etag(*parts):
+    """由任意参数计算强 ETag 值（不含引号）"""
+    return hashlib.blake2b(repr(parts).encode('utf-8'), digest_size=12).hexdigest()
+
+
+def _not_modified(etag, last_modified):
+    if request.if_none_match:
+        # If-None-Match 优先于 If-Modified-Since
+        return request.if_none_match.contains_weak(etag)
+    if last_modified is not None and request.if_modified_since is not None:
+        return last_modified.replace(tzinfo=None) <= request.if_modified_since.replace(tzinfo=None)
+    return False
+
+
+def conditional_response(route, etag, build, policy, last_modified=None):
+    """条件响应：客户端缓存仍有效时返回 304，否则调用 build() 生成完整响应
+
+    route: 用于指标标签的路由名；policy: CACHE_POLICIES 中的键。
+    """
+    if _not_modified(etag, last_modified):
+        HTTP_CACHE_REVALIDATIONS.inc(route=route, result='hit')
+        response = current_app.response_class(status=304)
+    else:
+        has_validator = bool(request.if_none_match) or request.if_modified_since is not None
+        HTTP_CACHE_REVALIDATIONS.inc(route=route, result='miss' if has_validator else 'none')
+        response = current_app.make_response(build())
+        if response.status_code != 200:
+            return response
+    response.set_etag(etag)
+    if last_modified is not None:
+        response.last_modified = last_modified
+    response.headers['Cache-Control'] = CACHE_POLICIES[policy]
+    response.vary.add('Accept-Encoding')
+    return response
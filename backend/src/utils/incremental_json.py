@@ -0,0 +1,130 @@
+"""大模型 JSON 输出的解析。
+
+- extract_json_object：完整文本的解析，去除 BOM 与前后说明文字，取第一个 '{' 到最后一个 '}' 之间的内容；
+- IncrementalObjectParser：流式解析。逐段 feed() 模型输出，顶层对象的某个字段一闭合就立即返回
+  (key, value)，无需等待整个对象生成完毕。同样跳过 BOM 和 '{' 之前的文字，顶层对象闭合后的内容忽略。
+"""
+import codecs
+import json
+
+_BOM = codecs.BOM_UTF8.decode('utf-8')
+
+
+def extract_json_object(text):
+    """从模型回复中提取并解析 JSON 对象；找不到对象边界时抛 ValueError，内容非法时抛 json.JSONDecodeError"""
+    cleaned = text.strip()
+    if cleaned.startswith(_BOM):
+        cleaned = cleaned[len(_BOM):]
+    cleaned = cleaned.strip()
+    start_index = cleaned.find('{')
+    end_index = cleaned.rfind('}')
+    if start_index == -1 or end_index == -1 or end_index < start_index:
+        raise ValueError("无法在内容中找到有效的JSON对象边界")
+    return json.loads(cleaned[start_index:end_index + 1])
+
+
+class IncrementalObjectParser:
+    """顶层 JSON 对象的增量解析器
+
+    只跟踪括号深度与字符串状态，顶层字段的值在遇到深度 1 的 ',' 或闭合的 '}' 时整体交给 json.loads，
+    因此每个字符只扫描一次，值的解析与标准库完全一致。
+    """
+
+    def __init__(self):
+        self.buffer = ''
+        self.fields = {}
+        self.started = False
+        self.done = False
+        self.errors = []
+        self._pos = 0
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._phase = 'key'  # key -> colon -> value
+        self._key = None
+        self._token_start = 0
+
+    def feed(self, chunk):
+        """追加一段输出，返回本段内闭合的顶层字段 [(key, value)]"""
+        if self.done or not chunk:
+            return []
+        if not self.started:
+            chunk = (self.buffer + chunk).lstrip(_BOM)
+            brace = chunk.find('{')
+            if brace == -1:
+                # 保留尚未遇到 '{' 的文字，BOM 可能被拆在两段之间
+                self.buffer = chunk[-1:] if chunk.endswith(_BOM[:1]) else ''
+                return []
+            self.started = True
+            self.buffer = ''
+            chunk = chunk[brace:]
+        self.buffer += chunk
+        return self._scan()
+
+    def _scan(self):
+        completed = []
+        buffer = self.buffer
+        pos = self._pos
+        while pos < len(buffer):
+            char = buffer[pos]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == '\\':
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+                    if self._depth == 1 and self._phase == 'key':
+                        self._key = self._loads(buffer[self._token_start:pos + 1])
+                        self._phase = 'colon'
+            elif char == '"':
+                self._in_string = True
+                if self._depth == 1 and self._phase == 'key':
+                    self._token_start = pos
+            elif char in '{[':
+                self._depth += 1
+            elif char in '}]':
+                self._depth -= 1
+                if self._depth == 0:
+                    self._complete(buffer[self._token_start:pos], completed)
+                    self.done = True
+                    pos += 1
+                    break
+            elif self._depth == 1:
+                if char == ':' and self._phase == 'colon':
+                    self._phase = 'value'
+                    self._token_start = pos + 1
+                elif char == ',' and self._phase == 'value':
+                    self._complete(buffer[self._token_start:pos], completed)
+                    self._phase = 'key'
+            pos += 1
+        self._pos = pos
+        if self.done:
+            # 顶层对象之后的说明文字不再保留
+            self.buffer = buffer[:pos]
+        return completed
+
+    def _complete(self, raw, completed):
+        if self._phase != 'value' or self._key is None:
+            return
+        value = self._loads(raw.strip())
+        if value is not _INVALID:
+            self.fields[self._key] = value
+            completed.append((self._key, value))
+        self._key = None
+
+    def _loads(self, text):
+        try:
+            return json.loads(text)
+        except ValueError as e:
+            self.errors.append(f'{e}: {text[:80]}')
+            return _INVALID
+
+    def result(self):
+        """流结束后的完整对象；增量解析未能得到完整对象时回退到 extract_json_object"""
+        if self.done and not self.errors:
+            return dict(self.fields)
+        return extract_json_object(self.buffer)
+
+
+_INVALID = object()
@@ -0,0 +1,123 @@
+"""快速 JSON 序列化。
+
+- FastJSONProvider：替换 Flask 默认的 JSON provider，安装了 orjson 时使用 orjson
+  （原生支持 datetime/date），否则回退到标准库 json；
+- RawJSON：包装一段已经序列化好的 JSON 字节串（如缓存的医院片段），
+  dumps_bytes 组装响应时原样拼接，不再重新编码；
+- json_response：直接用字节串构造响应，绕过 jsonify 的 dict -> str -> bytes 转换。
+"""
+import datetime
+import decimal
+import json
+import threading
+import uuid
+
+from flask import current_app
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:  # orjson 为可选依赖
+    orjson = None
+
+
+class RawJSON:
+    """已序列化的 JSON 片段"""
+
+    __slots__ = ('data',)
+
+    def __init__(self, data):
+        self.data = data
+
+
+# 编码途中遇到 RawJSON 时先编码为 null 并在此做标记，由 dumps_bytes 检查标记后改走拼接路径
+_raw_state = threading.local()
+
+
+def _default(obj):
+    if isinstance(obj, RawJSON):
+        _raw_state.found = True
+        return None
+    if isinstance(obj, (datetime.date, datetime.datetime)):
+        return obj.isoformat()
+    if isinstance(obj, (decimal.Decimal, uuid.UUID)):
+        return str(obj)
+    if isinstance(obj, (set, frozenset)):
+        return list(obj)
+    raise TypeError(f'Object of type {type(obj).__name__} is not JSON serializable')
+
+
+if orjson is not None:
+    _ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS
+
+    def _encode(obj):
+        return orjson.dumps(obj, default=_default, option=_ORJSON_OPTIONS)
+
+    def _decode(data):
+        return orjson.loads(data)
+else:
+    def _encode(obj):
+        return json.dumps(obj, default=_default, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+    def _decode(data):
+        return json.loads(data)
+
+
+def _assemble(obj):
+    if isinstance(obj, RawJSON):
+        return obj.data
+    if isinstance(obj, dict):
+        return b'{' + b','.join(_encode(str(k)) + b':' + _assemble(v) for k, v in obj.items()) + b'}'
+    if isinstance(obj, (list, tuple, set, frozenset)):
+        return b'[' + b','.join(_assemble(v) for v in obj) + b']'
+    return _encode(obj)
+
+
+def extend_raw(fragment, extra):
+    """在已序列化的 JSON 对象片段末尾追加字段，返回新的 RawJSON"""
+    if not extra:
+        return RawJSON(fragment)
+    tail = b','.join(_encode(str(k)) + b':' + dumps_bytes(v) for k, v in extra.items())
+    if fragment == b'{}':
+        return RawJSON(b'{' + tail + b'}')
+    return RawJSON(fragment[:-1] + b',' + tail + b'}')
+
+
+def dumps_bytes(obj):
+    """序列化为 UTF-8 字节串；包含 RawJSON 片段时逐层拼接，片段本身不再重新编码"""
+    _raw_state.found = False
+    try:
+        data = _encode(obj)
+        return _assemble(obj) if _raw_state.found else data
+    finally:
+        _raw_state.found = False
+
+
+def loads(data):
+    return _decode(data)
+
+
+def json_response(obj, status=200, headers=None):
+    """以快速路径构造 JSON 响应，obj 可包含 RawJSON 片段"""
+    response = current_app.response_class(dumps_bytes(obj), status=status, mimetype='application/json')
+    if headers:
+        response.headers.update(headers)
+    return response
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """基于 orjson 的 Flask JSON provider；jsonify 与 request.get_json 都会经过这里"""
+
+    def dumps(self, obj, **kwargs):
+        if kwargs:
+            return super().dumps(obj, **kwargs)
+        return dumps_bytes(obj).decode('utf-8')
+
+    def loads(self, s, **kwargs):
+        if kwargs:
+            return super().loads(s, **kwargs)
+        return _decode(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(dumps_bytes(obj), mimetype=self.mimetype)
@@ -0,0 +1,154 @@
+"""结构化、分级、低开销的日志工具。
+
+- 日志级别通过环境变量 LOG_LEVEL 控制（默认 INFO），DEBUG 输出需显式开启；
+- 使用 %-风格参数实现惰性格式化，级别不满足时不会构造消息字符串；
+- 通过 QueueHandler + QueueListener 异步写出，请求线程只负责入队；
+- 在入队前对密钥类信息脱敏（API Key 环境变量的值、URL 中的 key=... 等），
+  用户消息中的手机号、身份证号与经纬度同样打码；
+- 为流式分片等高频事件提供按 key 的采样计数器。
+"""
+import atexit
+import itertools
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import re
+import threading
+
+LOGGER_ROOT = 'medical_ai'
+
+# 需要脱敏的环境变量：其值一旦出现在日志消息中即被替换
+SECRET_ENV_VARS = ('DASHSCOPE_API_KEY', 'WEATHER_API', 'ADMIN_TOKEN', 'PROFILE_TOKEN')
+SECRET_PATTERN = re.compile(r'(?i)\b(api_key|apikey|key|token|secret|password)(["\']?\s*[=:]\s*["\']?)([^\s&"\',}]+)')
+REDACTED = '***'
+# 个人信息：18 位身份证号、11 位手机号（保留首尾几位便于排查），以及 lat/lng/location 等字段的坐标值
+ID_NUMBER_PATTERN = re.compile(r'(?<![0-9A-Za-z])(\d{3})\d{11}(\d{3}[\dXx])(?![0-9A-Za-z])')
+PHONE_PATTERN = re.compile(r'(?<!\d)(1[3-9]\d)\d{4}(\d{4})(?!\d)')
+LOCATION_PATTERN = re.compile(r'(?i)(?<![a-z])(lat|lng|lon|latitude|longitude|location)(["\']?\s*[=:]\s*["\']?)'
+                              r'(-?\d+(?:\.\d+)?(?:\s*,\s*-?\d+(?:\.\d+)?)?)')
+
+# LogRecord 自带的属性，结构化输出时用于区分 extra 字段
+_RESERVED_ATTRS = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+_configured = False
+_config_lock = threading.Lock()
+_listener = None
+_sample_counters = {}
+
+
+def get_logger(name):
+    """获取挂在应用根日志器下的子日志器"""
+    return logging.getLogger(f'{LOGGER_ROOT}.{name}')
+
+
+def redact(text):
+    """对文本中的密钥与个人信息进行脱敏"""
+    for env_name in SECRET_ENV_VARS:
+        secret = os.environ.get(env_name)
+        if secret and len(secret) >= 4 and secret in text:
+            text = text.replace(secret, REDACTED)
+    text = SECRET_PATTERN.sub(lambda m: f'{m.group(1)}{m.group(2)}{REDACTED}', text)
+    text = ID_NUMBER_PATTERN.sub(r'\1***********\2', text)
+    text = PHONE_PATTERN.sub(r'\1****\2', text)
+    return LOCATION_PATTERN.sub(lambda m: f'{m.group(1)}{m.group(2)}{REDACTED}', text)
+
+
+def sampled(key, every):
+    """按 key 采样：每 every 次调用返回一次 True，用于流式分片等高频日志"""
+    if every <= 1:
+        return True
+    counter = _sample_counters.get(key)
+    if counter is None:
+        counter = _sample_counters.setdefault(key, itertools.count())
+    return next(counter) % every == 0
+
+
+def _extra_fields(record):
+    return {k: v for k, v in record.__dict__.items() if k not in _RESERVED_ATTRS and not k.startswith('_')}
+
+
+class RedactingFilter(logging.Filter):
+    """在记录入队前完成格式化与脱敏，之后的处理不再接触原始参数"""
+
+    def filter(self, record):
+        message = redact(record.getMessage())
+        record.msg = message
+        record.args = None
+        if record.exc_info and not record.exc_text:
+            record.exc_text = redact(logging.Formatter().formatException(record.exc_info))
+        return True
+
+
+class KeyValueFormatter(logging.Formatter):
+    """文本格式：时间 级别 日志器 消息 key=value ..."""
+
+    def __init__(self):
+        super().__init__('%(asctime)s %(levelname)s %(name)s %(message)s')
+
+    def format(self, record):
+        line = super().format(record)
+        fields = _extra_fields(record)
+        if fields:
+            line += ' ' + ' '.join(f'{k}={v}' for k, v in fields.items())
+        return line
+
+
+class JsonFormatter(logging.Formatter):
+    """JSON 行格式，便于日志系统采集"""
+
+    def format(self, record):
+        payload = {
+            'ts': round(record.created, 3),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+        }
+        payload.update(_extra_fields(record))
+        if record.exc_text:
+            payload['exc'] = record.exc_text
+        return json.dumps(payload, ensure_ascii=False, default=str)
+
+
+def configure_logging(level=None, fmt=None):
+    """初始化应用日志（幂等）。
+
+    level: 日志级别，默认取环境变量 LOG_LEVEL，未设置时为 INFO。
+    fmt: 'text' 或 'json'，默认取环境变量 LOG_FORMAT。
+    """
+    global _configured, _listener
+    with _config_lock:
+        if _configured:
+            return
+        level = (level or os.environ.get('LOG_LEVEL', 'INFO')).upper()
+        fmt = (fmt or os.environ.get('LOG_FORMAT', 'text')).lower()
+
+        stream_handler = logging.StreamHandler()
+        stream_handler.setFormatter(JsonFormatter() if fmt == 'json' else KeyValueFormatter())
+
+        log_queue = queue.SimpleQueue()
+        queue_handler = logging.handlers.QueueHandler(log_queue)
+        queue_handler.addFilter(RedactingFilter())
+
+        root = logging.getLogger(LOGGER_ROOT)
+        root.setLevel(level)
+        root.addHandler(queue_handler)
+        root.propagate = False
+
+        _listener = logging.handlers.QueueListener(log_queue, stream_handler, respect_handler_level=True)
+        _listener.start()
+        atexit.register(lambda: _listener.stop())
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=lambda: _restart_listener(queue_handler, stream_handler))
+        _configured = True
+
+
+def _restart_listener(queue_handler, stream_handler):
+    """fork 出的子进程（如 gunicorn preload 模式下的 worker）没有写出线程，需换一个新队列重新启动"""
+    global _listener
+    log_queue = queue.SimpleQueue()
+    queue_handler.queue = log_queue
+    _listener = logging.handlers.QueueListener(log_queue, stream_handler, respect_handler_level=True)
+    _listener.start()
+
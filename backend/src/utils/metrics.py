@@ -0,0 +1,299 @@
+"""进程内指标采集，以 Prometheus 文本格式导出。
+
+提供 Counter / Gauge / Histogram 三类指标，以及挂载到 Flask 应用上的
+请求中间件（按蓝图路由统计延迟直方图、状态码计数、在途请求数）和
+SQLAlchemy 查询计数。未处理的异常按 500 计数；流式响应在响应体发送完毕
+（或被关闭）时才记录耗时。所有指标只做加法与桶定位，开销足够低，可常驻开启。
+"""
+import bisect
+import threading
+import time
+
+from flask import Response, g, has_request_context, request
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+PROMETHEUS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def _format_labels(labelnames, values, extra=None):
+    pairs = list(zip(labelnames, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ''
+    escaped = (str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, v in pairs)
+    return '{' + ','.join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+class _Metric:
+    metric_type = 'untyped'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def _key(self, labels):
+        if len(labels) != len(self.labelnames):
+            raise ValueError(f'{self.name} expects labels {self.labelnames}, got {tuple(labels)}')
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def collect(self):
+        raise NotImplementedError
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.metric_type}']
+        lines.extend(self.collect())
+        return '\n'.join(lines)
+
+
+class Counter(_Metric):
+    metric_type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(self._key(labels), 0)
+
+    def collect(self):
+        with self._lock:
+            items = list(self._values.items())
+        return [f'{self.name}{_format_labels(self.labelnames, key)} {_format_value(v)}' for key, v in items]
+
+
+class Gauge(Counter):
+    metric_type = 'gauge'
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram(_Metric):
+    metric_type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # [各桶计数..., +Inf 桶计数, 总和]
+                state = self._values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            state[index] += 1
+            state[-1] += value
+
+    def count(self, **labels):
+        state = self._values.get(self._key(labels))
+        return sum(state[:-1]) if state else 0
+
+    def time(self, **labels):
+        """上下文管理器：统计代码块耗时"""
+        return _HistogramTimer(self, labels)
+
+    def collect(self):
+        with self._lock:
+            items = [(key, list(state)) for key, state in self._values.items()]
+        lines = []
+        for key, state in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), state[:-1]):
+                cumulative += count
+                labels = _format_labels(self.labelnames, key, ('le', _format_value(float(bound))))
+                lines.append(f'{self.name}_bucket{labels} {cumulative}')
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f'{self.name}_sum{labels} {_format_value(state[-1])}')
+            lines.append(f'{self.name}_count{labels} {cumulative}')
+        return lines
+
+
+class _HistogramTimer:
+    __slots__ = ('histogram', 'labels', 'start')
+
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.histogram.observe(time.perf_counter() - self.start, **self.labels)
+        return False
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _get_or_create(self, cls, name, documentation, labelnames, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, documentation, labelnames, **kwargs)
+            elif not isinstance(metric, cls):
+                raise ValueError(f'metric {name} already registered as {metric.metric_type}')
+            return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._get_or_create(Counter, name, documentation, labelnames)
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self._get_or_create(Gauge, name, documentation, labelnames)
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._get_or_create(Histogram, name, documentation, labelnames, buckets=buckets)
+
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return '\n'.join(metric.render() for metric in metrics) + '\n'
+
+
+REGISTRY = MetricsRegistry()
+
+# --- HTTP 请求指标 ---
+HTTP_REQUEST_SECONDS = REGISTRY.histogram(
+    'http_request_duration_seconds', 'HTTP request latency by route', ('blueprint', 'route', 'method'))
+HTTP_REQUESTS_TOTAL = REGISTRY.counter(
+    'http_requests_total', 'HTTP responses by route and status', ('blueprint', 'route', 'method', 'status'))
+HTTP_IN_FLIGHT = REGISTRY.gauge('http_requests_in_flight', 'HTTP requests currently being served')
+HTTP_REQUEST_DB_QUERIES = REGISTRY.histogram(
+    'http_request_db_queries', 'Database queries issued per request', ('blueprint', 'route'),
+    buckets=(0, 1, 2, 5, 10, 20, 50, 100))
+
+# --- 上游调用指标 ---
+LLM_FIRST_TOKEN_SECONDS = REGISTRY.histogram(
+    'llm_first_token_seconds', 'Time from Generation.call to the first streamed chunk', ('model', 'call'))
+LLM_CALL_SECONDS = REGISTRY.histogram(
+    'llm_call_duration_seconds', 'Total Generation.call time including stream consumption', ('model', 'call', 'status'))
+TOOL_CALL_SECONDS = REGISTRY.histogram(
+    'tool_call_duration_seconds', 'Tool execution time', ('tool', 'status'))
+
+# --- 数据库与缓存指标 ---
+DB_QUERIES_TOTAL = REGISTRY.counter('db_queries_total', 'SQL statements executed')
+DB_QUERY_SECONDS = REGISTRY.histogram('db_query_duration_seconds', 'SQL statement execution time')
+CACHE_REQUESTS_TOTAL = REGISTRY.counter('cache_requests_total', 'Cache lookups by result', ('cache', 'result'))
+
+
+def record_cache(cache_name, hit):
+    """记录一次缓存查询结果，命中率 = hit / (hit + miss)"""
+    CACHE_REQUESTS_TOTAL.inc(cache=cache_name, result='hit' if hit else 'miss')
+
+
+def _route_labels():
+    rule = request.url_rule
+    return request.blueprint or '', rule.rule if rule is not None else '<unmatched>'
+
+
+def _before_request():
+    g._metrics_start = time.perf_counter()
+    g._metrics_db_queries = 0
+    HTTP_IN_FLIGHT.inc()
+
+
+def _record(start, blueprint, route, method, status, db_queries):
+    HTTP_REQUEST_SECONDS.observe(time.perf_counter() - start, blueprint=blueprint, route=route, method=method)
+    HTTP_REQUESTS_TOTAL.inc(blueprint=blueprint, route=route, method=method, status=status)
+    HTTP_REQUEST_DB_QUERIES.observe(db_queries, blueprint=blueprint, route=route)
+
+
+def _after_request(response):
+    start = g.pop('_metrics_start', None)
+    if start is None:
+        return response
+    blueprint, route = _route_labels()
+    labels = (start, blueprint, route, request.method, response.status_code)
+    if not response.is_streamed:
+        _record(*labels, g.get('_metrics_db_queries', 0))
+        HTTP_IN_FLIGHT.dec()
+        return response
+
+    # 流式响应（包括 Flask 以 WSGI 方式生成的错误响应）：响应体在视图返回后才生成，
+    # 等响应体发送完毕或服务器关闭响应（客户端断开）时再记录耗时，在途请求数也到那时才减少；
+    # 此时请求上下文可能已经结束，标签与 g 对象提前取出
+    state = g._get_current_object()
+    finished = []
+
+    def finish():
+        if not finished:
+            finished.append(True)
+            _record(*labels, getattr(state, '_metrics_db_queries', 0))
+            HTTP_IN_FLIGHT.dec()
+
+    response.response = _timed_body(response.response, finish)
+    response.call_on_close(finish)
+    return response
+
+
+def _timed_body(chunks, finish):
+    try:
+        yield from chunks
+    finally:
+        if hasattr(chunks, 'close'):
+            chunks.close()
+        finish()
+
+
+def _teardown_request(exc):
+    # after_request 未执行（视图抛出未处理的异常）时在这里补记，按 500 计数
+    start = g.pop('_metrics_start', None)
+    if start is None:
+        return
+    if exc is not None:
+        blueprint, route = _route_labels()
+        _record(start, blueprint, route, request.method, 500, g.get('_metrics_db_queries', 0))
+    HTTP_IN_FLIGHT.dec()
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('_metrics_query_start', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    starts = conn.info.get('_metrics_query_start')
+    if starts:
+        DB_QUERY_SECONDS.observe(time.perf_counter() - starts.pop())
+    DB_QUERIES_TOTAL.inc()
+    if has_request_context() and '_metrics_db_queries' in g:
+        g._metrics_db_queries += 1
+
+
+def metrics_response():
+    return Response(REGISTRY.render(), mimetype=None, content_type=PROMETHEUS_CONTENT_TYPE)
+
+
+def init_app(app, db=None):
+    """为应用注册请求指标中间件，并（可选）为数据库引擎挂载查询计数"""
+    app.before_request(_before_request)
+    app.after_request(_after_request)
+    app.teardown_request(_teardown_request)
+    if db is not None:
+        from sqlalchemy import event
+        with app.app_context():
+            engine = db.engine
+        event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(engine, 'after_cursor_execute', _after_cursor_execute)
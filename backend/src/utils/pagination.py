@@ -0,0 +1,98 @@
+"""键集（keyset）分页与 NDJSON 流式导出。
+
+- 游标是最后一行排序键的不透明编码（urlsafe base64 的 JSON 数组，如 [id] 或 [distance, id]），
+  附带以 SECRET_KEY 计算的 HMAC 签名，客户端篡改或自行构造的游标一律拒绝；
+  下一页以 WHERE 排序键 > 游标 继续，不使用 OFFSET，翻到多深都只扫描一页的数据；
+- 客户端传 ?format=ndjson（或 Accept: application/x-ndjson）时改为流式导出：
+  通过 yield_per 分批从服务端游标读取并逐行写出，内存占用与表大小无关。
+"""
+import base64
+import binascii
+import hashlib
+import hmac
+import json
+
+from flask import Response, current_app, request, stream_with_context
+
+from src.utils.json_provider import dumps_bytes
+
+NDJSON_MIMETYPE = 'application/x-ndjson'
+# 流式导出时每批从数据库游标读取的行数
+STREAM_BATCH_SIZE = 500
+
+
+def _b64encode(data):
+    return base64.urlsafe_b64encode(data).decode('ascii').rstrip('=')
+
+
+def _signature(payload):
+    key = current_app.config['SECRET_KEY'].encode('utf-8')
+    return _b64encode(hmac.new(key, payload.encode('ascii'), hashlib.sha256).digest()[:12])
+
+
+def encode_cursor(*values):
+    """游标格式为 <payload>.<signature>"""
+    payload = _b64encode(json.dumps(values, separators=(',', ':')).encode('utf-8'))
+    return f'{payload}.{_signature(payload)}'
+
+
+def decode_cursor(cursor, size):
+    """校验签名并解析游标，返回长度为 size 的列表；游标为空时返回 None，签名不符或格式非法时抛 ValueError"""
+    if not cursor:
+        return None
+    cursor = str(cursor)
+    payload, _, signature = cursor.rpartition('.')
+    if not payload or not cursor.isascii() or not hmac.compare_digest(signature, _signature(payload)):
+        raise ValueError('无效的分页游标')
+    try:
+        values = json.loads(base64.urlsafe_b64decode(payload + '=' * (-len(payload) % 4)))
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise ValueError('无效的分页游标')
+    if not isinstance(values, list) or len(values) != size:
+        raise ValueError('无效的分页游标')
+    return values
+
+
+def page_limit(value, default, maximum):
+    """解析每页条数，限制在 [1, maximum]；非整数时抛 ValueError"""
+    if value in (None, ''):
+        return default
+    try:
+        limit = int(value)
+    except (TypeError, ValueError):
+        raise ValueError('limit 必须是整数')
+    return max(1, min(limit, maximum))
+
+
+def wants_ndjson():
+    if request.args.get('format') == 'ndjson':
+        return True
+    return request.accept_mimetypes.best == NDJSON_MIMETYPE
+
+
+def after_cursor(query, key_column, cursor):
+    """按单列键集过滤出游标之后的行并按该列排序"""
+    values = decode_cursor(cursor, 1)
+    if values is not None:
+        query = query.filter(key_column > values[0])
+    return query.order_by(key_column)
+
+
+def paginate(query, key_column, cursor, limit):
+    """按单列键集分页，返回 (本页行, 下一页游标或 None)；多取一行判断是否还有下一页"""
+    rows = after_cursor(query, key_column, cursor).limit(limit + 1).all()
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, encode_cursor(getattr(rows[-1], key_column.key))
+
+
+def ndjson_response(query, serialize, batch_size=STREAM_BATCH_SIZE):
+    """逐行流式导出 query 的结果；serialize(row) 返回 dict 或已序列化的 JSON 字节串"""
+    def generate():
+        for row in query.yield_per(batch_size):
+            line = serialize(row)
+            yield (line if isinstance(line, bytes) else dumps_bytes(line)) + b'\n'
+
+    return Response(stream_with_context(generate()), mimetype=NDJSON_MIMETYPE,
+                    headers={'Cache-Control': 'no-store', 'X-Accel-Buffering': 'no'})
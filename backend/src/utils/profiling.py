@@ -0,0 +1,261 @@
+"""按需请求剖析。
+
+触发方式（二选一）：
+- 请求头 X-Profile 携带与环境变量 PROFILE_TOKEN 相同的值；
+- 按 PROFILE_SAMPLE_RATE（0~1）随机抽样。
+
+剖析模式由请求头 X-Profile-Mode 指定：
+- cprofile（默认）：cProfile 确定性剖析，保存为 .pstats；
+- sample：统计采样，按固定间隔抓取请求线程调用栈，保存为火焰图所需的 collapsed stacks；
+- memory：tracemalloc 快照，保存请求前后内存分配差异（文本）和快照文件。
+
+结果写入 PROFILE_DIR 下的环形缓冲区，最多保留 PROFILE_MAX_FILES 个文件。
+"""
+import cProfile
+import io
+import os
+import pstats
+import random
+import re
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from collections import Counter
+
+from flask import g, request
+
+from src.utils.log import get_logger
+
+logger = get_logger('profiling')
+
+PROFILE_HEADER = 'X-Profile'
+PROFILE_MODE_HEADER = 'X-Profile-Mode'
+PROFILE_MODES = ('cprofile', 'sample', 'memory')
+PROFILE_EXTENSIONS = ('.pstats', '.collapsed', '.txt', '.tracemalloc')
+
+_memory_lock = threading.Lock()
+
+
+def _slug(text):
+    return re.sub(r'[^A-Za-z0-9]+', '_', text).strip('_')[:60] or 'root'
+
+
+class ProfileStore:
+    """磁盘上的有界环形缓冲区，文件名即元数据：<毫秒时间戳>-<方法>-<路径>-<模式>.<扩展名>"""
+
+    def __init__(self, directory, max_files=50):
+        self.directory = directory
+        self.max_files = max_files
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def _entries(self):
+        names = [n for n in os.listdir(self.directory) if n.endswith(PROFILE_EXTENSIONS)]
+        return sorted(names)
+
+    def new_path(self, method, path, mode, extension):
+        name = f'{int(time.time() * 1000)}-{method}-{_slug(path)}-{mode}{extension}'
+        return os.path.join(self.directory, name)
+
+    def write(self, path, data):
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        self._evict()
+        return os.path.basename(path)
+
+    def _evict(self):
+        with self._lock:
+            entries = self._entries()
+            for name in entries[:max(0, len(entries) - self.max_files)]:
+                try:
+                    os.remove(os.path.join(self.directory, name))
+                except OSError:
+                    pass
+
+    def list(self):
+        result = []
+        for name in reversed(self._entries()):
+            full_path = os.path.join(self.directory, name)
+            try:
+                stat = os.stat(full_path)
+            except OSError:
+                continue
+            result.append({'name': name, 'size': stat.st_size, 'created_at': stat.st_mtime})
+        return result
+
+    def resolve(self, name):
+        """返回文件完整路径；非法或不存在的名字返回 None"""
+        if os.path.basename(name) != name or not name.endswith(PROFILE_EXTENSIONS):
+            return None
+        full_path = os.path.join(self.directory, name)
+        return full_path if os.path.isfile(full_path) else None
+
+
+class StackSampler:
+    """统计采样器：后台线程按间隔读取目标线程的调用栈并计数"""
+
+    def __init__(self, thread_id, interval=0.005):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='stack-sampler', daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f'{os.path.basename(code.co_filename)}:{code.co_name}')
+                frame = frame.f_back
+            self.stacks[';'.join(reversed(stack))] += 1
+
+    def collapsed(self):
+        return '\n'.join(f'{stack} {count}' for stack, count in self.stacks.most_common()) + '\n'
+
+
+def _should_profile(app):
+    token = app.config.get('PROFILE_TOKEN')
+    header = request.headers.get(PROFILE_HEADER)
+    if header and token and header == token:
+        return True
+    rate = app.config.get('PROFILE_SAMPLE_RATE', 0.0)
+    return rate > 0 and random.random() < rate
+
+
+def _start_profile(app):
+    if not _should_profile(app):
+        return
+    mode = request.headers.get(PROFILE_MODE_HEADER, 'cprofile').lower()
+    if mode not in PROFILE_MODES:
+        mode = 'cprofile'
+
+    if mode == 'cprofile':
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            # 同一时刻已有其他剖析器在运行
+            logger.info("Skipping cProfile for %s: another profiler is active", request.path)
+            return
+        g._profile = (mode, profiler)
+    elif mode == 'sample':
+        sampler = StackSampler(threading.get_ident(), app.config.get('PROFILE_SAMPLE_INTERVAL', 0.005))
+        sampler.start()
+        g._profile = (mode, sampler)
+    else:
+        # tracemalloc 是进程级的，同一时刻只允许一个内存剖析请求
+        if not _memory_lock.acquire(blocking=False):
+            logger.info("Skipping memory profile for %s: another one is running", request.path)
+            return
+        started_here = not tracemalloc.is_tracing()
+        if started_here:
+            tracemalloc.start(25)
+        g._profile = (mode, (tracemalloc.take_snapshot(), started_here))
+
+
+def _finish_profile(app, response):
+    profile = g.pop('_profile', None)
+    if profile is None:
+        return response
+    mode, state = profile
+    store = app.extensions['profile_store']
+    method, path = request.method, request.path
+    try:
+        if mode == 'cprofile':
+            state.disable()
+            target = store.new_path(method, path, mode, '.pstats')
+            state.dump_stats(target + '.tmp')
+            os.replace(target + '.tmp', target)
+            store._evict()
+            name = os.path.basename(target)
+        elif mode == 'sample':
+            state.stop()
+            name = store.write(store.new_path(method, path, mode, '.collapsed'), state.collapsed().encode('utf-8'))
+        else:
+            before, started_here = state
+            try:
+                after = tracemalloc.take_snapshot()
+                if started_here:
+                    tracemalloc.stop()
+            finally:
+                _memory_lock.release()
+            report = io.StringIO()
+            report.write(f'# tracemalloc diff for {method} {path}\n')
+            for stat in after.compare_to(before, 'lineno')[:50]:
+                report.write(f'{stat}\n')
+            stem = store.new_path(method, path, mode, '')
+            after.dump(stem + '.tracemalloc')
+            name = store.write(stem + '.txt', report.getvalue().encode('utf-8'))
+        response.headers['X-Profile-Id'] = name
+        logger.info("Stored %s profile for %s %s as %s", mode, method, path, name)
+    except Exception:
+        logger.exception("Failed to store %s profile for %s %s", mode, method, path)
+    return response
+
+
+def _abort_profile(exc):
+    """请求未正常走到 after_request 时（如未处理异常）释放剖析资源"""
+    profile = g.pop('_profile', None)
+    if profile is None:
+        return
+    mode, state = profile
+    if mode == 'cprofile':
+        state.disable()
+    elif mode == 'sample':
+        state.stop()
+    else:
+        if state[1]:
+            tracemalloc.stop()
+        _memory_lock.release()
+
+
+def take_memory_snapshot(store, limit=50):
+    """对整个进程做一次 tracemalloc 快照；若尚未开启追踪则先开启，下次调用时才有数据"""
+    if not tracemalloc.is_tracing():
+        tracemalloc.start(25)
+        return None
+    snapshot = tracemalloc.take_snapshot()
+    report = io.StringIO()
+    current, peak = tracemalloc.get_traced_memory()
+    report.write(f'# process tracemalloc snapshot: current={current} peak={peak}\n')
+    for stat in snapshot.statistics('lineno')[:limit]:
+        report.write(f'{stat}\n')
+    stem = store.new_path('PROCESS', 'snapshot', 'memory', '')
+    snapshot.dump(stem + '.tracemalloc')
+    name = store.write(stem + '.txt', report.getvalue().encode('utf-8'))
+    return name
+
+
+def pstats_summary(path, limit=30):
+    """把 .pstats 文件格式化为按累计耗时排序的文本"""
+    out = io.StringIO()
+    pstats.Stats(path, stream=out).sort_stats('cumulative').print_stats(limit)
+    return out.getvalue()
+
+
+def init_app(app):
+    """根据配置注册剖析钩子，并创建剖析结果存储"""
+    app.config.setdefault('PROFILE_TOKEN', os.environ.get('PROFILE_TOKEN', ''))
+    app.config.setdefault('PROFILE_SAMPLE_RATE', float(os.environ.get('PROFILE_SAMPLE_RATE', '0')))
+    app.config.setdefault('PROFILE_DIR', os.environ.get(
+        'PROFILE_DIR', os.path.join(tempfile.gettempdir(), 'medical_ai_profiles')))
+    app.config.setdefault('PROFILE_MAX_FILES', int(os.environ.get('PROFILE_MAX_FILES', '50')))
+    app.extensions['profile_store'] = ProfileStore(app.config['PROFILE_DIR'], app.config['PROFILE_MAX_FILES'])
+    app.before_request(lambda: _start_profile(app))
+    app.after_request(lambda response: _finish_profile(app, response))
+    app.teardown_request(_abort_profile)
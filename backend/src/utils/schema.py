@@ -0,0 +1,73 @@
+"""轻量的表结构迁移：为已存在的表补齐模型中新增的列与索引，重建唯一约束已变更的表。
+
+db.create_all() 只创建缺失的表，不会修改已有表；本模块处理“新增可为空的列”与“唯一约束变更”两种变更，
+更复杂的迁移仍需手工处理。SQLite 不支持修改约束，唯一约束变更按官方建议的方式重建表并复制数据。
+"""
+from sqlalchemy import UniqueConstraint, inspect
+from sqlalchemy.schema import CreateColumn
+
+from src.utils.log import get_logger
+
+logger = get_logger('schema')
+
+
+def add_missing_columns(engine, *models):
+    """为 models 对应的已有表 ALTER TABLE ADD COLUMN 补齐缺失的列，并创建涉及这些列的索引；返回新增的列名"""
+    inspector = inspect(engine)
+    added = []
+    for model in models:
+        table = model.__table__
+        if not inspector.has_table(table.name):
+            continue
+        existing = {column['name'] for column in inspector.get_columns(table.name)}
+        missing = [column for column in table.columns if column.name not in existing]
+        if not missing:
+            continue
+        with engine.begin() as connection:
+            for column in missing:
+                if not column.nullable or column.server_default is not None or column.primary_key:
+                    raise RuntimeError(f'无法自动添加列 {table.name}.{column.name}：只支持可为空且无服务端默认值的列')
+                ddl = CreateColumn(column).compile(dialect=engine.dialect)
+                connection.exec_driver_sql(f'ALTER TABLE {table.name} ADD COLUMN {ddl}')
+                added.append(f'{table.name}.{column.name}')
+            names = {column.name for column in missing}
+            for index in table.indexes:
+                if names & {column.name for column in index.columns}:
+                    index.create(connection, checkfirst=True)
+    if added:
+        logger.info("Added columns: %s", ', '.join(added))
+    return added
+
+
+def _unique_column_sets(table):
+    return {tuple(constraint.columns.keys()) for constraint in table.constraints
+            if isinstance(constraint, UniqueConstraint)}
+
+
+def rebuild_changed_unique_constraints(engine, *models):
+    """已有表的唯一约束与模型不一致时重建表（新建表、复制同名列的数据、删除旧表）；返回重建的表名"""
+    inspector = inspect(engine)
+    rebuilt = []
+    for model in models:
+        table = model.__table__
+        if not inspector.has_table(table.name):
+            continue
+        existing = {tuple(constraint['column_names']) for constraint in inspector.get_unique_constraints(table.name)}
+        if existing == _unique_column_sets(table):
+            continue
+        columns = {column['name'] for column in inspector.get_columns(table.name)}
+        shared = ', '.join(column.name for column in table.columns if column.name in columns)
+        old_indexes = [index['name'] for index in inspector.get_indexes(table.name) if index['name']]
+        old_name = f'_{table.name}_old'
+        with engine.begin() as connection:
+            # 旧表的索引名会与新表冲突，先删除
+            for name in old_indexes:
+                connection.exec_driver_sql(f'DROP INDEX {name}')
+            connection.exec_driver_sql(f'ALTER TABLE {table.name} RENAME TO {old_name}')
+            table.create(connection)
+            connection.exec_driver_sql(f'INSERT INTO {table.name} ({shared}) SELECT {shared} FROM {old_name}')
+            connection.exec_driver_sql(f'DROP TABLE {old_name}')
+        rebuilt.append(table.name)
+    if rebuilt:
+        logger.info("Rebuilt tables with changed unique constraints: %s", ', '.join(rebuilt))
+    return rebuilt
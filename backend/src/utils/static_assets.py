@@ -0,0 +1,202 @@
+"""SPA 静态资源服务。
+
+启动时扫描一次 static/ 目录生成内存清单（StaticManifest），之后每个请求只查字典，
+不再做 os.path.exists 等文件系统调用：
+- 小文件（含 index.html）常驻内存，大文件通过 wsgi.file_wrapper 发送（服务器支持时即 sendfile）；
+- 同名 .br / .gz 预压缩文件作为变体按 Accept-Encoding 选用；未提供时为可压缩的小文件在启动时
+  生成内存 gzip 变体，避免每次请求重复压缩；
+- ETag 取文件内容哈希；带内容哈希的文件使用 immutable 长缓存，index.html 使用 no-cache 以便前端发版后立即生效。
+  构建产物带 Vite 清单（build.manifest，.vite/manifest.json 或 manifest.json）时以清单列出的文件为准；
+  否则按文件名判断：扩展名前 8 位 base64url 哈希（如 assets/index-BjPq3x_K.js、assets/index-3f2a9c1b.js），
+  且必须同时含字母与数字，site-background.png、app-settings.js 这类普通文件名不会被误判。
+"""
+import gzip
+import hashlib
+import mimetypes
+import json
+import os
+import re
+
+from flask import current_app, request
+from werkzeug.wsgi import wrap_file
+
+# 内存常驻的单文件大小上限
+MEMORY_LIMIT = 256 * 1024
+# 生成内存 gzip 变体的最小文件大小
+PRECOMPRESS_MIN_SIZE = 1024
+
+HASHED_NAME = re.compile(r'[.-]([A-Za-z0-9_-]{8})\.[A-Za-z0-9]+$')
+MANIFEST_PATHS = ('.vite/manifest.json', 'manifest.json')
+PRECOMPRESSED_SUFFIXES = {'.br': 'br', '.gz': 'gzip'}
+COMPRESSIBLE_PREFIXES = ('text/', 'application/javascript', 'application/json', 'image/svg+xml')
+
+CACHE_IMMUTABLE = 'public, max-age=31536000, immutable'
+CACHE_DEFAULT = 'public, max-age=3600'
+CACHE_INDEX = 'no-cache'
+
+
+def is_hashed_name(rel_path):
+    """文件名是否带内容哈希：扩展名前以 . 或 - 分隔的 8 位 base64url，且同时含字母与数字"""
+    match = HASHED_NAME.search(rel_path)
+    if match is None:
+        return False
+    digest = match.group(1)
+    return any(ch.isdigit() for ch in digest) and any(ch.isalpha() for ch in digest)
+
+
+def _is_build_manifest(manifest):
+    """Vite 清单是 {入口: {"file": ..., ...}}；PWA 的 manifest.json（{"name": ..., "icons": [...]}）不是"""
+    return (isinstance(manifest, dict) and bool(manifest)
+            and all(isinstance(chunk, dict) and isinstance(chunk.get('file'), str) for chunk in manifest.values()))
+
+
+def read_build_manifest(root):
+    """Vite 构建清单中列出的产物路径（均带内容哈希）；没有清单时返回 None。
+    根目录的 manifest.json 也可能是 PWA 清单，格式不符或无法解析时跳过，回退到按文件名判断"""
+    for name in MANIFEST_PATHS:
+        path = os.path.join(root, name)
+        if not os.path.isfile(path):
+            continue
+        try:
+            with open(path, encoding='utf-8') as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            continue
+        if not _is_build_manifest(manifest):
+            continue
+        files = set()
+        for chunk in manifest.values():
+            files.add(chunk['file'])
+            files.update(chunk.get('css', []))
+            files.update(chunk.get('assets', []))
+        # index.html 本身也可能作为入口出现在清单中，始终使用 no-cache
+        files.discard('index.html')
+        return files
+    return None
+
+
+def _file_digest(path):
+    digest = hashlib.blake2b(digest_size=12)
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 16), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class _Body:
+    """一种编码下的响应体：内存字节或磁盘文件"""
+
+    __slots__ = ('abs_path', 'size', 'data')
+
+    def __init__(self, abs_path, size, data=None):
+        self.abs_path = abs_path
+        self.size = size
+        self.data = data
+
+
+class StaticAsset:
+    __slots__ = ('path', 'mimetype', 'etag', 'mtime', 'cache_control', 'bodies')
+
+    def __init__(self, path, abs_path, stat, cache_control):
+        self.path = path
+        self.mimetype = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+        self.etag = _file_digest(abs_path)
+        self.mtime = int(stat.st_mtime)
+        self.cache_control = cache_control
+        data = None
+        if stat.st_size <= MEMORY_LIMIT:
+            with open(abs_path, 'rb') as f:
+                data = f.read()
+        # 编码 -> _Body，None 表示原始内容
+        self.bodies = {None: _Body(abs_path, stat.st_size, data)}
+
+    @property
+    def compressible(self):
+        return self.mimetype.startswith(COMPRESSIBLE_PREFIXES)
+
+    def choose_body(self, accept_encodings):
+        for encoding in ('br', 'gzip'):
+            if encoding in self.bodies and accept_encodings[encoding]:
+                return encoding, self.bodies[encoding]
+        return None, self.bodies[None]
+
+
+class StaticManifest:
+    def __init__(self, root):
+        self.root = root
+        self.assets = {}
+        self.hashed_files = None
+        if root and os.path.isdir(root):
+            self.hashed_files = read_build_manifest(root)
+            self._scan()
+        self.index = self.assets.get('index.html')
+
+    def _scan(self):
+        variants = []
+        for dirpath, _, filenames in os.walk(self.root):
+            for filename in filenames:
+                abs_path = os.path.join(dirpath, filename)
+                rel_path = os.path.relpath(abs_path, self.root).replace(os.sep, '/')
+                suffix = os.path.splitext(filename)[1]
+                if suffix in PRECOMPRESSED_SUFFIXES:
+                    variants.append((rel_path[:-len(suffix)], PRECOMPRESSED_SUFFIXES[suffix], abs_path))
+                    continue
+                self.assets[rel_path] = StaticAsset(rel_path, abs_path, os.stat(abs_path), self._cache_policy(rel_path))
+
+        for rel_path, encoding, abs_path in variants:
+            asset = self.assets.get(rel_path)
+            if asset is None:
+                continue
+            size = os.path.getsize(abs_path)
+            data = None
+            if size <= MEMORY_LIMIT:
+                with open(abs_path, 'rb') as f:
+                    data = f.read()
+            asset.bodies[encoding] = _Body(abs_path, size, data)
+
+        for asset in self.assets.values():
+            raw = asset.bodies[None]
+            if ('gzip' not in asset.bodies and asset.compressible and raw.data is not None
+                    and raw.size >= PRECOMPRESS_MIN_SIZE):
+                compressed = gzip.compress(raw.data, compresslevel=9, mtime=0)
+                if len(compressed) < raw.size:
+                    asset.bodies['gzip'] = _Body(None, len(compressed), compressed)
+
+    def _cache_policy(self, rel_path):
+        if rel_path == 'index.html':
+            return CACHE_INDEX
+        hashed = rel_path in self.hashed_files if self.hashed_files is not None else is_hashed_name(rel_path)
+        if hashed:
+            return CACHE_IMMUTABLE
+        return CACHE_DEFAULT
+
+    def get(self, path):
+        return self.assets.get(path)
+
+    def __len__(self):
+        return len(self.assets)
+
+
+def serve_asset(asset):
+    """按清单条目构造响应（含 304、预压缩变体与文件直传）"""
+    encoding, body = asset.choose_body(request.accept_encodings)
+    etag = asset.etag if encoding is None else f'{asset.etag}-{encoding}'
+
+    if request.if_none_match and request.if_none_match.contains_weak(etag):
+        response = current_app.response_class(status=304)
+    elif body.data is not None:
+        response = current_app.response_class(body.data, mimetype=asset.mimetype)
+    else:
+        file_handle = open(body.abs_path, 'rb')
+        response = current_app.response_class(
+            wrap_file(request.environ, file_handle), mimetype=asset.mimetype, direct_passthrough=True)
+        response.content_length = body.size
+
+    response.set_etag(etag)
+    response.last_modified = asset.mtime
+    response.headers['Cache-Control'] = asset.cache_control
+    if len(asset.bodies) > 1:
+        response.vary.add('Accept-Encoding')
+    if encoding is not None and response.status_code == 200:
+        response.headers['Content-Encoding'] = encoding
+    return response
@@ -0,0 +1,25 @@
+import os
+
+import pytest
+
+# 测试不访问外部服务：不加载高德城市编码表、不调用大模型
+os.environ.setdefault('LOG_LEVEL', 'WARNING')
+os.environ.setdefault('AMAP_ADCODE_URL', os.path.join(os.path.dirname(__file__), 'missing-adcode.csv'))
+os.environ.pop('DASHSCOPE_API_KEY', None)
+
+
+@pytest.fixture
+def app(tmp_path):
+    """使用临时 SQLite 数据库的应用"""
+    from src.main import create_app
+    app = create_app({'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path / 'app.db'}", 'TESTING': True})
+    yield app
+    from src.models.user import db
+    with app.app_context():
+        db.session.remove()
+        db.engine.dispose()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
@@ -0,0 +1,156 @@
+import datetime
+import threading
+
+import pytest
+from sqlalchemy import create_engine, inspect
+
+from src.models.job import JOB_DONE, AIJob
+from src.models.user import db
+from src.services import ai_jobs
+from src.services.ai_jobs import JobQueue, validate_webhook_url
+from src.utils.schema import rebuild_changed_unique_constraints
+
+BODY = {'symptoms': ['发热', '咳嗽'], 'severity': '中等', 'duration': '1-2天'}
+
+
+@pytest.fixture
+def queue(app, monkeypatch):
+    """不自动派发的任务队列，由测试显式调用 _execute"""
+    queue = JobQueue(workers=1)
+    calls = []
+    queue.register('echo', lambda payload: calls.append(payload) or {'echo': payload})
+    monkeypatch.setattr(queue, '_dispatch', lambda job_id, kind: None)
+    queue.calls = calls
+    with app.app_context():
+        yield queue
+
+
+@pytest.fixture
+def no_dispatch(monkeypatch):
+    monkeypatch.setattr(ai_jobs.job_queue, '_dispatch', lambda job_id, kind: None)
+
+
+def _submit(client, body=BODY, key='key-1', remote_addr='203.0.113.5'):
+    return client.post('/api/ai/jobs', json=body, headers={'Idempotency-Key': key},
+                       environ_base={'REMOTE_ADDR': remote_addr})
+
+
+def test_job_is_claimed_and_executed_once(queue):
+    job, created = queue.submit('echo', {'n': 1}, client='a')
+    assert created
+    queue._execute(job.id)
+    queue._execute(job.id)
+    job = queue.get(job.id)
+    assert queue.calls == [{'n': 1}]
+    assert job.status == JOB_DONE and job.attempts == 1
+    assert job.to_dict()['result'] == {'echo': {'n': 1}}
+
+
+def test_idempotency_key_is_scoped_to_client(queue):
+    first, _ = queue.submit('echo', {'n': 1}, client='a', idempotency_key='k')
+    replayed, created = queue.submit('echo', {'n': 1}, client='a', idempotency_key='k')
+    assert replayed.id == first.id and not created
+    other, created = queue.submit('echo', {'n': 2}, client='b', idempotency_key='k')
+    assert created and other.id != first.id
+    with pytest.raises(ai_jobs.JobConflict):
+        queue.submit('echo', {'n': 2}, client='a', idempotency_key='k')
+
+
+def test_submit_replay_and_conflict(client, no_dispatch):
+    first = _submit(client)
+    assert first.status_code == 202
+    job_id = first.get_json()['data']['id']
+
+    replay = _submit(client)
+    assert replay.status_code == 200
+    assert replay.headers['Idempotent-Replayed'] == 'true'
+    assert replay.get_json()['data']['id'] == job_id
+
+    conflict = _submit(client, dict(BODY, severity='严重'))
+    assert conflict.status_code == 422
+
+    # 其他客户端使用相同的键得到自己的任务
+    other = _submit(client, dict(BODY, severity='严重'), remote_addr='198.51.100.7')
+    assert other.status_code == 202
+    assert other.get_json()['data']['id'] != job_id
+
+
+def test_expired_job_returns_404(app, client, no_dispatch):
+    job_id = _submit(client).get_json()['data']['id']
+    assert client.get(f'/api/ai/jobs/{job_id}').status_code == 200
+    with app.app_context():
+        job = db.session.get(AIJob, job_id)
+        job.expires_at = datetime.datetime.utcnow() - datetime.timedelta(seconds=1)
+        db.session.commit()
+    assert client.get(f'/api/ai/jobs/{job_id}').status_code == 404
+
+
+@pytest.mark.parametrize('url', [
+    'http://127.0.0.1:8080/hook',
+    'http://localhost/hook',
+    'http://10.1.2.3/hook',
+    'http://192.168.0.10/hook',
+    'http://169.254.169.254/latest/meta-data',
+    'http://[::1]/hook',
+    'http://[::ffff:127.0.0.1]/hook',
+    'http://0.0.0.0/hook',
+    'ftp://93.184.216.34/hook',
+    'http:///hook',
+])
+def test_webhook_rejects_internal_addresses(monkeypatch, url):
+    monkeypatch.setattr(ai_jobs, 'AI_JOB_WEBHOOK_HOSTS', set())
+    with pytest.raises(ValueError):
+        validate_webhook_url(url)
+
+
+def test_webhook_allows_public_address_or_allowlisted_host(monkeypatch):
+    monkeypatch.setattr(ai_jobs, 'AI_JOB_WEBHOOK_HOSTS', set())
+    assert validate_webhook_url('https://93.184.216.34/hook')
+    monkeypatch.setattr(ai_jobs, 'AI_JOB_WEBHOOK_HOSTS', {'hooks.internal'})
+    assert validate_webhook_url('http://hooks.internal/hook')
+    with pytest.raises(ValueError):
+        validate_webhook_url('https://93.184.216.34/hook')
+
+
+def test_submit_rejects_internal_webhook(client, no_dispatch, monkeypatch):
+    monkeypatch.setattr(ai_jobs, 'AI_JOB_WEBHOOK_HOSTS', set())
+    response = _submit(client, dict(BODY, webhook_url='http://127.0.0.1:5000/api/admin/hospital-shards'))
+    assert response.status_code == 400
+
+
+def test_webhook_is_delivered_off_the_worker_pool(queue, monkeypatch):
+    delivered = threading.Event()
+    threads = []
+
+    def deliver(job):
+        threads.append(threading.current_thread().name)
+        delivered.set()
+
+    monkeypatch.setattr(queue, '_deliver_webhook', deliver)
+    job, _ = queue.submit('echo', {'n': 1}, client='a', webhook_url='https://93.184.216.34/hook')
+    queue._execute(job.id)
+    assert delivered.wait(5)
+    assert threads[0].startswith('ai-job-webhook')
+
+
+def test_rebuild_scopes_existing_idempotency_keys(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'old.db'}")
+    with engine.begin() as connection:
+        connection.exec_driver_sql(
+            'CREATE TABLE ai_jobs (id VARCHAR(32) PRIMARY KEY, kind VARCHAR(32) NOT NULL, status VARCHAR(16) NOT NULL, '
+            'idempotency_key VARCHAR(128), request_hash VARCHAR(64) NOT NULL, client VARCHAR(128), '
+            'payload TEXT NOT NULL, result TEXT, error TEXT, webhook_url VARCHAR(500), attempts INTEGER NOT NULL, '
+            'created_at DATETIME NOT NULL, started_at DATETIME, finished_at DATETIME, expires_at DATETIME, '
+            'UNIQUE (idempotency_key))')
+        connection.exec_driver_sql('CREATE INDEX ix_ai_jobs_status ON ai_jobs (status)')
+        connection.exec_driver_sql(
+            "INSERT INTO ai_jobs (id, kind, status, idempotency_key, request_hash, client, payload, attempts, "
+            "created_at) VALUES ('j1', 'echo', 'queued', 'k', 'h', 'a', '{}', 0, '2026-01-01 00:00:00')")
+
+    assert rebuild_changed_unique_constraints(engine, AIJob) == ['ai_jobs']
+    assert rebuild_changed_unique_constraints(engine, AIJob) == []
+    inspector = inspect(engine)
+    assert [c['column_names'] for c in inspector.get_unique_constraints('ai_jobs')] == [['client', 'idempotency_key']]
+    with engine.connect() as connection:
+        assert connection.exec_driver_sql('SELECT id, client FROM ai_jobs').all() == [('j1', 'a')]
+    engine.dispose()
@@ -0,0 +1,61 @@
+import pytest
+
+from src.models.user import User, db
+from src.services.bulk_users import InvalidRow, bulk_write
+
+
+@pytest.fixture
+def existing(app):
+    with app.app_context():
+        db.session.add_all([User(username='alice', email='alice@example.com'),
+                            User(username='bob', email='bob@example.com')])
+        db.session.commit()
+
+
+def _bulk(client, op, rows):
+    response = client.post(f'/api/users/bulk?op={op}', json=rows)
+    assert response.status_code == 200
+    return [result['status'] for result in response.get_json()['results']]
+
+
+def test_create_reports_conflicts_per_row(client, existing):
+    statuses = _bulk(client, 'create', [
+        {'username': 'carol', 'email': 'carol@example.com'},
+        {'username': 'alice', 'email': 'new@example.com'},
+        {'username': 'dave', 'email': 'bob@example.com'},
+        {'username': 'carol', 'email': 'carol2@example.com'},
+        {'username': 'erin'},
+    ])
+    assert statuses == ['created', 'conflict', 'conflict', 'conflict', 'invalid']
+
+
+def test_upsert_falls_back_to_row_by_row_on_email_conflict(app, client, existing):
+    statuses = _bulk(client, 'upsert', [
+        {'username': 'alice', 'email': 'alice@new.example.com'},
+        # 新邮箱与 bob 冲突：整批语句失败，逐行重试后只有这一行是 conflict
+        {'username': 'carol', 'email': 'bob@example.com'},
+        {'username': 'dave', 'email': 'dave@example.com'},
+    ])
+    assert statuses == ['updated', 'conflict', 'created']
+    with app.app_context():
+        emails = dict(db.session.query(User.username, User.email))
+    assert emails == {'alice': 'alice@new.example.com', 'bob': 'bob@example.com', 'dave': 'dave@example.com'}
+
+
+def test_upsert_conflict_does_not_roll_back_other_batches(app, existing):
+    rows = [{'username': 'u1', 'email': 'u1@example.com'},
+            {'username': 'u2', 'email': 'alice@example.com'},
+            {'username': 'u3', 'email': 'u3@example.com'},
+            InvalidRow('无法解析的JSON行')]
+    with app.app_context():
+        results = list(bulk_write('upsert', rows, batch_size=2))
+        assert [r['index'] for r in results] == [0, 1, 2, 3]
+        assert [r['status'] for r in results] == ['created', 'conflict', 'created', 'invalid']
+        assert {name for (name,) in db.session.query(User.username)} == {'alice', 'bob', 'u1', 'u3'}
+
+
+def test_delete_by_id_and_username(app, client, existing):
+    with app.app_context():
+        alice_id = db.session.query(User.id).filter_by(username='alice').scalar()
+    statuses = _bulk(client, 'delete', [alice_id, {'username': 'bob'}, {'username': 'nobody'}, 'x'])
+    assert statuses == ['deleted', 'deleted', 'not_found', 'invalid']
@@ -0,0 +1,52 @@
+import pytest
+
+from src.routes import ai_assistant
+
+TOOL_CALL = [{'id': 'call-1', 'type': 'function', 'function': {'name': 'amap_weather', 'arguments': '{}'}}]
+
+
+@pytest.fixture
+def rounds(monkeypatch):
+    """按轮次返回预设的 (文本, 工具调用)，记录每轮是否传入了工具与执行过的工具调用"""
+    monkeypatch.setenv('DASHSCOPE_API_KEY', 'sk-test')
+    calls = {'tools': [], 'executed': 0, 'replies': []}
+
+    def call_generation(call_name, **kwargs):
+        calls['tools'].append('tools' in kwargs)
+        return calls['replies'][len(calls['tools']) - 1]
+
+    def execute(tool_calls):
+        calls['executed'] += 1
+        return [{'role': 'tool', 'tool_call_id': 'call-1', 'content': '{}'}]
+
+    monkeypatch.setattr(ai_assistant, 'call_generation', call_generation)
+    monkeypatch.setattr(ai_assistant, 'consume_stream', lambda reply, call_name: reply)
+    monkeypatch.setattr(ai_assistant.tool_registry, 'execute', execute)
+    return calls
+
+
+def test_tool_calls_in_final_round_are_ignored(rounds):
+    max_rounds = ai_assistant.TOOL_MAX_ROUNDS
+    rounds['replies'] = [('', TOOL_CALL)] * max_rounds + [('晴，适合外出', TOOL_CALL)]
+
+    result = ai_assistant.call_qwen_api('明天海淀区天气怎么样')
+
+    assert result == {'success': True, 'response': '晴，适合外出'}
+    assert rounds['tools'] == [True] * max_rounds + [False]
+    assert rounds['executed'] == max_rounds
+
+
+def test_exhausted_rounds_without_content_is_an_error(rounds):
+    rounds['replies'] = [('', TOOL_CALL)] * (ai_assistant.TOOL_MAX_ROUNDS + 1)
+
+    result = ai_assistant.call_qwen_api('明天海淀区天气怎么样')
+
+    assert 'error' in result
+    assert rounds['executed'] == ai_assistant.TOOL_MAX_ROUNDS
+
+
+def test_answer_after_one_tool_round(rounds):
+    rounds['replies'] = [('', TOOL_CALL), ('多云', [])]
+
+    assert ai_assistant.call_qwen_api('天气')['response'] == '多云'
+    assert rounds['executed'] == 1
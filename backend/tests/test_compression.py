@@ -0,0 +1,133 @@
+import gzip
+import json
+import zlib
+
+import pytest
+from flask import Response, jsonify
+
+from src.routes.hospitals import init_sample_data
+from src.utils import compression
+from src.utils.http_cache import conditional_response
+
+PAYLOAD = {'items': [{'id': i, 'name': f'医院{i}', 'address': '北京市东城区帅府园1号'} for i in range(100)]}
+EVENTS = [f'data: {json.dumps({"index": i, "text": "建议多喝水，注意休息"}, ensure_ascii=False)}\n\n' for i in range(5)]
+
+
+@pytest.fixture
+def app(app, monkeypatch):
+    # 固定可用编码为 gzip，结果不取决于是否安装了 brotli / zstandard
+    monkeypatch.setattr(compression, 'brotli', None)
+    monkeypatch.setattr(compression, 'zstandard', None)
+
+    app.add_url_rule('/test/large', 'large', lambda: jsonify(PAYLOAD))
+    app.add_url_rule('/test/small', 'small', lambda: jsonify({'ok': True}))
+    app.add_url_rule('/test/stream', 'stream', lambda: Response(iter(EVENTS), mimetype='text/event-stream'))
+    app.add_url_rule('/test/png', 'png', lambda: Response(b'\x89PNG' * 1000, mimetype='image/png'))
+    app.add_url_rule('/test/encoded', 'encoded', lambda: Response(
+        gzip.compress(b'{}' * 1000), mimetype='application/json', headers={'Content-Encoding': 'gzip'}))
+
+    def etagged():
+        response = jsonify(PAYLOAD)
+        response.set_etag('v1')
+        return response
+
+    app.add_url_rule('/test/etag', 'etag', etagged)
+    app.add_url_rule('/test/conditional', 'conditional',
+                     lambda: conditional_response('test', 'v1', lambda: jsonify(PAYLOAD), 'hospital_details'))
+    return app
+
+
+def _get(client, path, encoding='gzip', **kwargs):
+    headers = {'Accept-Encoding': encoding} if encoding is not None else {}
+    return client.get(path, headers=headers, **kwargs)
+
+
+def test_large_json_is_gzipped(client):
+    response = _get(client, '/test/large')
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert 'Accept-Encoding' in response.vary
+    assert int(response.headers['Content-Length']) == len(response.data)
+    assert json.loads(gzip.decompress(response.data)) == PAYLOAD
+
+
+@pytest.mark.parametrize('encoding', [None, 'identity', 'gzip;q=0, identity', 'deflate'])
+def test_not_accepted_encodings_are_left_uncompressed(client, encoding):
+    response = _get(client, '/test/large', encoding)
+    assert 'Content-Encoding' not in response.headers
+    assert 'Accept-Encoding' in response.vary
+    assert response.get_json() == PAYLOAD
+
+
+def test_unavailable_preferred_encoding_falls_back_to_gzip(client):
+    response = _get(client, '/test/large', 'br, zstd;q=0.9, gzip;q=0.5')
+    assert response.headers['Content-Encoding'] == 'gzip'
+
+
+def test_brotli_is_preferred_when_installed(client, monkeypatch):
+    brotli = pytest.importorskip('brotli')
+    monkeypatch.setattr(compression, 'brotli', brotli)
+    response = _get(client, '/test/large', 'gzip, br')
+    assert response.headers['Content-Encoding'] == 'br'
+    assert json.loads(brotli.decompress(response.data)) == PAYLOAD
+
+
+def test_small_response_is_skipped(client):
+    skipped = compression.COMPRESSION_SKIPPED.value(reason='below_threshold')
+    response = _get(client, '/test/small')
+    assert 'Content-Encoding' not in response.headers
+    assert response.get_json() == {'ok': True}
+    assert compression.COMPRESSION_SKIPPED.value(reason='below_threshold') == skipped + 1
+
+
+def test_incompressible_and_already_encoded_responses_are_untouched(client):
+    assert 'Content-Encoding' not in _get(client, '/test/png').headers
+    response = _get(client, '/test/encoded')
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert gzip.decompress(response.data) == b'{}' * 1000
+
+
+def test_compression_can_be_disabled(app, client):
+    app.config['COMPRESS_ENABLED'] = False
+    assert 'Content-Encoding' not in _get(client, '/test/large').headers
+
+
+def test_compressed_etag_is_weakened(client):
+    response = _get(client, '/test/etag')
+    assert response.get_etag() == ('v1', True)
+    assert _get(client, '/test/etag', None).get_etag() == ('v1', False)
+
+
+@pytest.mark.parametrize('encoding, weak', [('gzip', True), (None, False)])
+def test_not_modified_keeps_the_cached_etag(client, encoding, weak):
+    full = _get(client, '/test/conditional', encoding)
+    assert full.status_code == 200 and full.get_etag() == ('v1', weak)
+    headers = {'If-None-Match': full.headers['ETag']}
+    if encoding is not None:
+        headers['Accept-Encoding'] = encoding
+    cached = client.get('/test/conditional', headers=headers)
+    assert cached.status_code == 304
+    assert cached.headers['ETag'] == full.headers['ETag']
+
+
+def test_stream_is_compressed_chunk_by_chunk(client):
+    response = _get(client, '/test/stream', buffered=False)
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert 'Content-Length' not in response.headers
+    decompressor = zlib.decompressobj(31)
+    chunks = iter(response.response)
+    # 每个事件压缩后立即 flush：收到一块即可解出完整事件，不必等整个响应结束
+    for event in EVENTS:
+        assert decompressor.decompress(next(chunks)).decode('utf-8') == event
+    tail = b''.join(chunks)
+    assert decompressor.decompress(tail) == b'' and decompressor.eof
+    response.close()
+
+
+def test_ndjson_export_is_streamed_compressed(app, client):
+    with app.app_context():
+        init_sample_data()
+    response = client.get('/api/hospitals/search', query_string={'format': 'ndjson'},
+                          headers={'Accept-Encoding': 'gzip'})
+    assert response.headers['Content-Encoding'] == 'gzip'
+    lines = gzip.decompress(response.data).decode('utf-8').splitlines()
+    assert lines and all(json.loads(line)['name'] for line in lines)
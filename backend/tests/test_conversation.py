@@ -0,0 +1,92 @@
+import datetime
+
+import pytest
+
+from src.routes import ai_assistant
+from src.models.conversation import Conversation, ConversationStore
+from src.models.user import db
+
+
+def _contents(window):
+    return [message['content'] for message in window.messages]
+
+
+def test_cached_conversation_reloads_after_another_worker_appends(app):
+    # 两个 store 实例模拟两个 worker 进程各自的 LRU
+    worker_a, worker_b = ConversationStore(), ConversationStore()
+    with app.app_context():
+        conversation_id = worker_a.create()
+        worker_a.append_turn(conversation_id, '我头痛', '多休息')
+        assert _contents(worker_a.history(conversation_id)) == ['我头痛', '多休息']
+
+        worker_b.append_turn(conversation_id, '还有点发热', '测量体温')
+
+        assert _contents(worker_a.history(conversation_id)) == ['我头痛', '多休息', '还有点发热', '测量体温']
+        # 本进程继续追加时使用数据库中的最新序号
+        assert worker_a.append_turn(conversation_id, '需要吃药吗', '对症处理') == 3
+
+
+def test_stale_worker_does_not_overwrite_newer_summary(app):
+    worker_a, worker_b = ConversationStore(budget=200), ConversationStore(budget=200)
+    with app.app_context():
+        conversation_id = worker_a.create()
+        worker_a.append_turn(conversation_id, '第一轮问题' * 4, '第一轮回答' * 4)
+        worker_a.history(conversation_id)
+
+        for i in range(4):
+            worker_b.append_turn(conversation_id, f'第{i + 2}轮问题' * 4, f'第{i + 2}轮回答' * 4)
+        expected = worker_b.history(conversation_id)
+        assert expected.summary and expected.messages
+        rolled_upto = db.session.get(Conversation, conversation_id, populate_existing=True).summary_upto
+        assert rolled_upto > 0
+
+        assert worker_a.history(conversation_id) == expected
+        assert db.session.get(Conversation, conversation_id, populate_existing=True).summary_upto == rolled_upto
+
+
+def test_deleted_conversation_is_not_served_from_cache(app):
+    worker_a, worker_b = ConversationStore(), ConversationStore()
+    with app.app_context():
+        conversation_id = worker_a.create()
+        worker_a.history(conversation_id)
+        assert worker_b.delete(conversation_id)
+        assert worker_a.history(conversation_id) is None
+
+
+def test_sweep_removes_conversations_idle_past_ttl(app):
+    store = ConversationStore(ttl=3600)
+    with app.app_context():
+        stale, fresh = store.create(), store.create()
+        store.append_turn(stale, '我头痛', '多休息')
+        store.append_turn(fresh, '我咳嗽', '多喝水')
+        Conversation.query.filter_by(id=stale).update(
+            {'updated_at': datetime.datetime.utcnow() - datetime.timedelta(hours=2)})
+        db.session.commit()
+
+        assert store.sweep() == 1
+        assert store.history(stale) is None
+        assert not store.turns(stale)
+        assert _contents(store.history(fresh)) == ['我咳嗽', '多喝水']
+
+
+@pytest.fixture
+def llm(monkeypatch):
+    monkeypatch.setattr(ai_assistant, 'call_qwen_api',
+                        lambda message, context=None, history=None: {'success': True, 'response': '多休息'})
+
+
+def test_stateless_chat_does_not_create_conversations(app, client, llm):
+    body = client.post('/api/ai/chat', json={'message': '最近总是失眠怎么办'}).get_json()
+    assert body['success'] and body['conversation_id'] is None
+    with app.app_context():
+        assert Conversation.query.count() == 0
+
+
+def test_chat_creates_conversation_on_request(app, client, llm):
+    body = client.post('/api/ai/chat', json={'message': '最近总是失眠怎么办', 'conversation': True}).get_json()
+    conversation_id = body['conversation_id']
+    assert conversation_id
+    body = client.post('/api/ai/chat', json={'message': '需要吃药吗', 'conversation_id': conversation_id}).get_json()
+    assert body['conversation_id'] == conversation_id
+    turns = client.get(f'/api/ai/conversations/{conversation_id}').get_json()['data']['turns']
+    assert [turn['user'] for turn in turns] == ['最近总是失眠怎么办', '需要吃药吗']
@@ -0,0 +1,213 @@
+import json
+
+import pytest
+
+from src.routes import ai_assistant, symptoms, triage
+from src.services.emergency import EMERGENCY_KEYWORDS, detect_emergency
+from src.services.symptom_index import strip_negated
+
+
+@pytest.mark.parametrize('text, expected', [
+    ('没有胸痛', ' '),
+    ('我没有发烧但是咳嗽', '我 但是咳嗽'),
+    ('否认胸痛、心悸', ' '),
+    ('有没有胸痛', '有没有胸痛'),
+    ('是不是胸痛了', '是不是胸痛了'),
+    ('没有胃口', '没有胃口'),
+    ('无法呼吸', '无法呼吸'),
+    ('四肢无力', '四肢无力'),
+])
+def test_strip_negated(text, expected):
+    assert strip_negated(text) == expected
+
+
+@pytest.mark.parametrize('text, expected', [
+    ('没有胸痛', ' '),
+    ('没有明显胸痛和呼吸困难', ' '),
+    ('否认胸痛、心悸', ' '),
+    ('孩子没吃东西突然抽搐', '孩子没吃东西突然抽搐'),
+    ('老人没反应昏迷了', '老人没反应昏迷了'),
+    ('无缘无故胸痛', '无缘无故胸痛'),
+])
+def test_strip_negated_terms_only_removes_directly_negated_terms(text, expected):
+    assert strip_negated(text, EMERGENCY_KEYWORDS) == expected
+
+
+@pytest.mark.parametrize('text', ['没有胸痛', '我没有胸痛，只是有点咳嗽', '否认心悸、抽搐', '无胸痛'])
+def test_negated_keywords_are_not_emergencies(text):
+    assert not detect_emergency(text).is_emergency
+
+
+@pytest.mark.parametrize('text', ['心悸是什么原因', '什么是抽搐', '胸痛有哪些常见原因'])
+def test_knowledge_questions_are_informational(text):
+    result = detect_emergency(text)
+    assert result.is_emergency and result.informational
+
+
+@pytest.mark.parametrize('text', ['胸痛', '我突然胸痛，呼吸困难', '我心悸是什么原因', '没有发热，但是胸痛'])
+def test_reports_are_emergencies(text):
+    result = detect_emergency(text)
+    assert result.is_emergency and not result.informational
+
+
+@pytest.mark.parametrize('text, expected', [
+    ('孩子没吃东西突然抽搐', ['抽搐']),
+    ('老人没反应昏迷了', ['昏迷']),
+    ('没想到突然晕倒', ['晕倒']),
+    ('没多久就大出血', ['大出血']),
+    ('无缘无故胸痛', ['胸痛']),
+])
+def test_negation_does_not_reach_later_keywords(text, expected):
+    result = detect_emergency(text)
+    assert result.detected_symptoms == expected and not result.informational
+
+
+def test_symptom_list_items_do_not_negate_each_other():
+    assert detect_emergency(['没有发热', '胸痛']).detected_symptoms == ['胸痛']
+
+
+@pytest.fixture
+def llm(monkeypatch):
+    calls = []
+
+    def fake_call_qwen_api(message, context=None, history=None):
+        calls.append(message)
+        return {'success': True, 'response': '心悸常见原因包括……'}
+
+    monkeypatch.setattr(ai_assistant, 'call_qwen_api', fake_call_qwen_api)
+    return calls
+
+
+def test_chat_question_reaches_llm_with_emergency_banner(client, llm):
+    data = client.post('/api/ai/chat', json={'message': '心悸是什么原因'}).get_json()['data']
+    assert llm == ['心悸是什么原因']
+    assert data['raw_data'] == '心悸常见原因包括……'
+    assert data['emergency']['informational'] is True
+
+
+def test_chat_negation_reaches_llm_without_banner(client, llm):
+    data = client.post('/api/ai/chat', json={'message': '我没有胸痛，就是有点咳嗽'}).get_json()['data']
+    assert llm == ['我没有胸痛，就是有点咳嗽']
+    assert 'emergency' not in data
+
+
+def test_chat_report_short_circuits(client, llm):
+    data = client.post('/api/ai/chat', json={'message': '我突然胸痛'}).get_json()['data']
+    assert llm == []
+    assert data['emergency']['detected_symptoms'] == ['胸痛']
+
+
+def test_symptom_analysis_checks_emergency_before_semantic_search(client, monkeypatch):
+    def unexpected():
+        raise AssertionError('semantic index should not be used for emergencies')
+
+    monkeypatch.setattr(symptoms, 'semantic_index', unexpected)
+    data = client.post('/api/symptoms/analyze', json={'symptoms': ['抽搐']}).get_json()['data']
+    assert data['urgency_level'] == '高'
+    assert data['emergency']['detected_symptoms'] == ['抽搐']
+
+
+def test_emergency_only_term_keeps_analysis_shape(client):
+    # “昏迷”不在症状知识库中，只命中紧急关键词
+    data = client.post('/api/symptoms/analyze', json={'symptoms': ['昏迷']}).get_json()['data']
+    assert 'error' not in data and 'suggestions' not in data
+    assert data['normalized_symptoms'] == ['昏迷']
+    assert data['possible_diseases'] == []
+    assert data['recommended_departments'] == ['急诊科']
+    assert data['urgency_level'] == '高'
+    assert data['advice'][0] == data['emergency']['immediate_actions'][0]
+
+
+def test_symptom_analysis_puts_er_first(client):
+    data = client.post('/api/symptoms/analyze', json={'symptoms': ['我突然胸痛']}).get_json()['data']
+    departments = data['recommended_departments']
+    assert departments[0] == '急诊科' and departments.count('急诊科') == 1
+    assert len(departments) > 1
+
+
+def test_symptom_analysis_question_is_not_escalated(client, monkeypatch):
+    searched = []
+    monkeypatch.setattr(symptoms, 'semantic_search', lambda text: searched.append(text) or [])
+    data = client.post('/api/symptoms/analyze', json={'symptoms': ['心悸是什么原因']}).get_json()['data']
+    # 照常分析（包括语义检索），未识别时返回正常的提示，只附带急救提示
+    assert [text.strip() for text in searched] == ['心悸是什么原因']
+    assert data['error'] == '未能识别有效症状，请重新描述'
+    assert data['emergency']['informational'] is True
+
+
+QUESTION = {'symptoms': ['心悸是什么原因']}
+ADVICE = {'analysis': {'urgency_level': '低'}, 'source': 'llm'}
+
+
+@pytest.fixture
+def diagnosis(monkeypatch):
+    """替换大模型诊断，记录知识性提问是否照常走到诊断"""
+    calls = []
+
+    def fake_diagnose(symptoms, severity, duration, additional_info, wait_for_llm=False):
+        calls.append(symptoms)
+        return dict(ADVICE), None
+
+    def fake_stream(symptoms, severity, duration, additional_info):
+        calls.append(symptoms)
+        yield ('result', {'urgency_level': '低'})
+
+    monkeypatch.setattr(ai_assistant, 'diagnose_health_advice', fake_diagnose)
+    monkeypatch.setattr(ai_assistant, 'stream_qwen_diagnosis', fake_stream)
+    monkeypatch.setattr(ai_assistant, 'quota_retry_after', lambda: None)
+    return calls
+
+
+def test_health_advice_question_is_diagnosed_with_banner(client, diagnosis):
+    data = client.post('/api/ai/health-advice', json=QUESTION).get_json()['data']
+    assert diagnosis == [QUESTION['symptoms']]
+    assert data['source'] == 'llm'
+    assert data['emergency']['informational'] is True
+
+
+def test_health_advice_report_short_circuits(client, diagnosis):
+    data = client.post('/api/ai/health-advice', json={'symptoms': ['我突然胸痛']}).get_json()['data']
+    assert diagnosis == []
+    assert data['source'] == 'emergency'
+
+
+def _events(response):
+    events = []
+    for block in response.data.decode('utf-8').strip().split('\n\n'):
+        event, data = block.split('\n')
+        events.append((event[len('event: '):], json.loads(data[len('data: '):])))
+    return events
+
+
+def test_stream_question_is_diagnosed_with_banner(client, diagnosis):
+    events = _events(client.post('/api/ai/health-advice/stream', json=QUESTION))
+    assert diagnosis == [QUESTION['symptoms']]
+    assert [event for event, _ in events] == ['emergency', 'result', 'done']
+    assert events[1][1]['source'] == 'llm'
+    assert events[1][1]['emergency']['informational'] is True
+
+
+def test_stream_report_short_circuits(client, diagnosis):
+    events = _events(client.post('/api/ai/health-advice/stream', json={'symptoms': ['我突然胸痛']}))
+    assert diagnosis == []
+    assert [event for event, _ in events] == ['emergency', 'result', 'done']
+    assert events[1][1]['source'] == 'emergency'
+
+
+def test_job_question_is_diagnosed_with_banner(app, diagnosis):
+    with app.app_context():
+        advice = ai_assistant.run_health_advice_job(QUESTION)
+        assert diagnosis == [QUESTION['symptoms']]
+        assert advice['source'] == 'llm' and advice['emergency']['informational'] is True
+        assert ai_assistant.run_health_advice_job({'symptoms': ['我突然胸痛']})['source'] == 'emergency'
+    assert len(diagnosis) == 1
+
+
+def test_triage_question_is_not_escalated(client, monkeypatch):
+    monkeypatch.setattr(triage, 'quota_retry_after', lambda: 1.0)
+    response = client.post('/api/triage', json=dict(QUESTION, include_advice=True,
+                                                    location={'latitude': 39.9, 'longitude': 116.4}))
+    sections = {line['section']: line for line in map(json.loads, response.data.decode('utf-8').splitlines())}
+    assert sections['emergency']['data']['informational'] is True
+    assert 'advice' in sections
+    assert '急诊科' not in sections.get('hospitals', {}).get('data', {}).get('recommended_departments', [])
@@ -0,0 +1,68 @@
+import threading
+
+import pytest
+
+from src.services.hedged_diagnosis import HedgedDiagnosis, _cache_key, local_diagnosis
+
+LOCAL = {'urgency_level': '低', 'source': 'local'}
+LLM = {'urgency_level': '中', 'source': 'llm'}
+
+
+def _hedged(llm_fn, local=LOCAL, deadline_ms=50):
+    return HedgedDiagnosis(llm_fn, local_fn=lambda *args: local, deadline_ms=deadline_ms, max_workers=2)
+
+
+def test_llm_within_deadline_wins():
+    hedged = _hedged(lambda *args: {'success': True, 'data': LLM})
+    assert hedged.diagnose(['发热'], '中等', '1-2天', '') == ('llm', LLM, None)
+    # 补充信息仅首尾空白不同，命中缓存
+    assert hedged.diagnose(['发热'], '中等', '1-2天', ' ') == ('llm_cache', LLM, None)
+
+
+def test_deadline_returns_local_and_caches_late_llm():
+    release = threading.Event()
+    finished = threading.Event()
+
+    def slow_llm(*args):
+        release.wait(5)
+        return {'success': True, 'data': LLM}
+
+    hedged = _hedged(slow_llm)
+    assert hedged.diagnose(['咳嗽', '发热'], '中等', '1-2天', '') == ('local', LOCAL, 'deadline')
+
+    original_put = hedged._cache_put
+    hedged._cache_put = lambda key, data: (original_put(key, data), finished.set())
+    release.set()
+    assert finished.wait(5)
+    assert hedged.diagnose(['发热', '咳嗽'], '中等', '1-2天', '') == ('llm_cache', LLM, None)
+
+
+def test_llm_error_falls_back_to_local_or_reports_error():
+    failing = lambda *args: {'error': '上游超时'}
+    assert _hedged(failing).diagnose(['发热'], '中等', '1-2天', '') == ('local', LOCAL, 'llm_error')
+    assert _hedged(failing, local=None).diagnose(['未知'], '中等', '1-2天', '') == (None, None, '上游超时')
+
+
+def test_wait_for_llm_ignores_deadline():
+    def slow_llm(*args):
+        threading.Event().wait(0.2)
+        return {'success': True, 'data': LLM}
+
+    hedged = _hedged(slow_llm, deadline_ms=10)
+    assert hedged.diagnose(['发热'], '中等', '1-2天', '', wait_for_llm=True) == ('llm', LLM, None)
+
+
+def test_cache_key_normalises_inputs():
+    # 整段字符串不按字符拆分：字符相同但内容不同的描述不共享缓存
+    assert _cache_key('热发', '中等', '1-2天', '') != _cache_key('发热', '中等', '1-2天', '')
+    assert _cache_key('发热', '中等', '1-2天', '') == _cache_key(['发热'], '中等', '1-2天', None)
+    assert _cache_key([' 咳嗽', '发热'], '中等', '1-2天', '') == _cache_key(['发热', '咳嗽'], '中等', '1-2天', '')
+    # 不可哈希的字段也能生成键
+    hash(_cache_key(['发热'], ['严重'], {'days': 3}, {'note': 1}))
+
+
+@pytest.mark.parametrize('symptoms', ['发热咳嗽', ['发热', '咳嗽']])
+def test_local_diagnosis_accepts_string_or_list(symptoms):
+    result = local_diagnosis(symptoms, '中等', '1-2天', '')
+    assert result is not None
+    assert {d['name'] for d in result['possible_diseases']} >= {'感冒'}
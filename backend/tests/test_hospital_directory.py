@@ -0,0 +1,210 @@
+import json
+import os
+
+import pytest
+
+from src.models import hospital as hospital_module
+from src.models.hospital import Hospital, get_data_version, hospital_json
+from src.models.user import db
+from src.routes.hospitals import init_sample_data
+from src.services import hospital_directory as directory_module
+from src.services import regions
+from src.services.hospital_directory import HEADER_SIZE, HospitalDirectory, export_directory, hospital_directory
+from src.services.hospital_shards import hospital_shards
+from src.services.regions import RegionMatcher
+
+ROWS = [('北京市', '110000'), ('东城区', '110101'), ('上海市', '310000'), ('静安区', '310106'),
+        ('广东省', '440000'), ('广州市', '440100'), ('越秀区', '440104')]
+BEIJING = {'latitude': 39.9, 'longitude': 116.4}
+BEIJING_BOX = (39.5, 40.3, 116.0, 116.8)
+DEPARTMENTS = ['内科', '神经内科', '心血管内科']
+
+
+@pytest.fixture
+def path(app, tmp_path, monkeypatch):
+    """示例医院导出到临时目录文件；各数据源只剩目录与数据库，每次查询都重新检查文件"""
+    from src.main import backfill_hospital_regions
+
+    path = str(tmp_path / 'directory' / 'hospital_directory.bin')
+    monkeypatch.setattr(regions, '_matcher', RegionMatcher(ROWS))
+    monkeypatch.setattr(hospital_module, '_version_cache', {})
+    monkeypatch.setattr(directory_module, 'HOSPITAL_DIRECTORY_CHECK_INTERVAL', 0.0)
+    monkeypatch.setattr(hospital_directory, 'path', path)
+    monkeypatch.setattr(hospital_shards, 'directory', str(tmp_path / 'no-shards'))
+    hospital_shards.reset()
+    with app.app_context():
+        init_sample_data()
+        backfill_hospital_regions()
+        export_directory(path)
+    hospital_directory.reset()
+    yield path
+    hospital_directory.reset()
+
+
+@pytest.fixture
+def in_box_calls(monkeypatch):
+    """记录目录的矩形查询次数（区分请求走的是目录还是数据库）"""
+    calls = []
+    in_box = HospitalDirectory.in_box
+
+    def spy(self, *args, **kwargs):
+        calls.append(args)
+        return in_box(self, *args, **kwargs)
+
+    monkeypatch.setattr(HospitalDirectory, 'in_box', spy)
+    return calls
+
+
+def _version(app):
+    with app.app_context():
+        return get_data_version()
+
+
+def _change_phone(app, hospital_id, phone):
+    with app.app_context():
+        db.session.get(Hospital, hospital_id).phone = phone
+        db.session.commit()
+        hospital_module._version_cache.clear()
+        return get_data_version()
+
+
+def _nearby(client, **body):
+    response = client.post('/api/hospitals/nearby', json=dict(BEIJING, radius=3000000, **body))
+    assert response.status_code == 200
+    return response.get_json()['data']
+
+
+def _recommend(client, **body):
+    response = client.post('/api/hospitals/recommend', json=dict(
+        location=BEIJING, radius=3000000, analysis_result={'recommended_departments': DEPARTMENTS}, **body))
+    assert response.status_code == 200
+    recommendations = response.get_json()['data']['recommendations']
+    for item in recommendations:
+        # 数据库路径的科室来自集合运算，顺序不固定
+        item['matched_departments'] = sorted(item['matched_departments'])
+    return recommendations
+
+
+def _without_directory(path):
+    os.unlink(path)
+    hospital_directory.reset()
+
+
+def test_export_round_trips_hospitals(app, path):
+    directory = HospitalDirectory(path)
+    with app.app_context():
+        hospitals = Hospital.query.order_by(Hospital.id).all()
+        version = get_data_version()
+        assert directory.version == version
+        assert directory.count == len(hospitals)
+        assert list(directory.ids) == [h.id for h in hospitals]
+        for row, hospital in enumerate(hospitals):
+            assert directory.fragment(row) == hospital_json(hospital, version)
+            assert directory.entry(row) == (hospital.id, hospital.level, hospital.rating)
+            assert (float(directory.latitude[row]), float(directory.longitude[row])) == \
+                (hospital.latitude, hospital.longitude)
+            assert int(directory.adcodes['province'][row]) == hospital.province_adcode
+        specialties = {name for h in hospitals for name in json.loads(h.specialties)}
+    assert directory.vocabulary == sorted(specialties)
+    # 临时文件已原子替换为目标文件
+    assert os.listdir(os.path.dirname(path)) == [os.path.basename(path)]
+
+
+def test_in_box_filters_by_box_and_region(path):
+    directory = HospitalDirectory(path)
+    ids = lambda rows: sorted(int(directory.ids[row]) for row in rows)
+    assert ids(directory.in_box(*BEIJING_BOX)) == [1, 2, 3]
+    assert ids(directory.in_box(*BEIJING_BOX, region=('district', 110101))) == [1]
+    assert ids(directory.in_box(*BEIJING_BOX, region=('province', 440000))) == []
+    assert ids(directory.in_box(-90, 90, -180, 180, region=('province', 440000))) == [5]
+
+
+def test_mask_and_matched(path):
+    directory = HospitalDirectory(path)
+    mask = directory.mask(['神经外科', '内科', '不存在的科室'])
+    assert directory.matched(2, mask) == sorted(['神经外科', '内科'])
+    assert directory.matched(0, mask) == ['内科']
+    assert directory.matched(0, directory.mask([])) == []
+
+
+def test_bitmap_spans_several_words(app, path):
+    names = [f'专科{i:03d}' for i in range(150)]
+    with app.app_context():
+        db.session.get(Hospital, 1).specialties = json.dumps(names, ensure_ascii=False)
+        db.session.commit()
+        hospital_module._version_cache.clear()
+        export_directory(path)
+    directory = HospitalDirectory(path)
+    assert directory.words > 2
+    wanted = [names[0], names[63], names[64], names[149]]
+    assert directory.matched(0, directory.mask(wanted)) == wanted
+    assert directory.matched(1, directory.mask(wanted)) == []
+
+
+def test_nearby_from_directory_matches_database(client, path, in_box_calls):
+    from_directory = _nearby(client)
+    assert in_box_calls
+    _without_directory(path)
+    in_box_calls.clear()
+    from_database = _nearby(client)
+    assert not in_box_calls
+    assert from_directory == from_database
+
+
+@pytest.mark.parametrize('body', [{}, {'city': '北京', 'district': '东城区'}, {'preferences': {'sort_by': 'rating'}}])
+def test_recommend_from_directory_matches_database(client, path, in_box_calls, body):
+    from_directory = _recommend(client, **body)
+    assert in_box_calls
+    _without_directory(path)
+    in_box_calls.clear()
+    from_database = _recommend(client, **body)
+    assert not in_box_calls
+    assert from_directory == from_database
+
+
+def test_data_version_change_falls_back_until_reexport(app, client, path, in_box_calls):
+    old_version = hospital_directory.current(_version(app)).version
+    version = _change_phone(app, 1, '010-00000000')
+    assert version != old_version
+    assert hospital_directory.current(version) is None
+    assert {item['id']: item['phone'] for item in _nearby(client)}[1] == '010-00000000'
+    assert not in_box_calls
+
+    with app.app_context():
+        export_directory(path)
+    # 文件被替换后重新映射
+    assert hospital_directory.current(version).version == version
+    assert {item['id']: item['phone'] for item in _nearby(client)}[1] == '010-00000000'
+    assert in_box_calls
+
+
+def test_old_mapping_survives_replacement(app, path):
+    old = HospitalDirectory(path)
+    fragment = old.fragment(0)
+    _change_phone(app, 1, '010-00000000')
+    with app.app_context():
+        export_directory(path)
+    assert old.fragment(0) == fragment
+    assert b'010-00000000' in HospitalDirectory(path).fragment(0)
+
+
+def _corrupt(path, transform):
+    with open(path, 'rb') as f:
+        data = f.read()
+    with open(path, 'wb') as f:
+        f.write(transform(data))
+    hospital_directory.reset()
+
+
+@pytest.mark.parametrize('transform', [
+    lambda data: b'garbage' * 20,
+    lambda data: data[:HEADER_SIZE + 16],
+    lambda data: data[:8] + (99).to_bytes(4, 'little') + data[12:],
+], ids=['garbage', 'truncated', 'format-version'])
+def test_corrupt_file_falls_back_to_database(app, client, path, in_box_calls, transform):
+    expected = _nearby(client)
+    _corrupt(path, transform)
+    assert hospital_directory.current(_version(app)) is None
+    in_box_calls.clear()
+    assert _nearby(client) == expected
+    assert not in_box_calls
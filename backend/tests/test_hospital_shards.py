@@ -0,0 +1,204 @@
+import json
+import os
+from types import SimpleNamespace
+
+import pytest
+
+from src.models import hospital as hospital_module
+from src.models.hospital import Hospital, get_data_version
+from src.models.user import db
+from src.routes import hospitals as hospitals_routes
+from src.routes.hospitals import init_sample_data
+from src.services import hospital_shards as shards_module
+from src.services import regions
+from src.services.hospital_shards import MANIFEST_NAME, ShardSet, export_shards, hospital_shards
+from src.services.regions import RegionMatcher
+
+ROWS = [('北京市', '110000'), ('东城区', '110101'), ('上海市', '310000'), ('静安区', '310106'),
+        ('广东省', '440000'), ('广州市', '440100'), ('越秀区', '440104')]
+BEIJING = {'latitude': 39.9, 'longitude': 116.4}
+# 北京市区附近的矩形，只与北京分片相交
+BEIJING_BOX = (39.5, 40.3, 116.0, 116.8)
+TOKEN = 'shard-secret'
+
+
+def _read_manifest(directory):
+    with open(os.path.join(directory, MANIFEST_NAME), encoding='utf-8') as f:
+        return json.load(f)
+
+
+@pytest.fixture
+def directory(app, tmp_path, monkeypatch):
+    """示例医院按省导出到临时目录，路由器指向该目录并在每次查询时重新检查清单"""
+    from src.main import backfill_hospital_regions
+
+    path = str(tmp_path / 'shards')
+    monkeypatch.setattr(regions, '_matcher', RegionMatcher(ROWS))
+    monkeypatch.setattr(hospital_module, '_version_cache', {})
+    monkeypatch.setattr(shards_module, 'HOSPITAL_SHARD_CHECK_INTERVAL', 0.0)
+    monkeypatch.setattr(hospital_shards, 'directory', path)
+    monkeypatch.setattr(hospital_shards, 'nodes', {})
+    with app.app_context():
+        init_sample_data()
+        backfill_hospital_regions()
+        export_shards(path)
+    hospital_shards.reset()
+    yield path
+    hospital_shards.reset()
+
+
+@pytest.fixture
+def queried(monkeypatch):
+    """记录本机查询过的分片"""
+    provinces = []
+    query_local = ShardSet.query_local
+
+    def spy(self, province, box, region=None):
+        provinces.append(province)
+        return query_local(self, province, box, region)
+
+    monkeypatch.setattr(ShardSet, 'query_local', spy)
+    return provinces
+
+
+def _nearby(client, **body):
+    response = client.post('/api/hospitals/nearby', json=dict(BEIJING, radius=3000000, **body))
+    assert response.status_code == 200
+    return response.get_json()['data']
+
+
+def test_export_writes_one_shard_per_province(app, directory):
+    manifest = _read_manifest(directory)
+    with app.app_context():
+        assert manifest['version'] == get_data_version()
+    counts = {shard['province']: shard['count'] for shard in manifest['shards']}
+    assert counts == {110000: 3, 310000: 1, 440000: 1}
+    for shard in manifest['shards']:
+        assert shard['file'] == f"province_{shard['province']}.v{manifest['version']}.db"
+        assert os.path.exists(os.path.join(directory, shard['file']))
+    beijing = next(shard for shard in manifest['shards'] if shard['province'] == 110000)
+    assert beijing['bounds'] == [39.8586, 39.9289, 116.3831, 116.4074]
+
+
+def test_reexport_replaces_old_version_files(app, directory):
+    old = {shard['file'] for shard in _read_manifest(directory)['shards']}
+    with app.app_context():
+        db.session.get(Hospital, 1).phone = '010-00000000'
+        db.session.commit()
+        hospital_module._version_cache.clear()
+        export_shards(directory)
+    current = {shard['file'] for shard in _read_manifest(directory)['shards']}
+    assert not old & current
+    assert sorted(name for name in os.listdir(directory) if name.endswith('.db')) == sorted(current)
+
+
+def test_router_only_queries_intersecting_shards(app, directory, queried):
+    with app.app_context():
+        version = get_data_version()
+    shards = hospital_shards.current(version)
+    assert [shard.province for shard in shards.route(BEIJING_BOX)] == [110000]
+    # 区县筛选只路由到所属省份的分片
+    everywhere = (-90.0, 90.0, -180.0, 180.0)
+    assert [shard.province for shard in shards.route(everywhere, ('district', 440104))] == [440000]
+
+    hospitals = hospital_shards.query_box(version, BEIJING_BOX)
+    assert sorted(h.id for h in hospitals) == [1, 2, 3]
+    assert queried == [110000]
+    assert [h.id for h in hospital_shards.query_box(version, BEIJING_BOX, ('district', 110101))] == [1]
+
+
+def test_nearby_served_from_shards_matches_database(app, client, directory, queried):
+    from_shards = _nearby(client)
+    assert sorted(queried) == [110000, 310000, 440000]
+    hospital_shards.reset()
+    os.unlink(os.path.join(directory, MANIFEST_NAME))
+    queried.clear()
+    from_database = _nearby(client)
+    assert queried == []
+    assert from_shards == from_database
+
+
+def test_version_mismatch_falls_back_to_database(app, client, directory, queried):
+    with app.app_context():
+        db.session.get(Hospital, 1).phone = '010-00000000'
+        db.session.commit()
+        hospital_module._version_cache.clear()
+        version = get_data_version()
+    assert hospital_shards.current(version) is None
+    assert hospital_shards.query_box(version, BEIJING_BOX) is None
+    data = _nearby(client)
+    assert queried == []
+    assert {item['id']: item['phone'] for item in data}[1] == '010-00000000'
+
+
+def test_unsupported_manifest_format_disables_shards(app, directory):
+    manifest = _read_manifest(directory)
+    manifest['format'] = 99
+    with open(os.path.join(directory, MANIFEST_NAME), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f)
+    hospital_shards.reset()
+    assert hospital_shards.snapshot() is None
+
+
+def _box(client, province, token=TOKEN, **body):
+    return client.post(f'/api/hospitals/shards/{province}/box', headers={'X-Shard-Token': token}, json=body)
+
+
+def test_shard_endpoint_checks_token_province_and_version(app, client, directory, monkeypatch):
+    monkeypatch.setattr(hospitals_routes, 'HOSPITAL_SHARD_TOKEN', TOKEN)
+    with app.app_context():
+        version = get_data_version()
+    assert _box(client, 110000, token='wrong', version=version, box=BEIJING_BOX).status_code == 403
+    assert _box(client, 120000, version=version, box=BEIJING_BOX).status_code == 404
+    mismatch = _box(client, 110000, version=version - 1, box=BEIJING_BOX)
+    assert mismatch.status_code == 409 and mismatch.get_json()['version'] == version
+    assert _box(client, 110000, version=version, box=[1, 2]).status_code == 400
+
+    data = _box(client, 110000, version=version, box=BEIJING_BOX, region=['district', 110101]).get_json()['data']
+    assert [item['hospital']['name'] for item in data['hospitals']] == ['北京协和医院']
+
+
+@pytest.fixture
+def remote(app, client, directory, monkeypatch):
+    """北京分片由“其他节点”承载：远程请求转给同一应用的分片接口"""
+    import requests
+
+    monkeypatch.setattr(hospitals_routes, 'HOSPITAL_SHARD_TOKEN', TOKEN)
+    monkeypatch.setattr(shards_module, 'HOSPITAL_SHARD_TOKEN', TOKEN)
+    monkeypatch.setattr(hospital_shards, 'nodes', {110000: 'http://node-b:5000'})
+    hospital_shards.reset()
+    calls = []
+
+    def post(url, json=None, headers=None, timeout=None):
+        calls.append(url)
+        response = client.post(url.replace('http://node-b:5000', ''), json=json, headers=headers)
+
+        def raise_for_status():
+            if response.status_code >= 400:
+                raise requests.HTTPError(f'{response.status_code}')
+
+        return SimpleNamespace(json=response.get_json, raise_for_status=raise_for_status)
+
+    monkeypatch.setattr(requests, 'post', post)
+    return calls
+
+
+def test_remote_shard_is_queried_through_node_endpoint(app, client, remote, queried):
+    with app.app_context():
+        version = get_data_version()
+    hospitals = hospital_shards.query_box(version, BEIJING_BOX)
+    assert remote == ['http://node-b:5000/api/hospitals/shards/110000/box']
+    assert sorted(h.id for h in hospitals) == [1, 2, 3]
+    assert {h.id: json.loads(h.fragment)['name'] for h in hospitals}[1] == '北京协和医院'
+
+
+def test_failed_remote_shard_falls_back_to_database(app, client, remote, monkeypatch):
+    import requests
+
+    def unreachable(*args, **kwargs):
+        raise requests.ConnectionError('node-b unreachable')
+
+    monkeypatch.setattr(requests, 'post', unreachable)
+    with app.app_context():
+        assert hospital_shards.query_box(get_data_version(), BEIJING_BOX) is None
+    assert sorted(item['id'] for item in _nearby(client)) == [1, 2, 3, 4, 5]
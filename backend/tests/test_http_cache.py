@@ -0,0 +1,100 @@
+import datetime
+
+import pytest
+from werkzeug.http import http_date
+
+from src.models import hospital as hospital_module
+from src.models.hospital import Hospital
+from src.models.user import db
+from src.routes.hospitals import init_sample_data
+from src.utils.http_cache import CACHE_POLICIES, HTTP_CACHE_REVALIDATIONS
+
+
+@pytest.fixture
+def hospital_id(app, monkeypatch):
+    # 数据版本在进程内缓存，各测试使用各自的数据库，需从空缓存开始
+    monkeypatch.setattr(hospital_module, '_version_cache', {})
+    with app.app_context():
+        init_sample_data()
+        return Hospital.query.order_by(Hospital.id).first().id
+
+
+def _details(client, hospital_id, **headers):
+    return client.get(f'/api/hospitals/{hospital_id}', headers=headers)
+
+
+def test_full_response_carries_validators_and_policy(client, hospital_id):
+    response = _details(client, hospital_id)
+    assert response.status_code == 200
+    etag, weak = response.get_etag()
+    assert etag and not weak
+    assert response.last_modified is not None
+    assert response.headers['Cache-Control'] == CACHE_POLICIES['hospital_details']
+    assert 'Accept-Encoding' in response.vary
+
+
+def test_matching_etag_returns_304_without_body(client, hospital_id):
+    etag = _details(client, hospital_id).get_etag()[0]
+    hits = HTTP_CACHE_REVALIDATIONS.value(route='hospital_details', result='hit')
+    response = _details(client, hospital_id, **{'If-None-Match': f'"{etag}"'})
+    assert response.status_code == 304
+    assert response.data == b''
+    assert response.get_etag()[0] == etag
+    assert response.headers['Cache-Control'] == CACHE_POLICIES['hospital_details']
+    assert HTTP_CACHE_REVALIDATIONS.value(route='hospital_details', result='hit') == hits + 1
+
+
+def test_weak_etag_from_compressed_response_still_matches(client, hospital_id):
+    # 压缩后的响应把 ETag 改为弱校验，客户端回传 W/"..." 时同样命中
+    etag = _details(client, hospital_id).get_etag()[0]
+    assert _details(client, hospital_id, **{'If-None-Match': f'W/"{etag}"'}).status_code == 304
+
+
+def test_stale_etag_returns_full_response(client, hospital_id):
+    misses = HTTP_CACHE_REVALIDATIONS.value(route='hospital_details', result='miss')
+    response = _details(client, hospital_id, **{'If-None-Match': '"stale"'})
+    assert response.status_code == 200
+    assert response.get_json()['data']['hospital']['id'] == hospital_id
+    assert HTTP_CACHE_REVALIDATIONS.value(route='hospital_details', result='miss') == misses + 1
+
+
+def test_if_modified_since(client, hospital_id):
+    last_modified = _details(client, hospital_id).last_modified
+    assert _details(client, hospital_id, **{'If-Modified-Since': http_date(last_modified)}).status_code == 304
+    earlier = last_modified - datetime.timedelta(seconds=1)
+    assert _details(client, hospital_id, **{'If-Modified-Since': http_date(earlier)}).status_code == 200
+
+
+def test_if_none_match_takes_precedence_over_if_modified_since(client, hospital_id):
+    last_modified = _details(client, hospital_id).last_modified
+    response = _details(client, hospital_id, **{'If-None-Match': '"stale"', 'If-Modified-Since': http_date(last_modified)})
+    assert response.status_code == 200
+
+
+def test_data_change_invalidates_etag(app, client, hospital_id, monkeypatch):
+    etag = _details(client, hospital_id).get_etag()[0]
+    with app.app_context():
+        db.session.get(Hospital, hospital_id).phone = '010-00000000'
+        db.session.commit()
+    monkeypatch.setattr(hospital_module, '_version_cache', {})
+    response = _details(client, hospital_id, **{'If-None-Match': f'"{etag}"'})
+    assert response.status_code == 200
+    assert response.get_etag()[0] != etag
+    assert response.get_json()['data']['hospital']['phone'] == '010-00000000'
+
+
+def test_missing_hospital_is_not_cached(client, hospital_id):
+    response = _details(client, 999999)
+    assert response.status_code == 404
+    assert response.get_etag() == (None, None)
+    assert 'Cache-Control' not in response.headers
+
+
+def test_search_etag_depends_on_parameters(client, hospital_id):
+    first = client.get('/api/hospitals/search', query_string={'level': '三甲'})
+    other = client.get('/api/hospitals/search', query_string={'level': '二甲'})
+    assert first.headers['Cache-Control'] == CACHE_POLICIES['hospital_search']
+    assert first.get_etag()[0] != other.get_etag()[0]
+    etag = first.get_etag()[0]
+    again = client.get('/api/hospitals/search', query_string={'level': '三甲'}, headers={'If-None-Match': f'"{etag}"'})
+    assert again.status_code == 304
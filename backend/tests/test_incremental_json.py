@@ -0,0 +1,67 @@
+import json
+
+import pytest
+
+from src.utils.incremental_json import IncrementalObjectParser, extract_json_object
+
+DOCUMENT = {
+    'urgency_level': '中',
+    'possible_diseases': [{'name': '感冒', 'confidence': 0.7}, {'name': '流感 "甲型"', 'confidence': 0.2}],
+    'recommended_departments': ['呼吸内科', '发热门诊'],
+    'analysis': '括号 {不} 影响 [解析]，逗号, 冒号: 反斜杠 \\ 与引号 " 都在字符串内',
+    'recommendations': {'immediate_actions': ['多喝水'], 'nested': {'a': [1, {'b': None}]}},
+    'score': -1.5e-3,
+    'flag': True,
+}
+TEXT = '\ufeff好的，诊断如下：\n' + json.dumps(DOCUMENT, ensure_ascii=False, indent=2) + '\n以上仅供参考。'
+
+
+def _feed(chunks):
+    parser = IncrementalObjectParser()
+    emitted = []
+    for chunk in chunks:
+        emitted.extend(parser.feed(chunk))
+    return parser, emitted
+
+
+def test_single_chunk():
+    parser, emitted = _feed([TEXT])
+    assert dict(emitted) == DOCUMENT
+    assert [key for key, _ in emitted] == list(DOCUMENT)
+    assert parser.result() == DOCUMENT
+
+
+@pytest.mark.parametrize('split', range(1, len(TEXT)))
+def test_every_two_chunk_boundary(split):
+    parser, emitted = _feed([TEXT[:split], TEXT[split:]])
+    assert dict(emitted) == DOCUMENT
+    assert parser.done and not parser.errors
+    assert parser.result() == DOCUMENT
+
+
+def test_one_character_at_a_time():
+    parser, emitted = _feed(list(TEXT))
+    assert [key for key, _ in emitted] == list(DOCUMENT)
+    assert parser.result() == DOCUMENT
+
+
+def test_fields_are_emitted_as_soon_as_they_close():
+    parser = IncrementalObjectParser()
+    assert parser.feed('{"urgency_level": "高", "possible_') == [('urgency_level', '高')]
+    assert parser.feed('diseases": [{"name": "肺炎"}') == []
+    assert parser.feed(']}') == [('possible_diseases', [{'name': '肺炎'}])]
+    assert parser.feed('{"ignored": 1}') == []
+
+
+def test_invalid_value_falls_back_to_extract():
+    parser, emitted = _feed(['{"a": 1, "b": tru', 'e , "c": nope}'])
+    assert emitted == [('a', 1), ('b', True)]
+    assert parser.errors
+    with pytest.raises(json.JSONDecodeError):
+        parser.result()
+
+
+def test_extract_json_object_requires_braces():
+    assert extract_json_object('前言 {"a": 1} 后记') == {'a': 1}
+    with pytest.raises(ValueError):
+        extract_json_object('没有 JSON')
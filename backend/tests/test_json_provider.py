@@ -0,0 +1,86 @@
+import datetime
+import decimal
+import json
+import uuid
+
+import pytest
+from flask import jsonify, request
+
+from src.utils import json_provider
+from src.utils.json_provider import RawJSON, dumps_bytes, extend_raw, json_response, loads
+
+# 片段原样拼接：保留其中的空格与键顺序，可借此确认没有被重新编码
+FRAGMENT = '{"name": "协和", "id": 1}'.encode('utf-8')
+
+
+def _stdlib_encode(obj):
+    return json.dumps(obj, default=json_provider._default, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+@pytest.fixture(params=['orjson', 'json'], autouse=True)
+def encoder(request, monkeypatch):
+    """orjson 与标准库两种编码后端都跑一遍"""
+    if request.param == 'orjson' and json_provider.orjson is None:
+        pytest.skip('orjson 未安装')
+    if request.param == 'json':
+        monkeypatch.setattr(json_provider, '_encode', _stdlib_encode)
+    return request.param
+
+
+def test_plain_objects():
+    day = datetime.date(2024, 1, 2)
+    moment = datetime.datetime(2024, 1, 2, 3, 4, 5)
+    key = uuid.UUID('12345678-1234-5678-1234-567812345678')
+    data = {'day': day, 'moment': moment, 'price': decimal.Decimal('1.50'), 'id': key, 'tags': {'a'}, 1: '一'}
+    assert loads(dumps_bytes(data)) == {'day': '2024-01-02', 'moment': '2024-01-02T03:04:05', 'price': '1.50',
+                                        'id': str(key), 'tags': ['a'], '1': '一'}
+
+
+def test_raw_fragments_are_spliced_verbatim():
+    assert dumps_bytes(RawJSON(FRAGMENT)) == FRAGMENT
+    assert dumps_bytes({'hospital': RawJSON(FRAGMENT), 'distance': 1.5}) == \
+        b'{"hospital":' + FRAGMENT + b',"distance":1.5}'
+    assert dumps_bytes([RawJSON(b'1'), 'a', (RawJSON(b'[]'),)]) == b'[1,"a",[[]]]'
+
+
+def test_raw_fragment_in_list_in_dict():
+    data = {'success': True, 'data': {'items': [RawJSON(FRAGMENT), RawJSON(b'{}')], 'total': 2}}
+    encoded = dumps_bytes(data)
+    assert FRAGMENT in encoded
+    assert loads(encoded) == {'success': True,
+                              'data': {'items': [{'name': '协和', 'id': 1}, {}], 'total': 2}}
+
+
+def test_unsupported_type_still_raises_and_resets_flag():
+    with pytest.raises(TypeError):
+        dumps_bytes({'hospital': RawJSON(FRAGMENT), 'bad': object()})
+    assert not json_provider._raw_state.found
+    # 下一次序列化不会误走拼接路径
+    assert dumps_bytes({'a': 1}) == b'{"a":1}'
+
+
+def test_extend_raw():
+    assert extend_raw(FRAGMENT, {}).data == FRAGMENT
+    assert extend_raw(b'{}', {'distance': 2}).data == b'{"distance":2}'
+    extended = extend_raw(FRAGMENT, {'distance': 1.25, 'tags': ['急诊']})
+    assert extended.data.startswith(FRAGMENT[:-1])
+    assert loads(extended.data) == {'name': '协和', 'id': 1, 'distance': 1.25, 'tags': ['急诊']}
+    # 追加的值本身也可以是片段
+    nested = extend_raw(b'{"id":2}', {'hospital': RawJSON(FRAGMENT), 'items': [RawJSON(b'1')]})
+    assert nested.data == b'{"id":2,"hospital":' + FRAGMENT + b',"items":[1]}'
+
+
+def test_flask_provider_and_json_response(app):
+    with app.test_request_context(json={'名称': '协和', 'ids': [1, 2]}):
+        assert request.get_json() == {'名称': '协和', 'ids': [1, 2]}
+        response = jsonify({'data': [RawJSON(FRAGMENT)], 'day': datetime.date(2024, 1, 2)})
+        assert response.mimetype == 'application/json'
+        assert response.get_data() == b'{"data":[' + FRAGMENT + b'],"day":"2024-01-02"}'
+        assert app.json.dumps({'a': RawJSON(b'1')}) == '{"a":1}'
+        # 带参数时交给 Flask 默认实现
+        assert app.json.dumps({'a': 1}, indent=2) == '{\n  "a": 1\n}'
+
+        response = json_response({'data': RawJSON(FRAGMENT)}, status=201, headers={'X-Test': '1'})
+        assert response.status_code == 201
+        assert response.headers['X-Test'] == '1'
+        assert response.get_data() == b'{"data":' + FRAGMENT + b'}'
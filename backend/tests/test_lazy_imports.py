@@ -0,0 +1,56 @@
+import json
+import os
+import subprocess
+import sys
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 只应在首次使用（或 preload 模式的 warm_up）时导入的重依赖，与 benchmarks/import_time.py 的 LAZY_MODULES 一致
+LAZY_MODULES = ('dashscope', 'numpy', 'pandas', 'aiohttp', 'geopy', 'requests')
+
+# 在干净的子进程中依次执行各阶段，每个阶段结束时报告已导入的重依赖与语义索引是否已构建
+SCRIPT = '''
+import importlib.util, json, sys
+LAZY = {lazy!r}
+
+def report():
+    from src.routes import symptoms
+    return {{"loaded": [m for m in LAZY if m in sys.modules], "semantic_index": symptoms._semantic_index is not None}}
+
+stages = {{}}
+import src.main
+stages["import"] = report()
+app = src.main.create_app({{"SQLALCHEMY_DATABASE_URI": {database!r}, "TESTING": True}})
+stages["create_app"] = report()
+client = app.test_client()
+client.get("/api/health")
+client.post("/api/symptoms/analyze", json={{"symptoms": ["发热", "咳嗽"]}})
+stages["requests"] = report()
+if importlib.util.find_spec("numpy") is not None:
+    client.post("/api/symptoms/analyze", json={{"symptoms": ["嗓子冒烟浑身滚烫"]}})
+    stages["semantic_search"] = report()
+print(json.dumps(stages))
+'''
+
+
+def _stages(tmp_path):
+    env = dict(os.environ)
+    env['LOG_LEVEL'] = 'WARNING'
+    env['AMAP_ADCODE_URL'] = str(tmp_path / 'missing-adcode.csv')
+    env.pop('DASHSCOPE_API_KEY', None)
+    script = SCRIPT.format(lazy=LAZY_MODULES, database=f"sqlite:///{tmp_path / 'app.db'}")
+    result = subprocess.run([sys.executable, '-c', script], cwd=BACKEND_DIR, env=env,
+                            capture_output=True, text=True, timeout=120)
+    assert result.returncode == 0, result.stderr[-2000:]
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def test_heavy_modules_are_imported_on_first_use(tmp_path):
+    stages = _stages(tmp_path)
+    for stage in ('import', 'create_app', 'requests'):
+        assert stages[stage] == {'loaded': [], 'semantic_index': False}, stage
+    # 关键词无法识别的描述才触发语义检索，此时才构建索引并导入 numpy
+    if 'semantic_search' in stages:
+        assert stages['semantic_search']['semantic_index'] is True
+        assert 'numpy' in stages['semantic_search']['loaded']
+        assert 'dashscope' not in stages['semantic_search']['loaded']
@@ -0,0 +1,90 @@
+import json
+import logging
+import sys
+import threading
+
+import pytest
+
+from src.utils import log
+from src.utils.log import JsonFormatter, KeyValueFormatter, RedactingFilter, redact, sampled
+
+API_KEY = 'sk-0123456789abcdef'
+
+
+def _record(msg, *args, exc_info=None):
+    return logging.LogRecord('medical_ai.test', logging.INFO, __file__, 1, msg, args, exc_info)
+
+
+def _formatted(msg, *args, **kwargs):
+    """经过脱敏过滤器后，分别用文本与 JSON 格式输出"""
+    record = _record(msg, *args, **kwargs)
+    assert RedactingFilter().filter(record)
+    return KeyValueFormatter().format(record), json.loads(JsonFormatter().format(record))['msg']
+
+
+@pytest.fixture(autouse=True)
+def api_key(monkeypatch):
+    monkeypatch.setenv('DASHSCOPE_API_KEY', API_KEY)
+
+
+@pytest.mark.parametrize('msg, args, masked, leaked', [
+    ('Calling DashScope with key %s', (API_KEY,), 'key ***', API_KEY),
+    ('GET %s', ('https://restapi.amap.com/v3/weather?city=110000&key=abcd1234',), 'key=***', 'abcd1234'),
+    ('payload %s', ({'api_key': 'plain-secret', 'token': 'tok-1'},), "'api_key': '***'", 'plain-secret'),
+    ('用户消息：我的电话是%s，请回电', ('13812345678',), '138****5678', '13812345678'),
+    ('身份证号 %s', ('110101199003071234',), '110***********1234', '110101199003071234'),
+    ('身份证号 %s', ('11010119900307123X',), '110***********123X', '11010119900307123X'),
+    ('nearby lat=%s&lng=%s', (39.9139, 116.4074), 'lat=***&lng=***', '39.9139'),
+    ('user location %s', ({'latitude': 39.9139, 'longitude': 116.4074},), "'latitude': ***", '116.4074'),
+    ('weather location=%s', ('116.40,39.91',), 'location=***', '39.91'),
+])
+def test_sensitive_values_are_masked(msg, args, masked, leaked):
+    for output in _formatted(msg, *args):
+        assert masked in output
+        assert leaked not in output
+
+
+@pytest.mark.parametrize('text', ['北京协和医院 010-69156114', '订单号 12345678901234567890', '耗时 1234.5 ms'])
+def test_ordinary_numbers_are_kept(text):
+    assert redact(text) == text
+
+
+def test_filter_formats_once_and_drops_args():
+    record = _record('chunk %d of %s', 3, 'call-1')
+    RedactingFilter().filter(record)
+    assert record.msg == 'chunk 3 of call-1' and record.args is None
+
+
+def test_exception_text_is_masked():
+    try:
+        raise RuntimeError(f'upstream rejected {API_KEY} for 13812345678')
+    except RuntimeError:
+        record = _record('call failed', exc_info=sys.exc_info())
+    RedactingFilter().filter(record)
+    assert API_KEY not in record.exc_text and '13812345678' not in record.exc_text
+    assert 'RuntimeError: upstream rejected *** for 138****5678' in record.exc_text
+    assert API_KEY not in json.loads(JsonFormatter().format(record))['exc']
+
+
+def test_sampled_every_nth_call_per_key(monkeypatch):
+    monkeypatch.setattr(log, '_sample_counters', {})
+    assert [sampled('test-a', 3) for _ in range(7)] == [True, False, False, True, False, False, True]
+    # 各 key 独立计数
+    assert sampled('test-b', 3) is True
+    assert all(sampled('test-c', 1) for _ in range(5))
+    assert all(sampled('test-c', 0) for _ in range(5))
+
+
+def test_sampled_is_exact_across_threads(monkeypatch):
+    monkeypatch.setattr(log, '_sample_counters', {})
+    hits = []
+
+    def worker():
+        hits.append(sum(sampled('test-threads', 10) for _ in range(1000)))
+
+    threads = [threading.Thread(target=worker) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sum(hits) == 400
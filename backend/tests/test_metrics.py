@@ -0,0 +1,105 @@
+import time
+
+import pytest
+from flask import Response, jsonify, stream_with_context
+
+from src.utils.metrics import HTTP_IN_FLIGHT, HTTP_REQUEST_SECONDS, HTTP_REQUESTS_TOTAL
+
+CHUNK_DELAY = 0.05
+
+
+@pytest.fixture
+def app(app):
+    def boom():
+        raise RuntimeError('boom')
+
+    def stream():
+        def generate():
+            for i in range(3):
+                time.sleep(CHUNK_DELAY)
+                yield f'data: {i}\n\n'
+
+        return Response(stream_with_context(generate()), mimetype='text/event-stream')
+
+    app.add_url_rule('/test/ok', 'ok', lambda: jsonify({'ok': True}))
+    app.add_url_rule('/test/boom', 'boom', boom)
+    app.add_url_rule('/test/stream', 'stream', stream)
+    return app
+
+
+@pytest.fixture
+def observed(monkeypatch):
+    """记录请求耗时直方图的每次观测值"""
+    values = []
+    observe = HTTP_REQUEST_SECONDS.observe
+
+    def spy(value, **labels):
+        values.append((labels['route'], value))
+        observe(value, **labels)
+
+    monkeypatch.setattr(HTTP_REQUEST_SECONDS, 'observe', spy)
+    return values
+
+
+def _total(route, status):
+    return HTTP_REQUESTS_TOTAL.value(blueprint='', route=route, method='GET', status=status)
+
+
+def test_request_is_counted_once(client, observed):
+    ok = _total('/test/ok', 200)
+    in_flight = HTTP_IN_FLIGHT.value()
+    assert client.get('/test/ok').status_code == 200
+    assert _total('/test/ok', 200) == ok + 1
+    assert [route for route, _ in observed] == ['/test/ok']
+    assert HTTP_IN_FLIGHT.value() == in_flight
+
+
+def test_propagated_exception_is_counted_as_500(app, client, observed):
+    errors = _total('/test/boom', 500)
+    in_flight = HTTP_IN_FLIGHT.value()
+    with pytest.raises(RuntimeError):
+        client.get('/test/boom')
+    assert _total('/test/boom', 500) == errors + 1
+    assert [route for route, _ in observed] == ['/test/boom']
+    assert HTTP_IN_FLIGHT.value() == in_flight
+
+
+def test_handled_exception_is_not_counted_twice(app, client, observed):
+    # 不向外传播时 Flask 先生成 500 响应（after_request 照常执行），teardown 不再重复计数
+    app.config['PROPAGATE_EXCEPTIONS'] = False
+    errors = _total('/test/boom', 500)
+    in_flight = HTTP_IN_FLIGHT.value()
+    response = client.get('/test/boom')
+    assert response.status_code == 500 and response.data
+    assert _total('/test/boom', 500) == errors + 1
+    assert [route for route, _ in observed] == ['/test/boom']
+    assert HTTP_IN_FLIGHT.value() == in_flight
+
+
+def test_streamed_response_is_timed_until_body_is_sent(client, observed):
+    streamed = _total('/test/stream', 200)
+    in_flight = HTTP_IN_FLIGHT.value()
+    response = client.get('/test/stream', buffered=False)
+    # 视图已返回，但响应体尚未生成
+    assert observed == []
+    assert HTTP_IN_FLIGHT.value() == in_flight + 1
+
+    assert response.get_data(as_text=True) == 'data: 0\n\ndata: 1\n\ndata: 2\n\n'
+    assert _total('/test/stream', 200) == streamed + 1
+    assert HTTP_IN_FLIGHT.value() == in_flight
+    [(route, seconds)] = observed
+    assert route == '/test/stream' and seconds >= 3 * CHUNK_DELAY
+    # 服务器随后关闭响应，不重复记录
+    response.close()
+    assert len(observed) == 1 and _total('/test/stream', 200) == streamed + 1
+
+
+def test_stream_closed_early_is_still_recorded(client, observed):
+    in_flight = HTTP_IN_FLIGHT.value()
+    response = client.get('/test/stream', buffered=False)
+    # 客户端断开：响应体未读完，服务器关闭响应
+    next(response.response)
+    response.close()
+    assert [route for route, _ in observed] == ['/test/stream']
+    assert HTTP_IN_FLIGHT.value() == in_flight
+
@@ -0,0 +1,107 @@
+from types import SimpleNamespace
+
+import pytest
+
+from src.routes import ai_assistant
+from src.services import model_router as router_module
+from src.services.model_router import ModelRouter
+
+TIERS = [('turbo', 'qwen-turbo'), ('plus', 'qwen-plus'), ('max', 'qwen-max')]
+FIRST_TOKEN_SLO_MS = {'qwen-turbo': 2000, 'qwen-plus': 4000, 'qwen-max': 8000}
+TOTAL_SLO_MS = {'qwen-turbo': 10000, 'qwen-plus': 20000, 'qwen-max': 40000}
+# 走中档（qwen-plus）的对话消息
+CHAT = '最近睡眠不太好，白天总是犯困怎么办'
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return Clock()
+
+
+@pytest.fixture
+def router(clock):
+    return ModelRouter(TIERS, FIRST_TOKEN_SLO_MS, enabled=True, total_slo_ms=TOTAL_SLO_MS, window=60, clock=clock)
+
+
+def _record(router, model, latency, count=router_module.MODEL_STATS_MIN_SAMPLES, ok=True, kind='first_token'):
+    for _ in range(count):
+        router.record(model, latency, ok=ok, kind=kind)
+
+
+def test_healthy_router_uses_classified_tier(router):
+    _record(router, 'qwen-plus', 1.0)
+    assert router.choose('chat', message=CHAT) == 'qwen-plus'
+
+
+def test_too_few_samples_do_not_fail_over(router):
+    _record(router, 'qwen-plus', 9.0, count=router_module.MODEL_STATS_MIN_SAMPLES - 1)
+    assert router.choose('chat', message=CHAT) == 'qwen-plus'
+
+
+def test_slow_first_token_fails_over_to_faster_tier(router):
+    _record(router, 'qwen-plus', 6.0)
+    assert router.breached('qwen-plus')
+    assert router.choose('chat', message=CHAT) == 'qwen-turbo'
+
+
+def test_error_rate_fails_over(router):
+    _record(router, 'qwen-plus', 1.0, ok=False)
+    assert router.choose('chat', message=CHAT) == 'qwen-turbo'
+
+
+def test_model_recovers_after_window_expires(router, clock):
+    _record(router, 'qwen-plus', 6.0)
+    assert router.choose('chat', message=CHAT) == 'qwen-turbo'
+    clock.now += 61
+    assert not router.breached('qwen-plus')
+    assert router.choose('chat', message=CHAT) == 'qwen-plus'
+
+
+def test_long_diagnosis_totals_do_not_fail_over_chat(router):
+    # 非流式诊断的总耗时有数秒，但在总耗时 SLO 之内；对话的首包延迟正常
+    _record(router, 'qwen-plus', 8.0, count=20, kind='total')
+    _record(router, 'qwen-plus', 0.8, count=20, kind='first_token')
+    assert not router.breached('qwen-plus')
+    assert router.choose('chat', message=CHAT) == 'qwen-plus'
+    status = {item['model']: item for item in router.status()}['qwen-plus']
+    assert status['latency']['total']['p90'] == 8.0
+    assert status['latency']['first_token']['p90'] == 0.8
+    assert not status['breached']
+
+
+def test_total_latency_over_its_own_slo_fails_over(router):
+    _record(router, 'qwen-plus', 25.0, kind='total')
+    _record(router, 'qwen-plus', 0.8, kind='first_token')
+    status = {item['model']: item for item in router.status()}['qwen-plus']
+    assert status['breached'] and status['latency']['total']['breached']
+    assert not status['latency']['first_token']['breached']
+    assert router.choose('chat', message=CHAT) == 'qwen-turbo'
+
+
+def test_no_healthy_faster_tier_keeps_the_classified_model(router):
+    _record(router, 'qwen-plus', 6.0)
+    _record(router, 'qwen-turbo', 3.0)
+    assert router.choose('chat', message=CHAT) == 'qwen-plus'
+
+
+def test_generation_calls_record_latency_kind(monkeypatch):
+    import dashscope
+
+    recorded = []
+    monkeypatch.setattr(ai_assistant, 'model_router', SimpleNamespace(
+        record=lambda model, latency, ok=True, kind='total': recorded.append((model, kind, ok))))
+    monkeypatch.setattr(dashscope.Generation, 'call', lambda **kwargs: (
+        iter([SimpleNamespace(status_code=200, usage=None)]) if kwargs.get('stream')
+        else SimpleNamespace(status_code=200, usage=None)))
+
+    ai_assistant.call_generation('diagnosis', model='qwen-plus', messages=[])
+    list(ai_assistant.call_generation('chat', model='qwen-turbo', messages=[], stream=True))
+    assert recorded == [('qwen-plus', 'total', True), ('qwen-turbo', 'first_token', True)]
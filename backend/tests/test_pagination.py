@@ -0,0 +1,65 @@
+import base64
+import json
+
+import pytest
+
+from src.models.user import User, db
+from src.utils.pagination import decode_cursor, encode_cursor
+
+
+@pytest.fixture
+def users(app):
+    with app.app_context():
+        db.session.add_all(User(username=f'user{i}', email=f'user{i}@example.com') for i in range(7))
+        db.session.commit()
+    return 7
+
+
+def test_cursor_round_trip(app):
+    with app.app_context():
+        assert decode_cursor(encode_cursor(1.25, 42), 2) == [1.25, 42]
+        assert decode_cursor('', 1) is None
+
+
+def test_pages_cover_all_users_once(client, users):
+    seen, cursor = [], None
+    while True:
+        response = client.get('/api/users', query_string={'limit': 3, 'cursor': cursor or ''})
+        assert response.status_code == 200
+        seen.extend(user['id'] for user in response.get_json())
+        cursor = response.headers.get('X-Next-Cursor')
+        if not cursor:
+            break
+    assert seen == sorted(seen) and len(seen) == len(set(seen)) == users
+
+
+def _forge(values):
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode().rstrip('=')
+
+
+@pytest.mark.parametrize('tamper', [
+    lambda cursor: _forge([0]) + '.' + cursor.split('.')[1],   # 替换内容，沿用原签名
+    lambda cursor: cursor.split('.')[0],                       # 去掉签名（旧格式）
+    lambda cursor: cursor[:-1] + ('A' if cursor[-1] != 'A' else 'B'),
+    lambda cursor: cursor + '游标',
+    lambda cursor: 'not-a-cursor',
+])
+def test_tampered_cursor_is_rejected(client, users, tamper):
+    cursor = client.get('/api/users', query_string={'limit': 3}).headers['X-Next-Cursor']
+    response = client.get('/api/users', query_string={'cursor': tamper(cursor)})
+    assert response.status_code == 400
+    assert response.get_json()['error'] == '无效的分页游标'
+
+
+def test_cursor_from_another_secret_is_rejected(app):
+    with app.app_context():
+        cursor = encode_cursor(3)
+        app.config['SECRET_KEY'] = 'rotated'
+        with pytest.raises(ValueError):
+            decode_cursor(cursor, 1)
+
+
+def test_cursor_with_wrong_arity_is_rejected(app):
+    with app.app_context():
+        with pytest.raises(ValueError):
+            decode_cursor(encode_cursor(1), 2)
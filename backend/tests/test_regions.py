@@ -0,0 +1,90 @@
+import sqlite3
+
+import pytest
+
+from src.models.hospital import Hospital
+from src.models.user import db
+from src.routes.hospitals import init_sample_data
+from src.services import regions
+from src.services.regions import RegionMatcher
+
+ROWS = [('北京市', '110000'), ('东城区', '110101'), ('上海市', '310000'), ('静安区', '310106'),
+        ('广东省', '440000'), ('广州市', '440100'), ('越秀区', '440104')]
+BEIJING = {'latitude': 39.9, 'longitude': 116.4}
+
+
+@pytest.fixture
+def sample(app):
+    """示例医院中北京的医院；测试环境没有编码表，导入时编码全部为空（相当于旧库尚未回填）"""
+    with app.app_context():
+        init_sample_data()
+        assert Hospital.query.filter(Hospital.province_adcode.isnot(None)).count() == 0
+        beijing = sorted(h.name for h in Hospital.query.filter(Hospital.address.startswith('北京市')))
+    assert 0 < len(beijing) < 5
+    return beijing
+
+
+@pytest.fixture
+def matcher(monkeypatch):
+    monkeypatch.setattr(regions, '_matcher', RegionMatcher(ROWS))
+
+
+def _names(hospitals):
+    return sorted(item.get('hospital', item)['name'] for item in hospitals)
+
+
+def _search(client, **params):
+    return _names(client.get('/api/hospitals/search', query_string=params).get_json()['data'])
+
+
+def _nearby(client, **body):
+    response = client.post('/api/hospitals/nearby', json=dict(BEIJING, radius=3000000, **body))
+    assert response.status_code == 200
+    return _names(response.get_json()['data'])
+
+
+def _recommend(client, **body):
+    response = client.post('/api/hospitals/recommend', json=dict(
+        location=BEIJING, radius=3000000, analysis_result={'recommended_departments': ['内科']}, **body))
+    assert response.status_code == 200
+    return _names(response.get_json()['data']['recommendations'])
+
+
+def test_unresolvable_region_falls_back_to_address_in_every_endpoint(client, sample):
+    assert _search(client, city='北京') == sample
+    assert _nearby(client, city='北京') == sample
+    assert _recommend(client, city='北京') == sample
+
+
+def test_rows_without_adcodes_match_by_address(client, sample, matcher):
+    assert _search(client, city='北京') == sample
+    assert _nearby(client, city='北京') == sample
+    assert _recommend(client, city='北京') == sample
+
+
+def test_backfilled_rows_use_adcodes(app, client, sample, matcher):
+    from src.main import backfill_hospital_regions
+    with app.app_context():
+        matched, total = backfill_hospital_regions()
+        assert matched == total
+        beijing = Hospital.query.filter_by(name='北京协和医院').one()
+        assert (beijing.province_adcode, beijing.district_adcode) == (110000, 110101)
+    assert _search(client, city='北京', district='东城区') == ['北京协和医院']
+    assert _search(client, city='广州') == ['广州中山大学附属第一医院']
+
+
+def test_create_app_backfills_regions_after_adding_columns(tmp_path, matcher):
+    path = tmp_path / 'old.db'
+    with sqlite3.connect(path) as connection:
+        connection.execute('CREATE TABLE hospitals (id INTEGER PRIMARY KEY, name VARCHAR(200) NOT NULL, '
+                           'level VARCHAR(10), address TEXT, latitude FLOAT, longitude FLOAT, phone VARCHAR(20), '
+                           'website VARCHAR(200), specialties TEXT, rating FLOAT, created_at DATETIME)')
+        connection.execute("INSERT INTO hospitals (name, address) VALUES ('广州中山大学附属第一医院', '广州市越秀区中山二路1号')")
+
+    from src.main import create_app
+    app = create_app({'SQLALCHEMY_DATABASE_URI': f'sqlite:///{path}', 'TESTING': True})
+    with app.app_context():
+        hospital = Hospital.query.one()
+        assert (hospital.province_adcode, hospital.city_adcode, hospital.district_adcode) == (440000, 440100, 440104)
+        db.session.remove()
+        db.engine.dispose()
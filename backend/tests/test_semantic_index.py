@@ -0,0 +1,57 @@
+import pytest
+
+from src.routes.symptoms import analyze_symptoms_logic, semantic_search
+from src.services.hedged_diagnosis import local_diagnosis
+from src.services.semantic_index import SemanticIndex, char_ngrams
+
+NON_MEDICAL = ['我想买一台电脑', 'fail test', '我很好没有不舒服', 'test', '我很开心', '我家的猫不吃饭', '帮我订一张去上海的机票',
+               '孩子考试考得不好', '孩子不爱写作业', '手机信号不好']
+
+
+def test_ngrams_skip_single_characters_and_ascii():
+    assert char_ngrams('头疼 test') == ['头疼']
+    assert char_ngrams('发烧了') == ['发烧', '烧了', '发烧了']
+
+
+def test_negated_text_is_not_embedded():
+    index = SemanticIndex([('symptom', '胸痛', '胸痛 胸口疼'), ('symptom', '咳嗽', '咳嗽 干咳')])
+    assert index.search('没有胸口疼') == []
+    assert [hit.key for hit in index.search('没有胸口疼，就是干咳')][:1] == ['咳嗽']
+
+
+def test_min_margin_rejects_ambiguous_best_match():
+    index = SemanticIndex([('department', '甲', '头晕 眼花'), ('department', '乙', '头晕 耳鸣')])
+    assert index.search('头晕', min_margin=0.1) == []
+    assert [hit.key for hit in index.search('头晕眼花', min_margin=0.1)][:1] == ['甲']
+
+
+def test_related_hits_are_not_ambiguous():
+    index = SemanticIndex([('symptom', '发热', '发热 发烧'), ('symptom', '咳嗽', '咳嗽 干咳')])
+    assert index.search('发烧咳嗽', min_margin=0.1) == []
+    hits = index.search('发烧咳嗽', min_margin=0.1, related=lambda first, second: True)
+    assert {hit.key for hit in hits} == {'发热', '咳嗽'}
+
+
+@pytest.mark.parametrize('text', NON_MEDICAL)
+def test_non_medical_input_is_not_diagnosed(text):
+    assert local_diagnosis([text], '中等', '1-2天', '') is None
+    assert 'error' in analyze_symptoms_logic([text])
+
+
+@pytest.mark.parametrize('text, department', [
+    ('心慌', '心血管内科'),
+    ('手脚发麻', '神经内科'),
+    ('喘不上气', '呼吸内科'),
+    ('身上起风团', '皮肤科'),
+    ('眼皮和脚都肿了', '肾内科'),
+    ('嗓子冒烟浑身滚烫', '呼吸内科'),
+])
+def test_semantic_fallback_finds_department(text, department):
+    result = analyze_symptoms_logic([text])
+    assert 'error' not in result
+    assert result['semantic_matches'][0]['name'] == department
+    assert department in result['recommended_departments']
+
+
+def test_symptoms_of_one_department_are_found_together():
+    assert {hit.key for hit in semantic_search('发烧咳嗽')} >= {'发热', '咳嗽'}
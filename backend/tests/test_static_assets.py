@@ -0,0 +1,76 @@
+import json
+
+import pytest
+
+from src.utils.static_assets import CACHE_DEFAULT, CACHE_IMMUTABLE, CACHE_INDEX, StaticManifest, is_hashed_name
+
+
+@pytest.mark.parametrize('path', [
+    'assets/index-3f2a9c1b.js',
+    'assets/index-BjPq3x_K.js',
+    'assets/vendor-a-b3C_9d.css',
+    'assets/logo.4e5f6a7b.svg',
+])
+def test_hashed_names(path):
+    assert is_hashed_name(path)
+
+
+@pytest.mark.parametrize('path', [
+    'site-background.png',
+    'app-settings.js',
+    'assets/components.js',
+    'favicon.ico',
+    'report-20240101.pdf',
+])
+def test_plain_names_are_not_hashed(path):
+    assert not is_hashed_name(path)
+
+
+def _write(root, rel_path, content='x'):
+    path = root / rel_path
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(content)
+
+
+def test_cache_policy_by_file_name(tmp_path):
+    for rel_path in ('index.html', 'assets/index-BjPq3x_K.js', 'app-settings.js'):
+        _write(tmp_path, rel_path)
+    manifest = StaticManifest(str(tmp_path))
+    assert manifest.get('index.html').cache_control == CACHE_INDEX
+    assert manifest.get('assets/index-BjPq3x_K.js').cache_control == CACHE_IMMUTABLE
+    assert manifest.get('app-settings.js').cache_control == CACHE_DEFAULT
+
+
+def test_build_manifest_takes_precedence(tmp_path):
+    for rel_path in ('index.html', 'assets/main-abcdefgh.js', 'assets/main-a1b2c3d4.css', 'assets/x-1234abcd.js'):
+        _write(tmp_path, rel_path)
+    _write(tmp_path, '.vite/manifest.json', json.dumps({
+        'index.html': {'file': 'assets/main-abcdefgh.js', 'css': ['assets/main-a1b2c3d4.css'], 'isEntry': True},
+    }))
+    manifest = StaticManifest(str(tmp_path))
+    assert manifest.get('assets/main-abcdefgh.js').cache_control == CACHE_IMMUTABLE
+    assert manifest.get('assets/main-a1b2c3d4.css').cache_control == CACHE_IMMUTABLE
+    # 清单存在时不再按文件名猜测
+    assert manifest.get('assets/x-1234abcd.js').cache_control == CACHE_DEFAULT
+    assert manifest.get('index.html').cache_control == CACHE_INDEX
+
+
+def test_pwa_manifest_in_root_is_not_a_build_manifest(tmp_path):
+    for rel_path in ('index.html', 'assets/index-BjPq3x_K.js', 'app-settings.js'):
+        _write(tmp_path, rel_path)
+    _write(tmp_path, 'manifest.json', json.dumps({
+        'name': 'App', 'short_name': 'App', 'icons': [{'src': 'icon-192.png', 'sizes': '192x192'}],
+    }))
+    manifest = StaticManifest(str(tmp_path))
+    assert manifest.hashed_files is None
+    # 回退到按文件名判断，PWA 清单本身作为普通文件提供
+    assert manifest.get('assets/index-BjPq3x_K.js').cache_control == CACHE_IMMUTABLE
+    assert manifest.get('app-settings.js').cache_control == CACHE_DEFAULT
+    assert manifest.get('manifest.json').cache_control == CACHE_DEFAULT
+
+
+def test_unparseable_root_manifest_falls_back_to_file_names(tmp_path):
+    _write(tmp_path, 'assets/index-BjPq3x_K.js')
+    _write(tmp_path, 'manifest.json', '{not json')
+    manifest = StaticManifest(str(tmp_path))
+    assert manifest.get('assets/index-BjPq3x_K.js').cache_control == CACHE_IMMUTABLE
@@ -0,0 +1,53 @@
+import pytest
+
+from src.routes.symptoms import SYMPTOM_INDEX, analyze_symptoms_logic
+from src.services.symptom_index import is_pinyin
+
+
+def matched(text):
+    return [(m.symptom, m.distance) for m in SYMPTOM_INDEX.match(text)]
+
+
+@pytest.mark.parametrize('text, expected', [
+    ('咳嗽', [('咳嗽', 0)]),
+    ('头疼', [('头痛', 0)]),
+    ('咳漱', [('咳嗽', 1)]),
+    ('發熱', [('发热', 0)]),
+    ('kesou', [('咳嗽', 0)]),
+    ('ke sou', [('咳嗽', 0)]),
+    ('kesuo', [('咳嗽', 1)]),
+    ('fali', [('乏力', 0)]),
+])
+def test_symptom_matches(text, expected):
+    assert matched(text) == expected
+
+
+@pytest.mark.parametrize('text', ['fail', 'test', 'fail test', 'fial', 'hello world', '我想买一台电脑'])
+def test_english_words_are_not_pinyin_symptoms(text):
+    assert matched(text) == []
+
+
+@pytest.mark.parametrize('text', ['嗓子疼', '脖子疼', '鼻子疼', '胸口闷'])
+def test_three_character_terms_do_not_swap_the_body_part(text):
+    assert matched(text) == []
+    assert SYMPTOM_INDEX.lookup(text) == []
+
+
+def test_sore_throat_is_not_routed_to_gastroenterology():
+    result = analyze_symptoms_logic(['嗓子疼'])
+    assert '腹痛' not in result.get('normalized_symptoms', [])
+    assert '消化内科' not in result.get('recommended_departments', [])
+
+
+@pytest.mark.parametrize('text, expected', [
+    ('kesou', True),
+    ('fali', True),
+    ('toutong', True),
+    ('zhuang', True),
+    ('fail', False),
+    ('test', False),
+    ('hello', False),
+    ('', False),
+])
+def test_is_pinyin(text, expected):
+    assert is_pinyin(text) is expected
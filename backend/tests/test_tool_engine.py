@@ -0,0 +1,107 @@
+import json
+import threading
+import time
+
+import pytest
+
+from src.services.tool_engine import ToolError, ToolRegistry
+from src.utils.metrics import TOOL_CALL_SECONDS
+
+PARAMETERS = [{'name': 'q', 'type': 'string', 'description': '查询', 'required': True}]
+
+
+def _call(call_id, name, arguments='{}'):
+    return {'id': call_id, 'type': 'function', 'function': {'name': name, 'arguments': arguments}}
+
+
+def _contents(messages):
+    return [(message['tool_call_id'], json.loads(message['content'])) for message in messages]
+
+
+@pytest.fixture
+def registry():
+    registry = ToolRegistry(max_workers=4)
+    yield registry
+    registry.executor.shutdown(wait=False)
+
+
+def test_schemas_are_generated_from_parameter_lists(registry):
+    registry.register('lookup', lambda args: '{}', '查询', PARAMETERS)
+    assert registry.schemas() == [{'type': 'function', 'function': {
+        'name': 'lookup', 'description': '查询',
+        'parameters': {'type': 'object', 'properties': {'q': {'type': 'string', 'description': '查询'}},
+                       'required': ['q']}}}]
+    assert 'lookup' in registry and 'missing' not in registry
+
+
+def test_calls_run_concurrently_and_keep_call_order(registry):
+    started = threading.Barrier(3, timeout=2)
+
+    def slow(args):
+        # 三个调用须同时在运行才能越过屏障；串行执行会在这里超时
+        started.wait()
+        time.sleep(args['delay'])
+        return {'q': args['q']}
+
+    registry.register('slow', slow, '慢工具', PARAMETERS)
+    calls = [_call(f'call-{i}', 'slow', json.dumps({'q': i, 'delay': delay}))
+             for i, delay in enumerate([0.2, 0.0, 0.1])]
+    start = time.perf_counter()
+    messages = registry.execute(calls)
+    assert time.perf_counter() - start < 0.5
+    assert _contents(messages) == [('call-0', {'q': 0}), ('call-1', {'q': 1}), ('call-2', {'q': 2})]
+    assert all(message['role'] == 'tool' for message in messages)
+
+
+def test_timeout_is_per_tool(registry):
+    release = threading.Event()
+    registry.register('hang', lambda args: release.wait(2) and '{}', '卡住的工具', PARAMETERS, timeout=0.1)
+    registry.register('fast', lambda args: '{"ok": true}', '快工具', PARAMETERS, timeout=1)
+    start = time.perf_counter()
+    messages = registry.execute([_call('a', 'hang'), _call('b', 'fast')])
+    release.set()
+    assert time.perf_counter() - start < 1
+    assert _contents(messages) == [('a', {'error': 'Tool hang timed out'}), ('b', {'ok': True})]
+
+
+def test_unknown_tool_and_malformed_arguments(registry):
+    registry.register('fast', lambda args: {'q': args['q']}, '快工具', PARAMETERS)
+    messages = registry.execute([
+        _call('a', 'missing'),
+        _call('b', 'fast', '{not json'),
+        {'id': 'c', 'type': 'function'},
+        _call('d', 'fast', '{"q": "ok"}'),
+    ])
+    # 缺少 function 的调用被跳过，其余调用各自得到结果
+    assert _contents(messages) == [
+        ('a', {'error': 'Unknown tool: missing'}),
+        ('b', {'error': 'Malformed arguments for tool fast'}),
+        ('d', {'q': 'ok'}),
+    ]
+
+
+def test_failures_are_reported_by_raising(registry):
+    def failing(args):
+        raise ToolError('upstream said no')
+
+    def crashing(args):
+        raise KeyError('q')
+
+    registry.register('failing', failing, '失败的工具', PARAMETERS)
+    registry.register('crashing', crashing, '出错的工具', PARAMETERS)
+    errors = TOOL_CALL_SECONDS.count(tool='failing', status='error')
+    messages = registry.execute([_call('a', 'failing'), _call('b', 'crashing')])
+    assert _contents(messages) == [('a', {'error': 'upstream said no'}),
+                                   ('b', {'error': "Error calling crashing: 'q'"})]
+    assert TOOL_CALL_SECONDS.count(tool='failing', status='error') == errors + 1
+    assert TOOL_CALL_SECONDS.count(tool='crashing', status='error') >= 1
+
+
+def test_result_mentioning_error_is_still_a_success(registry):
+    # 序列化后含有 "error" 字样的正常结果（如术语解释）不应被当作失败
+    description = {'term': 'error', 'definition': '医学检验中的误差'}
+    registry.register('describe', lambda args: json.dumps(description, ensure_ascii=False), '描述', PARAMETERS)
+    ok = TOOL_CALL_SECONDS.count(tool='describe', status='ok')
+    assert _contents(registry.execute([_call('a', 'describe')])) == [('a', description)]
+    assert TOOL_CALL_SECONDS.count(tool='describe', status='ok') == ok + 1
+    assert TOOL_CALL_SECONDS.count(tool='describe', status='error') == 0
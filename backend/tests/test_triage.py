@@ -0,0 +1,81 @@
+import json
+
+import pytest
+
+from src.routes import triage
+
+LOCATION = {'latitude': 39.9139, 'longitude': 116.4074}
+
+
+def _triage(client, **body):
+    response = client.post('/api/triage', json=body)
+    assert response.status_code == 200
+    assert response.mimetype == 'application/x-ndjson'
+    return [json.loads(line) for line in response.data.decode('utf-8').splitlines()]
+
+
+def _sections(lines):
+    return {line['section']: line for line in lines}
+
+
+def test_sections_arrive_in_order(client):
+    lines = _triage(client, symptoms=['发热', '咳嗽'], location=LOCATION, include_advice=True)
+    assert [line['section'] for line in lines] == ['emergency', 'analysis', 'hospitals', 'advice', 'done']
+    sections = _sections(lines)
+    assert sections['emergency']['data'] == {'is_emergency': False}
+    assert '呼吸内科' in sections['analysis']['data']['recommended_departments']
+    assert sections['hospitals']['data']['recommendations']
+    assert sections['advice']['data']['diagnosis']
+    assert sections['done']['data']['elapsed_ms'] >= 0
+
+
+def test_emergency_short_circuits_advice_and_prefers_er(client):
+    lines = _triage(client, symptoms=['我突然胸痛'], location=LOCATION, include_advice=True)
+    assert [line['section'] for line in lines] == ['emergency', 'analysis', 'hospitals', 'done']
+    sections = _sections(lines)
+    assert sections['emergency']['data']['detected_symptoms'] == ['胸痛']
+    assert sections['analysis']['data']['urgency_level'] == '高'
+    assert sections['analysis']['data']['recommended_departments'][0] == '急诊科'
+    assert sections['hospitals']['data']['recommended_departments'][0] == '急诊科'
+
+
+def test_missing_location(client):
+    sections = _sections(_triage(client, symptoms=['发热']))
+    assert sections['hospitals']['error'] == '请提供用户位置信息'
+    assert 'data' in sections['analysis']
+    assert 'done' in sections
+
+
+def test_unrecognised_symptom(client):
+    lines = _triage(client, symptoms=['我想买一台电脑'], location=LOCATION)
+    sections = _sections(lines)
+    assert 'error' in sections['analysis']
+    assert sections['hospitals']['error'] == '未能识别有效症状，无法推荐科室'
+    assert lines[-1]['section'] == 'done'
+
+
+@pytest.mark.parametrize('body', [{}, {'symptoms': []}])
+def test_missing_symptoms_is_rejected(client, body):
+    assert client.post('/api/triage', json=body or None).status_code == 400
+
+
+def _boom(*args, **kwargs):
+    raise RuntimeError('boom')
+
+
+@pytest.mark.parametrize('target, section', [
+    ('emergency_prestage', 'emergency'),
+    ('analyze_symptoms_logic', 'analysis'),
+    ('region_filter', 'hospitals'),
+    ('recommend_for', 'hospitals'),
+    ('local_diagnosis', 'advice'),
+])
+def test_failing_stage_yields_error_line_and_done(client, monkeypatch, target, section):
+    monkeypatch.setattr(triage, target, _boom)
+    # 配额用尽时健康建议走本地规则引擎（local_diagnosis）
+    monkeypatch.setattr(triage, 'quota_retry_after', lambda: 1.0)
+    lines = _triage(client, symptoms=['发热', '咳嗽'], location=LOCATION, include_advice=True, city='北京')
+    sections = _sections(lines)
+    assert 'boom' in sections[section]['error']
+    assert lines[-1]['section'] == 'done'
+    assert len(lines) == len(sections)
@@ -0,0 +1,92 @@
+import ipaddress
+
+import pytest
+
+from src.services import usage
+
+
+@pytest.fixture
+def trusted(monkeypatch):
+    monkeypatch.setattr(usage, 'TRUSTED_PROXIES', [ipaddress.ip_network('10.0.0.0/8')])
+
+
+def _client_id(app, remote_addr, **headers):
+    with app.test_request_context('/', headers=headers, environ_base={'REMOTE_ADDR': remote_addr}):
+        return usage.client_id()
+
+
+def test_client_headers_are_ignored_without_trusted_proxy(app):
+    assert _client_id(app, '203.0.113.5', **{'X-Client-Id': 'spoofed'}) == '203.0.113.5'
+    assert _client_id(app, '203.0.113.5', **{'X-Forwarded-For': '198.51.100.1'}) == '203.0.113.5'
+
+
+def test_untrusted_peer_cannot_use_forwarded_id(app, trusted):
+    assert _client_id(app, '203.0.113.5', **{'X-Client-Id': 'spoofed'}) == '203.0.113.5'
+
+
+def test_trusted_proxy_forwards_client_id(app, trusted):
+    assert _client_id(app, '10.0.0.2', **{'X-Client-Id': 'user-42'}) == 'user-42'
+
+
+def test_trusted_proxy_uses_rightmost_untrusted_forwarded_address(app, trusted):
+    # 最左侧的地址由客户端自行填写，不可信；取经过可信代理之前的最后一跳
+    headers = {'X-Forwarded-For': '1.2.3.4, 198.51.100.7, 10.0.0.3'}
+    assert _client_id(app, '10.0.0.2', **headers) == '198.51.100.7'
+    assert _client_id(app, '10.0.0.2') == '10.0.0.2'
+
+
+class Clock:
+    def __init__(self):
+        self.now = 7200.0
+
+    def __call__(self):
+        return self.now
+
+
+def _workers(clock, count=2, **kwargs):
+    return [usage.TokenQuota(limit=100, window=3600, clock=clock, **kwargs) for _ in range(count)]
+
+
+def test_quota_is_shared_between_workers(app):
+    clock = Clock()
+    first, second = _workers(clock)
+    with app.app_context():
+        first.charge('203.0.113.5', 60)
+        second.charge('203.0.113.5', 60)
+        assert first.status('203.0.113.5')['used'] == 120
+        assert first.exceeded('203.0.113.5') == 3600.0
+        assert second.exceeded('203.0.113.5') == 3600.0
+        assert second.exceeded('198.51.100.1') is None
+
+
+def test_quota_window_resets_and_purges_old_rows(app):
+    from src.models.usage import LLMClientUsage
+    clock = Clock()
+    quota, = _workers(clock, count=1)
+    with app.app_context():
+        quota.charge('203.0.113.5', 150)
+        clock.now += 1800
+        assert quota.exceeded('203.0.113.5') == 1800.0
+        clock.now += 1800
+        assert quota.exceeded('203.0.113.5') is None
+        quota.charge('203.0.113.5', 10)
+        assert [row.tokens for row in LLMClientUsage.query] == [10]
+
+
+def test_quota_counts_in_process_without_database():
+    clock = Clock()
+    first, second = _workers(clock)
+    first.charge('203.0.113.5', 150)
+    assert first.exceeded('203.0.113.5') == 3600.0
+    assert second.exceeded('203.0.113.5') is None
+
+
+def test_per_worker_quota_when_sharing_is_disabled(app):
+    from src.models.usage import LLMClientUsage
+    clock = Clock()
+    first, second = _workers(clock, shared=False)
+    with app.app_context():
+        first.charge('203.0.113.5', 150)
+        assert first.exceeded('203.0.113.5') == 3600.0
+        assert second.exceeded('203.0.113.5') is None
+        assert LLMClientUsage.query.count() == 0